@@ -1,13 +1,21 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from datetime import datetime, timedelta, date, timezone # Added timezone
 import calendar # For monthrange
 import re
-from sqlalchemy import func, extract, desc
+import base64
+import binascii
+import hashlib
+import json
+from sqlalchemy import func, extract, desc, select, literal, union_all, and_, or_, cast
 from functools import wraps
 
 # Corrected imports: Import from 'flask_app' which is your main application module
 # Ensure 'db' is your SQLAlchemy instance, and other models are correctly defined in flask_app
 from flask_app import db, CompletedTable, TopRail, CompletedPods, WoodCount, PrintedPartsCount, ProductionSchedule, MDFInventory, HardwarePart, TableStock
+from flask_app import current_part_inventory_entry, current_part_inventory_snapshot, snapshot_part_count
+from flask_app import month_buckets, period_counts, serial_is_6ft_expression, production_rollup_totals
+from flask_app import notification_dispatcher, cnc_event_fanout, cnc_analytics_report, london_now
+from flask_app import invoice_extraction_pipeline
 # Import datetime module itself to access datetime.time if needed for other parts (dt alias)
 import datetime as dt # dt alias is used in existing code
 
@@ -40,13 +48,19 @@ CUSHION_CONSUMABLE_PART_NAMES = [
 ]
 
 def get_latest_part_entry(part_name):
-    return (PrintedPartsCount.query
-            .filter_by(part_name=part_name)
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-            .first())
+    return current_part_inventory_entry(part_name)
 
 
-def get_felt_count():
+def get_felt_count(snapshot=None):
+    if snapshot is not None:
+        felt_entry = snapshot.get(FELT_PART_NAME.lower())
+        if felt_entry and felt_entry[2]:
+            return felt_entry[1]
+        return sum(
+            snapshot_part_count(snapshot, legacy_name, include_baseline=False)
+            for legacy_name in LEGACY_FELT_PART_NAMES
+        )
+
     entry = get_latest_part_entry(FELT_PART_NAME)
     if entry:
         return entry.count
@@ -113,6 +127,245 @@ def parse_date_str(date_str):
     except ValueError:
         return None
 
+# --- Point-in-time inventory helpers ---
+INVENTORY_LOG_MAX_PAGE_SIZE = 5000
+INVENTORY_SERIES_MAX_DAYS = 366
+INVENTORY_STREAM_BATCH_SIZE = 1000
+
+
+def _format_log_time(value):
+    return value.strftime('%H:%M:%S') if value else None
+
+
+def _latest_per_key_select(model, key_column, on_or_before):
+    """Rows dated on or before a day, ranked newest-first within each key (rank 1 = latest)."""
+    ranked = (
+        select(
+            key_column.label("key"),
+            model.count.label("count"),
+            model.date.label("date"),
+            model.time.label("time"),
+            func.row_number().over(
+                partition_by=key_column,
+                order_by=(model.date.desc(), model.time.desc(), model.id.desc()),
+            ).label("row_rank"),
+        )
+        .where(model.date <= on_or_before)
+        .subquery()
+    )
+    return ranked
+
+
+def _inventory_as_of(model, key_column, target_d):
+    ranked = _latest_per_key_select(model, key_column, target_d)
+    rows = db.session.execute(
+        select(ranked.c.key, ranked.c.count, ranked.c.date, ranked.c.time)
+        .where(ranked.c.row_rank == 1)
+        .order_by(ranked.c.key)
+    ).all()
+    return {
+        row.key: {
+            "count": row.count,
+            "last_recorded_date": row.date.isoformat(),
+            "last_recorded_time": _format_log_time(row.time),
+        }
+        for row in rows
+    }
+
+
+def _inventory_series(model, key_column, start_d, end_d):
+    """Daily {key: count} from start_d to end_d, read in a single query.
+
+    The query unions the latest row per key as of start_d with every change
+    after it up to end_d; the days are then rolled forward in order.
+    """
+    ranked = _latest_per_key_select(model, key_column, start_d)
+    seed = (
+        select(
+            literal(0).label("phase"),
+            ranked.c.key,
+            ranked.c.count,
+            ranked.c.date,
+            ranked.c.time,
+            literal(0).label("id"),
+        )
+        .where(ranked.c.row_rank == 1)
+    )
+    changes = (
+        select(
+            literal(1).label("phase"),
+            key_column.label("key"),
+            model.count,
+            model.date,
+            model.time,
+            model.id,
+        )
+        .where(model.date > start_d, model.date <= end_d)
+    )
+    combined = union_all(seed, changes).subquery()
+    rows = db.session.execute(
+        select(combined.c.key, combined.c.count, combined.c.date)
+        .order_by(combined.c.phase, combined.c.date, combined.c.time, combined.c.id)
+    ).all()
+
+    counts = {}
+    series = []
+    row_index = 0
+    day = start_d
+    while day <= end_d:
+        while row_index < len(rows) and _as_date(rows[row_index].date) <= day:
+            counts[rows[row_index].key] = rows[row_index].count
+            row_index += 1
+        series.append({"date": day.isoformat(), "counts": dict(counts)})
+        day += timedelta(days=1)
+    return series
+
+
+def _as_date(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _inventory_as_of_response(model, key_column, target_date_str):
+    target_d = parse_date_str(target_date_str)
+    if not target_d:
+        return jsonify({"error": "Invalid date format. Please use YYYY-MM-DD."}), 400
+
+    end_date_str = request.args.get("to")
+    if not end_date_str:
+        return jsonify(_inventory_as_of(model, key_column, target_d))
+
+    end_d = parse_date_str(end_date_str)
+    if not end_d:
+        return jsonify({"error": "Invalid 'to' date format. Please use YYYY-MM-DD."}), 400
+    if end_d < target_d:
+        return jsonify({"error": "'to' must be on or after the start date."}), 400
+    if (end_d - target_d).days + 1 > INVENTORY_SERIES_MAX_DAYS:
+        return jsonify({"error": f"Date ranges are limited to {INVENTORY_SERIES_MAX_DAYS} days."}), 400
+    return jsonify({
+        "from": target_d.isoformat(),
+        "to": end_d.isoformat(),
+        "series": _inventory_series(model, key_column, target_d, end_d),
+    })
+
+
+def _encode_log_cursor(row):
+    # The full time, microseconds included: rows logged within one second
+    # must still compare before or after the cursor.
+    payload = json.dumps([row.date.isoformat(), row.time.isoformat(), row.id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def _decode_log_cursor(cursor):
+    try:
+        date_text, time_text, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (
+            date.fromisoformat(date_text),
+            dt.time.fromisoformat(time_text),
+            int(row_id),
+        )
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+
+def _inventory_log_etag(model, key_column, *variant):
+    """Fingerprint of a log table; changes on insert, edit or delete.
+
+    Counts, dates and times are folded into numeric aggregates. Keys are
+    compared as text, joined in id order, so renaming one to another name of
+    the same length still changes the tag.
+    """
+    keyed_rows = select(model.id, func.coalesce(key_column, "").label("key")).order_by(model.id).subquery()
+    keys = select(
+        func.group_concat(cast(keyed_rows.c.id, db.String) + ":" + keyed_rows.c.key, func.char(31))
+    ).scalar_subquery()
+    fingerprint = db.session.execute(
+        select(
+            func.count(model.id),
+            func.max(model.id),
+            func.total(model.count),
+            func.total(model.id * model.count),
+            func.total(func.julianday(model.date) * model.id),
+            func.total(func.julianday(model.time) * model.id),
+            keys,
+        )
+    ).one()
+    return hashlib.sha1(repr((tuple(fingerprint), variant)).encode("utf-8")).hexdigest()
+
+
+def _inventory_log_response(model, key_column, key_name):
+    """Full log newest first; paged with ?limit=&cursor= and cached with ETag.
+
+    Without ``limit`` the whole log is streamed. With it, the next page's
+    cursor is returned in the X-Next-Cursor header (absent on the last page).
+    """
+    limit_arg = request.args.get("limit")
+    cursor_arg = request.args.get("cursor")
+    limit = None
+    if limit_arg is not None:
+        try:
+            limit = int(limit_arg)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= INVENTORY_LOG_MAX_PAGE_SIZE:
+            return jsonify({"error": f"limit must be between 1 and {INVENTORY_LOG_MAX_PAGE_SIZE}."}), 400
+    cursor = None
+    if cursor_arg:
+        cursor = _decode_log_cursor(cursor_arg)
+        if cursor is None:
+            return jsonify({"error": "Invalid cursor."}), 400
+
+    etag = _inventory_log_etag(model, key_column, limit, cursor_arg)
+    if request.if_none_match.contains_weak(etag):
+        not_modified = Response(status=304)
+        not_modified.set_etag(etag, weak=True)
+        return not_modified
+
+    query = select(model.id, key_column, model.count, model.date, model.time).order_by(
+        model.date.desc(), model.time.desc(), model.id.desc()
+    )
+    if cursor is not None:
+        cursor_date, cursor_time, cursor_id = cursor
+        query = query.where(or_(
+            model.date < cursor_date,
+            and_(model.date == cursor_date, model.time < cursor_time),
+            and_(model.date == cursor_date, model.time == cursor_time, model.id < cursor_id),
+        ))
+
+    def serialize(row):
+        return {
+            "id": row.id,
+            key_name: row[1],
+            "count": row.count,
+            "date": row.date.isoformat(),
+            "time": _format_log_time(row.time),
+        }
+
+    if limit is not None:
+        rows = db.session.execute(query.limit(limit + 1)).all()
+        response = jsonify([serialize(row) for row in rows[:limit]])
+        if len(rows) > limit:
+            response.headers["X-Next-Cursor"] = _encode_log_cursor(rows[limit - 1])
+        response.set_etag(etag, weak=True)
+        return response
+
+    def generate():
+        yield "["
+        first = True
+        result = db.session.execute(query.execution_options(yield_per=INVENTORY_STREAM_BATCH_SIZE))
+        for partition in result.partitions():
+            chunk = ",".join(json.dumps(serialize(row)) for row in partition)
+            if not chunk:
+                continue
+            yield chunk if first else "," + chunk
+            first = False
+        yield "]"
+
+    response = Response(stream_with_context(generate()), mimetype="application/json")
+    response.set_etag(etag, weak=True)
+    return response
+
 # --- API Routes ---
 @api.route('/status', methods=['GET'])
 def api_status():
@@ -124,6 +377,50 @@ def api_status():
         "timestamp": dt.datetime.now(dt.timezone.utc).isoformat() 
     })
 
+@api.route('/notifications/stats', methods=['GET'])
+@require_api_token
+def notification_stats():
+    """Counters for the background ntfy dispatcher (sent, failed, dropped, pending)."""
+    return jsonify(notification_dispatcher.stats())
+
+@api.route('/cnc/events/stats', methods=['GET'])
+@require_api_token
+def cnc_event_stream_stats():
+    """Counters for this process's CNC queue event fan-out (subscribers, polls, buffered)."""
+    return jsonify(cnc_event_fanout.stats())
+
+@api.route('/invoice_extraction/stats', methods=['GET'])
+@require_api_token
+def invoice_extraction_stats():
+    """Counters for this process's invoice extraction pool plus summed OCR stage timings."""
+    return jsonify(invoice_extraction_pipeline.stats())
+
+@api.route('/cnc/analytics', methods=['GET'])
+@require_api_token
+def cnc_analytics():
+    """Per-machine cycle/wait/idle figures, queue drain projection, per-job and per-day totals.
+
+    Optional ``?start=`` and ``?end=`` (YYYY-MM-DD, London dates, inclusive);
+    defaults to the last 30 days.
+    """
+    now = london_now()
+    end_d = parse_date_str(request.args.get("end", "")) if request.args.get("end") else now.date()
+    if not end_d:
+        return jsonify({"error": "Invalid 'end' date format. Please use YYYY-MM-DD."}), 400
+    start_d = parse_date_str(request.args.get("start", "")) if request.args.get("start") else end_d - dt.timedelta(days=29)
+    if not start_d:
+        return jsonify({"error": "Invalid 'start' date format. Please use YYYY-MM-DD."}), 400
+    if start_d > end_d:
+        return jsonify({"error": "'start' must be on or before 'end'."}), 400
+    if (end_d - start_d).days + 1 > INVENTORY_SERIES_MAX_DAYS:
+        return jsonify({"error": f"Date ranges are limited to {INVENTORY_SERIES_MAX_DAYS} days."}), 400
+
+    report = cnc_analytics_report(start_d, end_d, now)
+    for machine in report["machines"]:
+        if machine["drain_finish"] is not None:
+            machine["drain_finish"] = machine["drain_finish"].isoformat(timespec="minutes")
+    return jsonify(report)
+
 @api.route('/top_rail/next_serial', methods=['GET'])
 @require_api_token
 def get_next_top_rail_serial():
@@ -287,26 +584,19 @@ def monthly_work_summary(year, month):
     month_start_date = date(year, month, 1)
     month_end_date = date(year, month, num_days_in_month)
 
-    bodies_in_month = CompletedTable.query.filter(CompletedTable.date.between(month_start_date, month_end_date)).all()
-    pods_in_month = CompletedPods.query.filter(CompletedPods.date.between(month_start_date, month_end_date)).all()
-    top_rails_in_month = TopRail.query.filter(TopRail.date.between(month_start_date, month_end_date)).all()
-
-    daily_counts = {} 
-
-    for b in bodies_in_month:
-        date_str = b.date.isoformat()
-        if date_str not in daily_counts: daily_counts[date_str] = {"bodies": 0, "pods": 0, "top_rails": 0}
-        daily_counts[date_str]["bodies"] += 1
-    
-    for p in pods_in_month:
-        date_str = p.date.isoformat()
-        if date_str not in daily_counts: daily_counts[date_str] = {"bodies": 0, "pods": 0, "top_rails": 0}
-        daily_counts[date_str]["pods"] += 1
+    # Per-day totals come from the daily production rollup instead of loading every row.
+    rollup_totals = production_rollup_totals(
+        month_start_date,
+        month_end_date,
+        group_by=("date", "area"),
+        areas=["bodies", "pods", "top_rails"],
+    )
 
-    for tr in top_rails_in_month:
-        date_str = tr.date.isoformat()
+    daily_counts = {}
+    for (day, area), total in rollup_totals.items():
+        date_str = day.isoformat()
         if date_str not in daily_counts: daily_counts[date_str] = {"bodies": 0, "pods": 0, "top_rails": 0}
-        daily_counts[date_str]["top_rails"] += 1
+        daily_counts[date_str][area] += total
 
     for day_num in range(1, num_days_in_month + 1):
         # Uses 'date' from 'from datetime import ... date'
@@ -345,33 +635,26 @@ def monthly_work_summary(year, month):
 def get_production_summary_for_period(year, month):
     """Helper function to get production summary for a given year and month"""
     schedule = ProductionSchedule.query.filter_by(year=year, month=month).first()
-    
-    completed_bodies = CompletedTable.query.filter(
-        extract('year', CompletedTable.date) == year,
-        extract('month', CompletedTable.date) == month
-    ).count()
-    
-    completed_top_rails = TopRail.query.filter(
-        extract('year', TopRail.date) == year,
-        extract('month', TopRail.date) == month
-    ).count()
-    
-    completed_pods = CompletedPods.query.filter(
-        extract('year', CompletedPods.date) == year,
-        extract('month', CompletedPods.date) == month
-    ).count()
 
-    def is_6ft_serial(serial_str): 
-        if not serial_str: return False
-        return " - 6" in serial_str or "-6" in serial_str or serial_str.replace(" ", "").endswith("-6")
+    # One grouped aggregate per model: month totals split by 6ft/7ft serials.
+    buckets = month_buckets([date(year, month, 1)])
+    month_key = buckets[0][0]
 
-    all_bodies = CompletedTable.query.filter(extract('year', CompletedTable.date) == year, extract('month', CompletedTable.date) == month).all()
-    all_rails = TopRail.query.filter(extract('year', TopRail.date) == year, extract('month', TopRail.date) == month).all()
-    all_pods = CompletedPods.query.filter(extract('year', CompletedPods.date) == year, extract('month', CompletedPods.date) == month).all()
+    def count_by_size(model):
+        grouped = period_counts(
+            model, model.date, buckets,
+            group_by=serial_is_6ft_expression(model.serial_number)
+        )
+        count_6ft = sum(counts[month_key] for is_6ft, counts in grouped.items() if is_6ft)
+        count_7ft = sum(counts[month_key] for is_6ft, counts in grouped.items() if not is_6ft)
+        return {"6ft": count_6ft, "7ft": count_7ft}
 
-    def count_by_size(items):
-        count_6ft = sum(1 for item in items if is_6ft_serial(item.serial_number))
-        return {"6ft": count_6ft, "7ft": len(items) - count_6ft}
+    bodies_by_size = count_by_size(CompletedTable)
+    rails_by_size = count_by_size(TopRail)
+    pods_by_size = count_by_size(CompletedPods)
+    completed_bodies = sum(bodies_by_size.values())
+    completed_top_rails = sum(rails_by_size.values())
+    completed_pods = sum(pods_by_size.values())
 
     target_7ft_val = schedule.target_7ft if schedule else 60
     target_6ft_val = schedule.target_6ft if schedule else 60
@@ -390,9 +673,9 @@ def get_production_summary_for_period(year, month):
                 "bodies": completed_bodies, "top_rails": completed_top_rails, "pods": completed_pods
             },
             "by_size": {
-                "bodies": count_by_size(all_bodies),
-                "top_rails": count_by_size(all_rails),
-                "pods": count_by_size(all_pods)
+                "bodies": bodies_by_size,
+                "top_rails": rails_by_size,
+                "pods": pods_by_size
             }
         },
         "progress_percentage": {
@@ -485,22 +768,12 @@ def inventory_summary():
         "Catch Plate": 12,
     }
     all_hardware_parts = HardwarePart.query.all()
-    hardware_initial_counts = {
-        part.name.casefold(): part.initial_count for part in all_hardware_parts
+    # One read of the current_part_inventory projection serves every section below.
+    inventory_snapshot = current_part_inventory_snapshot()
+    table_parts_counts = {
+        part_name_def: snapshot_part_count(inventory_snapshot, part_name_def)
+        for part_name_def in table_parts_definitions
     }
-    table_parts_counts = {}
-    for part_name_def in table_parts_definitions:
-        latest_entry = (
-            db.session.query(PrintedPartsCount.count)
-            .filter_by(part_name=part_name_def)
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-            .first()
-        )
-        table_parts_counts[part_name_def] = (
-            latest_entry[0]
-            if latest_entry
-            else hardware_initial_counts.get(part_name_def.casefold(), 0)
-        )
     
     printed_parts_definitions = [
         "Large Ramp", "Paddle", *LAMINATE_PART_NAMES, "Spring Mount", "Spring Holder",
@@ -511,15 +784,11 @@ def inventory_summary():
     printed_parts_counts = {}
     for part_name_def in printed_parts_definitions:
         if part_name_def == FELT_PART_NAME:
-            printed_parts_counts[part_name_def] = get_felt_count()
+            printed_parts_counts[part_name_def] = get_felt_count(inventory_snapshot)
             continue
-        latest_entry = (
-            db.session.query(PrintedPartsCount.count)
-            .filter_by(part_name=part_name_def)
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-            .first()
+        printed_parts_counts[part_name_def] = snapshot_part_count(
+            inventory_snapshot, part_name_def, include_baseline=False
         )
-        printed_parts_counts[part_name_def] = latest_entry[0] if latest_entry else 0
     
     table_part_names = {name.casefold() for name in table_parts_definitions}
     hardware_parts_db = [
@@ -528,14 +797,10 @@ def inventory_summary():
     ]
     hardware_counts = {}
     for part_hw in hardware_parts_db:
-        latest_entry = (
-            db.session.query(PrintedPartsCount.count)
-            .filter_by(part_name=part_hw.name) 
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-            .first()
-        )
         # Fallback to initial_count if no PrintedPartsCount entry exists for this hardware part
-        hardware_counts[part_hw.name] = latest_entry[0] if latest_entry else part_hw.initial_count
+        hardware_counts[part_hw.name] = snapshot_part_count(
+            inventory_snapshot, part_hw.name, default=part_hw.initial_count
+        )
     
     table_stock_entries_db = TableStock.query.all()
     table_stock_finished = {entry.type: entry.count for entry in table_stock_entries_db}
@@ -582,75 +847,24 @@ def inventory_summary():
 @api.route('/inventory/printed_parts_count/all', methods=['GET'])
 @require_api_token
 def all_printed_parts_counts():
-    records = PrintedPartsCount.query.order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc()).all()
-    return jsonify([{
-        "id": r.id, "part_name": r.part_name, "count": r.count, 
-        "date": r.date.isoformat(), 
-        "time": r.time.strftime('%H:%M:%S') if r.time else None # Handle null time
-    } for r in records])
+    return _inventory_log_response(PrintedPartsCount, PrintedPartsCount.part_name, "part_name")
 
 @api.route('/inventory/printed_parts_count/as_of/<target_date_str>', methods=['GET'])
 @require_api_token
 def printed_parts_counts_as_of(target_date_str):
-    target_d = parse_date_str(target_date_str)
-    if not target_d:
-        return jsonify({"error": "Invalid date format. Please use YYYY-MM-DD."}), 400
-    
-    distinct_parts_query = db.session.query(PrintedPartsCount.part_name.distinct()).filter(
-        PrintedPartsCount.date <= target_d
-    ).all()
-    distinct_part_names = [name for (name,) in distinct_parts_query]
-    parts_as_of_date = {}
-    for part_name in distinct_part_names:
-        latest_entry = (
-            PrintedPartsCount.query
-            .filter(PrintedPartsCount.part_name == part_name, PrintedPartsCount.date <= target_d)
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc()).first())
-        if latest_entry:
-            parts_as_of_date[part_name] = {
-                "count": latest_entry.count,
-                "last_recorded_date": latest_entry.date.isoformat(),
-                "last_recorded_time": latest_entry.time.strftime('%H:%M:%S') if latest_entry.time else None
-            }
-        else:
-            # This case should ideally not be hit if part_name comes from distinct_parts_query
-            # based on records up to target_d. But as a fallback:
-            parts_as_of_date[part_name] = {"count": 0, "last_recorded_date": None, "last_recorded_time": None}
-    return jsonify(parts_as_of_date)
+    """Latest count per part on a date, or a daily series with ?to=YYYY-MM-DD."""
+    return _inventory_as_of_response(PrintedPartsCount, PrintedPartsCount.part_name, target_date_str)
 
 @api.route('/inventory/wood_counts/all', methods=['GET'])
 @require_api_token
 def all_wood_counts():
-    records = WoodCount.query.order_by(WoodCount.date.desc(), WoodCount.time.desc()).all()
-    return jsonify([{
-        "id": r.id, "section": r.section, "count": r.count, 
-        "date": r.date.isoformat(), 
-        "time": r.time.strftime('%H:%M:%S') if r.time else None # Handle null time
-    } for r in records])
+    return _inventory_log_response(WoodCount, WoodCount.section, "section")
 
 @api.route('/inventory/wood_counts/as_of/<target_date_str>', methods=['GET'])
 @require_api_token
 def wood_counts_as_of(target_date_str):
-    target_d = parse_date_str(target_date_str)
-    if not target_d:
-        return jsonify({"error": "Invalid date format. Please use YYYY-MM-DD."}), 400
-    
-    distinct_sections_query = db.session.query(WoodCount.section.distinct()).filter(WoodCount.date <= target_d).all()
-    distinct_sections = [name for (name,) in distinct_sections_query]
-    sections_as_of_date = {}
-    for section_name in distinct_sections:
-        latest_entry = (
-            WoodCount.query
-            .filter(WoodCount.section == section_name, WoodCount.date <= target_d)
-            .order_by(WoodCount.date.desc(), WoodCount.time.desc()).first())
-        if latest_entry:
-            sections_as_of_date[section_name] = {
-                "count": latest_entry.count,
-                "last_recorded_date": latest_entry.date.isoformat(),
-                "last_recorded_time": latest_entry.time.strftime('%H:%M:%S') if latest_entry.time else None
-            }
-        # No else needed, as section_name is guaranteed to have at least one entry by this logic
-    return jsonify(sections_as_of_date)
+    """Latest count per section on a date, or a daily series with ?to=YYYY-MM-DD."""
+    return _inventory_as_of_response(WoodCount, WoodCount.section, target_date_str)
 
 @api.route('/tables/<string:serial_number>', methods=['GET'])
 @require_api_token
@@ -0,0 +1,153 @@
+"""CNC dashboard totals: raw CncQueueItem scans vs the completion rollup.
+
+Seeds a throwaway database with synthetic years of completed queue history
+(every weekday, every machine, a run every ~15 minutes), then times the
+figures /cnc_dashboard and the queue manager need, both the pre-rollup way
+and from the rollup. Run with ``python bench_cnc_analytics.py [--years 3]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+JOB_NAMES = ["Egger 7ft Black", "Egger 6ft Oak", "Plain 7ft", "Plain 6ft", "Cushion rails", "Pods"]
+
+
+def legacy_completed_quantity_total(flask_app, year=None, month=None, day=None):
+    CncQueueItem, CncJob = flask_app.CncQueueItem, flask_app.CncJob
+    filters = [CncQueueItem.status == flask_app.CNC_STATUS_COMPLETED, CncQueueItem.completed_at.isnot(None)]
+    if year is not None:
+        start_utc, end_utc = flask_app.london_period_utc_bounds(year, month, day)
+        filters.extend([CncQueueItem.completed_at >= start_utc, CncQueueItem.completed_at < end_utc])
+    rows = (
+        flask_app.db.session.query(CncJob.name, CncJob.quantity)
+        .select_from(CncQueueItem)
+        .join(CncJob, CncQueueItem.job_id == CncJob.id)
+        .filter(*filters)
+        .all()
+    )
+    return sum(flask_app.cnc_effective_completed_quantity(name, quantity) for name, quantity in rows)
+
+
+def legacy_monthly_history_totals(flask_app):
+    CncQueueItem, CncJob = flask_app.CncQueueItem, flask_app.CncJob
+    rows = (
+        flask_app.db.session.query(CncQueueItem.completed_at, CncJob.name, CncJob.quantity)
+        .select_from(CncQueueItem)
+        .join(CncJob, CncQueueItem.job_id == CncJob.id)
+        .filter(CncQueueItem.status == flask_app.CNC_STATUS_COMPLETED, CncQueueItem.completed_at.isnot(None))
+        .all()
+    )
+    totals = {}
+    for completed_at, name, quantity in rows:
+        key = flask_app.utc_to_london(completed_at).strftime("%Y-%m")
+        totals[key] = totals.get(key, 0) + flask_app.cnc_effective_completed_quantity(name, quantity)
+    return totals
+
+
+def seed_history(flask_app, years, rng):
+    db = flask_app.db
+    jobs = [flask_app.CncJob(name=name, quantity=rng.randint(1, 3), notes="") for name in JOB_NAMES]
+    db.session.add_all(jobs)
+    db.session.commit()
+    job_ids = [job.id for job in jobs]
+
+    rows = []
+    day = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=365 * years)
+    end = datetime.utcnow()
+    while day < end:
+        if day.weekday() < 5:
+            for machine_number in flask_app.CNC_MACHINE_NUMBERS:
+                completed_at = day + timedelta(hours=8)
+                while completed_at.hour < 16:
+                    completed_at += timedelta(minutes=rng.randint(8, 25))
+                    rows.append({
+                        "job_id": rng.choice(job_ids),
+                        "machine_number": machine_number,
+                        "position": 0,
+                        "status": flask_app.CNC_STATUS_COMPLETED,
+                        "created_at": completed_at - timedelta(hours=rng.randint(1, 72)),
+                        "completed_at": completed_at,
+                        "completed_by": "Bench",
+                    })
+        day += timedelta(days=1)
+    # Core inserts skip the mapper listeners; the rollup is rebuilt below.
+    db.session.execute(flask_app.CncQueueItem.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        os.environ["POOL_TRACKER_DATABASE_URI"] = "sqlite:///" + os.path.join(tempdir, "bench.db")
+        import flask_app
+
+        with flask_app.app.app_context():
+            flask_app.run_schema_migrations()
+            completions = seed_history(flask_app, args.years, random.Random(args.seed))
+            rebuild_ms, machine_days = timed(
+                lambda: _rebuild(flask_app), 1
+            )
+            print(f"{completions} completions over {args.years} years; "
+                  f"rollup rebuild {rebuild_ms:.0f} ms ({machine_days} machine-days)")
+
+            today = flask_app.london_now().date()
+            cases = [
+                ("completed today", lambda: legacy_completed_quantity_total(flask_app, today.year, today.month, today.day),
+                 lambda: flask_app.cnc_completed_quantity_total(today.year, today.month, today.day)),
+                ("completed this month", lambda: legacy_completed_quantity_total(flask_app, today.year, today.month),
+                 lambda: flask_app.cnc_completed_quantity_total(today.year, today.month)),
+                ("monthly cut history", lambda: legacy_monthly_history_totals(flask_app),
+                 lambda: {month["key"]: month["total_quantity"] for month in flask_app.cnc_monthly_cut_file_history()}),
+            ]
+            print(f"{'figure':<22} {'raw scan ms':>12} {'rollup ms':>10}")
+            for label, legacy, rollup in cases:
+                legacy_ms, legacy_result = timed(legacy, args.repeat)
+                rollup_ms, rollup_result = timed(rollup, args.repeat)
+                assert legacy_result == rollup_result, (label, legacy_result, rollup_result)
+                print(f"{label:<22} {legacy_ms:>12.1f} {rollup_ms:>10.1f}")
+
+            report_ms, _ = timed(
+                lambda: flask_app.cnc_analytics_report(today - timedelta(days=29), today), args.repeat
+            )
+            print(f"{'30-day analytics':<22} {'-':>12} {report_ms:>10.1f}")
+
+            item = flask_app.CncQueueItem(
+                job_id=1, machine_number=1, position=0, status=flask_app.CNC_STATUS_QUEUED
+            )
+            flask_app.db.session.add(item)
+            flask_app.db.session.commit()
+            started = time.perf_counter()
+            item.status = flask_app.CNC_STATUS_COMPLETED
+            item.completed_at = datetime.utcnow()
+            flask_app.db.session.commit()
+            print(f"incremental update on completion: {(time.perf_counter() - started) * 1000:.1f} ms")
+            flask_app.db.engine.dispose()
+
+
+def _rebuild(flask_app):
+    with flask_app.db.engine.begin() as conn:
+        return flask_app.rebuild_cnc_completion_rollup(conn)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Cost of CNC queue moves: legacy full reindex vs sparse positions.
+
+The legacy path is the pre-gap reorder handler (load the machine's whole
+queue, move the item in Python, renumber every row 1..n). The sparse path
+goes through /api/cnc/queue/reorder. Both run against a throwaway database.
+Run with ``python bench_cnc_queue_reorder.py [--sizes 500 2000 5000]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+
+def legacy_reorder(flask_app, item, direction):
+    CncQueueItem = flask_app.CncQueueItem
+    machine_items = (
+        CncQueueItem.query
+        .filter_by(machine_number=item.machine_number, status=flask_app.CNC_STATUS_QUEUED)
+        .order_by(CncQueueItem.position.asc(), CncQueueItem.id.asc())
+        .all()
+    )
+    index = next(i for i, machine_item in enumerate(machine_items) if machine_item.id == item.id)
+    if direction == "top":
+        machine_items.insert(0, machine_items.pop(index))
+    elif direction == "up" and index > 0:
+        machine_items[index - 1], machine_items[index] = machine_items[index], machine_items[index - 1]
+    elif direction == "down" and index < len(machine_items) - 1:
+        machine_items[index + 1], machine_items[index] = machine_items[index], machine_items[index + 1]
+    for position, machine_item in enumerate(machine_items, start=1):
+        machine_item.position = position
+    flask_app.db.session.commit()
+
+
+def seed_queue(flask_app, size):
+    db = flask_app.db
+    db.session.query(flask_app.CncQueueItem).delete()
+    job = flask_app.CncJob(name="Bench job", quantity=1, notes="")
+    db.session.add(job)
+    db.session.flush()
+    db.session.execute(flask_app.CncQueueItem.__table__.insert(), [
+        {
+            "job_id": job.id,
+            "machine_number": 1,
+            "position": index * flask_app.CNC_POSITION_GAP,
+            "status": flask_app.CNC_STATUS_QUEUED,
+        }
+        for index in range(1, size + 1)
+    ])
+    db.session.commit()
+    return [row[0] for row in db.session.execute(flask_app.select(flask_app.CncQueueItem.id)).all()]
+
+
+def run_size(flask_app, client, size, moves, rng):
+    plan = [rng.choice(("up", "down", "top")) for _ in range(moves)]
+
+    with flask_app.app.app_context():
+        item_ids = seed_queue(flask_app, size)
+        targets = [rng.choice(item_ids) for _ in range(moves)]
+        started = time.perf_counter()
+        for item_id, direction in zip(targets, plan):
+            legacy_reorder(flask_app, flask_app.db.session.get(flask_app.CncQueueItem, item_id), direction)
+        legacy_seconds = time.perf_counter() - started
+        seed_queue(flask_app, size)
+
+    started = time.perf_counter()
+    for item_id, direction in zip(targets, plan):
+        response = client.post("/api/cnc/queue/reorder", json={"item_id": item_id, "direction": direction})
+        assert response.status_code == 200, response.data
+    sparse_seconds = time.perf_counter() - started
+    return legacy_seconds / moves * 1000, sparse_seconds / moves * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 5000])
+    parser.add_argument("--moves", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        os.environ["POOL_TRACKER_DATABASE_URI"] = "sqlite:///" + os.path.join(tempdir, "bench.db")
+        import flask_app
+
+        with flask_app.app.app_context():
+            flask_app.run_schema_migrations()
+        client = flask_app.app.test_client()
+        with client.session_transaction() as session:
+            session["worker"] = "Bench"
+
+        rng = random.Random(args.seed)
+        print(f"{args.moves} random up/down/top moves per queue size")
+        print(f"{'queue size':>10} {'legacy ms/move':>15} {'sparse ms/move':>15}")
+        for size in args.sizes:
+            legacy_ms, sparse_ms = run_size(flask_app, client, size, args.moves, rng)
+            print(f"{size:>10} {legacy_ms:>15.2f} {sparse_ms:>15.2f}")
+        with flask_app.app.app_context():
+            flask_app.db.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
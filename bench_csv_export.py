@@ -0,0 +1,182 @@
+"""Cushion history CSV export: in-memory build vs the streamed export.
+
+The legacy path is the pre-streaming ``cushion_history_export_csv`` body:
+``.all()`` loads every log row as an ORM object and the whole file is written
+into one ``StringIO`` before anything is sent. The streamed path iterates
+column tuples in ``yield_per`` batches and hands ``csv_chunks`` (optionally
+through ``gzip_chunks``) to the response a chunk at a time. Both run against
+a throwaway database seeded with workflow log rows and must produce the same
+text. Peak memory is measured with tracemalloc in a separate pass from the
+timings. Run with ``python bench_csv_export.py [--log-rows 10000 100000 300000]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from io import StringIO
+
+from csv_stream import csv_chunks, gzip_chunks
+
+
+def legacy_export(app, filters):
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["Cushion History Export"])
+    writer.writerow(["Period", filters["period"]])
+    writer.writerow(["Start Date", filters["start_date_value"]])
+    writer.writerow(["End Date", filters["end_date_value"]])
+    writer.writerow(["Worker", filters["worker"]])
+    writer.writerow(["Stage", filters["stage_key"]])
+    writer.writerow(["Size", filters["size_label"]])
+    writer.writerow(["Shape", filters["shape_value"]])
+    writer.writerow(["End Type", filters["end_type"]])
+    writer.writerow(["Action", filters["action_type"]])
+    writer.writerow([])
+    writer.writerow(["Action Log"])
+    writer.writerow([
+        "When", "Worker", "Stage", "Size", "Shape", "End Type",
+        "Action", "Delta", "Count After", "Seconds Taken", "Note"
+    ])
+    log = app.CushionWorkflowLog
+    for entry in app.cushion_history_log_query(filters).order_by(log.created_at.desc(), log.id.desc()).all():
+        writer.writerow([
+            entry.created_at.strftime("%Y-%m-%d %H:%M:%S") if entry.created_at else "",
+            entry.worker, entry.stage_label, entry.size_label, entry.shape_no or "", entry.end_type,
+            entry.action_type, entry.delta, entry.count_after,
+            entry.seconds_taken if entry.seconds_taken is not None else "",
+            entry.note or "",
+        ])
+    writer.writerow([])
+    writer.writerow(["Completed Cushion Sets"])
+    writer.writerow(["Completed", "Size", "Worker", "Stock After", "Estimated Seconds"])
+    completed_set = app.CushionCompletedSet
+    for completed in (
+        app.cushion_history_completed_query(filters)
+        .order_by(completed_set.completed_at.desc(), completed_set.id.desc())
+        .all()
+    ):
+        writer.writerow([
+            completed.completed_at.strftime("%Y-%m-%d %H:%M:%S") if completed.completed_at else "",
+            completed.size_label, completed.worker, completed.stock_count_after,
+            completed.estimated_seconds if completed.estimated_seconds is not None else "",
+        ])
+    writer.writerow([])
+    writer.writerow(["Consumable Stock Entries"])
+    writer.writerow(["Date", "Time", "Part", "Count After"])
+    parts = app.PrintedPartsCount
+    for entry in (
+        app.cushion_history_consumable_query(filters)
+        .order_by(parts.date.desc(), parts.time.desc(), parts.id.desc())
+        .all()
+    ):
+        writer.writerow([
+            entry.date.strftime("%Y-%m-%d") if entry.date else "",
+            entry.time.strftime("%H:%M:%S") if entry.time else "",
+            entry.part_name, entry.count,
+        ])
+    return output.getvalue()
+
+
+def seed(app, log_rows):
+    db = app.db
+    db.session.query(app.CushionWorkflowLog).delete()
+    started = app.london_now() - timedelta(days=365)
+    stages = app.CUSHION_WORKFLOW_STAGES
+    batch = []
+    for number in range(log_rows):
+        stage = stages[number % len(stages)]
+        batch.append({
+            "action_type": "add" if number % 5 else "move_out",
+            "stage_key": stage["key"], "stage_label": stage["label"],
+            "size_label": "7ft" if number % 2 else "6ft", "shape_no": number % 7, "end_type": "",
+            "worker": ("Alex", "Sam", "Jo", "Priya")[number % 4], "delta": 1, "count_after": number % 40,
+            "seconds_taken": number % 900 or None, "batch_number": 1 + number // 5000,
+            "note": "Moved to next stage, checked" if number % 3 == 0 else None,
+            "created_at": started + timedelta(seconds=number * 300),
+        })
+        if len(batch) == 10_000:
+            db.session.execute(app.CushionWorkflowLog.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(app.CushionWorkflowLog.__table__.insert(), batch)
+    app.rebuild_cushion_timing_stats(db.session.connection())
+    db.session.commit()
+
+
+def consume(chunks):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+    return size
+
+
+def measure(function):
+    """(seconds, peak traced bytes) for ``function()``, from separate untraced and traced runs."""
+    gc.collect()
+    started = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log-rows", type=int, nargs="+", default=[10_000, 100_000, 300_000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        os.environ["POOL_TRACKER_DATABASE_URI"] = "sqlite:///" + os.path.join(tempdir, "bench.db")
+        import flask_app
+
+        print(
+            f"{'log rows':>9} {'MB out':>7} {'legacy s':>9} {'peak MB':>8} "
+            f"{'stream s':>9} {'peak MB':>8} {'gzip s':>7} {'peak MB':>8} {'gzip MB':>8}"
+        )
+        with flask_app.app.app_context():
+            flask_app.run_schema_migrations()
+            flask_app.ensure_cushion_consumables()
+            with flask_app.app.test_request_context("/cushion_history/export.csv?period=all"):
+                filters = flask_app.cushion_history_filter_state(flask_app.request.args)
+            for log_rows in args.log_rows:
+                seed(flask_app, log_rows)
+
+                def streamed():
+                    return csv_chunks(flask_app.cushion_history_csv_rows(filters))
+
+                def run_legacy():
+                    text = legacy_export(flask_app, filters)
+                    flask_app.db.session.expunge_all()
+                    return text
+
+                legacy_text = run_legacy()
+                if "".join(streamed()) != legacy_text:
+                    raise SystemExit(f"Exports differ for {log_rows} log rows")
+                legacy_s, legacy_peak = measure(run_legacy)
+                stream_s, stream_peak = measure(lambda: consume(streamed()))
+                gzip_s, gzip_peak = measure(lambda: consume(gzip_chunks(streamed())))
+                gzip_size = consume(gzip_chunks(streamed()))
+                megabyte = 1024 * 1024
+                print(
+                    f"{log_rows:>9} {len(legacy_text) / megabyte:>7.1f} {legacy_s:>9.2f} {legacy_peak / megabyte:>8.1f} "
+                    f"{stream_s:>9.2f} {stream_peak / megabyte:>8.1f} {gzip_s:>7.2f} {gzip_peak / megabyte:>8.1f} "
+                    f"{gzip_size / megabyte:>8.1f}"
+                )
+            flask_app.db.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
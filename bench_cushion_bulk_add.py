@@ -0,0 +1,242 @@
+"""Cushion "+N" stage adds: per-unit writes vs the set-based bulk path.
+
+The legacy path is the pre-bulk ``record_cushion_stage_add_many``: a count
+lookup per input requirement, a read-modify-write per input, and for the
+bundle stage a stock lookup, stock log and completed-set flush (with its
+rollup upsert) for every set. The bulk path is the current function, which
+reads the count rows once, takes the inputs in one UPDATE and bulk inserts
+the logs and completed sets. Each case starts from the same seeded
+database, commits once and must leave the same counts, stock, completed
+sets, production rollup and timing stats behind.
+Run with ``python bench_cushion_bulk_add.py [--quantities 1 10 100 500]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from sqlalchemy import event
+
+
+WORKER = "Sam"
+SIZE_LABEL = "7ft"
+CASES = (
+    ("spindle_mould", "", 0, ""),
+    ("glue_ends", SIZE_LABEL, 2, ""),
+    ("bundle", SIZE_LABEL, 0, ""),
+)
+
+
+def legacy_add_cushion_set_to_stock(app, size_label, worker, estimated_seconds=None):
+    stock_type = app.cushion_stock_key(size_label)
+    stock_entry = app.TableStock.query.filter_by(type=stock_type).first()
+    if not stock_entry:
+        stock_entry = app.TableStock(type=stock_type, count=0)
+        app.db.session.add(stock_entry)
+        app.db.session.flush()
+    old_count = stock_entry.count
+    stock_entry.count += 1
+    app.record_table_stock_log(
+        stock_type, "complete_cushion_set", worker, 1, old_count, stock_entry.count,
+        f"Completed {size_label} cushion set",
+    )
+    completed_set = app.CushionCompletedSet(
+        size_label=size_label,
+        worker=worker,
+        stock_type=stock_type,
+        stock_count_after=stock_entry.count,
+        estimated_seconds=estimated_seconds if estimated_seconds is not None else app.cushion_estimated_set_seconds(size_label),
+        completed_at=app.london_now(),
+    )
+    app.db.session.add(completed_set)
+    return completed_set
+
+
+def legacy_record_cushion_stage_add_many(app, stage_key, size_label, shape_no, end_type, quantity, worker):
+    size_label, shape_no, end_type = app.normalize_cushion_variant(stage_key, size_label, shape_no, end_type)
+    quantity = app.parse_positive_count(quantity, "Quantity")
+    required_counts = defaultdict(int)
+    for requirement in app.cushion_input_requirements(stage_key, size_label, shape_no, end_type):
+        required_counts[requirement] += quantity
+
+    for variant, required_count in required_counts.items():
+        if app.get_cushion_count_record(*variant, create=True).count < required_count:
+            raise ValueError(f"Not enough {app.cushion_variant_display(*variant)}")
+
+    tee_nuts_required = 0
+    if stage_key == "glue_ends":
+        tee_nuts_required = app.cushion_tee_nuts_required_for_glue_ends(size_label, quantity)
+        current_tee_nuts, _ = app.consumable_stock_state(app.CUSHION_CONSUMABLE_TEE_NUTS["name"])
+        if current_tee_nuts < tee_nuts_required:
+            raise ValueError("Not enough tee nuts")
+
+    active_batch = app.get_or_create_active_cushion_batch(worker)
+    batch_number = active_batch.batch_number if active_batch else None
+    batch_date = active_batch.batch_date if active_batch else None
+
+    for variant, required_count in required_counts.items():
+        app.apply_cushion_count_delta(
+            *variant, -required_count, worker, action_type="move_out",
+            note=f"Moved to {app.CUSHION_STAGE_BY_KEY[stage_key]['label']}",
+            batch_number=batch_number, batch_date=batch_date,
+        )
+
+    now = app.london_now()
+    seconds_taken = app.cushion_action_duration_seconds(
+        stage_key, size_label, shape_no, end_type, worker, now, batch_number=batch_number,
+    )
+    if seconds_taken and quantity > 1:
+        seconds_taken = max(1, int(round(seconds_taken / quantity)))
+
+    if stage_key == "bundle":
+        completed_sets = [
+            legacy_add_cushion_set_to_stock(app, size_label, worker, seconds_taken)
+            for _ in range(quantity)
+        ]
+        target_record = app.get_cushion_count_record(stage_key, size_label, 0, "", create=True)
+        target_record.count = completed_sets[-1].stock_count_after
+        target_record.updated_at = now
+        app.db.session.add(app.CushionWorkflowLog(
+            action_type="add", stage_key=stage_key, stage_label=app.CUSHION_STAGE_BY_KEY[stage_key]["label"],
+            size_label=size_label, shape_no=0, end_type="", worker=worker, delta=quantity,
+            count_after=target_record.count, seconds_taken=seconds_taken, batch_number=batch_number,
+            batch_date=batch_date, note=f"Bundled {quantity} completed cushion set(s)",
+        ))
+        return target_record, completed_sets
+
+    if tee_nuts_required:
+        app.adjust_consumable_stock(app.CUSHION_CONSUMABLE_TEE_NUTS["name"], -tee_nuts_required)
+    target_record = app.apply_cushion_count_delta(
+        stage_key, size_label, shape_no, end_type, quantity, worker, action_type="add",
+        seconds_taken=seconds_taken, batch_number=batch_number, batch_date=batch_date,
+    )
+    return target_record, []
+
+
+def seed(app, quantity):
+    """Enough stock at every stage for ``quantity`` units, plus an earlier add so each case is timed."""
+    db = app.db
+    for model in (
+        app.CushionWorkflowCount, app.CushionWorkflowLog, app.CushionCompletedSet, app.CushionBatch,
+        app.TableStock, app.TableStockLog, app.DailyProductionRollup,
+        app.CushionTimingStat, app.CushionTimingBucket, app.CountCheckpoint,
+    ):
+        db.session.query(model).delete()
+    now = app.london_now()
+    rows = []
+    for stage_key, size_label, shape_no, end_type in app.cushion_input_requirements(*CASES[0]) + [
+        ("shape_cushions", SIZE_LABEL, 2, ""),
+        ("punch_rubber_ends", "", 0, "Big end"),
+        ("punch_rubber_ends", "", 0, "Small end"),
+        *(("sand_tops", SIZE_LABEL, shape_no, "") for shape_no in app.CUSHION_SHAPES),
+    ]:
+        rows.append({
+            "stage_key": stage_key, "size_label": size_label, "shape_no": shape_no, "end_type": end_type,
+            "count": 2 * quantity, "updated_at": now,
+        })
+    db.session.execute(app.CushionWorkflowCount.__table__.insert(), rows)
+    db.session.add(app.TableStock(type=app.cushion_stock_key(SIZE_LABEL), count=3))
+    app.set_consumable_stock(app.CUSHION_CONSUMABLE_TEE_NUTS["name"], 10 * quantity)
+    batch = app.start_new_cushion_batch(WORKER)
+    for stage_key, size_label, shape_no, end_type in CASES:
+        db.session.add(app.CushionWorkflowLog(
+            action_type="add", stage_key=stage_key, stage_label=app.CUSHION_STAGE_BY_KEY[stage_key]["label"],
+            size_label=size_label, shape_no=shape_no, end_type=end_type, worker=WORKER, delta=1, count_after=1,
+            seconds_taken=None, batch_number=batch.batch_number, batch_date=batch.batch_date,
+            created_at=now - timedelta(minutes=45),
+        ))
+    db.session.commit()
+
+
+def snapshot(app):
+    db = app.db
+    counts = {
+        (row.stage_key, row.size_label, row.shape_no, row.end_type): row.count
+        for row in app.CushionWorkflowCount.query
+    }
+    logs = Counter(
+        (row.action_type, row.stage_key, row.size_label, row.shape_no, row.end_type, row.delta, row.count_after,
+         row.seconds_taken, row.batch_number, row.note)
+        for row in app.CushionWorkflowLog.query
+    )
+    completed = Counter(
+        (row.size_label, row.worker, row.stock_count_after, row.estimated_seconds)
+        for row in app.CushionCompletedSet.query
+    )
+    rollup = {
+        (row.date, row.area, row.size_label, row.worker): row.completed_count
+        for row in app.DailyProductionRollup.query
+    }
+    stats = sorted(
+        (row.stage_key, row.size_label, row.shape_no, row.end_type, row.worker, row.batch_number,
+         row.sample_count, row.seconds_sum, row.min_seconds, row.max_seconds, row.last_seconds)
+        for row in app.CushionTimingStat.query
+    )
+    stock = {row.type: row.count for row in app.TableStock.query}
+    stock_logs = app.TableStockLog.query.order_by(app.TableStockLog.id.desc()).first()
+    return {
+        "counts": counts, "logs": logs, "completed": completed, "rollup": rollup, "stats": stats, "stock": stock,
+        "consumables": app.consumable_current_count(app.CUSHION_CONSUMABLE_TEE_NUTS["name"]),
+        "last_stock_count": stock_logs.count_after if stock_logs else None,
+        "batches": db.session.query(app.CushionBatch).count(),
+    }
+
+
+def run_case(app, function, case, quantity):
+    seed(app, quantity)
+    statements = []
+
+    def count(*_):
+        statements.append(1)
+
+    engine = app.db.engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        started = time.perf_counter()
+        function(*case, quantity, WORKER)
+        app.db.session.commit()
+        elapsed = time.perf_counter() - started
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return elapsed * 1000, len(statements), snapshot(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quantities", type=int, nargs="+", default=[1, 10, 50, 100, 250, 500])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        os.environ["POOL_TRACKER_DATABASE_URI"] = "sqlite:///" + os.path.join(tempdir, "bench.db")
+        import flask_app
+
+        print(f"{'stage':<15} {'quantity':>8} {'legacy ms':>10} {'queries':>8} {'bulk ms':>8} {'queries':>8}")
+        with flask_app.app.app_context():
+            flask_app.run_schema_migrations()
+            for case in CASES:
+                for quantity in args.quantities:
+                    legacy_ms, legacy_queries, legacy = run_case(
+                        flask_app,
+                        lambda *arguments: legacy_record_cushion_stage_add_many(flask_app, *arguments),
+                        case,
+                        quantity,
+                    )
+                    bulk_ms, bulk_queries, bulk = run_case(flask_app, flask_app.record_cushion_stage_add_many, case, quantity)
+                    # The bulk path writes one stock log per press rather than one per set.
+                    differing = sorted(name for name in legacy if legacy[name] != bulk[name])
+                    if differing:
+                        raise SystemExit(f"{case[0]} x{quantity}: results differ in {', '.join(differing)}")
+                    print(
+                        f"{case[0]:<15} {quantity:>8} {legacy_ms:>10.1f} {legacy_queries:>8} "
+                        f"{bulk_ms:>8.1f} {bulk_queries:>8}"
+                    )
+            flask_app.db.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
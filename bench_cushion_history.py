@@ -0,0 +1,240 @@
+"""Cushion history page queries: per-figure summaries and offset paging vs the history engine.
+
+The legacy path is the pre-engine page: ``cushion_history_summary`` and
+``cushion_history_stage_summary`` ran a count, two sums, a correction count
+and an average per stage plus the same again overall, the completed-set
+stats ran a query per month and loaded every set of the last six weeks,
+and the action log was paged with OFFSET. The engine reads the per-stage
+totals in one grouped pass, the completed stats from one rollup read, and
+pages by ``(created_at, id)`` keyset. "cached" is a second summary call
+with the same filters. Both paths must agree on every figure and page.
+Run with ``python bench_cushion_history.py [--log-rows 20000 200000]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from datetime import time as day_time
+
+from sqlalchemy import event, func
+
+
+PER_PAGE = 50
+FILTER_CASES = (
+    ("all, every row", {"period": "all"}),
+    ("all, one stage", {"period": "all", "stage_key": "bundle"}),
+    ("month", {"period": "month"}),
+    ("all, one worker", {"period": "all", "worker": "Sam"}),
+)
+
+
+def legacy_sum_delta(app, query):
+    return int(query.with_entities(func.coalesce(func.sum(app.CushionWorkflowLog.delta), 0)).scalar() or 0)
+
+
+def legacy_log_figures(app, query):
+    log = app.CushionWorkflowLog
+    average_seconds = (
+        query.filter(log.seconds_taken.isnot(None), log.seconds_taken > 0)
+        .with_entities(func.avg(log.seconds_taken))
+        .scalar()
+    )
+    return {
+        "added_units": legacy_sum_delta(app, query.filter(log.action_type == "add", log.delta > 0)),
+        "moved_out_units": abs(legacy_sum_delta(app, query.filter(log.action_type == "move_out", log.delta < 0))),
+        "corrections": query.filter(log.action_type == "correction").count(),
+        "average_display": app.cushion_format_duration(average_seconds) if average_seconds else "N/A",
+    }
+
+
+def legacy_summaries(app, filters):
+    log_query = app.cushion_history_log_query(filters)
+    completed_query = app.cushion_history_completed_query(filters)
+    summary = {
+        "total_actions": log_query.count(),
+        **legacy_log_figures(app, log_query),
+        "completed_sets": completed_query.count(),
+        "completed_by_size": {
+            size_label: completed_query.filter(app.CushionCompletedSet.size_label == size_label).count()
+            for size_label in app.CUSHION_SIZES
+        },
+    }
+    stage_rows = []
+    for stage in app.CUSHION_WORKFLOW_STAGES:
+        if filters.get("stage_key") and filters["stage_key"] != stage["key"]:
+            continue
+        query = app.cushion_history_log_query({**filters, "stage_key": stage["key"]})
+        stage_rows.append({"label": stage["label"], "actions": query.count(), **legacy_log_figures(app, query)})
+    return summary, stage_rows
+
+
+def legacy_completed_stats(app, today):
+    completed = app.CushionCompletedSet
+    end_dt = datetime.combine(today + timedelta(days=1), day_time.min)
+
+    def counts_between(start_date, end):
+        return dict(
+            app.db.session.query(completed.size_label, func.count(completed.id))
+            .filter(completed.completed_at >= datetime.combine(start_date, day_time.min), completed.completed_at < end)
+            .group_by(completed.size_label)
+            .all()
+        )
+
+    month_counts = counts_between(today.replace(day=1), end_dt)
+    year_counts = counts_between(date(today.year, 1, 1), end_dt)
+    size_stats = [
+        {"size": size, "month": month_counts.get(size, 0), "year": year_counts.get(size, 0)}
+        for size in app.CUSHION_SIZES
+    ]
+    oldest_week_start = today - timedelta(days=today.weekday()) - timedelta(weeks=5)
+    weekly = app.build_recent_weekly_size_history(
+        completed.query.filter(
+            completed.completed_at >= datetime.combine(oldest_week_start, day_time.min),
+            completed.completed_at < end_dt,
+        ).all(),
+        today,
+        date_getter=lambda row: row.completed_at,
+        size_getter=lambda row: row.size_label,
+        week_count=6,
+    )
+    months = []
+    month_start = today.replace(day=1)
+    for _ in range(7):
+        next_start = date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+        counts = counts_between(month_start, datetime.combine(next_start, day_time.min))
+        months.append({
+            "label": month_start.strftime("%B %Y"),
+            "sizes": {size: counts.get(size, 0) for size in app.CUSHION_SIZES},
+            "total": sum(counts.get(size, 0) for size in app.CUSHION_SIZES),
+        })
+        month_start = (month_start - timedelta(days=1)).replace(day=1)
+    return {"completed_size_stats": size_stats, "weekly_size_stats": weekly, "previous_month_size_stats": months}
+
+
+def legacy_page(app, filters, page):
+    log = app.CushionWorkflowLog
+    return (
+        app.cushion_history_log_query(filters)
+        .order_by(log.created_at.desc(), log.id.desc())
+        .offset((page - 1) * PER_PAGE)
+        .limit(PER_PAGE)
+        .all()
+    )
+
+
+def seed(app, log_rows):
+    """``log_rows`` actions spread over three years, with a completed set for every fifth one."""
+    db = app.db
+    for model in (app.CushionWorkflowLog, app.CushionCompletedSet, app.DailyProductionRollup):
+        db.session.query(model).delete()
+    now = app.london_now()
+    step = timedelta(days=3 * 365) / log_rows
+    stages = app.CUSHION_WORKFLOW_STAGES
+    logs, completed = [], []
+    for number in range(log_rows):
+        stage = stages[number % len(stages)]
+        created_at = now - step * number
+        action_type = ("add", "add", "move_out", "correction", "add")[number % 5]
+        logs.append({
+            "action_type": action_type, "stage_key": stage["key"], "stage_label": stage["label"],
+            "size_label": "7ft" if number % 2 else "6ft", "shape_no": number % 7, "end_type": "",
+            "worker": ("Alex", "Sam", "Jo", "Priya")[number % 4],
+            "delta": -2 if action_type == "move_out" else 1 + number % 3, "count_after": number % 40,
+            "seconds_taken": number % 900 or None, "created_at": created_at,
+        })
+        if number % 5 == 0:
+            completed.append({
+                "size_label": "7ft" if number % 3 else "6ft", "worker": ("Alex", "Sam")[number % 2],
+                "stock_type": "cushion_set_7ft", "stock_count_after": number, "estimated_seconds": 600,
+                "completed_at": created_at,
+            })
+    db.session.execute(app.CushionWorkflowLog.__table__.insert(), logs)
+    db.session.execute(app.CushionCompletedSet.__table__.insert(), completed)
+    app.rebuild_daily_production_rollup(db.session.connection())
+    db.session.commit()
+    app.cushion_history_summary_cache.clear()
+
+
+def timed(app, function):
+    statements = []
+
+    def count(*_):
+        statements.append(1)
+
+    event.listen(app.db.engine, "before_cursor_execute", count)
+    try:
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+    finally:
+        event.remove(app.db.engine, "before_cursor_execute", count)
+    return result, elapsed * 1000, len(statements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log-rows", type=int, nargs="+", default=[20_000, 200_000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        os.environ["POOL_TRACKER_DATABASE_URI"] = "sqlite:///" + os.path.join(tempdir, "bench.db")
+        import flask_app as app
+
+        print(
+            f"{'log rows':>9} {'filters':<16} {'legacy ms':>10} {'queries':>8} "
+            f"{'engine ms':>10} {'queries':>8} {'cached ms':>10}"
+        )
+        with app.app.app_context():
+            app.run_schema_migrations()
+            today = app.london_now().date()
+            for log_rows in args.log_rows:
+                seed(app, log_rows)
+                for label, query_args in FILTER_CASES:
+                    with app.app.test_request_context("/cushion_history", query_string=query_args):
+                        filters = app.cushion_history_filter_state(app.request.args)
+                    legacy, legacy_ms, legacy_queries = timed(app, lambda: legacy_summaries(app, filters))
+                    engine, engine_ms, engine_queries = timed(app, lambda: app.cushion_history_summaries(filters))
+                    _, cached_ms, _ = timed(app, lambda: app.cushion_history_summaries(filters))
+                    if legacy != engine:
+                        raise SystemExit(f"Summaries differ for {label} at {log_rows} rows")
+                    print(
+                        f"{log_rows:>9} {label:<16} {legacy_ms:>10.1f} {legacy_queries:>8} "
+                        f"{engine_ms:>10.1f} {engine_queries:>8} {cached_ms:>10.3f}"
+                    )
+
+                legacy, legacy_ms, legacy_queries = timed(app, lambda: legacy_completed_stats(app, today))
+                app.cushion_history_summary_cache.clear()
+                engine, engine_ms, engine_queries = timed(app, lambda: app.cushion_completed_stats(today))
+                if legacy != engine:
+                    raise SystemExit(f"Completed stats differ at {log_rows} rows")
+                print(
+                    f"{log_rows:>9} {'completed stats':<16} {legacy_ms:>10.1f} {legacy_queries:>8} "
+                    f"{engine_ms:>10.1f} {engine_queries:>8}"
+                )
+
+                filters = app.cushion_history_filter_state({"period": "all"})
+                last_page = -(-log_rows // PER_PAGE)
+                for page in (2, last_page // 2, last_page):
+                    previous = legacy_page(app, filters, page - 1)
+                    expected, legacy_ms, _ = timed(app, lambda: legacy_page(app, filters, page))
+                    cursor = (previous[-1].created_at, previous[-1].id)
+                    keyset, engine_ms, _ = timed(
+                        app, lambda: app.cushion_history_action_page(filters, PER_PAGE, cursor)
+                    )
+                    newer = app.cushion_history_action_page(
+                        filters, PER_PAGE, (expected[0].created_at, expected[0].id), older=False
+                    )
+                    if [row.id for row in keyset] != [row.id for row in expected] or \
+                            [row.id for row in newer] != [row.id for row in previous]:
+                        raise SystemExit(f"Page {page} differs at {log_rows} rows")
+                    print(f"{log_rows:>9} {'page ' + str(page):<16} {legacy_ms:>10.2f} {1:>8} {engine_ms:>10.2f} {1:>8}")
+                app.db.session.expunge_all()
+            app.db.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
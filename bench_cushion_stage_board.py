@@ -0,0 +1,279 @@
+"""Cushion stage board: per-variant queries vs the batched builder.
+
+The legacy path is the pre-batching ``build_cushion_stage_context``: one
+count lookup, and with timing an AVG query plus a latest-row query on the
+workflow log, for every stage variant, and more count lookups for
+readiness. The batched path is the current builder, which reads timings
+from the running stats table. Both run against a throwaway database seeded
+with workflow counts and timed log rows, and must produce the same board.
+Run with ``python bench_cushion_stage_board.py [--log-rows 2000 20000 100000]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import event
+
+
+WORKERS = ["Alex", "Sam", "Jo", "Priya"]
+BATCHES = [1, 2, 3]
+
+
+def legacy_variant_timing(app, stage_key, size_label="", shape_no=0, end_type="", worker_name=None, batch_number=None):
+    """Average and last seconds for one variant, queried from the workflow log."""
+    log = app.CushionWorkflowLog
+    size_label, shape_no, end_type = app.normalize_cushion_variant(stage_key, size_label, shape_no, end_type)
+    filters = [
+        log.action_type == "add",
+        log.stage_key == stage_key,
+        log.size_label == size_label,
+        log.shape_no == shape_no,
+        log.end_type == end_type,
+        log.seconds_taken.isnot(None),
+        log.seconds_taken > 0,
+    ]
+    if worker_name:
+        filters.append(log.worker == worker_name)
+    average_seconds = app.cushion_timing_batch_filter(
+        app.db.session.query(app.func.avg(log.seconds_taken)), batch_number,
+    ).filter(*filters).scalar()
+    last_log = (
+        app.cushion_timing_batch_filter(log.query, batch_number)
+        .filter(*filters)
+        .order_by(log.created_at.desc(), log.id.desc())
+        .first()
+    )
+    return app.cushion_timing_payload(average_seconds, last_log.seconds_taken if last_log else None)
+
+
+def legacy_ready_count_for_variant(app, stage_key, size_label="", shape_no=0, end_type=""):
+    requirements = app.cushion_input_requirements(stage_key, size_label, shape_no, end_type)
+    if not requirements:
+        return 0
+    required_counts = defaultdict(int)
+    for requirement in requirements:
+        required_counts[requirement] += 1
+    ready_counts = [
+        app.cushion_current_count_for_variant(*variant) // required_count
+        for variant, required_count in required_counts.items()
+    ]
+    return min(ready_counts) if ready_counts else 0
+
+
+def legacy_ready_bundle_count(app, size_label):
+    return min(app.cushion_count_value("sand_tops", size_label, shape_no, "") for shape_no in app.CUSHION_SHAPES)
+
+
+def legacy_ready_count_for_stage(app, stage_key):
+    stage = app.CUSHION_STAGE_BY_KEY[stage_key]
+    if stage_key == "bundle":
+        return sum(legacy_ready_bundle_count(app, size_label) for size_label in app.CUSHION_SIZES)
+    if stage["variant"] == app.CUSHION_STAGE_PLAIN:
+        return legacy_ready_count_for_variant(app, stage_key)
+    if stage["variant"] == app.CUSHION_STAGE_END_TYPE:
+        return 0
+    if stage["variant"] == app.CUSHION_STAGE_SIZE_ONLY:
+        return sum(legacy_ready_count_for_variant(app, stage_key, size_label=size_label) for size_label in app.CUSHION_SIZES)
+    return sum(
+        legacy_ready_count_for_variant(app, stage_key, size_label=size_label, shape_no=shape_no)
+        for size_label in app.CUSHION_SIZES
+        for shape_no in app.CUSHION_SHAPES
+    )
+
+
+def legacy_stock_summary(app):
+    summary = {}
+    for size_label in app.CUSHION_SIZES:
+        entry = app.TableStock.query.filter_by(type=app.cushion_stock_key(size_label)).first()
+        summary[size_label] = entry.count if entry else 0
+    return summary
+
+
+def legacy_build_context(app, include_timing=False, worker_name=None, batch_number=None):
+    """The pre-batching builder, minus the highlight pass both versions share."""
+
+    def timing(stage_key, **variant):
+        if not include_timing:
+            return None
+        return legacy_variant_timing(app, stage_key, worker_name=worker_name, batch_number=batch_number, **variant)
+
+    def entry(label, button_label, size_label, shape_no, end_type, count, count_label, variant_timing):
+        return {
+            "label": label, "button_label": button_label, "size_label": size_label, "shape_no": shape_no,
+            "end_type": end_type, "count": count, "count_label": count_label, "timing": variant_timing,
+        }
+
+    stage_context = []
+    for stage in app.CUSHION_WORKFLOW_STAGES:
+        key = stage["key"]
+        groups = []
+        ready_bundle_count = 0
+        if stage["variant"] == app.CUSHION_STAGE_PLAIN:
+            count = app.cushion_count_value(key)
+            groups.append({"label": stage["short_label"], "variants": [entry(
+                stage["short_label"], f"+1 {stage['short_label']}", "", 0, "", count, f"Current {count}", timing(key),
+            )]})
+        elif stage["variant"] == app.CUSHION_STAGE_END_TYPE:
+            variants = []
+            for end_type in app.CUSHION_END_TYPES:
+                count = app.cushion_count_value(key, end_type=end_type)
+                variants.append(entry(
+                    end_type, f"+1 {end_type}", "", 0, end_type, count, f"Stock {count}", timing(key, end_type=end_type),
+                ))
+            groups.append({"label": "Rubber ends", "variants": variants})
+        elif stage["variant"] == app.CUSHION_STAGE_SIZE_ONLY:
+            variants = []
+            stock_summary = legacy_stock_summary(app)
+            for size_label in app.CUSHION_SIZES:
+                count = stock_summary.get(size_label, 0)
+                ready_bundle_count += legacy_ready_bundle_count(app, size_label)
+                variants.append(entry(
+                    f"{size_label} Set", f"+1 {size_label} Set", size_label, 0, "", count, "",
+                    timing(key, size_label=size_label),
+                ))
+            groups.append({"label": "Completed sets", "variants": variants})
+        else:
+            for size_label in app.CUSHION_SIZES:
+                variants = []
+                for shape_no in app.CUSHION_SHAPES:
+                    count = app.cushion_count_value(key, size_label=size_label, shape_no=shape_no)
+                    variants.append(entry(
+                        f"Shape {shape_no}", f"+1 {size_label} S{shape_no}", size_label, shape_no, "", count,
+                        f"Current {count}", timing(key, size_label=size_label, shape_no=shape_no),
+                    ))
+                groups.append({"label": size_label, "variants": variants})
+        stage_context.append({
+            "key": key,
+            "groups": groups,
+            "ready_to_work_count": legacy_ready_count_for_stage(app, key),
+            "ready_bundle_count": ready_bundle_count,
+        })
+    return stage_context
+
+
+def board_summary(stage_context):
+    return [
+        {field: stage[field] for field in ("key", "groups", "ready_to_work_count", "ready_bundle_count")}
+        for stage in stage_context
+    ]
+
+
+def all_variants(app):
+    for stage in app.CUSHION_WORKFLOW_STAGES:
+        if stage["variant"] == app.CUSHION_STAGE_PLAIN:
+            yield stage, "", 0, ""
+        elif stage["variant"] == app.CUSHION_STAGE_END_TYPE:
+            for end_type in app.CUSHION_END_TYPES:
+                yield stage, "", 0, end_type
+        elif stage["variant"] == app.CUSHION_STAGE_SIZE_ONLY:
+            for size_label in app.CUSHION_SIZES:
+                yield stage, size_label, 0, ""
+        else:
+            for size_label in app.CUSHION_SIZES:
+                for shape_no in app.CUSHION_SHAPES:
+                    yield stage, size_label, shape_no, ""
+
+
+def seed(app, log_rows, rng):
+    db = app.db
+    db.session.query(app.CushionWorkflowLog).delete()
+    db.session.query(app.CushionWorkflowCount).delete()
+    variants = list(all_variants(app))
+    db.session.execute(app.CushionWorkflowCount.__table__.insert(), [
+        {
+            "stage_key": stage["key"], "size_label": size_label, "shape_no": shape_no, "end_type": end_type,
+            "count": rng.randint(0, 40), "updated_at": app.london_now(),
+        }
+        for stage, size_label, shape_no, end_type in variants
+        if rng.random() < 0.8
+    ])
+    for size_label in app.CUSHION_SIZES:
+        stock_type = app.cushion_stock_key(size_label)
+        entry = app.TableStock.query.filter_by(type=stock_type).first()
+        if entry is None:
+            db.session.add(app.TableStock(type=stock_type, count=rng.randint(0, 20)))
+    started = app.london_now() - timedelta(days=60)
+    rows = []
+    for number in range(log_rows):
+        stage, size_label, shape_no, end_type = rng.choice(variants)
+        rows.append({
+            "action_type": "add" if rng.random() < 0.9 else "correction",
+            "stage_key": stage["key"], "stage_label": stage["label"],
+            "size_label": size_label, "shape_no": shape_no, "end_type": end_type,
+            "worker": rng.choice(WORKERS), "delta": 1, "count_after": 1,
+            "seconds_taken": rng.choice([None, 0, rng.randint(20, 900)]),
+            "batch_number": rng.choice(BATCHES),
+            # Ties on created_at check that both paths break them by id.
+            "created_at": started + timedelta(seconds=60 * (number // 2)),
+        })
+    db.session.execute(app.CushionWorkflowLog.__table__.insert(), rows)
+    # The bulk insert skips the log's mapper events, so rebuild the running timing stats.
+    app.rebuild_cushion_timing_stats(db.session.connection())
+    db.session.commit()
+
+
+def timed(app, function, repeats):
+    statements = []
+
+    def count(*_):
+        statements.append(1)
+
+    engine = app.db.engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        best = None
+        for _ in range(repeats):
+            statements.clear()
+            started = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return result, best * 1000, len(statements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log-rows", type=int, nargs="+", default=[2000, 20_000, 100_000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=21)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        os.environ["POOL_TRACKER_DATABASE_URI"] = "sqlite:///" + os.path.join(tempdir, "bench.db")
+        import flask_app
+
+        rng = random.Random(args.seed)
+        print(f"{'log rows':>9} {'filter':<14} {'legacy ms':>10} {'queries':>8} {'batched ms':>11} {'queries':>8}")
+        with flask_app.app.app_context():
+            flask_app.run_schema_migrations()
+            for log_rows in args.log_rows:
+                seed(flask_app, log_rows, rng)
+                for label, worker_name, batch_number in (
+                    ("all", None, None), ("batch 2", None, 2), ("Sam, batch 2", "Sam", 2),
+                ):
+                    legacy, legacy_ms, legacy_queries = timed(flask_app, lambda: legacy_build_context(
+                        flask_app, include_timing=True, worker_name=worker_name, batch_number=batch_number,
+                    ), args.repeats)
+                    batched, batched_ms, batched_queries = timed(flask_app, lambda: flask_app.build_cushion_stage_context(
+                        include_timing=True, worker_name=worker_name, batch_number=batch_number,
+                    ), args.repeats)
+                    if board_summary(batched) != board_summary(legacy):
+                        raise SystemExit(f"Boards differ for {log_rows} log rows, filter {label}")
+                    print(
+                        f"{log_rows:>9} {label:<14} {legacy_ms:>10.1f} {legacy_queries:>8} "
+                        f"{batched_ms:>11.1f} {batched_queries:>8}"
+                    )
+            flask_app.db.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
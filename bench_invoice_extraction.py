@@ -0,0 +1,77 @@
+"""Invoice extraction: serial request-thread parsing vs the process-pool pipeline.
+
+Builds a batch of synthetic invoices and extracts them the pre-pipeline way
+(one after another), on the pool, and again from a warm content-hash cache.
+``--parse-ms`` adds a fixed per-file cost standing in for PDF text or OCR
+work, which is where the pool pays off. Run with
+``python bench_invoice_extraction.py [--files 20] [--parse-ms 400]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import functools
+import os
+import tempfile
+import time
+
+from invoice_extraction import ExtractionCache, ExtractionPipeline
+from packaging_planner import extract_invoice_bytes
+
+
+def slow_extract(filename, data, parse_ms):
+    time.sleep(parse_ms / 1000)
+    return extract_invoice_bytes(filename.replace(".pdf", ".txt"), data)
+
+
+def build_files(count):
+    lines = [
+        "2 x 7ft Champion Pool Table Black",
+        "1 x 6ft Lite Pool Table Grey Oak",
+        "3 x 7ft League Pool Table Rustic Oak",
+    ]
+    return [
+        (f"invoice-{number:02d}.pdf", ("\n".join(lines[: 1 + number % 3]) + f"\nPO {number}\n").encode())
+        for number in range(count)
+    ]
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--parse-ms", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    files = build_files(args.files)
+    extractor = functools.partial(slow_extract, parse_ms=args.parse_ms)
+    serial_ms, serial = timed(lambda: [extractor(filename, data) for filename, data in files])
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        cache = ExtractionCache(os.path.join(tempdir, "cache.db"))
+        pipeline = ExtractionPipeline(max_workers=args.workers, timeout_seconds=60, cache=cache, extractor=extractor)
+        try:
+            # Start the workers up front; a long-running server pays this once.
+            pipeline._get_pool()
+            pooled_ms, pooled = timed(lambda: pipeline.run(files))
+            cached_ms, cached = timed(lambda: pipeline.run(files))
+        finally:
+            pipeline.close()
+
+    item_counts = [len(items) for items, _ in serial]
+    assert [len(items) for items, _ in pooled] == item_counts
+    assert [len(items) for items, _ in cached] == item_counts
+    print(f"{args.files} files, {args.parse_ms} ms simulated parse each, {args.workers} workers")
+    print(f"{'serial':<10} {serial_ms:>9.0f} ms")
+    print(f"{'pool':<10} {pooled_ms:>9.0f} ms")
+    print(f"{'cached':<10} {cached_ms:>9.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
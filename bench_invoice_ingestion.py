@@ -0,0 +1,143 @@
+"""Spreadsheet/CSV invoice ingestion: whole-file parsing vs the streaming path.
+
+Writes a synthetic supplier export (100k rows by default) as CSV and XLSX,
+then parses it in a fresh child process per mode so each peak RSS figure
+stands alone:
+
+- ``legacy``: decode the whole file, ``list(csv.reader(...))``, build an item per row
+- ``stream-all``: streaming rows with no item cap, for raw throughput
+- ``upload``: what an upload runs in the extraction pool, ``extract_invoice_bytes`` on
+  the whole file's bytes (uploads are capped at 10 MB) with the default item cap
+
+Run with ``python bench_invoice_ingestion.py [--rows 100000]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["Order number", "Description", "Size", "Colour", "Qty", "Notes"])
+        for number in range(rows):
+            writer.writerow([
+                f"PO{100000 + number // 50}",
+                f"{'7ft' if number % 2 else '6ft'} Champion Pool Table - Rustic Oak finish #{number}",
+                "", "", number % 5 + 1, "Deliver to warehouse door 3, call ahead",
+            ])
+
+
+def write_xlsx(path, rows):
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(["Order number", "Description", "Size", "Colour", "Qty", "Notes"])
+    for number in range(rows):
+        sheet.append([
+            f"PO{100000 + number // 50}",
+            f"{'7ft' if number % 2 else '6ft'} Champion Pool Table - Rustic Oak finish #{number}",
+            None, None, number % 5 + 1, "Deliver to warehouse door 3, call ahead",
+        ])
+    workbook.save(path)
+
+
+def legacy_extract(filename, data):
+    """The pre-streaming CSV/XLSX path, kept here for comparison."""
+    import packaging_planner
+
+    if filename.endswith(".csv"):
+        text = packaging_planner._decode_text(data)
+        try:
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        rows = list(csv.reader(io.StringIO(text), dialect))
+        return packaging_planner.items_from_rows(rows, filename, limit=None)
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    items = []
+    for sheet in workbook.worksheets:
+        rows = [list(row) for row in sheet.iter_rows(values_only=True)]
+        items.extend(packaging_planner.items_from_rows(rows, filename, limit=None))
+    return items
+
+
+def run_child(mode, path):
+    import packaging_planner
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    filename = os.path.basename(path)
+    started = time.perf_counter()
+    if mode == "legacy":
+        with open(path, "rb") as handle:
+            items = legacy_extract(filename, handle.read())
+    elif mode == "stream-all":
+        with open(path, "rb") as handle:
+            if filename.endswith(".csv"):
+                rows = packaging_planner.iter_csv_rows(handle)
+                items = packaging_planner.items_from_rows(rows, filename, limit=None)
+            else:
+                import openpyxl
+
+                workbook = openpyxl.load_workbook(handle, read_only=True, data_only=True)
+                items = []
+                for sheet in workbook.worksheets:
+                    items.extend(packaging_planner.items_from_rows(
+                        sheet.iter_rows(values_only=True), filename, limit=None
+                    ))
+    else:
+        with open(path, "rb") as handle:
+            data = handle.read()
+        items, _ = packaging_planner.extract_invoice_bytes(filename, data)
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"items": len(items), "seconds": elapsed, "extra_rss_kb": peak_kb - baseline_kb}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        paths = [os.path.join(tempdir, "export.csv"), os.path.join(tempdir, "export.xlsx")]
+        write_csv(paths[0], args.rows)
+        write_xlsx(paths[1], args.rows)
+        print(f"{args.rows:,} data rows")
+        print(f"{'file':<6} {'mode':<11} {'items':>7} {'seconds':>8} {'items/s':>9} {'peak RSS +MB':>13}")
+        for path in paths:
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            for mode in ("legacy", "stream-all", "upload"):
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", mode, path],
+                    check=True, capture_output=True, text=True,
+                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                rate = result["items"] / result["seconds"]
+                print(
+                    f"{os.path.splitext(path)[1][1:]:<6} {mode:<11} {result['items']:>7} "
+                    f"{result['seconds']:>8.2f} {rate:>9,.0f} {result['extra_rss_kb'] / 1024:>13.1f}"
+                )
+            print(f"       ({size_mb:.1f} MB file)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Invoice text and row parsing throughput on multi-thousand-line invoices.
+
+Builds synthetic text invoices (one product per line, as pasted or pulled
+from a PDF) and CSV-style rows, then reports lines per second for
+``items_from_text`` and ``items_from_rows``. ``cold`` clears the inference
+caches before every run; ``warm`` parses the same invoice again, as when a
+file is re-uploaded or a supplier sends the same lines week after week. Run
+with ``python bench_invoice_text_parsing.py [--lines 2000 10000]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from packaging_planner import clear_inference_cache, items_from_rows, items_from_text
+
+
+SIZES = ["6ft", "7ft", "7 ft"]
+MODELS = ["Champion", "League", "Lite", "Premium Edition"]
+COLOURS = ["Black", "Grey Oak", "Rustic Oak", "Rustic Black", "Stone", "White", "Blue"]
+KINDS = ["Pool Table", "Pool Table", "Pool Table", "Top Rail Replacement", "Cushion Set", "Table Body Only"]
+
+
+def invoice_rows(count, seed):
+    rng = random.Random(seed)
+    return [
+        [
+            f"PO{100000 + number // 25}",
+            f"{rng.choice(SIZES)} {rng.choice(MODELS)} {rng.choice(KINDS)} {rng.choice(COLOURS)}",
+            str(rng.randint(1, 6)),
+        ]
+        for number in range(count)
+    ]
+
+
+def text_invoice(rows):
+    lines = ["Invoice 2041", "Delivery address: Unit 4, Harbour Road"]
+    lines.extend(f"{quantity} x {description} {po_number} £{120 * int(quantity)}.00" for po_number, description, quantity in rows)
+    lines.append("Terms and conditions apply")
+    return "\n".join(lines)
+
+
+def best_of(function, runs, setup=None):
+    best = None
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="+", default=[2000, 10_000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'input':<6} {'lines':>7} {'items':>7} {'cold lines/s':>13} {'warm lines/s':>13}")
+    for count in args.lines:
+        rows = invoice_rows(count, seed=count)
+        text = text_invoice(rows)
+        table = [["Order number", "Description", "Qty"]] + rows
+        cases = [
+            ("text", lambda: items_from_text(text, "invoice.txt")),
+            ("rows", lambda: items_from_rows(table, "invoice.csv", limit=None)),
+        ]
+        for name, function in cases:
+            items = function()
+            cold = best_of(function, args.runs, setup=clear_inference_cache)
+            function()
+            warm = best_of(function, args.runs)
+            print(f"{name:<6} {count:>7} {len(items):>7} {count / cold:>13,.0f} {count / warm:>13,.0f}")
+
+
+if __name__ == "__main__":
+    main()
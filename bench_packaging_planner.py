@@ -0,0 +1,324 @@
+"""Packaging planner benchmark and slowdown check.
+
+Times invoice extraction (CSV, XLSX, DOCX, text PDF and image files built
+on the fly) and the planning steps ``build_requirements``,
+``generate_packaging``, ``regenerate_packaging`` and ``validate_packaging``
+on synthetic item lists of 1 to 10,000 lines. Everything runs offline; the
+image case times OCR preprocessing only when the tesseract binary is not
+installed.
+
+Each case reports the best of several runs. ``--update`` stores the results
+as the baseline; ``--check`` compares against it and exits non-zero when a
+case is slower than the baseline by more than ``--tolerance`` (and by at
+least a millisecond). Baselines are per machine, so refresh them after
+moving to new hardware. Run with
+``python bench_packaging_planner.py [--quick] [--check | --update]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import csv
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import time
+
+from packaging_planner import (
+    build_requirements,
+    clear_inference_cache,
+    clear_planning_cache,
+    extract_invoice_bytes,
+    generate_packaging,
+    normalise_config,
+    normalise_items,
+    regenerate_packaging,
+    validate_packaging,
+)
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_packaging_planner_baseline.json")
+FILE_ROWS = (10, 100, 1000)
+PLAN_LINES = (1, 10, 100, 1000, 10_000)
+QUICK_PLAN_LINES = (1, 10, 100, 1000)
+# Keep repeating a case until it has used this much time, so fast cases get a stable best-of.
+MIN_CASE_SECONDS = 0.3
+MAX_RUNS = 50
+# Slowdowns smaller than this are timer noise however large the ratio.
+MIN_FLAGGED_SLOWDOWN_SECONDS = 0.001
+
+COLOURS = ["Black", "Grey Oak", "Rustic Oak", "Stone", "Blue", ""]
+MODELS = ["Champion", "League", "Lite", "Premium Edition"]
+ITEM_TYPES = ["complete_table"] * 6 + ["body_only", "top_rail_only", "cushion_only", "legs_only"]
+
+
+def invoice_rows(count):
+    rng = random.Random(count)
+    return [
+        [
+            f"PO{100000 + number // 20}",
+            f"{rng.choice(['6ft', '7ft'])} {rng.choice(MODELS)} Pool Table {rng.choice(COLOURS[:-1])}",
+            rng.randint(1, 6),
+        ]
+        for number in range(count)
+    ]
+
+
+def csv_invoice(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["Order number", "Description", "Qty"])
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def xlsx_invoice(rows):
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Order number", "Description", "Qty"])
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def docx_invoice(rows):
+    from docx import Document
+
+    document = Document()
+    document.add_paragraph("Invoice")
+    table = document.add_table(rows=1, cols=3)
+    for cell, heading in zip(table.rows[0].cells, ["Order number", "Description", "Qty"]):
+        cell.text = heading
+    for row in rows:
+        for cell, value in zip(table.add_row().cells, row):
+            cell.text = str(value)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def text_lines(rows):
+    return [f"{quantity} x {description} {po_number}" for po_number, description, quantity in rows]
+
+
+def pdf_invoice(rows, lines_per_page=50):
+    """A plain text PDF written by hand, so no PDF writer library is needed."""
+    lines = text_lines(rows)
+    pages = [lines[start:start + lines_per_page] for start in range(0, len(lines), lines_per_page)] or [[]]
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page_lines in pages:
+        escaped = (
+            line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            for line in page_lines
+        )
+        stream = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({line}) '" for line in escaped) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] /Count {len(page_ids)} >>"
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref_at = output.tell()
+    output.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        output.write(f"{offset:010d} 00000 n \n".encode())
+    output.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode())
+    return output.getvalue()
+
+
+def png_invoice(rows):
+    from PIL import Image, ImageDraw
+
+    lines = text_lines(rows)
+    image = Image.new("L", (1240, 40 + 22 * len(lines)), 255)
+    draw = ImageDraw.Draw(image)
+    for index, line in enumerate(lines):
+        draw.text((40, 20 + 22 * index), line, fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def plan_items(count):
+    rng = random.Random(count)
+    return normalise_items([
+        {
+            "id": f"item-{number}",
+            "description": "Pool table",
+            "size": rng.choice(["6ft", "7ft"]),
+            "model": rng.choice(MODELS),
+            "colour": rng.choice(COLOURS),
+            "quantity": rng.randint(1, 9),
+            "item_type": rng.choice(ITEM_TYPES),
+            "po_number": f"PO{rng.randint(1, max(1, count // 10))}",
+            "confidence": 1,
+        }
+        for number in range(count)
+    ])
+
+
+def best_of(function, setup=None):
+    """Fastest wall time of ``function()`` in seconds, after ``setup()`` before each run."""
+    best = None
+    spent = 0.0
+    runs = 0
+    while runs < MAX_RUNS and (runs < 3 or spent < MIN_CASE_SECONDS):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        spent += elapsed
+        runs += 1
+        if elapsed > MIN_CASE_SECONDS * 3:
+            break
+    return best
+
+
+def extraction_cases():
+    builders = {"csv": csv_invoice, "xlsx": xlsx_invoice, "docx": docx_invoice, "pdf": pdf_invoice}
+    has_tesseract = shutil.which("tesseract") is not None
+    for rows in FILE_ROWS:
+        data_rows = invoice_rows(rows)
+        for extension, builder in builders.items():
+            data = builder(data_rows)
+            filename = f"invoice.{extension}"
+            yield f"extract/{extension}/{rows}", lambda filename=filename, data=data: extract_invoice_bytes(filename, data)
+        # OCR of a tall image is slow, so the image case stops at 100 rows.
+        if rows > 100:
+            continue
+        data = png_invoice(data_rows)
+        if has_tesseract:
+            yield f"extract/png/{rows}", lambda data=data: extract_invoice_bytes("invoice.png", data)
+        else:
+            from PIL import Image
+
+            from invoice_ocr import preprocess_image
+
+            yield f"ocr-preprocess/png/{rows}", lambda data=data: preprocess_image(Image.open(io.BytesIO(data)))
+
+
+def clear_caches():
+    """Forget planned segments and normalised items, so a plan starts from nothing."""
+    clear_planning_cache()
+    clear_inference_cache()
+
+
+def planning_cases(line_counts):
+    config = normalise_config({})
+    for count in line_counts:
+        items = plan_items(count)
+        plan = generate_packaging(items, config)
+        pallets = plan["pallets"]
+        requirements = build_requirements(items, config)
+
+        # The save path: one manual move, then one item quantity edit on a warm cache.
+        manual = copy.deepcopy(pallets)
+        source = next((pallet for pallet in manual if pallet["lines"]), None)
+        if source is not None:
+            moved = dict(source["lines"][0], id="line-moved", quantity=1)
+            source["lines"][0]["quantity"] -= 1
+            manual[-1]["lines"].append(moved)
+            source["manual_override"] = manual[-1]["manual_override"] = True
+        edited = copy.deepcopy(items)
+        edited[0]["quantity"] += 1
+        save = lambda items=items, edited=edited, manual=manual: regenerate_packaging(
+            edited, config, existing_pallets=manual, baseline_items=items, baseline_config=config,
+        )
+
+        yield f"build_requirements/{count}", lambda items=items: build_requirements(items, config)
+        yield f"generate_packaging/{count}", (lambda items=items: generate_packaging(items, config)), clear_caches
+        # Each timed save follows the same save, which planned the edited
+        # segments and cached both layouts, as a later save of the plan finds them.
+        yield f"regenerate_packaging/{count}", save, save
+        yield f"validate_packaging/{count}", lambda items=items, pallets=pallets, requirements=requirements: (
+            validate_packaging(items, pallets, config, requirements=requirements)
+        )
+
+
+def run(quick):
+    results = {}
+    cases = list(extraction_cases()) + list(planning_cases(QUICK_PLAN_LINES if quick else PLAN_LINES))
+    for case in cases:
+        name, function = case[0], case[1]
+        setup = case[2] if len(case) > 2 else None
+        results[name] = best_of(function, setup)
+        print(f"{name:<34} {results[name] * 1000:>10.2f} ms", flush=True)
+    return results
+
+
+def check(results, baseline, tolerance):
+    slower = []
+    print()
+    print(f"{'case':<34} {'baseline ms':>12} {'now ms':>10} {'change':>8}")
+    for name, seconds in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            print(f"{name:<34} {'-':>12} {seconds * 1000:>10.2f} {'new':>8}")
+            continue
+        change = seconds / before - 1 if before else 0.0
+        flag = "  SLOWER" if change > tolerance and seconds - before > MIN_FLAGGED_SLOWDOWN_SECONDS else ""
+        print(f"{name:<34} {before * 1000:>12.2f} {seconds * 1000:>10.2f} {change:>+8.0%}{flag}")
+        if flag:
+            slower.append(name)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="skip the 10,000-line planning cases")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--check", action="store_true", help="fail when a case is slower than the baseline")
+    mode.add_argument("--update", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown before a case is flagged (0.5 = 50%%)")
+    args = parser.parse_args()
+
+    results = run(args.quick)
+    if args.update:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as handle:
+                baseline = json.load(handle)
+        baseline.update({
+            "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+            "python": platform.python_version(),
+            "recorded_at": time.strftime("%Y-%m-%d"),
+        })
+        baseline["results"] = {**baseline.get("results", {}), **{name: round(seconds, 6) for name, seconds in results.items()}}
+        with open(args.baseline, "w", encoding="utf-8") as handle:
+            json.dump(baseline, handle, indent=2, sort_keys=True)
+            handle.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+    elif args.check:
+        with open(args.baseline, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        slower = check(results, baseline, args.tolerance)
+        if slower:
+            print(f"\n{len(slower)} case(s) slower than the baseline by more than {args.tolerance:.0%}.")
+            sys.exit(1)
+        print("\nNo slowdowns beyond the tolerance.")
+
+
+if __name__ == "__main__":
+    main()
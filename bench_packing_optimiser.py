@@ -0,0 +1,99 @@
+"""Pallet layout: standard fill order vs the optimised packing mode.
+
+Generates synthetic multi-PO orders of several sizes, plans each with the
+standard layout and with ``optimise_layout``, and reports the body/rail
+pallets and mixed pallets saved plus the solve time. Timeouts fall back to
+the standard layout and are counted. Run with
+``python bench_packing_optimiser.py [--orders 50] [--budget 0.5]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import time
+
+from packaging_planner import (
+    _layout_score,
+    _plan_pallets,
+    build_requirements,
+    clear_planning_cache,
+    normalise_config,
+    normalise_items,
+    optimise_layout,
+)
+
+
+COLOURS = ["Black", "Grey Oak", "Rustic Oak", "Stone", "Blue", "Red", ""]
+ITEM_TYPES = ["complete_table"] * 6 + ["body_only", "top_rail_only", "cushion_only"]
+
+
+def build_order(rng, lines):
+    return [
+        {
+            "description": "Champion pool table",
+            "size": rng.choice(["6ft", "7ft", "7ft"]),
+            "colour": rng.choice(COLOURS),
+            "quantity": rng.randint(1, 9),
+            "item_type": rng.choice(ITEM_TYPES),
+            "po_number": f"PO{rng.randint(1, max(1, lines // 5))}",
+        }
+        for _ in range(lines)
+    ]
+
+
+def build_config(rng):
+    return normalise_config({
+        "body_capacity": rng.choice([3, 4, 5, 6, 8]),
+        "top_rail_capacity": rng.choice([10, 15, 20]),
+        "loose_rail_limit": rng.choice([6, 10, 15]),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=50, help="orders per size")
+    parser.add_argument("--budget", type=float, default=0.5, help="optimiser time budget in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{args.orders} orders per size, {args.budget:g}s budget")
+    print(
+        f"{'lines':>6} {'pallets':>8} {'saved':>6} {'mixed':>6} {'saved':>6} "
+        f"{'improved':>9} {'timeouts':>9} {'mean ms':>8} {'max ms':>8}"
+    )
+    for lines in (5, 20, 100, 500, 2000):
+        pallets = pallets_saved = mixed = mixed_saved = improved = timeouts = 0
+        timings = []
+        for _ in range(args.orders):
+            config = build_config(rng)
+            requirements = build_requirements(normalise_items(build_order(rng, lines)), config)
+            clear_planning_cache()
+            standard = [
+                pallet for pallet in _plan_pallets(requirements, config)
+                if pallet["pallet_type"] != "cushion"
+            ]
+            started = time.perf_counter()
+            result = optimise_layout(requirements, config, standard, time_budget=args.budget)
+            timings.append((time.perf_counter() - started) * 1000)
+
+            before = _layout_score(standard)
+            after = before
+            if result["pallets"] is not None:
+                after = _layout_score(result["pallets"][0] + result["pallets"][1])
+                improved += 1
+            timeouts += result["status"] == "timeout"
+            pallets += before[0]
+            pallets_saved += before[0] - after[0]
+            mixed += before[1]
+            mixed_saved += before[1] - after[1]
+        print(
+            f"{lines:>6} {pallets:>8} {pallets_saved:>6} {mixed:>6} {mixed_saved:>6} "
+            f"{improved:>9} {timeouts:>9} {statistics.mean(timings):>8.1f} {max(timings):>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Concurrent read/write throughput of the legacy vs performance SQLite profiles.
+
+Each worker process stands in for a gunicorn worker: readers run the
+latest-count lookup the inventory pages use, writers append count rows and
+commit. Run with ``python bench_sqlite_profile.py [--seconds 5]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from sqlite_profile import SQLITE_PRAGMA_PROFILES, apply_sqlite_pragmas, engine_options, resolve_pragmas
+
+
+PART_NAMES = [f"Part {index}" for index in range(40)]
+
+READ_SQL = text(
+    "SELECT count FROM printed_parts_count WHERE part_name = :part_name "
+    "ORDER BY date DESC, time DESC, id DESC LIMIT 1"
+)
+WRITE_SQL = text(
+    "INSERT INTO printed_parts_count (part_name, count, date, time) "
+    "VALUES (:part_name, :count, date('now'), time('now'))"
+)
+
+
+def make_engine(path, profile):
+    engine = create_engine(f"sqlite:///{path}", **engine_options())
+    pragmas = resolve_pragmas(profile)
+    event.listen(engine, "connect", lambda dbapi_connection, record: apply_sqlite_pragmas(dbapi_connection, pragmas))
+    return engine
+
+
+def seed_database(path, profile, rows):
+    engine = make_engine(path, profile)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE printed_parts_count ("
+            "id INTEGER PRIMARY KEY, part_name VARCHAR(100) NOT NULL, count INTEGER NOT NULL, "
+            "date DATE NOT NULL, time TIME NOT NULL)"
+        ))
+        conn.execute(
+            WRITE_SQL,
+            [{"part_name": PART_NAMES[index % len(PART_NAMES)], "count": index} for index in range(rows)],
+        )
+    engine.dispose()
+
+
+def worker(path, profile, role, seconds, start_at, results):
+    engine = make_engine(path, profile)
+    completed = errors = 0
+    index = os.getpid()
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = start_at + seconds
+    while time.time() < deadline:
+        index += 1
+        part_name = PART_NAMES[index % len(PART_NAMES)]
+        try:
+            if role == "read":
+                with engine.connect() as conn:
+                    conn.execute(READ_SQL, {"part_name": part_name}).first()
+            else:
+                with engine.begin() as conn:
+                    conn.execute(WRITE_SQL, {"part_name": part_name, "count": index})
+            completed += 1
+        except OperationalError:
+            errors += 1
+    engine.dispose()
+    results.put((role, completed, errors))
+
+
+def run_profile(profile, readers, writers, seconds, seed_rows):
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "bench.db")
+        seed_database(path, profile, seed_rows)
+        results = multiprocessing.Queue()
+        start_at = time.time() + 0.5
+        processes = [
+            multiprocessing.Process(target=worker, args=(path, profile, role, seconds, start_at, results))
+            for role in ["read"] * readers + ["write"] * writers
+        ]
+        for process in processes:
+            process.start()
+        totals = {"read": [0, 0], "write": [0, 0]}
+        for _ in processes:
+            role, completed, errors = results.get()
+            totals[role][0] += completed
+            totals[role][1] += errors
+        for process in processes:
+            process.join()
+    return {
+        "reads_per_second": totals["read"][0] / seconds,
+        "writes_per_second": totals["write"][0] / seconds,
+        "read_errors": totals["read"][1],
+        "write_errors": totals["write"][1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seed-rows", type=int, default=20000)
+    parser.add_argument("--profiles", nargs="+", default=["legacy", "performance"],
+                        choices=sorted(SQLITE_PRAGMA_PROFILES))
+    args = parser.parse_args()
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile")
+    print(f"{'profile':<12} {'reads/s':>10} {'writes/s':>10} {'read errs':>10} {'write errs':>10}")
+    for profile in args.profiles:
+        result = run_profile(profile, args.readers, args.writers, args.seconds, args.seed_rows)
+        print(
+            f"{profile:<12} {result['reads_per_second']:>10.0f} {result['writes_per_second']:>10.0f} "
+            f"{result['read_errors']:>10} {result['write_errors']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Cycle time, queue wait, idle gap and queue-drain figures for the CNC machines."""
+
+from __future__ import annotations
+
+from datetime import datetime, time, timedelta
+
+
+SHIFT_START = time(9, 0)
+SHIFT_END = time(17, 0)
+LUNCH_START = time(12, 30)
+LUNCH_END = time(13, 0)
+# A longer pause between two completions counts as the machine standing idle
+# rather than as one (slow) cutting cycle.
+DEFAULT_IDLE_GAP_SECONDS = 30 * 60
+
+
+def empty_day_stats():
+    return {
+        "runs": 0,
+        "cycle_count": 0,
+        "cycle_seconds": 0.0,
+        "idle_gap_count": 0,
+        "idle_seconds": 0.0,
+        "wait_seconds": 0.0,
+    }
+
+
+def summarise_machine_day(completions, idle_gap_seconds=DEFAULT_IDLE_GAP_SECONDS):
+    """Aggregate one machine's completions for one day.
+
+    ``completions`` are ``(completed_at, created_at, job_id)`` tuples. Returns
+    the day's spacing stats and ``{job_id: {"runs", "wait_seconds"}}``.
+    """
+    stats = empty_day_stats()
+    per_job = {}
+    previous_at = None
+    for completed_at, created_at, job_id in sorted(completions, key=lambda row: row[0]):
+        wait_seconds = max((completed_at - created_at).total_seconds(), 0.0) if created_at else 0.0
+        stats["runs"] += 1
+        stats["wait_seconds"] += wait_seconds
+        job_totals = per_job.setdefault(job_id, {"runs": 0, "wait_seconds": 0.0})
+        job_totals["runs"] += 1
+        job_totals["wait_seconds"] += wait_seconds
+        if previous_at is not None:
+            gap_seconds = (completed_at - previous_at).total_seconds()
+            if gap_seconds > idle_gap_seconds:
+                stats["idle_gap_count"] += 1
+                stats["idle_seconds"] += gap_seconds
+            else:
+                stats["cycle_count"] += 1
+                stats["cycle_seconds"] += gap_seconds
+        previous_at = completed_at
+    return stats, per_job
+
+
+def _shift_segments(day):
+    return (
+        (datetime.combine(day, SHIFT_START), datetime.combine(day, LUNCH_START)),
+        (datetime.combine(day, LUNCH_END), datetime.combine(day, SHIFT_END)),
+    )
+
+
+def shift_hours(day, start=None, end=None):
+    """Shift hours on ``day``, less lunch, that fall between ``start`` and ``end`` (either may be open)."""
+    total = timedelta()
+    for segment_start, segment_end in _shift_segments(day):
+        if start is not None:
+            segment_start = max(segment_start, start)
+        if end is not None:
+            segment_end = min(segment_end, end)
+        if segment_end > segment_start:
+            total += segment_end - segment_start
+    return total.total_seconds() / 3600
+
+
+# Hours in one full weekday shift (7.5).
+SHIFT_HOURS = shift_hours(datetime.min.date())
+
+
+def add_work_hours(start, hours):
+    """The local time ``hours`` of weekday shift time after ``start``."""
+    remaining = timedelta(hours=max(hours, 0))
+    day = start.date()
+    while True:
+        if day.weekday() < 5:
+            for segment_start, segment_end in _shift_segments(day):
+                segment_start = max(segment_start, start)
+                if segment_start >= segment_end:
+                    continue
+                available = segment_end - segment_start
+                if remaining <= available:
+                    return segment_start + remaining
+                remaining -= available
+        day += timedelta(days=1)
+
+
+def combine_stats(rows):
+    totals = empty_day_stats()
+    for row in rows:
+        for key in totals:
+            totals[key] += row.get(key) or 0
+    return totals
+
+
+def machine_metrics(stats, queued_runs, current_time):
+    """Averages and a drain projection for one machine from summed day stats."""
+    runs = stats["runs"]
+    avg_cycle_seconds = stats["cycle_seconds"] / stats["cycle_count"] if stats["cycle_count"] else None
+    metrics = {
+        "runs": runs,
+        "avg_cycle_minutes": round(avg_cycle_seconds / 60, 1) if avg_cycle_seconds else None,
+        "avg_queue_wait_hours": round(stats["wait_seconds"] / runs / 3600, 1) if runs else None,
+        "idle_gap_count": stats["idle_gap_count"],
+        "idle_hours": round(stats["idle_seconds"] / 3600, 1),
+        "queued_runs": queued_runs,
+        "drain_work_hours": None,
+        "drain_finish": None,
+    }
+    if queued_runs == 0:
+        metrics["drain_work_hours"] = 0.0
+        metrics["drain_finish"] = current_time
+    elif avg_cycle_seconds:
+        drain_hours = queued_runs * avg_cycle_seconds / 3600
+        metrics["drain_work_hours"] = round(drain_hours, 1)
+        metrics["drain_finish"] = add_work_hours(current_time, drain_hours)
+    return metrics
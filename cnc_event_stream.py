@@ -0,0 +1,186 @@
+"""In-process fan-out of an append-only event log to Server-Sent Event streams."""
+
+from __future__ import annotations
+
+import collections
+import json
+import os
+import threading
+import time
+
+
+class CursorExpired(Exception):
+    """The client's last event id is older than the log still holds."""
+
+
+def format_sse(data, event_id=None, event_type=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event_type:
+        lines.append(f"event: {event_type}")
+    payload = data if isinstance(data, str) else json.dumps(data, separators=(",", ":"))
+    lines.extend(f"data: {line}" for line in payload.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+class EventFanout:
+    """Poll an event log once per process and hand new rows to every waiting stream.
+
+    ``fetch_after(after_id, limit)`` returns events (dicts with an ``id``) in id
+    order; ``fetch_bounds()`` returns the ``(oldest_id, newest_id)`` still
+    stored, or ``(None, None)`` when the log is empty. Recent events stay in a
+    ring buffer so reconnecting clients replay from memory; only a client whose
+    cursor predates the buffer costs an extra read of its own.
+    """
+
+    def __init__(self, fetch_after, fetch_bounds, poll_interval=1.0, buffer_size=500):
+        self.fetch_after = fetch_after
+        self.fetch_bounds = fetch_bounds
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self._condition = threading.Condition()
+        self._poll_lock = threading.RLock()
+        self._buffer = collections.deque()
+        self._floor = None
+        self._last_id = None
+        self._subscribers = 0
+        self._wake = False
+        self._stopping = False
+        self._thread = None
+        self._thread_pid = None
+        self._counters = {"polls": 0, "poll_errors": 0, "catch_up_reads": 0, "delivered": 0}
+
+    def wake(self):
+        """Poll now instead of at the next interval (called after a local commit)."""
+        with self._condition:
+            self._wake = True
+            self._condition.notify_all()
+
+    def subscribe(self):
+        self.ensure_started()
+        with self._condition:
+            self._subscribers += 1
+            self._condition.notify_all()
+
+    def unsubscribe(self):
+        with self._condition:
+            self._subscribers = max(0, self._subscribers - 1)
+
+    def events_after(self, after_id, timeout):
+        """Events newer than ``after_id``, waiting up to ``timeout`` seconds for one."""
+        self.ensure_started()
+        if after_id is None or after_id < 0:
+            raise CursorExpired(after_id)
+        with self._condition:
+            behind = after_id > self._last_id
+        if behind:
+            # Cursor came from a page rendered after our last poll.
+            self._refresh()
+        with self._condition:
+            if after_id > self._last_id:
+                raise CursorExpired(after_id)
+            deadline = time.monotonic() + timeout
+            while after_id == self._last_id and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            if after_id >= self._floor:
+                events = [event for event in self._buffer if event["id"] > after_id]
+                self._counters["delivered"] += len(events)
+                return events
+        events = self._catch_up(after_id)
+        with self._condition:
+            self._counters["delivered"] += len(events)
+        return events
+
+    def stats(self):
+        with self._condition:
+            counters = dict(self._counters)
+            counters.update(
+                subscribers=self._subscribers,
+                buffered=len(self._buffer),
+                last_id=self._last_id,
+                running=bool(self._thread and self._thread.is_alive()),
+            )
+        return counters
+
+    def ensure_started(self):
+        if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+            return
+        with self._condition:
+            if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            # A forked worker inherits the parent's buffer but not its thread.
+            self._buffer.clear()
+            self._subscribers = 0
+            newest_id = self.fetch_bounds()[1] or 0
+            self._floor = self._last_id = newest_id
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="cnc-event-fanout", daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    # -- internals ------------------------------------------------------
+
+    def _catch_up(self, after_id):
+        with self._condition:
+            self._counters["catch_up_reads"] += 1
+        oldest_id, _ = self.fetch_bounds()
+        if oldest_id is None or after_id < oldest_id - 1:
+            raise CursorExpired(after_id)
+        return self.fetch_after(after_id, self.buffer_size)
+
+    def _refresh(self):
+        with self._poll_lock:
+            newest_id = self.fetch_bounds()[1] or 0
+            with self._condition:
+                if newest_id - self._last_id > self.buffer_size:
+                    # Nobody was listening while the log moved on; start the buffer afresh.
+                    self._buffer.clear()
+                    self._floor = self._last_id = newest_id
+                    self._condition.notify_all()
+                    return
+            self._poll_once()
+
+    def _poll_once(self):
+        with self._poll_lock:
+            with self._condition:
+                after_id = self._last_id
+            try:
+                events = self.fetch_after(after_id, self.buffer_size)
+            except Exception:
+                with self._condition:
+                    self._counters["poll_errors"] += 1
+                return
+            with self._condition:
+                self._counters["polls"] += 1
+                if not events:
+                    return
+                self._buffer.extend(events)
+                self._last_id = events[-1]["id"]
+                while len(self._buffer) > self.buffer_size:
+                    self._floor = self._buffer.popleft()["id"]
+                self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # Idle processes (no open streams) do not touch the database.
+                while not self._stopping and not self._subscribers:
+                    self._condition.wait()
+                if not self._stopping and not self._wake:
+                    self._condition.wait(self.poll_interval)
+                if self._stopping:
+                    return
+                self._wake = False
+            self._poll_once()
@@ -0,0 +1,54 @@
+"""Chunked CSV text and gzip encoding for exports streamed to the client."""
+
+from __future__ import annotations
+
+import csv
+import io
+import zlib
+
+
+# Rows are buffered to about this many characters, so each chunk is one socket write.
+CSV_CHUNK_SIZE = 64 * 1024
+FILE_CHUNK_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+# zlib window bits that add a gzip header and trailer.
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def csv_chunks(rows, chunk_size=CSV_CHUNK_SIZE):
+    """Yield CSV text for ``rows`` in pieces of about ``chunk_size`` characters.
+
+    Only the current piece is held in memory, however many rows there are.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def file_chunks(path, chunk_size=FILE_CHUNK_SIZE):
+    """Yield a file's bytes in ``chunk_size`` pieces, closing it when done."""
+    with open(path, "rb") as handle:
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL, encoding="utf-8"):
+    """Gzip a stream of text or byte chunks into one gzip member, yielding output as it is produced."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode(encoding)
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -1,33 +1,68 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, make_response, send_from_directory, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify, has_request_context, stream_with_context, abort, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
+import click
 from sqlalchemy.exc import IntegrityError, OperationalError
 from datetime import datetime, timedelta, date, time, timezone
+from bisect import bisect_left
 from collections import defaultdict
+from functools import wraps
 from calendar import monthrange
-from sqlalchemy import func, extract, and_, or_, text
+from sqlalchemy import func, extract, and_, or_, text, event, select, insert, update, literal, case, tuple_, inspect as sa_inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import joinedload
+from sqlalchemy.schema import CreateIndex
 import requests
 import threading
 import os
 import re  # Add this import at the top of the file
 import csv
 import json
+import base64
+import binascii
 import uuid
 import html as html_lib
 from math import ceil, floor
-from io import StringIO, BytesIO
+from io import BytesIO
 from packaging_planner import (
     ITEM_TYPE_LABELS,
     SUPPORTED_EXTENSIONS,
     build_requirements as build_packaging_requirements,
     build_summary as build_packaging_summary,
-    extract_invoice_files,
     model_uses_lite_body as packaging_model_uses_lite_body,
     regenerate_packaging,
     normalise_config as normalise_packaging_config,
     normalise_items as normalise_packaging_items,
     validate_packaging,
 )
+from notification_dispatcher import NotificationDispatcher
+from invoice_extraction import ExtractionCache, ExtractionPipeline
+from invoice_ocr import configure_ocr
+from cnc_event_stream import CursorExpired, EventFanout, format_sse
+from csv_stream import csv_chunks, file_chunks, gzip_chunks
+from ttl_cache import TTLCache
+from cnc_analytics import (
+    DEFAULT_IDLE_GAP_SECONDS as CNC_IDLE_GAP_SECONDS,
+    SHIFT_HOURS as CNC_SHIFT_HOURS,
+    combine_stats as combine_cnc_day_stats,
+    machine_metrics as cnc_machine_metrics,
+    shift_hours as cnc_shift_hours,
+    summarise_machine_day as summarise_cnc_machine_day,
+)
+from timing_stats import (
+    add_timing_sample,
+    combine_timing_stats,
+    empty_timing_stats,
+    sketch_bucket,
+    sketch_quantiles,
+    timing_mean,
+    timing_standard_deviation,
+)
+from sqlite_profile import (
+    DEFAULT_SQLITE_PROFILE,
+    apply_sqlite_pragmas,
+    engine_options as sqlite_engine_options,
+    resolve_pragmas as resolve_sqlite_pragmas,
+)
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
@@ -37,12 +72,72 @@ STOCK_SNAPSHOT_INDEX_FILE = os.path.join(basedir, "stock_costs_snapshots.json")
 STOCK_SNAPSHOT_DELETED_WEEKS_FILE = os.path.join(basedir, "stock_costs_deleted_snapshot_weeks.json")
 STOCK_SNAPSHOT_DIR = os.path.join(basedir, "stock_costs_snapshots")
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'pool_table_tracker.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'POOL_TRACKER_DATABASE_URI',
+    'sqlite:///' + os.path.join(basedir, 'pool_table_tracker.db'),
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 if app.config.get('MAX_CONTENT_LENGTH') is None:
     app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
+# "performance" (WAL) or "legacy"; SQLITE_PRAGMAS overrides single pragmas.
+app.config.setdefault('SQLITE_PROFILE', os.environ.get('SQLITE_PROFILE', DEFAULT_SQLITE_PROFILE))
+app.config.setdefault('SQLITE_PRAGMAS', {})
+app.config.setdefault(
+    'SQLALCHEMY_ENGINE_OPTIONS', sqlite_engine_options(database_uri=app.config['SQLALCHEMY_DATABASE_URI'])
+)
 db = SQLAlchemy(app)
 
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    apply_sqlite_pragmas(
+        dbapi_connection,
+        resolve_sqlite_pragmas(app.config['SQLITE_PROFILE'], app.config['SQLITE_PRAGMAS']),
+    )
+
+
+with app.app_context():
+    event.listen(db.engine, "connect", _configure_sqlite_connection)
+
+app.config.setdefault('NTFY_URL', os.environ.get('NTFY_URL', 'https://ntfy.sh/PoolTableTrackerV2'))
+app.config.setdefault('NTFY_SPOOL_PATH', os.environ.get('NTFY_SPOOL_PATH', os.path.join(basedir, 'ntfy_spool.db')))
+notification_dispatcher = NotificationDispatcher(
+    app.config['NTFY_URL'],
+    spool_path=app.config['NTFY_SPOOL_PATH'],
+)
+
+app.config.setdefault('INVOICE_EXTRACTION_CACHE_PATH', os.path.join(basedir, 'invoice_extraction_cache.db'))
+app.config.setdefault('INVOICE_EXTRACTION_WORKERS', int(os.environ.get('INVOICE_EXTRACTION_WORKERS', 0)) or None)
+app.config.setdefault('INVOICE_EXTRACTION_TIMEOUT_SECONDS', 60)
+app.config.setdefault('INVOICE_OCR_CACHE_PATH', os.path.join(basedir, 'invoice_ocr_cache.db'))
+invoice_extraction_workers = app.config['INVOICE_EXTRACTION_WORKERS'] or min(4, os.cpu_count() or 1)
+invoice_extraction_pipeline = ExtractionPipeline(
+    max_workers=invoice_extraction_workers,
+    timeout_seconds=app.config['INVOICE_EXTRACTION_TIMEOUT_SECONDS'],
+    cache=ExtractionCache(app.config['INVOICE_EXTRACTION_CACHE_PATH']),
+    # Cores are split between extraction workers so their OCR page threads do not oversubscribe.
+    initializer=configure_ocr,
+    initargs=(
+        app.config['INVOICE_OCR_CACHE_PATH'],
+        max(1, (os.cpu_count() or 1) // invoice_extraction_workers),
+    ),
+)
+
+# CSV exports are gzip-encoded for clients that accept it; turn off when a proxy compresses instead.
+app.config.setdefault('CSV_EXPORT_GZIP', True)
+
+
+def send_ntfy_notification(message, title, priority=None, dedup_key=None):
+    """Queue an ntfy alert; delivery and retries happen on a background thread."""
+    queued = notification_dispatcher.enqueue(
+        message,
+        title=title,
+        priority=priority,
+        dedup_key=dedup_key,
+    )
+    if not queued:
+        print(f"Ntfy queue full, dropped notification: {title}")
+    return queued
+
 # Custom filter for absolute value
 @app.template_filter('abs')
 def abs_filter(value):
@@ -144,6 +239,33 @@ def safe_stock_snapshot_file_path(filename):
     return candidate
 
 
+CSV_EXPORT_BATCH_SIZE = 1000
+
+
+def csv_export_rows(query, batch_size=CSV_EXPORT_BATCH_SIZE):
+    """Iterate a column query's tuples in batches from an open cursor instead of loading every row."""
+    return query.yield_per(batch_size)
+
+
+def csv_gzip_accepted():
+    return bool(app.config['CSV_EXPORT_GZIP'] and request.accept_encodings['gzip'] > 0)
+
+
+def csv_stream_response(chunks, filename):
+    """Stream text or byte ``chunks`` as a CSV download, gzip-encoded when the client accepts it."""
+    use_gzip = csv_gzip_accepted()
+    response = Response(
+        stream_with_context(gzip_chunks(chunks) if use_gzip else chunks),
+        mimetype='text/csv',
+    )
+    # Werkzeug quotes the filename, so spaces, commas and quotes survive.
+    response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    response.vary.add('Accept-Encoding')
+    if use_gzip:
+        response.content_encoding = 'gzip'
+    return response
+
+
 def last_sunday(year, month):
     last_day = monthrange(year, month)[1]
     target = date(year, month, last_day)
@@ -219,7 +341,7 @@ def serial_is_lite(serial):
     return normalized.endswith("-L")
 
 
-def build_recent_weekly_size_history(records, reference_date, date_getter, size_getter, week_count=6):
+def build_recent_weekly_size_history(records, reference_date, date_getter, size_getter, week_count=6, count_getter=None):
     week_count = max(0, int(week_count or 0))
     if week_count == 0:
         return []
@@ -252,8 +374,9 @@ def build_recent_weekly_size_history(records, reference_date, date_getter, size_
         size_key = size_keys.get(str(size_getter(record) or "").strip().lower())
         if week_entry is None or size_key is None:
             continue
-        week_entry[size_key] += 1
-        week_entry["count"] += 1
+        count = count_getter(record) if count_getter else 1
+        week_entry[size_key] += count
+        week_entry["count"] += count
 
     return [
         history_by_start[week_start]
@@ -704,22 +827,7 @@ def reclassify_body_component_inventory(
         if abs(delta) < 1e-9:
             continue
 
-        latest_entry = (
-            PrintedPartsCount.query
-            .filter_by(part_name=part_name)
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-            .first()
-        )
-        if latest_entry:
-            current_count = latest_entry.count
-            canonical_name = latest_entry.part_name
-        else:
-            hardware_part = HardwarePart.query.filter(
-                func.lower(HardwarePart.name) == part_name.lower()
-            ).first()
-            current_count = hardware_part.initial_count if hardware_part else 0
-            canonical_name = hardware_part.name if hardware_part else part_name
-
+        canonical_name, current_count = current_printed_part_inventory(part_name)
         new_count = current_count + delta
         if new_count < 0 and not allows_negative_inventory(part_name):
             raise ValueError(
@@ -919,17 +1027,97 @@ BRAD_NAILS_UNITS_PER_STRIP = 4  # Track quarter-strip usage (0.25 = 1 unit, 0.5
 def allows_negative_inventory(part_name):
     return part_name in CHINESE_PARTS_ALLOW_NEGATIVE
 
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migration'
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# version -> (name, step). Steps must stay idempotent; when one changes, register
+# the new work under a new version instead of editing an applied one.
+SCHEMA_MIGRATIONS = {}
+
+
+def schema_migration(version, name):
+    """Register an ensure_* step with the startup migration runner.
+
+    Once run_schema_migrations() has brought the database up to date the
+    decorated function is a no-op, so request handlers can keep calling it.
+    """
+    def decorator(step):
+        if version in SCHEMA_MIGRATIONS:
+            raise ValueError(f"Schema migration version {version} is already registered.")
+        SCHEMA_MIGRATIONS[version] = (name, step)
+
+        @wraps(step)
+        def ensure(*args, **kwargs):
+            if app.config.get("_schema_migrations_applied"):
+                return None
+            return step(*args, **kwargs)
+
+        return ensure
+    return decorator
+
+
+def run_schema_migrations(force=False):
+    """Apply registered steps the database has not recorded; returns their names."""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    applied_versions = set()
+    if not force:
+        applied_versions = set(db.session.execute(select(SchemaMigration.version)).scalars())
+
+    applied_now = []
+    for version in sorted(SCHEMA_MIGRATIONS):
+        if version in applied_versions:
+            continue
+        name, step = SCHEMA_MIGRATIONS[version]
+        step()
+        # Other gunicorn workers may run the same idempotent step concurrently.
+        db.session.execute(
+            sqlite_insert(SchemaMigration.__table__)
+            .values(version=version, name=name, applied_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=["version"])
+        )
+        db.session.commit()
+        applied_now.append(name)
+
+    app.config["_schema_migrations_applied"] = True
+    return applied_now
+
+
+@schema_migration(1, "base_tables")
+def ensure_base_tables():
+    db.create_all()
+
+
+def create_missing_index(index):
+    # SQLite does not reflect expression indexes, so checkfirst cannot see them.
+    with db.engine.begin() as conn:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+@schema_migration(15, "hot_query_indexes")
+def ensure_declared_indexes():
+    """Create model-declared indexes missing from tables that predate them."""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            create_missing_index(index)
+
+
 # Models
 class CompletedTable(db.Model):
     __tablename__ = 'completed_table'
     id = db.Column(db.Integer, primary_key=True)
-    worker = db.Column(db.String(50), nullable=False)
+    # active_history on the daily_production_rollup key columns keeps the old
+    # value when an expired row is edited, so the build leaves its old rollup key.
+    worker = db.column_property(db.Column(db.String(50), nullable=False), active_history=True)
     start_time = db.Column(db.String(5), nullable=False)  # Store as string "HH:MM"
     finish_time = db.Column(db.String(5), nullable=False)
-    serial_number = db.Column(db.String(20), unique=True, nullable=False)
+    serial_number = db.column_property(db.Column(db.String(20), unique=True, nullable=False), active_history=True)
     issue = db.Column(db.String(100))
     lunch = db.Column(db.String(3), default='No')
-    date = db.Column(db.Date, default=date.today, nullable=False)
+    date = db.column_property(db.Column(db.Date, default=date.today, nullable=False, index=True), active_history=True)
 
 class TableStock(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -949,7 +1137,11 @@ class TableStockLog(db.Model):
     count_before = db.Column(db.Integer, nullable=False, default=0)
     count_after = db.Column(db.Integer, nullable=False, default=0)
     note = db.Column(db.String(200), nullable=True)
-    created_at = db.Column(db.DateTime, nullable=False, default=london_now)
+    # active_history keeps the old time when an expired row is edited, so a row
+    # moved later still drops the count checkpoints it leaves.
+    created_at = db.column_property(
+        db.Column(db.DateTime, nullable=False, default=london_now, index=True), active_history=True
+    )
 
 
 TABLE_STOCK_ACTION_LABELS = {
@@ -966,6 +1158,7 @@ TABLE_STOCK_ACTION_LABELS = {
 }
 
 
+@schema_migration(2, "table_stock_log")
 def ensure_table_stock_log_table():
     if app.config.get("_table_stock_log_table_ready"):
         return
@@ -1053,15 +1246,20 @@ class Issue(db.Model):
 
 class TopRail(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    worker = db.Column(db.String(50), nullable=False)
+    # Rollup key columns keep their old value on edit (see CompletedTable).
+    worker = db.column_property(db.Column(db.String(50), nullable=False), active_history=True)
     start_time = db.Column(db.String(10), nullable=False)
     finish_time = db.Column(db.String(10), nullable=False)
-    date = db.Column(db.Date, default=datetime.utcnow, nullable=False)
-    serial_number = db.Column(db.String(20), unique=True, nullable=False)
+    date = db.column_property(db.Column(db.Date, default=datetime.utcnow, nullable=False, index=True), active_history=True)
+    serial_number = db.column_property(db.Column(db.String(20), unique=True, nullable=False), active_history=True)
     issue = db.Column(db.String(50), nullable=False)
     lunch = db.Column(db.String(3), default='No')
 
 class WoodCount(db.Model):
+    __table_args__ = (
+        db.Index('ix_wood_count_section_date_time', 'section', 'date', 'time'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     section = db.Column(db.String(50), nullable=False)  
     count = db.Column(db.Integer, default=0, nullable=False)
@@ -1081,6 +1279,10 @@ class MDFInventory(db.Model):
     plain_mdf_36 = db.Column(db.Integer, nullable=False, default=0)
 
 class PrintedPartsCount(db.Model):
+    __table_args__ = (
+        db.Index('ix_printed_parts_count_part_date_time', 'part_name', 'date', 'time'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     part_name = db.Column(db.String(50), nullable=False)
     count = db.Column(db.Integer, default=1)
@@ -1088,6 +1290,13 @@ class PrintedPartsCount(db.Model):
     time = db.Column(db.Time, nullable=False)
 
 
+# The inventory projection looks parts up case-insensitively, by lower(part_name).
+db.Index(
+    'ix_printed_parts_count_part_key_date_time',
+    func.lower(PrintedPartsCount.part_name), PrintedPartsCount.date, PrintedPartsCount.time,
+)
+
+
 class GullyConversionLog(db.Model):
     __tablename__ = 'gully_conversion_log'
 
@@ -1115,18 +1324,198 @@ def new_printed_parts_snapshot(part_name, count, recorded_at=None):
     )
 
 
-def current_printed_part_inventory(part_name):
-    """Return the canonical name and current snapshot/baseline count for a part."""
-    latest_entry = (
-        PrintedPartsCount.query
-        .filter(func.lower(PrintedPartsCount.part_name) == part_name.lower())
-        .order_by(
-            PrintedPartsCount.date.desc(),
-            PrintedPartsCount.time.desc(),
-            PrintedPartsCount.id.desc(),
+class CurrentPartInventory(db.Model):
+    """Latest PrintedPartsCount snapshot per part, maintained on every flush."""
+    __tablename__ = 'current_part_inventory'
+
+    part_key = db.Column(db.String(100), primary_key=True)  # lower-cased part name
+    part_name = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    date = db.Column(db.Date, nullable=False)
+    time = db.Column(db.Time, nullable=False)
+    source_id = db.Column(db.Integer, nullable=False)
+
+
+def _current_part_inventory_source_select(part_key=None):
+    ranked = select(
+        func.lower(PrintedPartsCount.part_name).label("part_key"),
+        PrintedPartsCount.part_name.label("part_name"),
+        func.coalesce(PrintedPartsCount.count, 0).label("count"),
+        PrintedPartsCount.date.label("date"),
+        PrintedPartsCount.time.label("time"),
+        PrintedPartsCount.id.label("source_id"),
+        func.row_number().over(
+            partition_by=func.lower(PrintedPartsCount.part_name),
+            order_by=(
+                PrintedPartsCount.date.desc(),
+                PrintedPartsCount.time.desc(),
+                PrintedPartsCount.id.desc(),
+            ),
+        ).label("row_number"),
+    )
+    if part_key is not None:
+        ranked = ranked.where(func.lower(PrintedPartsCount.part_name) == part_key)
+    ranked = ranked.subquery()
+    return select(
+        ranked.c.part_key,
+        ranked.c.part_name,
+        ranked.c.count,
+        ranked.c.date,
+        ranked.c.time,
+        ranked.c.source_id,
+    ).where(ranked.c.row_number == 1)
+
+
+def _refresh_current_part_inventory(connection, part_key=None):
+    """Recompute projection rows from the snapshot log (one part, or all when part_key is None)."""
+    table = CurrentPartInventory.__table__
+    delete_stmt = table.delete()
+    if part_key is not None:
+        delete_stmt = delete_stmt.where(table.c.part_key == part_key)
+    connection.execute(delete_stmt)
+    source = _current_part_inventory_source_select(part_key)
+    connection.execute(
+        table.insert().from_select(
+            ["part_key", "part_name", "count", "date", "time", "source_id"],
+            source,
         )
-        .first()
     )
+
+
+@schema_migration(3, "current_part_inventory")
+def ensure_current_part_inventory_table(connection=None):
+    if app.config.get("_current_part_inventory_ready"):
+        return
+
+    def create_and_backfill(conn):
+        PrintedPartsCount.__table__.create(conn, checkfirst=True)
+        CurrentPartInventory.__table__.create(conn, checkfirst=True)
+        projected = conn.execute(select(func.count()).select_from(CurrentPartInventory.__table__)).scalar()
+        if not projected:
+            _refresh_current_part_inventory(conn)
+
+    if connection is not None:
+        create_and_backfill(connection)
+    else:
+        with db.engine.begin() as conn:
+            create_and_backfill(conn)
+    app.config["_current_part_inventory_ready"] = True
+
+
+@schema_migration(23, "printed_parts_part_key_index")
+def ensure_printed_parts_part_key_index():
+    """Expression index behind the per-part current_part_inventory refresh."""
+    for index in PrintedPartsCount.__table__.indexes:
+        create_missing_index(index)
+
+
+def rebuild_current_part_inventory():
+    """Rebuild the whole projection from the PrintedPartsCount log."""
+    ensure_current_part_inventory_table()
+    _refresh_current_part_inventory(db.session.connection())
+    db.session.commit()
+
+
+@event.listens_for(PrintedPartsCount, "after_insert")
+def _project_inserted_parts_snapshot(mapper, connection, target):
+    ensure_current_part_inventory_table(connection)
+    table = CurrentPartInventory.__table__
+    upsert = sqlite_insert(table).values(
+        part_key=(target.part_name or "").lower(),
+        part_name=target.part_name,
+        count=target.count or 0,
+        date=target.date,
+        time=target.time,
+        source_id=target.id,
+    )
+    # Back-dated snapshots (e.g. legacy splits) must not replace a newer count.
+    connection.execute(upsert.on_conflict_do_update(
+        index_elements=[table.c.part_key],
+        set_={
+            "part_name": upsert.excluded.part_name,
+            "count": upsert.excluded.count,
+            "date": upsert.excluded.date,
+            "time": upsert.excluded.time,
+            "source_id": upsert.excluded.source_id,
+        },
+        where=(
+            tuple_(upsert.excluded.date, upsert.excluded.time, upsert.excluded.source_id)
+            >= tuple_(table.c.date, table.c.time, table.c.source_id)
+        ),
+    ))
+
+
+@event.listens_for(PrintedPartsCount, "after_update")
+def _project_updated_parts_snapshot(mapper, connection, target):
+    ensure_current_part_inventory_table(connection)
+    table = CurrentPartInventory.__table__
+    # A renamed row's old name is only in the attribute history when it was
+    # loaded before the change, so find the part it was projected under instead.
+    part_keys = {(target.part_name or "").lower()}
+    part_keys.update(connection.execute(
+        select(table.c.part_key).where(table.c.source_id == target.id)
+    ).scalars())
+    for part_key in part_keys:
+        _refresh_current_part_inventory(connection, part_key)
+
+
+@event.listens_for(PrintedPartsCount, "after_delete")
+def _project_deleted_parts_snapshot(mapper, connection, target):
+    ensure_current_part_inventory_table(connection)
+    _refresh_current_part_inventory(connection, (target.part_name or "").lower())
+
+
+def current_part_inventory_snapshot():
+    """Return every part's current count in a single query.
+
+    Keys are lower-cased part names and values are
+    ``(canonical_name, count, has_snapshot)``. Hardware parts that have never
+    been counted report their configured baseline with ``has_snapshot`` False.
+    """
+    ensure_current_part_inventory_table()
+    counted = select(
+        CurrentPartInventory.part_key,
+        CurrentPartInventory.part_name,
+        CurrentPartInventory.count,
+        literal(True).label("has_snapshot"),
+    )
+    baselines = select(
+        func.lower(HardwarePart.name),
+        HardwarePart.name,
+        func.coalesce(HardwarePart.initial_count, 0),
+        literal(False),
+    ).where(func.lower(HardwarePart.name).not_in(select(CurrentPartInventory.part_key)))
+    rows = db.session.execute(counted.union_all(baselines)).all()
+    return {
+        part_key: (part_name, count or 0, bool(has_snapshot))
+        for part_key, part_name, count, has_snapshot in rows
+    }
+
+
+def snapshot_part_count(snapshot, part_name, default=0, include_baseline=True):
+    """Read one part's count from current_part_inventory_snapshot()."""
+    entry = snapshot.get((part_name or "").lower())
+    if not entry or (not include_baseline and not entry[2]):
+        return default
+    return entry[1]
+
+
+def current_part_inventory_entry(part_name):
+    """Return the projected latest snapshot row for a part, or None."""
+    ensure_current_part_inventory_table()
+    return db.session.execute(
+        select(
+            CurrentPartInventory.part_name,
+            CurrentPartInventory.count,
+            CurrentPartInventory.date,
+            CurrentPartInventory.time,
+        ).where(CurrentPartInventory.part_key == (part_name or "").lower())
+    ).first()
+
+
+def current_printed_part_inventory(part_name):
+    """Return the canonical name and current snapshot/baseline count for a part."""
+    latest_entry = current_part_inventory_entry(part_name)
     if latest_entry:
         return latest_entry.part_name, latest_entry.count or 0
 
@@ -1140,11 +1529,14 @@ def current_printed_part_inventory(part_name):
 
 class CompletedPods(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    worker = db.Column(db.String(50), nullable=False)
+    # Rollup key columns keep their old value on edit (see CompletedTable).
+    worker = db.column_property(db.Column(db.String(50), nullable=False), active_history=True)
     start_time = db.Column(db.Time, nullable=False)
     finish_time = db.Column(db.Time, nullable=False)
-    date = db.Column(db.Date, default=datetime.utcnow().date(), nullable=False)
-    serial_number = db.Column(db.String(20), unique=True, nullable=False)
+    date = db.column_property(
+        db.Column(db.Date, default=datetime.utcnow().date(), nullable=False, index=True), active_history=True
+    )
+    serial_number = db.column_property(db.Column(db.String(20), unique=True, nullable=False), active_history=True)
     issue = db.Column(db.String(100)) 
     lunch = db.Column(db.String(3), default='No')
 
@@ -1252,6 +1644,7 @@ class MonthlyBuildCompletion(db.Model):
     completed_at = db.Column(db.DateTime, nullable=False, default=london_now)
 
 
+@schema_migration(4, "monthly_build_list_tables")
 def ensure_monthly_build_list_tables():
     if app.config.get('_monthly_build_list_tables_ready'):
         return
@@ -1310,6 +1703,7 @@ BONUS_GOAL_AREAS = [
 BONUS_GOAL_AREA_LABELS = {area["key"]: area["label"] for area in BONUS_GOAL_AREAS}
 
 
+@schema_migration(5, "bonus_goal_tables")
 def ensure_bonus_goal_tables():
     BonusGoal.__table__.create(db.engine, checkfirst=True)
     CushionExtraTimeGoal.__table__.create(db.engine, checkfirst=True)
@@ -1358,59 +1752,31 @@ def cnc_effective_completed_quantity(job_name, quantity):
 
 
 def cnc_completed_quantity_total(year=None, month=None, day=None):
-    filters = [
-        CncQueueItem.status == CNC_STATUS_COMPLETED,
-        CncQueueItem.completed_at.isnot(None),
-    ]
+    start_date = end_date = None
     if year is not None or month is not None or day is not None:
         now = london_now()
         target_year = int(year or now.year)
         target_month = int(month or now.month)
         if day is not None:
-            start_utc, end_utc = london_period_utc_bounds(target_year, target_month, int(day))
+            start_date = date(target_year, target_month, int(day))
+            end_date = start_date + timedelta(days=1)
         elif month is not None:
-            start_utc, end_utc = london_period_utc_bounds(target_year, target_month)
+            start_date = date(target_year, target_month, 1)
+            end_date = shift_month_start(start_date, 1)
         else:
-            start_utc, end_utc = london_period_utc_bounds(target_year)
-        filters.extend([
-            CncQueueItem.completed_at >= start_utc,
-            CncQueueItem.completed_at < end_utc,
-        ])
+            start_date = date(target_year, 1, 1)
+            end_date = date(target_year + 1, 1, 1)
 
-    completed_rows = (
-        db.session.query(CncJob.name, CncJob.quantity)
-        .select_from(CncQueueItem)
-        .join(CncJob, CncQueueItem.job_id == CncJob.id)
-        .filter(*filters)
-        .all()
-    )
     return sum(
-        cnc_effective_completed_quantity(job_name, quantity)
-        for job_name, quantity in completed_rows
+        cnc_effective_completed_quantity(job_name, quantity) * runs
+        for _, job_name, quantity, runs in _cnc_rollup_job_runs(start_date, end_date)
     )
 
 
 def cnc_monthly_cut_file_history():
-    completed_rows = (
-        db.session.query(CncQueueItem.completed_at, CncJob.name, CncJob.quantity)
-        .select_from(CncQueueItem)
-        .join(CncJob, CncQueueItem.job_id == CncJob.id)
-        .filter(
-            CncQueueItem.status == CNC_STATUS_COMPLETED,
-            CncQueueItem.completed_at.isnot(None),
-        )
-        .order_by(CncQueueItem.completed_at.desc(), CncQueueItem.id.desc())
-        .all()
-    )
-
     months = {}
-    for completed_at, job_name, quantity in completed_rows:
-        completed_local = utc_to_london(completed_at)
-        if not completed_local:
-            continue
-
-        month_start = date(completed_local.year, completed_local.month, 1)
-        month_key = month_start.strftime("%Y-%m")
+    for month_key, _, job_name, quantity, runs in _cnc_rollup_job_runs(group_by_month=True):
+        month_start = datetime.strptime(month_key, "%Y-%m").date()
         month_data = months.setdefault(month_key, {
             "key": month_key,
             "label": month_start.strftime("%B %Y"),
@@ -1421,16 +1787,16 @@ def cnc_monthly_cut_file_history():
         })
 
         file_name = (job_name or "").strip() or "Unknown file"
-        cut_quantity = cnc_effective_completed_quantity(file_name, quantity)
+        cut_quantity = cnc_effective_completed_quantity(file_name, quantity) * runs
         file_data = month_data["files_map"].setdefault(file_name, {
             "name": file_name,
             "quantity": 0,
             "runs": 0,
         })
         file_data["quantity"] += cut_quantity
-        file_data["runs"] += 1
+        file_data["runs"] += runs
         month_data["total_quantity"] += cut_quantity
-        month_data["total_runs"] += 1
+        month_data["total_runs"] += runs
 
     history = sorted(months.values(), key=lambda month: month["sort_date"], reverse=True)
     for month_data in history:
@@ -1485,18 +1851,7 @@ def cnc_elapsed_workdays(current_time=None):
     )
     if current_date.weekday() >= 5:
         return float(completed_weekdays)
-
-    shift_start = datetime.combine(current_date, time(9, 0))
-    shift_end = datetime.combine(current_date, time(17, 0))
-    lunch_start = datetime.combine(current_date, time(12, 30))
-    lunch_end = datetime.combine(current_date, time(13, 0))
-    interval_end = min(max(current_time, shift_start), shift_end)
-    elapsed_hours = (interval_end - shift_start).total_seconds() / 3600
-    lunch_overlap_end = min(interval_end, lunch_end)
-    if lunch_overlap_end > lunch_start:
-        elapsed_hours -= (lunch_overlap_end - lunch_start).total_seconds() / 3600
-
-    return completed_weekdays + (max(elapsed_hours, 0) / 7.5)
+    return completed_weekdays + cnc_shift_hours(current_date, end=current_time) / CNC_SHIFT_HOURS
 
 
 def cnc_remaining_work_hours(current_time=None):
@@ -1508,24 +1863,10 @@ def cnc_remaining_work_hours(current_time=None):
         for offset in range(1, (month_end - current_date).days + 1)
         if (current_date + timedelta(days=offset)).weekday() < 5
     )
-    remaining_hours = future_weekdays * 7.5
+    remaining_hours = future_weekdays * CNC_SHIFT_HOURS
     if current_date.weekday() >= 5:
         return remaining_hours
-
-    shift_start = datetime.combine(current_date, time(9, 0))
-    shift_end = datetime.combine(current_date, time(17, 0))
-    lunch_start = datetime.combine(current_date, time(12, 30))
-    lunch_end = datetime.combine(current_date, time(13, 0))
-    interval_start = max(current_time, shift_start)
-    if interval_start >= shift_end:
-        return remaining_hours
-
-    today_hours = (shift_end - interval_start).total_seconds() / 3600
-    lunch_overlap_start = max(interval_start, lunch_start)
-    lunch_overlap_end = min(shift_end, lunch_end)
-    if lunch_overlap_end > lunch_overlap_start:
-        today_hours -= (lunch_overlap_end - lunch_overlap_start).total_seconds() / 3600
-    return remaining_hours + max(today_hours, 0)
+    return remaining_hours + cnc_shift_hours(current_date, start=current_time)
 
 
 def next_bonus_goal_month(year, month):
@@ -1581,50 +1922,14 @@ def bonus_goal_progress(area, year=None, month=None):
         return []
 
     counts = {}
-    if area == "bodies":
-        rows = (
-            db.session.query(CompletedTable.worker, func.count(CompletedTable.id))
-            .filter(
-                extract('year', CompletedTable.date) == year,
-                extract('month', CompletedTable.date) == month
-            )
-            .group_by(CompletedTable.worker)
-            .all()
-        )
-        counts = {(worker or "Unknown"): count for worker, count in rows}
-    elif area == "pods":
-        rows = (
-            db.session.query(CompletedPods.worker, func.count(CompletedPods.id))
-            .filter(
-                extract('year', CompletedPods.date) == year,
-                extract('month', CompletedPods.date) == month
-            )
-            .group_by(CompletedPods.worker)
-            .all()
-        )
-        counts = {(worker or "Unknown"): count for worker, count in rows}
-    elif area == "top_rails":
-        rows = (
-            db.session.query(TopRail.worker, func.count(TopRail.id))
-            .filter(
-                extract('year', TopRail.date) == year,
-                extract('month', TopRail.date) == month
-            )
-            .group_by(TopRail.worker)
-            .all()
+    if area in PRODUCTION_ROLLUP_AREAS:
+        month_start = date(year, month, 1)
+        counts = production_rollup_totals(
+            month_start,
+            shift_month_start(month_start, 1) - timedelta(days=1),
+            group_by=("worker",),
+            areas=[area],
         )
-        counts = {(worker or "Unknown"): count for worker, count in rows}
-    elif area == "cushions":
-        rows = (
-            db.session.query(CushionCompletedSet.worker, func.count(CushionCompletedSet.id))
-            .filter(
-                extract('year', CushionCompletedSet.completed_at) == year,
-                extract('month', CushionCompletedSet.completed_at) == month
-            )
-            .group_by(CushionCompletedSet.worker)
-            .all()
-        )
-        counts = {(worker or "Unknown"): count for worker, count in rows}
     elif area == "cnc":
         monthly_total = cnc_completed_quantity_total(year=year, month=month)
         counts = {goal.worker_name: monthly_total for goal in goals}
@@ -1653,31 +1958,19 @@ def bonus_goal_actual_count(area, worker_name, year, month):
     month = int(month)
     if area == "cnc":
         return cnc_completed_quantity_total(year=year, month=month)
-    if area == "cushions":
-        return int(CushionCompletedSet.query.filter(
-            extract('year', CushionCompletedSet.completed_at) == year,
-            extract('month', CushionCompletedSet.completed_at) == month,
-            CushionCompletedSet.worker == worker_name
-        ).count() or 0)
-
-    model = {
-        "bodies": CompletedTable,
-        "pods": CompletedPods,
-        "top_rails": TopRail,
-    }.get(area)
-    if not model:
+    if area not in PRODUCTION_ROLLUP_AREAS:
         return 0
 
-    worker_column = model.worker
-    query = model.query.filter(
-        extract('year', model.date) == year,
-        extract('month', model.date) == month
+    # The rollup stores blank and missing workers as "Unknown".
+    worker_key = "Unknown" if normalize_bonus_worker_name(worker_name) == "unknown" else worker_name
+    month_start = date(year, month, 1)
+    worker_counts = production_rollup_totals(
+        month_start,
+        shift_month_start(month_start, 1) - timedelta(days=1),
+        group_by=("worker",),
+        areas=[area],
     )
-    if normalize_bonus_worker_name(worker_name) == "unknown":
-        query = query.filter(or_(worker_column.is_(None), worker_column == "", worker_column == "Unknown"))
-    else:
-        query = query.filter(worker_column == worker_name)
-    return int(query.count() or 0)
+    return int(worker_counts.get(worker_key, 0))
 
 
 def bonus_goal_for_worker(area, worker_name, year, month):
@@ -1830,6 +2123,7 @@ class PartThreshold(db.Model):
     alerts_enabled = db.Column(db.Boolean, default=True, nullable=False)
 
 
+@schema_migration(6, "part_threshold_alerts_enabled")
 def ensure_part_threshold_schema():
     if app.config.get("_part_threshold_schema_checked"):
         return
@@ -1911,6 +2205,7 @@ def save_hidden_body_picker_pod_ids(hidden_ids):
         json.dump(payload, f, indent=2)
 
 
+@schema_migration(7, "legacy_inventory_names")
 def ensure_legacy_inventory_names_migrated():
     if app.config.get("_legacy_inventory_names_migrated"):
         return
@@ -2018,29 +2313,11 @@ def ensure_legacy_inventory_names_migrated():
 
         # Preserve the number of complete 7ft sets represented by the five legacy balances.
         seven_foot_set_name = GULLY_SET_PART_NAMES["7ft"]
-        existing_set_entry = (
-            PrintedPartsCount.query
-            .filter_by(part_name=seven_foot_set_name)
-            .order_by(
-                PrintedPartsCount.date.desc(),
-                PrintedPartsCount.time.desc(),
-                PrintedPartsCount.id.desc()
-            )
-            .first()
-        )
+        existing_set_entry = current_part_inventory_entry(seven_foot_set_name)
         if not existing_set_entry:
             legacy_counts = {}
             for part_name in LEGACY_SEVEN_FOOT_GULLY_PARTS:
-                latest_entry = (
-                    PrintedPartsCount.query
-                    .filter_by(part_name=part_name)
-                    .order_by(
-                        PrintedPartsCount.date.desc(),
-                        PrintedPartsCount.time.desc(),
-                        PrintedPartsCount.id.desc()
-                    )
-                    .first()
-                )
+                latest_entry = current_part_inventory_entry(part_name)
                 legacy_counts[part_name] = int(latest_entry.count or 0) if latest_entry else 0
 
             complete_sets = min(
@@ -2057,16 +2334,7 @@ def ensure_legacy_inventory_names_migrated():
             )
             if remainder_units:
                 untouched_name = "Gullies Untouched"
-                latest_untouched = (
-                    PrintedPartsCount.query
-                    .filter_by(part_name=untouched_name)
-                    .order_by(
-                        PrintedPartsCount.date.desc(),
-                        PrintedPartsCount.time.desc(),
-                        PrintedPartsCount.id.desc()
-                    )
-                    .first()
-                )
+                latest_untouched = current_part_inventory_entry(untouched_name)
                 untouched_count = int(latest_untouched.count or 0) if latest_untouched else 0
                 db.session.add(new_printed_parts_snapshot(
                     untouched_name,
@@ -2152,9 +2420,21 @@ def ensure_legacy_inventory_names_migrated():
 
 
 @app.before_request
-def run_legacy_inventory_name_migrations():
-    ensure_legacy_inventory_names_migrated()
-    ensure_table_stock_log_table()
+def apply_pending_schema_migrations():
+    # wsgi.py migrates at startup; this covers the dev server and CLI-less runs.
+    if not app.config.get("_schema_migrations_applied"):
+        run_schema_migrations()
+
+
+@app.cli.command("migrate-schema")
+@click.option("--force", is_flag=True, help="Re-run every step, even ones already recorded.")
+def migrate_schema_command(force):
+    """Apply pending schema migrations and record them in schema_migration."""
+    applied = run_schema_migrations(force=force)
+    if applied:
+        print("Applied schema migrations: " + ", ".join(applied))
+    else:
+        print("Schema is up to date.")
 
 
 @app.after_request
@@ -2188,23 +2468,49 @@ class CncJob(db.Model):
 
 class CncQueueItem(db.Model):
     __tablename__ = 'cnc_queue_item'
+    __table_args__ = (
+        db.Index('ix_cnc_queue_item_machine_status_position', 'machine_number', 'status', 'position'),
+        db.Index('ix_cnc_queue_item_machine_status_completed', 'machine_number', 'status', 'completed_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     job_id = db.Column(db.Integer, db.ForeignKey('cnc_job.id'), nullable=False)
-    machine_number = db.Column(db.Integer, nullable=False)
+    # active_history keeps the old value even when the row was expired, so the
+    # event stream and analytics listeners can see which transition happened.
+    machine_number = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)
     position = db.Column(db.Integer, nullable=False, default=1)
-    status = db.Column(db.String(20), nullable=False, default='queued')
+    status = db.column_property(db.Column(db.String(20), nullable=False, default='queued'), active_history=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    completed_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.column_property(db.Column(db.DateTime, nullable=True), active_history=True)
     completed_by = db.Column(db.String(50), nullable=True)
     completion_wood_change = db.Column(db.Text, nullable=True)
 
 
+class CncQueueEvent(db.Model):
+    """Append-only log of queue changes; its id is the kiosk stream cursor."""
+    __tablename__ = 'cnc_queue_event'
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(20), nullable=False)
+    item_id = db.Column(db.Integer, nullable=True)
+    machine_number = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
 CNC_MACHINE_NUMBERS = [1, 2, 3, 4]
 CNC_STATUS_QUEUED = "queued"
 CNC_STATUS_COMPLETED = "completed"
 CNC_QUEUE_LOW_NOTIFY_THRESHOLD = 3
+# Queue positions are sparse so a move writes one row; rebalancing restores the gaps.
+CNC_POSITION_GAP = 1024
+# Stream events kept for reconnecting kiosks, and how often old ones are pruned.
+CNC_EVENT_RETENTION = 5000
+CNC_EVENT_PRUNE_EVERY = 500
+CNC_EVENT_STREAM_SECONDS = 55
+CNC_EVENT_KEEPALIVE_SECONDS = 15
+CNC_DASHBOARD_ANALYTICS_DAYS = 30
 
 
+@schema_migration(8, "cnc_tables")
 def ensure_cnc_tables():
     CncJob.__table__.create(db.engine, checkfirst=True)
     CncQueueItem.__table__.create(db.engine, checkfirst=True)
@@ -2242,7 +2548,8 @@ def _coerce_positive_int_list(values):
     return sorted(set(parsed))
 
 
-def _cnc_reindex_machine(machine_number):
+def _cnc_rebalance_machine(machine_number):
+    """Respace a machine's queue to CNC_POSITION_GAP steps (the only O(n) write)."""
     queued_items = (
         CncQueueItem.query
         .filter_by(machine_number=machine_number, status=CNC_STATUS_QUEUED)
@@ -2250,7 +2557,522 @@ def _cnc_reindex_machine(machine_number):
         .all()
     )
     for index, item in enumerate(queued_items, start=1):
-        item.position = index
+        item.position = index * CNC_POSITION_GAP
+    db.session.flush()
+    return len(queued_items)
+
+
+def _cnc_gap_positions(lower, upper, count=1):
+    """``count`` evenly spaced positions strictly between two positions (None = open end)."""
+    if lower is None and upper is None:
+        return [CNC_POSITION_GAP * index for index in range(1, count + 1)]
+    if lower is None:
+        return [upper - CNC_POSITION_GAP * index for index in range(count, 0, -1)]
+    if upper is None:
+        return [lower + CNC_POSITION_GAP * index for index in range(1, count + 1)]
+    step = (upper - lower) // (count + 1)
+    if step < 1:
+        return None
+    return [lower + step * index for index in range(1, count + 1)]
+
+
+def _cnc_queue_neighbours(machine_number, anchor, direction, limit=1, exclude_id=None):
+    """Queued items just before/after ``anchor`` (a (position, id) pair, or None for the ends)."""
+    query = CncQueueItem.query.filter(
+        CncQueueItem.machine_number == machine_number,
+        CncQueueItem.status == CNC_STATUS_QUEUED,
+    )
+    if exclude_id is not None:
+        query = query.filter(CncQueueItem.id != exclude_id)
+    if direction == "before":
+        if anchor is not None:
+            position, item_id = anchor
+            query = query.filter(or_(
+                CncQueueItem.position < position,
+                and_(CncQueueItem.position == position, CncQueueItem.id < item_id),
+            ))
+        query = query.order_by(CncQueueItem.position.desc(), CncQueueItem.id.desc())
+    else:
+        if anchor is not None:
+            position, item_id = anchor
+            query = query.filter(or_(
+                CncQueueItem.position > position,
+                and_(CncQueueItem.position == position, CncQueueItem.id > item_id),
+            ))
+        query = query.order_by(CncQueueItem.position.asc(), CncQueueItem.id.asc())
+    return query.limit(limit).all()
+
+
+def _cnc_positions_between(machine_number, lower_item, upper_item, count=1):
+    """Positions for ``count`` rows placed between two queued items, rebalancing only when full."""
+    def bounds():
+        return (
+            lower_item.position if lower_item is not None else None,
+            upper_item.position if upper_item is not None else None,
+        )
+
+    positions = _cnc_gap_positions(*bounds(), count=count)
+    if positions is None:
+        _cnc_rebalance_machine(machine_number)
+        positions = _cnc_gap_positions(*bounds(), count=count)
+    return positions
+
+
+def _cnc_position_at_end(machine_number, exclude_id=None):
+    last = _cnc_queue_neighbours(machine_number, None, "before", exclude_id=exclude_id)
+    return _cnc_gap_positions(last[0].position if last else None, None)[0]
+
+
+def _cnc_position_at_top(machine_number, exclude_id=None):
+    first = _cnc_queue_neighbours(machine_number, None, "after", exclude_id=exclude_id)
+    return _cnc_gap_positions(None, first[0].position if first else None)[0]
+
+
+def _cnc_move_item(item, direction):
+    """Move one queued item top/up/down by rewriting only its own position."""
+    anchor = (item.position, item.id)
+    if direction == "top":
+        if not _cnc_queue_neighbours(item.machine_number, anchor, "before"):
+            return False
+        item.position = _cnc_position_at_top(item.machine_number, exclude_id=item.id)
+        return True
+
+    if direction == "up":
+        previous_items = _cnc_queue_neighbours(item.machine_number, anchor, "before", limit=2)
+        if not previous_items:
+            return False
+        upper_item = previous_items[0]
+        lower_item = previous_items[1] if len(previous_items) > 1 else None
+    else:
+        next_items = _cnc_queue_neighbours(item.machine_number, anchor, "after", limit=2)
+        if not next_items:
+            return False
+        lower_item = next_items[0]
+        upper_item = next_items[1] if len(next_items) > 1 else None
+
+    item.position = _cnc_positions_between(item.machine_number, lower_item, upper_item)[0]
+    return True
+
+
+def _cnc_apply_machine_order(machine_number, ordered_items):
+    """Put ``ordered_items`` on a machine in that order, rewriting as few positions as possible.
+
+    The longest run of items already on the machine in the wanted order keeps
+    its positions; every other item takes a position in the gap between its
+    kept neighbours. The machine is respaced only when one of those gaps is
+    too small, so dragging one item still writes one row.
+    """
+    # Longest increasing subsequence of current (position, id) keys.
+    tails, tail_indexes, parents = [], [], [None] * len(ordered_items)
+    for index, item in enumerate(ordered_items):
+        if item.machine_number != machine_number:
+            continue
+        key = (item.position, item.id)
+        slot = bisect_left(tails, key)
+        parents[index] = tail_indexes[slot - 1] if slot else None
+        if slot == len(tails):
+            tails.append(key)
+            tail_indexes.append(index)
+        else:
+            tails[slot] = key
+            tail_indexes[slot] = index
+    kept = set()
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        kept.add(index)
+        index = parents[index]
+
+    placements = []
+    lower, pending = None, []
+    for index, item in enumerate(ordered_items + [None]):
+        if item is not None and index not in kept:
+            pending.append(item)
+            continue
+        upper = item.position if item is not None else None
+        if pending:
+            positions = _cnc_gap_positions(lower, upper, count=len(pending))
+            if positions is None:
+                for position_index, queue_item in enumerate(ordered_items, start=1):
+                    queue_item.machine_number = machine_number
+                    queue_item.position = position_index * CNC_POSITION_GAP
+                return len(ordered_items)
+            placements.extend(zip(pending, positions))
+        lower, pending = upper, []
+
+    for queue_item, position in placements:
+        queue_item.machine_number = machine_number
+        queue_item.position = position
+    return len(placements)
+
+
+def _record_cnc_queue_event(connection, event_type, item_id=None, machine_number=None, **details):
+    payload = {"item_id": item_id, "machine_number": machine_number}
+    payload.update(details)
+    result = connection.execute(CncQueueEvent.__table__.insert().values(
+        event_type=event_type,
+        item_id=item_id,
+        machine_number=machine_number,
+        payload=json.dumps(payload, default=str),
+        created_at=datetime.utcnow(),
+    ))
+    event_id = result.inserted_primary_key[0]
+    if event_id % CNC_EVENT_PRUNE_EVERY == 0:
+        connection.execute(
+            CncQueueEvent.__table__.delete().where(CncQueueEvent.id <= event_id - CNC_EVENT_RETENTION)
+        )
+    db.session.info["cnc_queue_events_written"] = True
+
+
+def _cnc_item_event_details(connection, target):
+    job = connection.execute(
+        select(CncJob.name, CncJob.quantity, CncJob.notes).where(CncJob.id == target.job_id)
+    ).first()
+    return {
+        "job_id": target.job_id,
+        "job_name": job.name if job else "",
+        "quantity": job.quantity if job else None,
+        "notes": job.notes if job else None,
+        "position": target.position,
+        "status": target.status,
+    }
+
+
+@event.listens_for(CncQueueItem, "after_insert")
+def _stream_inserted_cnc_item(mapper, connection, target):
+    if target.status == CNC_STATUS_QUEUED:
+        _record_cnc_queue_event(
+            connection, "added", target.id, target.machine_number,
+            **_cnc_item_event_details(connection, target),
+        )
+
+
+@event.listens_for(CncQueueItem, "after_update")
+def _stream_updated_cnc_item(mapper, connection, target):
+    state = sa_inspect(target)
+    status_history = state.attrs.status.history
+    machine_history = state.attrs.machine_number.history
+    previous_status = status_history.deleted[0] if status_history.deleted else target.status
+    previous_machine = machine_history.deleted[0] if machine_history.deleted else target.machine_number
+
+    if previous_status == CNC_STATUS_QUEUED and target.status == CNC_STATUS_COMPLETED:
+        event_type = "completed"
+    elif previous_status == CNC_STATUS_COMPLETED and target.status == CNC_STATUS_QUEUED:
+        event_type = "undone"
+    elif target.status == CNC_STATUS_QUEUED and (
+        machine_history.deleted or state.attrs.position.history.deleted
+    ):
+        event_type = "moved"
+    else:
+        return
+    details = _cnc_item_event_details(connection, target)
+    if event_type == "completed":
+        details["completed_by"] = target.completed_by
+    _record_cnc_queue_event(
+        connection, event_type, target.id, target.machine_number,
+        previous_machine_number=previous_machine, **details,
+    )
+
+
+@event.listens_for(CncQueueItem, "after_delete")
+def _stream_deleted_cnc_item(mapper, connection, target):
+    if target.status == CNC_STATUS_QUEUED:
+        _record_cnc_queue_event(connection, "removed", target.id, target.machine_number, job_id=target.job_id)
+
+
+@event.listens_for(CncJob, "after_update")
+def _stream_updated_cnc_job(mapper, connection, target):
+    state = sa_inspect(target)
+    if not any(state.attrs[attr].history.deleted for attr in ("name", "quantity", "notes")):
+        return
+    _record_cnc_queue_event(
+        connection, "job_updated",
+        job_id=target.id, job_name=target.name, quantity=target.quantity, notes=target.notes,
+    )
+
+
+@event.listens_for(db.session, "after_commit")
+def _wake_cnc_event_stream(committed_session):
+    if committed_session.info.pop("cnc_queue_events_written", False):
+        cnc_event_fanout.wake()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_cnc_event_flag(rolled_back_session):
+    rolled_back_session.info.pop("cnc_queue_events_written", None)
+
+
+def _fetch_cnc_events_after(after_id, limit):
+    with app.app_context():
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                select(CncQueueEvent.id, CncQueueEvent.event_type, CncQueueEvent.payload)
+                .where(CncQueueEvent.id > after_id)
+                .order_by(CncQueueEvent.id.asc())
+                .limit(limit)
+            ).all()
+    return [
+        {"id": event_id, "type": event_type, "data": json.loads(payload)}
+        for event_id, event_type, payload in rows
+    ]
+
+
+def _fetch_cnc_event_bounds():
+    with app.app_context():
+        with db.engine.connect() as conn:
+            return tuple(conn.execute(select(func.min(CncQueueEvent.id), func.max(CncQueueEvent.id))).one())
+
+
+# One poller per process shares each read of cnc_queue_event across all open kiosk streams.
+cnc_event_fanout = EventFanout(_fetch_cnc_events_after, _fetch_cnc_event_bounds)
+
+
+def cnc_queue_event_cursor():
+    """Newest event id; read before a page's snapshot so the stream resumes from it."""
+    return db.session.execute(select(func.max(CncQueueEvent.id))).scalar() or 0
+
+
+@schema_migration(18, "cnc_queue_events")
+def ensure_cnc_queue_event_table():
+    CncQueueEvent.__table__.create(db.engine, checkfirst=True)
+
+
+@schema_migration(17, "cnc_sparse_positions")
+def ensure_cnc_sparse_positions():
+    """Spread existing 1..n queue positions out to CNC_POSITION_GAP steps."""
+    for machine_number in CNC_MACHINE_NUMBERS:
+        _cnc_rebalance_machine(machine_number)
+    db.session.commit()
+
+
+@app.cli.command("rebalance-cnc-queues")
+def rebalance_cnc_queues_command():
+    """Respace every CNC machine queue so moves have room again."""
+    ensure_cnc_tables()
+    for machine_number in CNC_MACHINE_NUMBERS:
+        print(f"Machine {machine_number}: {_cnc_rebalance_machine(machine_number)} queued items")
+    db.session.commit()
+
+
+class CncCompletionRollup(db.Model):
+    """Completed CNC runs per London day, machine and job."""
+    __tablename__ = 'cnc_completion_rollup'
+
+    date = db.Column(db.Date, primary_key=True)
+    machine_number = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, primary_key=True)
+    runs = db.Column(db.Integer, nullable=False, default=0)
+    wait_seconds = db.Column(db.Float, nullable=False, default=0)
+
+
+class CncMachineDayStats(db.Model):
+    """Spacing between one machine's completions on one London day."""
+    __tablename__ = 'cnc_machine_day_stats'
+
+    date = db.Column(db.Date, primary_key=True)
+    machine_number = db.Column(db.Integer, primary_key=True)
+    runs = db.Column(db.Integer, nullable=False, default=0)
+    cycle_count = db.Column(db.Integer, nullable=False, default=0)
+    cycle_seconds = db.Column(db.Float, nullable=False, default=0)
+    idle_gap_count = db.Column(db.Integer, nullable=False, default=0)
+    idle_seconds = db.Column(db.Float, nullable=False, default=0)
+    wait_seconds = db.Column(db.Float, nullable=False, default=0)
+
+
+CNC_DAY_STATS_FIELDS = ("runs", "cycle_count", "cycle_seconds", "idle_gap_count", "idle_seconds", "wait_seconds")
+
+
+def cnc_completion_day(completed_at):
+    local_value = utc_to_london(completed_at)
+    return local_value.date() if local_value else None
+
+
+def _write_cnc_machine_day(connection, machine_number, day, completions):
+    rollup = CncCompletionRollup.__table__
+    day_stats = CncMachineDayStats.__table__
+    connection.execute(rollup.delete().where(rollup.c.date == day, rollup.c.machine_number == machine_number))
+    connection.execute(day_stats.delete().where(day_stats.c.date == day, day_stats.c.machine_number == machine_number))
+    if not completions:
+        return
+    stats, per_job = summarise_cnc_machine_day(completions, CNC_IDLE_GAP_SECONDS)
+    connection.execute(day_stats.insert().values(date=day, machine_number=machine_number, **stats))
+    connection.execute(rollup.insert(), [
+        {"date": day, "machine_number": machine_number, "job_id": job_id, **totals}
+        for job_id, totals in per_job.items()
+    ])
+
+
+def _refresh_cnc_machine_day(connection, machine_number, day):
+    """Recompute one machine-day from its own completions (a handful of indexed rows)."""
+    start_utc, end_utc = london_period_utc_bounds(day.year, day.month, day.day)
+    completions = connection.execute(
+        select(CncQueueItem.completed_at, CncQueueItem.created_at, CncQueueItem.job_id)
+        .where(
+            CncQueueItem.machine_number == machine_number,
+            CncQueueItem.status == CNC_STATUS_COMPLETED,
+            CncQueueItem.completed_at >= start_utc,
+            CncQueueItem.completed_at < end_utc,
+        )
+    ).all()
+    _write_cnc_machine_day(connection, machine_number, day, [tuple(row) for row in completions])
+
+
+def rebuild_cnc_completion_rollup(connection):
+    """Recompute both CNC analytics tables from every completed queue item."""
+    connection.execute(CncCompletionRollup.__table__.delete())
+    connection.execute(CncMachineDayStats.__table__.delete())
+    completions_by_day = defaultdict(list)
+    rows = connection.execute(
+        select(CncQueueItem.machine_number, CncQueueItem.completed_at, CncQueueItem.created_at, CncQueueItem.job_id)
+        .where(CncQueueItem.status == CNC_STATUS_COMPLETED, CncQueueItem.completed_at.isnot(None))
+    )
+    for machine_number, completed_at, created_at, job_id in rows:
+        completions_by_day[(machine_number, cnc_completion_day(completed_at))].append(
+            (completed_at, created_at, job_id)
+        )
+    for (machine_number, day), completions in completions_by_day.items():
+        _write_cnc_machine_day(connection, machine_number, day, completions)
+    return len(completions_by_day)
+
+
+def _cnc_completion_keys(values):
+    if values["status"] != CNC_STATUS_COMPLETED or values["completed_at"] is None:
+        return set()
+    return {(values["machine_number"], cnc_completion_day(values["completed_at"]))}
+
+
+def _cnc_completion_values(target, use_previous=False):
+    state = sa_inspect(target)
+    values = {}
+    for attr in ("status", "completed_at", "machine_number", "created_at", "job_id"):
+        history = state.attrs[attr].history
+        if use_previous and history.deleted:
+            values[attr] = history.deleted[0]
+        else:
+            values[attr] = getattr(target, attr)
+    return values
+
+
+@event.listens_for(CncQueueItem, "after_insert")
+def _rollup_inserted_cnc_item(mapper, connection, target):
+    for machine_number, day in _cnc_completion_keys(_cnc_completion_values(target)):
+        _refresh_cnc_machine_day(connection, machine_number, day)
+
+
+@event.listens_for(CncQueueItem, "after_update")
+def _rollup_updated_cnc_item(mapper, connection, target):
+    # Completing and undoing land here; other queue edits touch no completion key.
+    old_keys = _cnc_completion_keys(_cnc_completion_values(target, use_previous=True))
+    new_keys = _cnc_completion_keys(_cnc_completion_values(target))
+    state = sa_inspect(target)
+    if old_keys == new_keys and not any(
+        state.attrs[attr].history.has_changes() for attr in ("created_at", "job_id", "completed_at")
+    ):
+        return
+    for machine_number, day in old_keys | new_keys:
+        _refresh_cnc_machine_day(connection, machine_number, day)
+
+
+@event.listens_for(CncQueueItem, "after_delete")
+def _rollup_deleted_cnc_item(mapper, connection, target):
+    for machine_number, day in _cnc_completion_keys(_cnc_completion_values(target)):
+        _refresh_cnc_machine_day(connection, machine_number, day)
+
+
+@schema_migration(19, "cnc_completion_rollup")
+def ensure_cnc_completion_rollup_tables():
+    CncCompletionRollup.__table__.create(db.engine, checkfirst=True)
+    CncMachineDayStats.__table__.create(db.engine, checkfirst=True)
+    for index in CncQueueItem.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    with db.engine.begin() as conn:
+        if not conn.execute(select(CncMachineDayStats.date).limit(1)).first():
+            rebuild_cnc_completion_rollup(conn)
+
+
+@app.cli.command("rebuild-cnc-analytics")
+def rebuild_cnc_analytics_command():
+    """Recompute the CNC completion rollup and machine-day stats."""
+    ensure_cnc_completion_rollup_tables()
+    with db.engine.begin() as conn:
+        machine_days = rebuild_cnc_completion_rollup(conn)
+    print(f"Rebuilt CNC analytics for {machine_days} machine-days.")
+
+
+def _cnc_rollup_job_runs(start_date=None, end_date=None, group_by_month=False):
+    """Completed runs per job (optionally per month) between two London dates, end exclusive."""
+    month_column = func.strftime('%Y-%m', CncCompletionRollup.date)
+    columns = [CncCompletionRollup.job_id]
+    if group_by_month:
+        columns.insert(0, month_column)
+    query = (
+        select(*columns, CncJob.name, CncJob.quantity, func.sum(CncCompletionRollup.runs))
+        .join(CncJob, CncJob.id == CncCompletionRollup.job_id)
+        .group_by(*columns)
+    )
+    if start_date is not None:
+        query = query.where(CncCompletionRollup.date >= start_date)
+    if end_date is not None:
+        query = query.where(CncCompletionRollup.date < end_date)
+    return db.session.execute(query).all()
+
+
+def cnc_analytics_report(start_date, end_date, current_time=None):
+    """Per-machine, per-job and per-day CNC figures for London dates ``start_date``..``end_date``."""
+    current_time = current_time or london_now()
+    day_rows = db.session.execute(
+        select(CncMachineDayStats)
+        .where(CncMachineDayStats.date >= start_date, CncMachineDayStats.date <= end_date)
+        .order_by(CncMachineDayStats.date.asc(), CncMachineDayStats.machine_number.asc())
+    ).scalars().all()
+    stats_by_machine = defaultdict(list)
+    days = {}
+    for row in day_rows:
+        row_stats = {field: getattr(row, field) for field in CNC_DAY_STATS_FIELDS}
+        stats_by_machine[row.machine_number].append(row_stats)
+        day_entry = days.setdefault(row.date, {"date": row.date.isoformat(), "runs": 0, "quantity": 0, "machines": {}})
+        day_entry["runs"] += row.runs
+        day_entry["machines"][row.machine_number] = row.runs
+
+    queued_counts = dict(
+        db.session.query(CncQueueItem.machine_number, func.count(CncQueueItem.id))
+        .filter(CncQueueItem.status == CNC_STATUS_QUEUED)
+        .group_by(CncQueueItem.machine_number)
+        .all()
+    )
+    machines = []
+    for machine_number in CNC_MACHINE_NUMBERS:
+        metrics = cnc_machine_metrics(
+            combine_cnc_day_stats(stats_by_machine.get(machine_number, [])),
+            queued_counts.get(machine_number, 0),
+            current_time,
+        )
+        metrics["machine_number"] = machine_number
+        machines.append(metrics)
+
+    quantity_rows = db.session.execute(
+        select(CncCompletionRollup.date, CncJob.name, CncJob.quantity, func.sum(CncCompletionRollup.runs))
+        .join(CncJob, CncJob.id == CncCompletionRollup.job_id)
+        .where(CncCompletionRollup.date >= start_date, CncCompletionRollup.date <= end_date)
+        .group_by(CncCompletionRollup.date, CncCompletionRollup.job_id)
+    ).all()
+    jobs = {}
+    for day, job_name, quantity, runs in quantity_rows:
+        cut_quantity = cnc_effective_completed_quantity(job_name, quantity) * runs
+        if day in days:
+            days[day]["quantity"] += cut_quantity
+        file_name = (job_name or "").strip() or "Unknown file"
+        job_entry = jobs.setdefault(file_name, {"name": file_name, "runs": 0, "quantity": 0})
+        job_entry["runs"] += runs
+        job_entry["quantity"] += cut_quantity
+
+    return {
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "idle_gap_minutes": CNC_IDLE_GAP_SECONDS // 60,
+        "machines": machines,
+        "jobs": sorted(jobs.values(), key=lambda job: (-job["quantity"], job["name"].lower())),
+        "days": [days[day] for day in sorted(days)],
+    }
 
 
 def _cnc_queue_snapshot():
@@ -2287,14 +3109,12 @@ def _cnc_capture_queue_counts(machine_numbers=None):
 
 def _send_cnc_low_queue_notification(machine_number, new_count):
     message = f"CNC {machine_number} queue is low ({new_count} queued jobs)."
-    try:
-        requests.post(
-            "https://ntfy.sh/PoolTableTrackerV2",
-            data=message,
-            headers={"Title": "CNC Queue Warning", "Priority": "high"}
-        )
-    except requests.RequestException as error:
-        print(f"Ntfy notification failed for CNC queue warning: {error}")
+    send_ntfy_notification(
+        message,
+        "CNC Queue Warning",
+        priority="high",
+        dedup_key=f"cnc_low_queue:{machine_number}",
+    )
 
 
 def _cnc_notify_low_queue_transitions(previous_counts):
@@ -2610,13 +3430,19 @@ def _payload_bool(value):
 
 # Shared helper to read felt counts (uses legacy felt names if needed).
 def get_latest_part_entry(part_name):
-    return (PrintedPartsCount.query
-            .filter_by(part_name=part_name)
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-            .first())
+    return current_part_inventory_entry(part_name)
 
 
-def get_felt_count():
+def get_felt_count(snapshot=None):
+    if snapshot is not None:
+        felt_entry = snapshot.get(FELT_PART_NAME.lower())
+        if felt_entry and felt_entry[2]:
+            return felt_entry[1]
+        return sum(
+            snapshot_part_count(snapshot, legacy_name, include_baseline=False)
+            for legacy_name in LEGACY_FELT_PART_NAMES
+        )
+
     entry = get_latest_part_entry(FELT_PART_NAME)
     if entry:
         return entry.count
@@ -2694,14 +3520,12 @@ def check_and_notify_chinese_parts_order_more(
         collected_warnings.append(message)
         return message
 
-    try:
-        requests.post(
-            "https://ntfy.sh/PoolTableTrackerV2",
-            data=message,
-            headers={"Title": "Order More Chinese Parts", "Priority": "high"}
-        )
-    except requests.RequestException as e:
-        print(f"Ntfy notification failed for Chinese parts order warning: {e}")
+    send_ntfy_notification(
+        message,
+        "Order More Chinese Parts",
+        priority="high",
+        dedup_key=f"chinese_parts_order_more:{part_name.lower()}",
+    )
     return message
 
 # Track last time we alerted for a given part to throttle repeats
@@ -2734,16 +3558,13 @@ def check_and_notify_low_stock(part_name, old_count, new_count, collected_warnin
             within_business_hours = business_start <= current_time < business_end
 
             if within_business_hours:
-                try:
-                    title = "Low Stock Warning"
-                    requests.post(
-                        "https://ntfy.sh/PoolTableTrackerV2",
-                        data=message,
-                        headers={"Title": title, "Priority": "high"}
-                    )
+                if send_ntfy_notification(
+                    message,
+                    "Low Stock Warning",
+                    priority="high",
+                    dedup_key=f"low_stock:{part_name.lower()}",
+                ):
                     LOW_STOCK_LAST_ALERT[part_name] = now
-                except requests.RequestException as e:
-                    print(f"Ntfy notification failed for low stock: {e}")
         return message
     LOW_STOCK_LAST_ALERT.pop(part_name, None)
     return None
@@ -2752,14 +3573,7 @@ def check_and_notify_low_stock(part_name, old_count, new_count, collected_warnin
 def fractional_strip_inventory_state(part_name, units_per_strip=4):
     hardware_part = HardwarePart.query.filter(func.lower(HardwarePart.name) == part_name.lower()).first()
     canonical_name = hardware_part.name if hardware_part else part_name
-    latest_entry = (PrintedPartsCount.query
-                    .filter(func.lower(PrintedPartsCount.part_name) == canonical_name.lower())
-                    .order_by(
-                        PrintedPartsCount.date.desc(),
-                        PrintedPartsCount.time.desc(),
-                        PrintedPartsCount.id.desc(),
-                    )
-                    .first())
+    latest_entry = current_part_inventory_entry(canonical_name)
     current_strips = (
         (latest_entry.count or 0)
         if latest_entry
@@ -2876,7 +3690,6 @@ def admin():
         return redirect(url_for('login'))
 
     ensure_part_threshold_schema()
-    BodyPieceCount.__table__.create(db.engine, checkfirst=True)
     ensure_cushion_consumables()
 
     threshold_section_open = False
@@ -2952,14 +3765,11 @@ def admin():
 
             # --- Check for immediate low stock after threshold update ---
             # Get current stock count
-            latest_entry = (db.session.query(PrintedPartsCount.count)
-                            .filter_by(part_name=part_name)
-                            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-                            .first())
+            latest_entry = current_part_inventory_entry(part_name)
             
             current_stock = 0
             if latest_entry:
-                current_stock = latest_entry[0]
+                current_stock = latest_entry.count
             else:
                 # Check if it's a hardware part with an initial count
                 hardware_part = HardwarePart.query.filter_by(name=part_name).first()
@@ -2973,15 +3783,14 @@ def admin():
 
             # If stock is already below the new threshold, notify
             if alerts_enabled and threshold > 0 and current_stock <= threshold:
-                try:
-                    message = f"Stock for {part_name} is low ({current_stock} remaining, threshold is {threshold})."
-                    title = "Low Stock Warning"
-                    requests.post("https://ntfy.sh/PoolTableTrackerV2",
-                                  data=message,
-                                  headers={"Title": title, "Priority": "high"})
-                    flash(f"Low stock notification sent for {part_name}.", "info")
-                except requests.RequestException as e:
-                    print(f"Ntfy notification failed for low stock: {e}")
+                message = f"Stock for {part_name} is low ({current_stock} remaining, threshold is {threshold})."
+                if send_ntfy_notification(
+                    message,
+                    "Low Stock Warning",
+                    priority="high",
+                    dedup_key=f"low_stock:{part_name.lower()}",
+                ):
+                    flash(f"Low stock notification queued for {part_name}.", "info")
             # --- End check ---
 
             alert_state = "on" if alerts_enabled else "off"
@@ -3028,7 +3837,7 @@ def admin():
 
     # Gather all unique part names for threshold management
     all_parts_query1 = db.session.query(HardwarePart.name.label("part_name")).distinct()
-    all_parts_query2 = db.session.query(PrintedPartsCount.part_name.label("part_name")).distinct()
+    all_parts_query2 = db.session.query(CurrentPartInventory.part_name.label("part_name"))
     all_parts_query3 = db.session.query(TopRailPieceCount.part_key.label("part_name")).distinct()
     all_parts_query4 = db.session.query(BodyPieceCount.part_key.label("part_name")).distinct()
     all_parts_union = all_parts_query1.union(all_parts_query2, all_parts_query3, all_parts_query4).all()
@@ -3063,12 +3872,7 @@ def admin():
                     inventory_recorded_at = london_now()
 
                     def restore_part(part_name, quantity):
-                        inventory_entry = (
-                            PrintedPartsCount.query
-                            .filter_by(part_name=part_name)
-                            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-                            .first()
-                        )
+                        inventory_entry = current_part_inventory_entry(part_name)
                         current_count = inventory_entry.count if inventory_entry else 0
                         db.session.add(new_printed_parts_snapshot(
                             part_name,
@@ -3137,87 +3941,132 @@ def admin():
         threshold_section_open=threshold_section_open
     )
 
-@app.route('/dashboard')
-def dashboard():
-    if 'worker' not in session:
-        flash("Please log in first.", "error")
-        return redirect(url_for('login'))
+def shift_month_start(value, months_delta):
+    """Return the first of the month, shifted by months_delta months."""
+    month_index = value.month - 1 + months_delta
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    return date(year, month, 1)
 
-    CushionCompletedSet.__table__.create(db.engine, checkfirst=True)
 
-    now = london_now()
-    today = now.date()
-    start_of_week = today - timedelta(days=today.weekday())
+def dashboard_period_buckets(today):
+    """Open-ended today/week/month/year buckets used by the /dashboard tiles."""
+    return [
+        ("today", today, None),
+        ("week", today - timedelta(days=today.weekday()), None),
+        ("month", today.replace(day=1), None),
+        ("year", today.replace(month=1, day=1), None),
+    ]
+
+
+def calendar_period_buckets(today):
+    """daily/weekly/monthly/yearly buckets bounded by the calendar, as the area dashboards count them."""
+    tomorrow = today + timedelta(days=1)
     start_of_month = today.replace(day=1)
-    start_of_year = today.replace(month=1, day=1)
+    return [
+        ("daily", today, tomorrow),
+        ("weekly", today - timedelta(days=today.weekday()), tomorrow),
+        ("monthly", start_of_month, shift_month_start(start_of_month, 1)),
+        ("yearly", today.replace(month=1, day=1), date(today.year + 1, 1, 1)),
+    ]
 
-    def get_count(model, start_date=None):
-        query = model.query
-        if start_date:
-            query = query.filter(model.date >= start_date)
-        return query.count()
-
-    top_rails_today = get_count(TopRail, today)
-    top_rails_week = get_count(TopRail, start_of_week)
-    top_rails_month = get_count(TopRail, start_of_month)
-    top_rails_year = get_count(TopRail, start_of_year)
-
-    bodies_today = get_count(CompletedTable, today)
-    bodies_week = get_count(CompletedTable, start_of_week)
-    bodies_month = get_count(CompletedTable, start_of_month)
-    bodies_year = get_count(CompletedTable, start_of_year)
-
-    pods_today = get_count(CompletedPods, today)
-    pods_week = get_count(CompletedPods, start_of_week)
-    pods_month = get_count(CompletedPods, start_of_month)
-    pods_year = get_count(CompletedPods, start_of_year)
-
-    def get_cushion_count(start_date=None):
-        query = CushionCompletedSet.query
-        if start_date:
-            query = query.filter(
-                CushionCompletedSet.completed_at >= datetime.combine(start_date, time.min)
-            )
-        return query.count()
 
-    cushions_today = get_cushion_count(today)
-    cushions_week = get_cushion_count(start_of_week)
-    cushions_month = get_cushion_count(start_of_month)
-    cushions_year = get_cushion_count(start_of_year)
+def month_buckets(month_starts):
+    """One [start, next start) bucket per month start, keyed by the month start."""
+    return [
+        (
+            start_date,
+            start_date,
+            month_starts[idx + 1] if idx + 1 < len(month_starts) else shift_month_start(start_date, 1),
+        )
+        for idx, start_date in enumerate(month_starts)
+    ]
 
-    def get_wood_count(section, start_date=None):
-        query = WoodCount.query.filter_by(section=section)
-        if start_date:
-            query = query.filter(WoodCount.date >= start_date)
-        return query.count()
 
-    wood_counts = {
-        "body": {
-            "today": get_wood_count('Body', today),
-            "week": get_wood_count('Body', start_of_week),
-            "month": get_wood_count('Body', start_of_month),
-            "year": get_wood_count('Body', start_of_year),
-        },
-        "pod_sides": {
-            "today": get_wood_count('Pod Sides', today),
-            "week": get_wood_count('Pod Sides', start_of_week),
-            "month": get_wood_count('Pod Sides', start_of_month),
-            "year": get_wood_count('Pod Sides', start_of_year),
-        },
-        "bases": {
-            "today": get_wood_count('Bases', today),
-            "week": get_wood_count('Bases', start_of_week),
-            "month": get_wood_count('Bases', start_of_month),
-            "year": get_wood_count('Bases', start_of_year),
-        },
+def period_counts(model, date_column, buckets, group_by=None, filters=(), measure=None):
+    """Count rows of ``model`` in every ``(key, start, end)`` bucket with a single aggregate query.
+
+    ``start`` is inclusive and ``end`` exclusive; either may be None for an
+    open bound. Date bounds are widened to midnight for DateTime columns.
+    ``measure`` sums a column (e.g. a pre-aggregated count) instead of
+    counting rows. Returns ``{key: count}``, or ``{group value: {key: count}}``
+    when ``group_by`` is given.
+    """
+    buckets = list(buckets)
+    if not buckets:
+        return {}
+
+    is_datetime = isinstance(date_column.type, db.DateTime)
+
+    def bound(value):
+        if value is not None and is_datetime and not isinstance(value, datetime):
+            return datetime.combine(value, time.min)
+        return value
+
+    bucket_columns = []
+    lower_bounds = []
+    for idx, (_, start, end) in enumerate(buckets):
+        start, end = bound(start), bound(end)
+        lower_bounds.append(start)
+        conditions = []
+        if start is not None:
+            conditions.append(date_column >= start)
+        if end is not None:
+            conditions.append(date_column < end)
+        amount = measure if measure is not None else literal(1)
+        hit = case((and_(*conditions), amount), else_=0) if conditions else amount
+        bucket_columns.append(func.coalesce(func.sum(hit), 0).label(f"bucket_{idx}"))
+
+    group_columns = [group_by.label("group_value")] if group_by is not None else []
+    query = select(*group_columns, *bucket_columns).select_from(model).where(*filters)
+    if all(start is not None for start in lower_bounds):
+        query = query.where(date_column >= min(lower_bounds))
+    if group_by is not None:
+        query = query.group_by(group_by)
+
+    rows = db.session.execute(query).all()
+    if group_by is None:
+        row = rows[0] if rows else None
+        return {
+            key: int(row[idx] or 0) if row is not None else 0
+            for idx, (key, _, _) in enumerate(buckets)
+        }
+    return {
+        row[0]: {key: int(row[idx + 1] or 0) for idx, (key, _, _) in enumerate(buckets)}
+        for row in rows
     }
 
-    def shift_month(dt, months_delta):
-        """Return a date at the first of the month, shifted by months_delta months."""
-        month_index = dt.month - 1 + months_delta
-        year = dt.year + month_index // 12
-        month = month_index % 12 + 1
-        return date(year, month, 1)
+
+def production_rollup_period_counts(area, buckets):
+    """period_counts() for one production area, read from the daily rollup."""
+    ensure_daily_production_rollup_table()
+    return period_counts(
+        DailyProductionRollup,
+        DailyProductionRollup.date,
+        buckets,
+        filters=(DailyProductionRollup.area == area,),
+        measure=DailyProductionRollup.completed_count,
+    )
+
+
+def serial_is_6ft_expression(serial_column):
+    """SQL counterpart of the API's 6ft serial check (" - 6", "-6" or a trailing "-6")."""
+    return or_(
+        serial_column.like("% - 6%"),
+        serial_column.like("%-6%"),
+        func.replace(serial_column, " ", "").like("%-6"),
+    )
+
+
+@app.route('/dashboard')
+def dashboard():
+    if 'worker' not in session:
+        flash("Please log in first.", "error")
+        return redirect(url_for('login'))
+
+    now = london_now()
+    today = now.date()
+    shift_month = shift_month_start
 
     # Range controls
     def clamp(val, lo, hi):
@@ -3263,59 +4112,46 @@ def dashboard():
         first_month = shift_month(current_month_start, -months_back)
         month_starts = [shift_month(first_month, i) for i in range(total_months)]
 
-    def monthly_counts(model, date_column=None):
-        date_column = date_column if date_column is not None else model.date
-        counts = []
-        for idx, start_date in enumerate(month_starts):
-            end_date = month_starts[idx + 1] if idx + 1 < len(month_starts) else shift_month(start_date, 1)
-            if isinstance(date_column.type, db.DateTime):
-                range_start = datetime.combine(start_date, time.min)
-                range_end = datetime.combine(end_date, time.min)
-            else:
-                range_start = start_date
-                range_end = end_date
-            total = model.query.filter(
-                date_column >= range_start,
-                date_column < range_end
-            ).count()
-            counts.append(total)
-        return counts
+    # Every area's tiles and chart series come from one pass over the daily rollup.
+    period_buckets = dashboard_period_buckets(today)
+    chart_buckets = month_buckets(month_starts)
+    ensure_daily_production_rollup_table()
+    area_counts = period_counts(
+        DailyProductionRollup,
+        DailyProductionRollup.date,
+        period_buckets + chart_buckets,
+        group_by=DailyProductionRollup.area,
+        measure=DailyProductionRollup.completed_count,
+    )
+    stats = {}
+    chart_series = {}
+    for area in ("pods", "bodies", "top_rails", "cushions"):
+        counts = area_counts.get(area, {})
+        stats[area] = {key: counts.get(key, 0) for key, _, _ in period_buckets}
+        chart_series[area] = [counts.get(key, 0) for key, _, _ in chart_buckets]
+
+    wood_sections = {"body": "Body", "pod_sides": "Pod Sides", "bases": "Bases"}
+    wood_by_section = period_counts(
+        WoodCount,
+        WoodCount.date,
+        period_buckets,
+        group_by=WoodCount.section,
+        filters=(WoodCount.section.in_(wood_sections.values()),),
+    )
+    wood_counts = {
+        key: {
+            period: wood_by_section.get(section, {}).get(period, 0)
+            for period, _, _ in period_buckets
+        }
+        for key, section in wood_sections.items()
+    }
 
     chart_labels = [dt.strftime("%b %Y") for dt in month_starts]
-    chart_data_pods = monthly_counts(CompletedPods)
-    chart_data_bodies = monthly_counts(CompletedTable)
-    chart_data_top_rails = monthly_counts(TopRail)
-    chart_data_cushions = monthly_counts(
-        CushionCompletedSet,
-        CushionCompletedSet.completed_at
-    )
+    chart_data_pods = chart_series["pods"]
+    chart_data_bodies = chart_series["bodies"]
+    chart_data_top_rails = chart_series["top_rails"]
+    chart_data_cushions = chart_series["cushions"]
 
-    stats = {
-        "pods": {
-            "today": pods_today,
-            "week": pods_week,
-            "month": pods_month,
-            "year": pods_year,
-        },
-        "bodies": {
-            "today": bodies_today,
-            "week": bodies_week,
-            "month": bodies_month,
-            "year": bodies_year,
-        },
-        "top_rails": {
-            "today": top_rails_today,
-            "week": top_rails_week,
-            "month": top_rails_month,
-            "year": top_rails_year,
-        },
-        "cushions": {
-            "today": cushions_today,
-            "week": cushions_week,
-            "month": cushions_month,
-            "year": cushions_year,
-        },
-    }
     summary = {
         period: sum(area[period] for area in stats.values())
         for period in ("today", "week", "month", "year")
@@ -3371,42 +4207,51 @@ def parse_compare_week(value, fallback_date):
         return fallback_monday
 
 
-def parse_completion_time(value):
-    if isinstance(value, time):
-        return value
-    if isinstance(value, datetime):
-        return value.time()
-    if value is None:
-        return None
+def completion_clock_expression(column):
+    """Finish time as 'HH:MM:SS.SSS' text (NULL when unparseable), comparable as a string.
 
-    value_text = str(value).strip()
-    for fmt in ("%H:%M:%S", "%H:%M"):
-        try:
-            return datetime.strptime(value_text, fmt).time()
-        except ValueError:
-            continue
-    return None
+    Handles "HH:MM" / "HH:MM:SS" strings, single-digit hours, and Time columns
+    stored by SQLAlchemy with microseconds.
+    """
+    trimmed = func.trim(column)
+    padded = case((func.instr(trimmed, ":") == 2, literal("0") + trimmed), else_=trimmed)
+    return func.strftime("%H:%M:%f", padded)
 
 
-def count_completed_to_clock(model, start_date, as_of_date, as_of_time, time_attr_name):
-    rows = (
-        model.query
-        .filter(model.date >= start_date, model.date <= as_of_date)
-        .all()
-    )
+def completion_clock_literal(value):
+    return literal(f"{value:%H:%M:%S}.{value.microsecond // 1000:03d}")
 
-    total = 0
-    for row in rows:
-        row_date = row.date
-        if row_date < as_of_date:
-            total += 1
-            continue
 
-        completion_time = parse_completion_time(getattr(row, time_attr_name, None))
-        if completion_time and completion_time <= as_of_time:
-            total += 1
+def count_completed_to_clock_windows(model, windows, time_attr_name="finish_time"):
+    """Count completions per window in one aggregate, without loading any rows.
 
-    return total
+    ``windows`` maps a key to ``(start_date, as_of_date, as_of_time)``; a row
+    counts when it falls between start_date and the day before as_of_date, or
+    on as_of_date with a finish time at or before as_of_time.
+    """
+    if not windows:
+        return {}
+    finish_clock = completion_clock_expression(getattr(model, time_attr_name))
+    labels = []
+    measures = []
+    for index, (key, (start_date, as_of_date, as_of_time)) in enumerate(windows.items()):
+        in_window = and_(
+            model.date >= start_date,
+            or_(
+                model.date < as_of_date,
+                and_(model.date == as_of_date, finish_clock <= completion_clock_literal(as_of_time)),
+            ),
+        )
+        labels.append(key)
+        measures.append(func.coalesce(func.sum(case((in_window, 1), else_=0)), 0).label(f"w{index}"))
+
+    row = db.session.execute(
+        select(*measures).where(
+            model.date >= min(window[0] for window in windows.values()),
+            model.date <= max(window[1] for window in windows.values()),
+        )
+    ).one()
+    return {key: int(value or 0) for key, value in zip(labels, row)}
 
 
 TOP_RAIL_PIECE_COLOR_KEYS = ["black", "rustic_oak", "grey_oak", "stone", "rustic_black"]
@@ -3499,6 +4344,7 @@ def restore_top_rail_piece_inventory(size_label, color_key, worker, note):
         )
 
 
+@schema_migration(9, "top_rail_piece_count_log")
 def ensure_top_rail_piece_count_log_table():
     TopRailPieceCountLog.__table__.create(db.engine, checkfirst=True)
 
@@ -3557,16 +4403,7 @@ def seed_top_rail_piece_count_log_baseline(commit=True):
 
 
 def top_rail_piece_counts_as_of(as_of_dt):
-    logs = (
-        TopRailPieceCountLog.query
-        .filter(TopRailPieceCountLog.created_at <= as_of_dt)
-        .order_by(TopRailPieceCountLog.created_at.asc(), TopRailPieceCountLog.id.asc())
-        .all()
-    )
-    counts = {}
-    for entry in logs:
-        counts[entry.part_key] = entry.count_after
-    return counts
+    return counts_as_of("top_rail_pieces", as_of_dt)
 
 
 def top_rail_piece_rails_possible_as_of(as_of_dt):
@@ -3600,6 +4437,14 @@ def component_delta_summary(current_count, previous_count):
     }
 
 
+PACKAGING_EXTRACTION_RUNNING = "running"
+PACKAGING_EXTRACTION_DONE = "done"
+PACKAGING_EXTRACTION_FAILED = "failed"
+# A running job whose progress has not moved for this long lost its worker
+# thread (usually a restart) and is released for manual entry.
+PACKAGING_EXTRACTION_STALE_SECONDS = 10 * 60
+
+
 class InvoicePackagingJob(db.Model):
     __tablename__ = "invoice_packaging_job"
 
@@ -3621,8 +4466,11 @@ class InvoicePackagingJob(db.Model):
     stock_removed_at = db.Column(db.DateTime, nullable=True)
     stock_removed_by = db.Column(db.String(50), nullable=True)
     stock_removal_json = db.Column(db.Text, nullable=False, default="[]")
+    extraction_status = db.Column(db.String(20), nullable=False, default=PACKAGING_EXTRACTION_DONE)
+    extraction_progress_json = db.Column(db.Text, nullable=False, default="{}")
 
 
+@schema_migration(10, "invoice_packaging_tables")
 def ensure_invoice_packaging_tables():
     InvoicePackagingJob.__table__.create(db.engine, checkfirst=True)
     existing_columns = {
@@ -3670,6 +4518,31 @@ def ensure_invoice_packaging_tables():
         db.session.commit()
 
 
+@schema_migration(20, "invoice_extraction_progress")
+def ensure_invoice_extraction_columns():
+    existing_columns = {
+        row[1]
+        for row in db.session.execute(
+            text("PRAGMA table_info(invoice_packaging_job)")
+        ).fetchall()
+    }
+    migration_changed = False
+    if "extraction_status" not in existing_columns:
+        db.session.execute(text(
+            "ALTER TABLE invoice_packaging_job "
+            "ADD COLUMN extraction_status VARCHAR(20) NOT NULL DEFAULT 'done'"
+        ))
+        migration_changed = True
+    if "extraction_progress_json" not in existing_columns:
+        db.session.execute(text(
+            "ALTER TABLE invoice_packaging_job "
+            "ADD COLUMN extraction_progress_json TEXT NOT NULL DEFAULT '{}'"
+        ))
+        migration_changed = True
+    if migration_changed:
+        db.session.commit()
+
+
 def packaging_json_load(value, fallback):
     try:
         parsed = json.loads(value or "")
@@ -3709,9 +4582,78 @@ def packaging_job_payload(job):
         "stock_removed_by": job.stock_removed_by or "",
         "stock_removal": packaging_json_load(job.stock_removal_json, []),
         "summary": build_packaging_summary(items, pallets, config=config),
+        "extraction_status": job.extraction_status or PACKAGING_EXTRACTION_DONE,
+        "extraction_progress": packaging_extraction_progress(job),
+    }
+
+
+def packaging_extraction_progress(job):
+    progress = packaging_json_load(job.extraction_progress_json, {})
+    files = progress.get("files") or []
+    return {
+        "total": len(files),
+        "done": sum(1 for file in files if file.get("status") != "queued"),
+        "files": files,
     }
 
 
+def release_stale_packaging_extraction(job):
+    """Fail a running extraction whose worker thread is gone so the plan can be edited."""
+    if job.extraction_status != PACKAGING_EXTRACTION_RUNNING:
+        return False
+    now = london_now().replace(tzinfo=None)
+    if job.updated_at and (now - job.updated_at).total_seconds() < PACKAGING_EXTRACTION_STALE_SECONDS:
+        return False
+    warnings = packaging_json_load(job.extraction_warnings_json, [])
+    warnings.append("Invoice extraction stopped before it finished. Add the remaining items manually.")
+    job.extraction_warnings_json = json.dumps(warnings)
+    job.extraction_status = PACKAGING_EXTRACTION_FAILED
+    job.updated_at = now
+    db.session.commit()
+    return True
+
+
+def run_packaging_extraction(job_id, files):
+    """Extract uploaded invoices for a job on the shared pipeline, recording per-file progress."""
+    with app.app_context():
+        job = db.session.get(InvoicePackagingJob, job_id)
+        progress = packaging_json_load(job.extraction_progress_json, {})
+
+        def on_file_done(index, filename, status):
+            progress["files"][index]["status"] = status
+            job.extraction_progress_json = json.dumps(progress)
+            job.updated_at = london_now().replace(tzinfo=None)
+            db.session.commit()
+
+        try:
+            results = invoice_extraction_pipeline.run(files, on_file_done=on_file_done)
+        except Exception as error:
+            db.session.rollback()
+            print(f"Invoice extraction for packaging plan {job_id} failed: {error}")
+            job = db.session.get(InvoicePackagingJob, job_id)
+            warnings = packaging_json_load(job.extraction_warnings_json, [])
+            warnings.append(
+                f"Invoice extraction failed ({type(error).__name__}). Add the items manually."
+            )
+            job.extraction_warnings_json = json.dumps(warnings)
+            job.extraction_status = PACKAGING_EXTRACTION_FAILED
+            job.updated_at = london_now().replace(tzinfo=None)
+            db.session.commit()
+            return
+
+        items = []
+        warnings = packaging_json_load(job.extraction_warnings_json, [])
+        for file_items, file_warnings in results:
+            items.extend(file_items)
+            warnings.extend(file_warnings)
+        job.items_json = json.dumps(items)
+        job.automatic_items_json = json.dumps(items)
+        job.extraction_warnings_json = json.dumps(warnings)
+        job.extraction_status = PACKAGING_EXTRACTION_DONE
+        job.updated_at = london_now().replace(tzinfo=None)
+        db.session.commit()
+
+
 def packaging_stock_color_key(colour):
     normalised = re.sub(r"[^a-z]+", "_", (colour or "").strip().lower()).strip("_")
     aliases = {
@@ -3856,8 +4798,11 @@ def invoice_packaging():
                 continue
             valid_uploads.append(uploaded_file)
 
-        items, extraction_warnings, source_files = extract_invoice_files(valid_uploads)
-        extraction_warnings = upload_warnings + extraction_warnings
+        files = [
+            (os.path.basename(uploaded_file.filename or "invoice"), uploaded_file.read())
+            for uploaded_file in valid_uploads
+        ]
+        source_files = [filename for filename, _ in files]
         now = london_now().replace(tzinfo=None)
         default_title = f"Packaging plan - {now.strftime('%d %b %Y %H:%M')}"
         job = InvoicePackagingJob(
@@ -3866,25 +4811,46 @@ def invoice_packaging():
             created_at=now,
             updated_at=now,
             source_files_json=json.dumps(source_files),
-            items_json=json.dumps(items),
+            items_json="[]",
             pallets_json="[]",
             config_json=json.dumps(normalise_packaging_config({})),
-            automatic_items_json=json.dumps(items),
+            automatic_items_json="[]",
             automatic_config_json=json.dumps(normalise_packaging_config({})),
-            extraction_warnings_json=json.dumps(extraction_warnings),
+            extraction_warnings_json=json.dumps(upload_warnings),
             warnings_json="[]",
             acknowledged_warnings_json="[]",
             notes="",
+            extraction_status=(
+                PACKAGING_EXTRACTION_RUNNING if files else PACKAGING_EXTRACTION_DONE
+            ),
+            extraction_progress_json=json.dumps({
+                "files": [{"name": filename, "status": "queued"} for filename in source_files],
+            }),
         )
         db.session.add(job)
         db.session.commit()
-        if extraction_warnings:
+        if files:
+            threading.Thread(
+                target=run_packaging_extraction,
+                args=(job.id, files),
+                name=f"invoice-extraction-{job.id}",
+                daemon=True,
+            ).start()
+
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({
+                "success": True,
+                "job_id": job.id,
+                "status": job.extraction_status,
+                "progress_url": url_for("invoice_packaging_extraction", job_id=job.id),
+            }), 202
+        if upload_warnings:
             flash(
-                "Invoice review created. Check the extraction warnings and correct the detected items.",
+                "Invoice review created. Some files were skipped - check the extraction warnings.",
                 "warning",
             )
-        else:
-            flash("Invoice items extracted. Review them before generating pallets.", "success")
+        elif files:
+            flash("Reading the invoices. The review opens when every file is done.", "success")
         return redirect(url_for("invoice_packaging", plan=job.id))
 
     selected_job = None
@@ -3893,6 +4859,8 @@ def invoice_packaging():
         selected_job = InvoicePackagingJob.query.get(requested_plan_id)
         if not selected_job:
             flash("That packaging plan was not found.", "error")
+        else:
+            release_stale_packaging_extraction(selected_job)
 
     recent_jobs = (
         InvoicePackagingJob.query
@@ -3909,12 +4877,40 @@ def invoice_packaging():
     )
 
 
+@app.route("/api/invoice_packaging/<int:job_id>/extraction")
+def invoice_packaging_extraction(job_id):
+    if "worker" not in session:
+        return jsonify({"success": False, "error": "Not logged in"}), 401
+
+    job = packaging_job_or_404(job_id)
+    release_stale_packaging_extraction(job)
+    return jsonify({
+        "success": True,
+        "status": job.extraction_status,
+        "progress": packaging_extraction_progress(job),
+        "extraction_warnings": packaging_json_load(job.extraction_warnings_json, []),
+        "item_count": len(packaging_json_load(job.items_json, [])),
+    })
+
+
+def packaging_extraction_conflict(job):
+    if job.extraction_status == PACKAGING_EXTRACTION_RUNNING:
+        return jsonify({
+            "success": False,
+            "error": "The invoices for this plan are still being read. Try again when it finishes.",
+        }), 409
+    return None
+
+
 @app.route("/api/invoice_packaging/<int:job_id>/save", methods=["POST"])
 def save_invoice_packaging(job_id):
     if "worker" not in session:
         return jsonify({"success": False, "error": "Not logged in"}), 401
 
     job = packaging_job_or_404(job_id)
+    conflict = packaging_extraction_conflict(job)
+    if conflict:
+        return conflict
     data = request.get_json(silent=True) or {}
     try:
         items = normalise_packaging_items(data.get("items", []))
@@ -3924,8 +4920,28 @@ def save_invoice_packaging(job_id):
         if not isinstance(pallets, list) or len(pallets) > 1000:
             raise ValueError("The pallet data is invalid or too large.")
         config = normalise_packaging_config(data.get("config", {}))
-        warnings = validate_packaging(items, pallets, config)
-        summary = build_packaging_summary(items, pallets, config=config)
+        if pallets and (
+            items != packaging_json_load(job.items_json, [])
+            or config != normalise_packaging_config(packaging_json_load(job.config_json, {}))
+        ):
+            # Item or setting edits re-plan the pallets, keeping manual moves. Only the
+            # planning segments the edits touched are packed again, so this stays fast
+            # for large multi-PO orders.
+            result = regenerate_packaging(
+                items,
+                config,
+                existing_pallets=pallets,
+                baseline_items=packaging_json_load(job.automatic_items_json, []),
+                baseline_config=packaging_json_load(job.automatic_config_json, {}),
+                preserve_manual_layout=data.get("manual_layout_override") is True,
+            )
+            items, pallets, config = result["items"], result["pallets"], result["config"]
+            warnings, summary = result["warnings"], result["summary"]
+            job.automatic_items_json = json.dumps(items)
+            job.automatic_config_json = json.dumps(config)
+        else:
+            warnings = validate_packaging(items, pallets, config)
+            summary = build_packaging_summary(items, pallets, config=config)
         current_warning_ids = {warning["id"] for warning in warnings}
         acknowledged_ids = [
             warning_id for warning_id in data.get("acknowledged_warning_ids", [])
@@ -3958,6 +4974,9 @@ def generate_invoice_packaging(job_id):
         return jsonify({"success": False, "error": "Not logged in"}), 401
 
     job = packaging_job_or_404(job_id)
+    conflict = packaging_extraction_conflict(job)
+    if conflict:
+        return conflict
     data = request.get_json(silent=True) or {}
     try:
         items = normalise_packaging_items(data.get("items", []))
@@ -4111,6 +5130,7 @@ def invoice_packaging_labels(job_id):
     )
 
 
+@schema_migration(11, "production_comparison_tables")
 def ensure_production_comparison_tables():
     CompletedPods.__table__.create(db.engine, checkfirst=True)
     TopRail.__table__.create(db.engine, checkfirst=True)
@@ -4181,26 +5201,43 @@ def production_comparison():
     previous_start_dt = datetime.combine(previous_month_start, time.min)
     previous_as_of_dt = datetime.combine(previous_as_of_date, selected_time)
 
+    current_week_start = parse_compare_week(request.args.get("compare_week"), today)
+    current_week_end = current_week_start + timedelta(days=6)
+    previous_week_start = current_week_start - timedelta(days=7)
+    previous_week_end = current_week_start - timedelta(days=1)
+
+    comparison_windows = {
+        "current_month": (current_month_start, selected_date, selected_time),
+        "previous_month": (previous_month_start, previous_as_of_date, selected_time),
+        "current_week": (current_week_start, current_week_end, time.max),
+        "previous_week": (previous_week_start, previous_week_end, time.max),
+    }
+    completion_counts = {
+        key: count_completed_to_clock_windows(model, comparison_windows)
+        for key, model in (("pods", CompletedPods), ("top_rails", TopRail), ("bodies", CompletedTable))
+    }
+    top_rail_piece_series = counts_series("top_rail_pieces", [current_as_of_dt, previous_as_of_dt])
+
     current_counts = {
-        "pods": count_completed_to_clock(CompletedPods, current_month_start, selected_date, selected_time, "finish_time"),
-        "top_rails": count_completed_to_clock(TopRail, current_month_start, selected_date, selected_time, "finish_time"),
-        "bodies": count_completed_to_clock(CompletedTable, current_month_start, selected_date, selected_time, "finish_time"),
+        "pods": completion_counts["pods"]["current_month"],
+        "top_rails": completion_counts["top_rails"]["current_month"],
+        "bodies": completion_counts["bodies"]["current_month"],
         "cushions": CushionCompletedSet.query.filter(
             CushionCompletedSet.completed_at >= current_start_dt,
             CushionCompletedSet.completed_at <= current_as_of_dt
         ).count(),
-        "top_rail_piece_rails": top_rail_piece_rails_possible_as_of(current_as_of_dt),
+        "top_rail_piece_rails": top_rail_piece_rails_possible_from_counts(top_rail_piece_series[current_as_of_dt]),
     }
 
     previous_counts = {
-        "pods": count_completed_to_clock(CompletedPods, previous_month_start, previous_as_of_date, selected_time, "finish_time"),
-        "top_rails": count_completed_to_clock(TopRail, previous_month_start, previous_as_of_date, selected_time, "finish_time"),
-        "bodies": count_completed_to_clock(CompletedTable, previous_month_start, previous_as_of_date, selected_time, "finish_time"),
+        "pods": completion_counts["pods"]["previous_month"],
+        "top_rails": completion_counts["top_rails"]["previous_month"],
+        "bodies": completion_counts["bodies"]["previous_month"],
         "cushions": CushionCompletedSet.query.filter(
             CushionCompletedSet.completed_at >= previous_start_dt,
             CushionCompletedSet.completed_at <= previous_as_of_dt
         ).count(),
-        "top_rail_piece_rails": top_rail_piece_rails_possible_as_of(previous_as_of_dt),
+        "top_rail_piece_rails": top_rail_piece_rails_possible_from_counts(top_rail_piece_series[previous_as_of_dt]),
     }
 
     labels = {
@@ -4236,22 +5273,14 @@ def production_comparison():
         "previous": previous_total,
     })
 
-    current_week_start = parse_compare_week(request.args.get("compare_week"), today)
-    current_week_end = current_week_start + timedelta(days=6)
-    previous_week_start = current_week_start - timedelta(days=7)
-    previous_week_end = current_week_start - timedelta(days=1)
     current_week_start_dt = datetime.combine(current_week_start, time.min)
     current_week_as_of_dt = datetime.combine(current_week_end, time.max)
     previous_week_start_dt = datetime.combine(previous_week_start, time.min)
     previous_week_as_of_dt = datetime.combine(previous_week_end, time.max)
 
     weekly_current_counts = {
-        "bodies": count_completed_to_clock(
-            CompletedTable, current_week_start, current_week_end, time.max, "finish_time"
-        ),
-        "pods": count_completed_to_clock(
-            CompletedPods, current_week_start, current_week_end, time.max, "finish_time"
-        ),
+        "bodies": completion_counts["bodies"]["current_week"],
+        "pods": completion_counts["pods"]["current_week"],
         "cushions": CushionCompletedSet.query.filter(
             CushionCompletedSet.completed_at >= current_week_start_dt,
             CushionCompletedSet.completed_at <= current_week_as_of_dt,
@@ -4259,17 +5288,11 @@ def production_comparison():
         "wood_cut": count_wood_sheets_for_comparison(
             current_week_start_dt, current_week_as_of_dt
         ),
-        "top_rails": count_completed_to_clock(
-            TopRail, current_week_start, current_week_end, time.max, "finish_time"
-        ),
+        "top_rails": completion_counts["top_rails"]["current_week"],
     }
     weekly_previous_counts = {
-        "bodies": count_completed_to_clock(
-            CompletedTable, previous_week_start, previous_week_end, time.max, "finish_time"
-        ),
-        "pods": count_completed_to_clock(
-            CompletedPods, previous_week_start, previous_week_end, time.max, "finish_time"
-        ),
+        "bodies": completion_counts["bodies"]["previous_week"],
+        "pods": completion_counts["pods"]["previous_week"],
         "cushions": CushionCompletedSet.query.filter(
             CushionCompletedSet.completed_at >= previous_week_start_dt,
             CushionCompletedSet.completed_at <= previous_week_as_of_dt,
@@ -4277,9 +5300,7 @@ def production_comparison():
         "wood_cut": count_wood_sheets_for_comparison(
             previous_week_start_dt, previous_week_as_of_dt
         ),
-        "top_rails": count_completed_to_clock(
-            TopRail, previous_week_start, previous_week_end, time.max, "finish_time"
-        ),
+        "top_rails": completion_counts["top_rails"]["previous_week"],
     }
     weekly_labels = {
         "bodies": "Bodies",
@@ -4372,18 +5393,13 @@ def inventory():
         "6ft Carpet", "7ft Carpet", FELT_PART_NAME
     ]
 
+    inventory_snapshot = current_part_inventory_snapshot()
     inventory_counts = {}
     for part in parts:
         if part == FELT_PART_NAME:
-            inventory_counts[part] = get_felt_count()
+            inventory_counts[part] = get_felt_count(inventory_snapshot)
             continue
-        latest_entry = (
-            db.session.query(PrintedPartsCount.count)
-            .filter_by(part_name=part)
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-            .first()
-        )
-        inventory_counts[part] = latest_entry[0] if latest_entry else 0
+        inventory_counts[part] = snapshot_part_count(inventory_snapshot, part, include_baseline=False)
 
     # ---------------------------------------------------------------------
     # 2) WOODEN PARTS
@@ -4497,23 +5513,11 @@ def inventory():
     # ---------------------------------------------------------------------
     table_parts = {part: 0 for part in ALL_CHINESE_PARTS}
     all_hardware_parts = HardwarePart.query.all()
-    hardware_initial_counts = {
-        part.name.casefold(): part.initial_count for part in all_hardware_parts
-    }
 
-    table_parts_counts = {part: 0 for part in table_parts}
-    for part in table_parts_counts:
-        latest_entry = (
-            db.session.query(PrintedPartsCount.count)
-            .filter_by(part_name=part)
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-            .first()
-        )
-        table_parts_counts[part] = (
-            latest_entry[0]
-            if latest_entry
-            else hardware_initial_counts.get(part.casefold(), 0)
-        )
+    table_parts_counts = {
+        part: snapshot_part_count(inventory_snapshot, part)
+        for part in table_parts
+    }
 
     table_parts_on_order_counts = saved_chinese_parts_on_order_counts()
     max_tables_possible_stock, tables_possible_per_part_stock = calculate_chinese_parts_build_capacity(
@@ -4531,15 +5535,10 @@ def inventory():
         part for part in all_hardware_parts
         if part.name.casefold() not in CHINESE_PART_NAME_KEYS
     ]
-    hardware_counts = {}
-    for hp in hardware_parts_query:
-        latest_entry = (
-            db.session.query(PrintedPartsCount.count)
-            .filter_by(part_name=hp.name)
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-            .first()
-        )
-        hardware_counts[hp.name] = latest_entry[0] if latest_entry else hp.initial_count
+    hardware_counts = {
+        hp.name: snapshot_part_count(inventory_snapshot, hp.name, default=hp.initial_count)
+        for hp in hardware_parts_query
+    }
 
     # ---------------------------------------------------------------------
     # 6) RENDER TEMPLATE
@@ -4565,8 +5564,6 @@ def inventory():
 def build_stock_snapshot():
     stock_items = []
 
-    BodyPieceCount.__table__.create(db.engine, checkfirst=True)
-
     def add_item(category, identifier, label, count, key_category=None, **extra_fields):
         key_source = identifier or label
         storage_category = key_category or category
@@ -4587,28 +5584,22 @@ def build_stock_snapshot():
             item_data.update(extra_fields)
         stock_items.append(item_data)
 
+    inventory_snapshot = current_part_inventory_snapshot()
+
     def fetch_part_count(part_name):
         if part_name == FELT_PART_NAME:
-            felt_entry = get_latest_part_entry(FELT_PART_NAME)
-            if felt_entry:
-                return felt_entry.count, True
-            legacy_total = 0
-            has_legacy = False
-            for legacy_name in LEGACY_FELT_PART_NAMES:
-                legacy_entry = get_latest_part_entry(legacy_name)
-                if legacy_entry:
-                    legacy_total += legacy_entry.count
-                    has_legacy = True
-            return legacy_total, has_legacy
+            felt_entry = inventory_snapshot.get(FELT_PART_NAME.lower())
+            if felt_entry and felt_entry[2]:
+                return felt_entry[1], True
+            has_legacy = any(
+                inventory_snapshot.get(legacy_name.lower(), (None, 0, False))[2]
+                for legacy_name in LEGACY_FELT_PART_NAMES
+            )
+            return get_felt_count(inventory_snapshot), has_legacy
 
-        entry = (
-            PrintedPartsCount.query
-            .filter_by(part_name=part_name)
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-            .first()
-        )
-        if entry:
-            return entry.count, True
+        entry = inventory_snapshot.get(part_name.lower())
+        if entry and entry[2]:
+            return entry[1], True
         return 0, False
 
     core_parts = [
@@ -4627,14 +5618,12 @@ def build_stock_snapshot():
     hardware_defaults = {hp.name: hp.initial_count for hp in hardware_parts}
 
     part_names = set()
-    distinct_parts = db.session.query(PrintedPartsCount.part_name).distinct().all()
     excluded_legacy_parts = {
         *LEGACY_FELT_PART_NAMES,
         *LEGACY_SEVEN_FOOT_GULLY_PARTS.keys(),
     }
-    for part_tuple in distinct_parts:
-        part_name = part_tuple[0]
-        if part_name and part_name not in excluded_legacy_parts:
+    for part_name, _, has_snapshot in inventory_snapshot.values():
+        if has_snapshot and part_name and part_name not in excluded_legacy_parts:
             part_names.add(part_name)
 
     part_names.update(core_parts)
@@ -5081,6 +6070,40 @@ def stock_costs():
         category_totals.get(cat, {}).get('inc_vat', 0.0) for cat in parts_on_water_categories
     )
 
+    def stock_snapshot_rows(items, include_category_headers):
+        yield [
+            "Category",
+            "Item",
+            "Count",
+            "Unit Cost",
+            "Shipping Cost",
+            "Labour Cost",
+            "Cost / Item (Ex VAT)",
+            "Cost / Item (Incl VAT)",
+            "Stock Value (Ex VAT)",
+            "Stock Value (Incl VAT)",
+        ]
+        last_category = None
+        for item in items:
+            if include_category_headers:
+                category_label = item.get("category", "")
+                if category_label and category_label != last_category:
+                    yield [category_label] + [""] * 9
+                    last_category = category_label
+            count_display = item.get("count_display", item.get("count", 0))
+            yield [
+                item.get("category", ""),
+                item.get("label", ""),
+                count_display,
+                item.get("unit_cost", 0),
+                item.get("shipping_cost", 0),
+                item.get("labour_cost", 0),
+                item.get("per_item_total", 0),
+                item.get("per_item_with_vat", 0),
+                item.get("stock_value_ex_vat", 0),
+                item.get("stock_value_inc_vat", 0),
+            ]
+
     def write_stock_snapshot_file(items, filename, include_category_headers=False):
         try:
             os.makedirs(STOCK_SNAPSHOT_DIR, exist_ok=True)
@@ -5088,39 +6111,8 @@ def stock_costs():
             if not filepath:
                 return False
             with open(filepath, "w", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    "Category",
-                    "Item",
-                    "Count",
-                    "Unit Cost",
-                    "Shipping Cost",
-                    "Labour Cost",
-                    "Cost / Item (Ex VAT)",
-                    "Cost / Item (Incl VAT)",
-                    "Stock Value (Ex VAT)",
-                    "Stock Value (Incl VAT)",
-                ])
-                last_category = None
-                for item in items:
-                    if include_category_headers:
-                        category_label = item.get("category", "")
-                        if category_label and category_label != last_category:
-                            writer.writerow([category_label] + [""] * 9)
-                            last_category = category_label
-                    count_display = item.get("count_display", item.get("count", 0))
-                    writer.writerow([
-                        item.get("category", ""),
-                        item.get("label", ""),
-                        count_display,
-                        item.get("unit_cost", 0),
-                        item.get("shipping_cost", 0),
-                        item.get("labour_cost", 0),
-                        item.get("per_item_total", 0),
-                        item.get("per_item_with_vat", 0),
-                        item.get("stock_value_ex_vat", 0),
-                        item.get("stock_value_inc_vat", 0),
-                    ])
+                for chunk in csv_chunks(stock_snapshot_rows(items, include_category_headers)):
+                    f.write(chunk)
             return True
         except OSError:
             return False
@@ -5265,7 +6257,13 @@ def download_stock_snapshot(filename):
     if 'worker' not in session:
         flash("Please log in first.", "error")
         return redirect(url_for('login'))
-    return send_from_directory(STOCK_SNAPSHOT_DIR, filename, as_attachment=True)
+    filepath = safe_stock_snapshot_file_path(filename)
+    if not filepath or not os.path.isfile(filepath):
+        abort(404)
+    if not csv_gzip_accepted():
+        # Plain downloads keep Content-Length, ETag, conditional and range requests.
+        return send_from_directory(STOCK_SNAPSHOT_DIR, filename, as_attachment=True)
+    return csv_stream_response(file_chunks(filepath), filename)
 
 
 @app.route('/stock_costs_snapshot/delete', methods=['POST'])
@@ -5332,27 +6330,14 @@ def counting_chinese_parts():
         return redirect(url_for('login'))
 
     table_parts = list(ALL_CHINESE_PARTS)
-    hardware_initial_counts = {
-        part.name.casefold(): part.initial_count for part in HardwarePart.query.all()
-    }
 
     def get_table_parts_counts():
         """
         Return a dictionary of { part_name: current_count } for each part.
         If no count has been logged yet, retain any legacy hardware starting count.
         """
-        counts = {}
-        for part in table_parts:
-            existing_entry = (db.session.query(PrintedPartsCount)
-                              .filter_by(part_name=part)
-                              .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-                              .first())
-            counts[part] = (
-                existing_entry.count
-                if existing_entry
-                else hardware_initial_counts.get(part.casefold(), 0)
-            )
-        return counts
+        snapshot = current_part_inventory_snapshot()
+        return {part: snapshot_part_count(snapshot, part) for part in table_parts}
 
     # Fetch current counts for all parts
     table_parts_counts = get_table_parts_counts()
@@ -5372,17 +6357,7 @@ def counting_chinese_parts():
             flash("Invalid part selected.", "error")
             return redirect(url_for('counting_chinese_parts'))
 
-        # Fetch the specific part entry to be updated
-        existing_entry = (db.session.query(PrintedPartsCount)
-                          .filter_by(part_name=selected_part)
-                          .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-                          .first())
-
-        current_count = (
-            existing_entry.count
-            if existing_entry
-            else hardware_initial_counts.get(selected_part.casefold(), 0)
-        )
+        _, current_count = current_printed_part_inventory(selected_part)
 
         # Perform the requested action
         if action == 'increment':
@@ -5442,6 +6417,8 @@ def counting_chinese_parts():
         )
 
         for entry in recent_entries:
+            # The delta needs the snapshot before this one; the projection only
+            # keeps the latest, so this stays on the log.
             previous = (
                 PrintedPartsCount.query
                 .filter(PrintedPartsCount.part_name == entry.part_name)
@@ -5483,16 +6460,10 @@ def counting_gullies():
         flash("Please log in first.", "error")
         return redirect(url_for('login'))
 
-    GullyConversionLog.__table__.create(db.engine, checkfirst=True)
     gully_parts = ["Gullies Untouched", *GULLY_SET_PART_NAMES.values()]
 
     def latest_count(part_name):
-        entry = (
-            PrintedPartsCount.query
-            .filter_by(part_name=part_name)
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc(), PrintedPartsCount.id.desc())
-            .first()
-        )
+        entry = current_part_inventory_entry(part_name)
         return int(entry.count or 0) if entry else 0
 
     selected_size = request.form.get('size_label', '7ft')
@@ -5610,23 +6581,18 @@ def counting_hardware():
     selected_part = request.args.get('selected') if request.args.get('selected') else (hardware_parts[0].name if hardware_parts else None)
 
     # 2. Build a dictionary of the latest known counts (or initial_count if none recorded)
-    hardware_counts = {}
-    for part in hardware_parts:
-        latest_entry = (db.session.query(PrintedPartsCount.count)
-                        .filter_by(part_name=part.name)
-                        .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-                        .first())
-        hardware_counts[part.name] = latest_entry[0] if latest_entry else part.initial_count
+    inventory_snapshot = current_part_inventory_snapshot()
+    hardware_counts = {
+        part.name: snapshot_part_count(inventory_snapshot, part.name)
+        for part in hardware_parts
+    }
     hardware_counts_raw = dict(hardware_counts)
 
     def pallet_wrap_display_count():
         target_name = "Pallet Wrap"
         wrap_part = HardwarePart.query.filter(func.lower(HardwarePart.name) == target_name.lower()).first()
         part_name = wrap_part.name if wrap_part else target_name
-        latest_entry = (PrintedPartsCount.query
-                        .filter(func.lower(PrintedPartsCount.part_name) == part_name.lower())
-                        .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-                        .first())
+        latest_entry = current_part_inventory_entry(part_name)
         roll_count = latest_entry.count if latest_entry else (wrap_part.initial_count if wrap_part else 0)
         remainder_entry = TableStock.query.filter_by(type="pallet_wrap_remainder").first()
         used_in_current_roll = remainder_entry.count if remainder_entry else 0
@@ -5642,10 +6608,7 @@ def counting_hardware():
         target_name = "Pallet Wrap"
         wrap_part = HardwarePart.query.filter(func.lower(HardwarePart.name) == target_name.lower()).first()
         part_name = wrap_part.name if wrap_part else target_name
-        latest_entry = (PrintedPartsCount.query
-                        .filter(func.lower(PrintedPartsCount.part_name) == part_name.lower())
-                        .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-                        .first())
+        latest_entry = current_part_inventory_entry(part_name)
         roll_count = latest_entry.count if latest_entry else (wrap_part.initial_count if wrap_part else 0)
         remainder_entry = TableStock.query.filter_by(type="pallet_wrap_remainder").first()
         used_in_current_roll = remainder_entry.count if remainder_entry else 0
@@ -5870,6 +6833,8 @@ def counting_hardware():
         )
 
         for entry in recent_entries:
+            # The delta needs the snapshot before this one; the projection only
+            # keeps the latest, so this stays on the log.
             previous = (
                 PrintedPartsCount.query
                 .filter(PrintedPartsCount.part_name == entry.part_name)
@@ -6053,24 +7018,21 @@ def pods():
                 return redirect_back_to_pod_form()
             parts_to_deduct.append((felt_part, felt_count, 2))
 
-            carpet_entry = PrintedPartsCount.query.filter_by(part_name=carpet_part).order_by(
-                PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc()).first()
+            carpet_entry = current_part_inventory_entry(carpet_part)
             if not carpet_entry or carpet_entry.count < 1:
                 flash(f"Not enough {carpet_part} in stock!", "error")
                 return redirect_back_to_pod_form()
             parts_to_deduct.append((carpet_part, carpet_entry.count, 1))
 
         # Check and deduct Tee Nuts
-        tee_nuts_entry = PrintedPartsCount.query.filter_by(part_name="M10x13mm Tee Nut").order_by(
-            PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc()).first()
+        tee_nuts_entry = current_part_inventory_entry("M10x13mm Tee Nut")
         if not tee_nuts_entry or tee_nuts_entry.count < 16:
             flash("Not enough M10x13mm Tee Nuts in stock! Need 16 per pod.", "error")
             return redirect_back_to_pod_form()
         parts_to_deduct.append(("M10x13mm Tee Nut", tee_nuts_entry.count, 16))
 
         if actual_table_type == TABLE_TYPE_CHAMPION:
-            black_staples_entry = PrintedPartsCount.query.filter_by(part_name="Rows of Black Staples").order_by(
-                PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc()).first()
+            black_staples_entry = current_part_inventory_entry("Rows of Black Staples")
             if not black_staples_entry or black_staples_entry.count < 2:
                 flash("Not enough Rows of Black Staples in stock! Need 2 per pod.", "error")
                 return redirect_back_to_pod_form()
@@ -6149,12 +7111,7 @@ def pods():
                 title = f"[LOW STOCK] Pod Completed: {type_label} {size}"
             else:
                 title = f"Pod Completed: {type_label} {size}"
-            try:
-                requests.post("https://ntfy.sh/PoolTableTrackerV2",
-                              data=message,
-                              headers={"Title": title})
-            except requests.RequestException as e:
-                print(f"Ntfy notification failed: {e}")
+            send_ntfy_notification(message, title)
             # --- End NTFY Notification ---
         except IntegrityError:
             db.session.rollback()
@@ -6471,16 +7428,7 @@ def pods():
         minutes, seconds = divmod(remainder, 60)
         return f"{hours:02}:{minutes:02}:{seconds:02}"
 
-    monthly_totals = (
-        db.session.query(
-            extract('year', CompletedPods.date).label('year'),
-            extract('month', CompletedPods.date).label('month'),
-            func.count(CompletedPods.id).label('total')
-        )
-        .group_by('year', 'month')
-        .order_by(desc(extract('year', CompletedPods.date)), desc(extract('month', CompletedPods.date)))
-        .all()
-    )
+    monthly_totals = production_rollup_monthly_totals("pods")
 
     def empty_monthly_pod_stats():
         return {
@@ -6721,10 +7669,7 @@ def manage_raw_data():
                                 units_per_strip=BRAD_NAILS_UNITS_PER_STRIP
                             )
                             continue
-                        inventory_entry = PrintedPartsCount.query.filter_by(
-                            part_name=part_name
-                        ).order_by(PrintedPartsCount.date.desc(),
-                                   PrintedPartsCount.time.desc()).first()
+                        inventory_entry = current_part_inventory_entry(part_name)
                         current_count = inventory_entry.count if inventory_entry else 0
                         db.session.add(new_printed_parts_snapshot(
                             part_name,
@@ -6760,10 +7705,7 @@ def manage_raw_data():
                                 units_per_strip=BRAD_NAILS_UNITS_PER_STRIP
                             )
                             continue
-                        inventory_entry = PrintedPartsCount.query.filter_by(
-                            part_name=part_name
-                        ).order_by(PrintedPartsCount.date.desc(),
-                                   PrintedPartsCount.time.desc()).first()
+                        inventory_entry = current_part_inventory_entry(part_name)
                         current_count = inventory_entry.count if inventory_entry else 0
                         db.session.add(new_printed_parts_snapshot(
                             part_name,
@@ -7857,22 +8799,31 @@ class CushionWorkflowCount(db.Model):
 
 class CushionWorkflowLog(db.Model):
     __tablename__ = 'cushion_workflow_log'
+    __table_args__ = (
+        db.Index(
+            'ix_cushion_workflow_log_variant',
+            'stage_key', 'size_label', 'shape_no', 'end_type', 'action_type',
+        ),
+        db.Index('ix_cushion_workflow_log_created_at_id', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    action_type = db.Column(db.String(30), nullable=False, default="add")
-    stage_key = db.Column(db.String(50), nullable=False)
+    # active_history on the columns the timing stats read keeps the old value
+    # when an expired row is edited, so the listener sees what changed.
+    action_type = db.column_property(db.Column(db.String(30), nullable=False, default="add"), active_history=True)
+    stage_key = db.column_property(db.Column(db.String(50), nullable=False), active_history=True)
     stage_label = db.Column(db.String(120), nullable=False)
-    size_label = db.Column(db.String(10), nullable=False, default="")
-    shape_no = db.Column(db.Integer, nullable=False, default=0)
-    end_type = db.Column(db.String(20), nullable=False, default="")
-    worker = db.Column(db.String(50), nullable=False)
+    size_label = db.column_property(db.Column(db.String(10), nullable=False, default=""), active_history=True)
+    shape_no = db.column_property(db.Column(db.Integer, nullable=False, default=0), active_history=True)
+    end_type = db.column_property(db.Column(db.String(20), nullable=False, default=""), active_history=True)
+    worker = db.column_property(db.Column(db.String(50), nullable=False), active_history=True)
     delta = db.Column(db.Integer, nullable=False, default=0)
     count_after = db.Column(db.Integer, nullable=False, default=0)
-    seconds_taken = db.Column(db.Integer, nullable=True)
-    batch_number = db.Column(db.Integer, nullable=True)
+    seconds_taken = db.column_property(db.Column(db.Integer, nullable=True), active_history=True)
+    batch_number = db.column_property(db.Column(db.Integer, nullable=True), active_history=True)
     batch_date = db.Column(db.Date, nullable=True)
     note = db.Column(db.String(200), nullable=True)
-    created_at = db.Column(db.DateTime, nullable=False, default=london_now)
+    created_at = db.column_property(db.Column(db.DateTime, nullable=False, default=london_now), active_history=True)
 
 
 class CushionBatch(db.Model):
@@ -7892,14 +8843,54 @@ class CushionBatch(db.Model):
 
 class CushionCompletedSet(db.Model):
     __tablename__ = 'cushion_completed_set'
+    __table_args__ = (
+        db.Index('ix_cushion_completed_set_completed_at', 'completed_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    size_label = db.Column(db.String(10), nullable=False)
-    worker = db.Column(db.String(50), nullable=False)
+    # Rollup key columns keep their old value on edit (see CompletedTable).
+    size_label = db.column_property(db.Column(db.String(10), nullable=False), active_history=True)
+    worker = db.column_property(db.Column(db.String(50), nullable=False), active_history=True)
     stock_type = db.Column(db.String(50), nullable=False)
     stock_count_after = db.Column(db.Integer, nullable=False)
     estimated_seconds = db.Column(db.Integer, nullable=True)
-    completed_at = db.Column(db.DateTime, nullable=False, default=london_now)
+    completed_at = db.column_property(db.Column(db.DateTime, nullable=False, default=london_now), active_history=True)
+
+
+CUSHION_TIMING_KEY_COLUMNS = ("stage_key", "size_label", "shape_no", "end_type", "worker", "batch_number")
+# Quantiles are reported per stage, so sketches skip the variant columns and stay small.
+CUSHION_TIMING_SKETCH_KEY_COLUMNS = ("stage_key", "worker", "batch_number")
+
+
+class CushionTimingStat(db.Model):
+    """Running seconds_taken stats of timed cushion adds per variant, worker and batch (0 = no batch)."""
+    __tablename__ = 'cushion_timing_stat'
+
+    stage_key = db.Column(db.String(50), primary_key=True)
+    size_label = db.Column(db.String(10), primary_key=True, default="")
+    shape_no = db.Column(db.Integer, primary_key=True, default=0)
+    end_type = db.Column(db.String(20), primary_key=True, default="")
+    worker = db.Column(db.String(50), primary_key=True)
+    batch_number = db.Column(db.Integer, primary_key=True, default=0)
+    sample_count = db.Column(db.Integer, nullable=False, default=0)
+    seconds_sum = db.Column(db.Integer, nullable=False, default=0)
+    seconds_sum_squares = db.Column(db.Integer, nullable=False, default=0)
+    min_seconds = db.Column(db.Integer, nullable=True)
+    max_seconds = db.Column(db.Integer, nullable=True)
+    last_seconds = db.Column(db.Integer, nullable=True)
+    last_created_at = db.Column(db.DateTime, nullable=True)
+    last_log_id = db.Column(db.Integer, nullable=True)
+
+
+class CushionTimingBucket(db.Model):
+    """Quantile sketch of timed cushion adds per stage, worker and batch: samples per log-scale seconds bucket."""
+    __tablename__ = 'cushion_timing_bucket'
+
+    stage_key = db.Column(db.String(50), primary_key=True)
+    worker = db.Column(db.String(50), primary_key=True)
+    batch_number = db.Column(db.Integer, primary_key=True, default=0)
+    bucket = db.Column(db.Integer, primary_key=True)
+    sample_count = db.Column(db.Integer, nullable=False, default=0)
 
 
 class CushionCompressorCheck(db.Model):
@@ -7933,6 +8924,230 @@ class CushionStageLock(db.Model):
     updated_at = db.Column(db.DateTime, nullable=False, default=london_now)
 
 
+class DailyProductionRollup(db.Model):
+    """Completed builds per day, area, size, table type and worker."""
+    __tablename__ = 'daily_production_rollup'
+
+    date = db.Column(db.Date, primary_key=True)
+    area = db.Column(db.String(20), primary_key=True)
+    size_label = db.Column(db.String(10), primary_key=True, default="")
+    table_type = db.Column(db.String(20), primary_key=True, default="")
+    worker = db.Column(db.String(50), primary_key=True)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+PRODUCTION_ROLLUP_AREAS = {
+    "bodies": CompletedTable,
+    "pods": CompletedPods,
+    "top_rails": TopRail,
+    "cushions": CushionCompletedSet,
+}
+PRODUCTION_ROLLUP_KEY_ATTRS = {
+    "cushions": ("completed_at", "size_label", "worker"),
+}
+PRODUCTION_ROLLUP_SERIAL_KEY_ATTRS = ("date", "serial_number", "worker")
+
+
+def production_rollup_key(area, values):
+    """Return the rollup primary key for a record's attribute values."""
+    if area == "cushions":
+        completed_at = values["completed_at"]
+        return (
+            completed_at.date() if isinstance(completed_at, datetime) else completed_at,
+            area,
+            values["size_label"] or "",
+            "",
+            values["worker"] or "Unknown",
+        )
+    serial = values["serial_number"]
+    return (
+        values["date"],
+        area,
+        serial_size_display_label(serial),
+        table_type_from_serial(serial),
+        values["worker"] or "Unknown",
+    )
+
+
+def _production_rollup_key_attrs(area):
+    return PRODUCTION_ROLLUP_KEY_ATTRS.get(area, PRODUCTION_ROLLUP_SERIAL_KEY_ATTRS)
+
+
+def _apply_production_rollup_delta(connection, key, delta):
+    day, area, size_label, table_type, worker = key
+    if day is None or not delta:
+        return
+    table = DailyProductionRollup.__table__
+    upsert = sqlite_insert(table).values(
+        date=day,
+        area=area,
+        size_label=size_label,
+        table_type=table_type,
+        worker=worker,
+        completed_count=delta,
+    )
+    connection.execute(upsert.on_conflict_do_update(
+        index_elements=[table.c.date, table.c.area, table.c.size_label, table.c.table_type, table.c.worker],
+        set_={"completed_count": table.c.completed_count + upsert.excluded.completed_count},
+    ))
+    if delta < 0:
+        connection.execute(table.delete().where(
+            table.c.date == day,
+            table.c.area == area,
+            table.c.size_label == size_label,
+            table.c.table_type == table_type,
+            table.c.worker == worker,
+            table.c.completed_count <= 0,
+        ))
+
+
+def rebuild_daily_production_rollup(connection):
+    """Recompute the whole rollup from the completion tables on ``connection``."""
+    table = DailyProductionRollup.__table__
+    connection.execute(table.delete())
+    table_names = set(sa_inspect(connection).get_table_names())
+    totals = defaultdict(int)
+    for area, model in PRODUCTION_ROLLUP_AREAS.items():
+        if model.__tablename__ not in table_names:
+            continue
+        attrs = _production_rollup_key_attrs(area)
+        rows = connection.execute(select(*(getattr(model, attr) for attr in attrs)))
+        for row in rows:
+            totals[production_rollup_key(area, dict(zip(attrs, row)))] += 1
+    if totals:
+        connection.execute(table.insert(), [
+            {
+                "date": day,
+                "area": area,
+                "size_label": size_label,
+                "table_type": table_type,
+                "worker": worker,
+                "completed_count": count,
+            }
+            for (day, area, size_label, table_type, worker), count in totals.items()
+            if day is not None
+        ])
+
+
+@schema_migration(12, "daily_production_rollup")
+def ensure_daily_production_rollup_table(connection=None):
+    """Create and backfill the rollup once; returns True when it was just backfilled."""
+    if app.config.get("_daily_production_rollup_ready"):
+        return False
+
+    def create_and_backfill(conn):
+        DailyProductionRollup.__table__.create(conn, checkfirst=True)
+        has_rows = conn.execute(select(DailyProductionRollup.date).limit(1)).first()
+        if has_rows:
+            return False
+        rebuild_daily_production_rollup(conn)
+        return True
+
+    if connection is not None:
+        backfilled = create_and_backfill(connection)
+    else:
+        with db.engine.begin() as conn:
+            backfilled = create_and_backfill(conn)
+    app.config["_daily_production_rollup_ready"] = True
+    return backfilled
+
+
+@app.cli.command("rebuild-production-rollup")
+def rebuild_production_rollup_command():
+    """Backfill daily_production_rollup from the completion tables."""
+    DailyProductionRollup.__table__.create(db.engine, checkfirst=True)
+    with db.engine.begin() as conn:
+        rebuild_daily_production_rollup(conn)
+        total = conn.execute(select(func.coalesce(func.sum(DailyProductionRollup.completed_count), 0))).scalar()
+    app.config["_daily_production_rollup_ready"] = True
+    print(f"Rebuilt daily production rollup ({total} completed builds).")
+
+
+def _register_production_rollup_events(area, model):
+    attrs = _production_rollup_key_attrs(area)
+
+    def current_values(target):
+        return {attr: getattr(target, attr) for attr in attrs}
+
+    @event.listens_for(model, "after_insert")
+    def rollup_inserted(mapper, connection, target):
+        _apply_production_rollup_delta(connection, production_rollup_key(area, current_values(target)), 1)
+
+    @event.listens_for(model, "after_update")
+    def rollup_updated(mapper, connection, target):
+        state = sa_inspect(target)
+        new_values = current_values(target)
+        old_values = dict(new_values)
+        for attr in attrs:
+            history = state.attrs[attr].history
+            if history.deleted:
+                old_values[attr] = history.deleted[0]
+        old_key = production_rollup_key(area, old_values)
+        new_key = production_rollup_key(area, new_values)
+        if old_key != new_key:
+            _apply_production_rollup_delta(connection, old_key, -1)
+            _apply_production_rollup_delta(connection, new_key, 1)
+
+    @event.listens_for(model, "after_delete")
+    def rollup_deleted(mapper, connection, target):
+        _apply_production_rollup_delta(connection, production_rollup_key(area, current_values(target)), -1)
+
+
+for _rollup_area, _rollup_model in PRODUCTION_ROLLUP_AREAS.items():
+    _register_production_rollup_events(_rollup_area, _rollup_model)
+
+
+@event.listens_for(db.session, "before_flush")
+def _ensure_production_rollup_before_flush(flush_session, flush_context, instances):
+    # Backfill before any completion row is written so the per-row deltas
+    # applied during this flush are never counted twice.
+    if not app.config.get("_daily_production_rollup_ready") \
+            and not app.config.get("_schema_migrations_applied"):
+        ensure_daily_production_rollup_table(flush_session.connection())
+
+
+def production_rollup_totals(start_date=None, end_date=None, group_by=(), areas=None):
+    """Sum rollup counts between two dates (inclusive), grouped by rollup columns.
+
+    ``group_by`` names DailyProductionRollup columns. Results are keyed by the
+    single grouped value, or by a tuple when grouping on several columns.
+    """
+    ensure_daily_production_rollup_table()
+    group_columns = [getattr(DailyProductionRollup, name) for name in group_by]
+    query = select(*group_columns, func.sum(DailyProductionRollup.completed_count))
+    if start_date is not None:
+        query = query.where(DailyProductionRollup.date >= start_date)
+    if end_date is not None:
+        query = query.where(DailyProductionRollup.date <= end_date)
+    if areas is not None:
+        query = query.where(DailyProductionRollup.area.in_(list(areas)))
+    if group_columns:
+        query = query.group_by(*group_columns)
+
+    totals = {}
+    for row in db.session.execute(query).all():
+        *group_values, total = row
+        if not group_columns:
+            return int(total or 0)
+        key = group_values[0] if len(group_values) == 1 else tuple(group_values)
+        totals[key] = int(total or 0)
+    return totals if group_columns else 0
+
+
+def production_rollup_monthly_totals(area):
+    """Return [(year, month, total)] for an area, newest month first."""
+    ensure_daily_production_rollup_table()
+    year_col = extract('year', DailyProductionRollup.date).label('year')
+    month_col = extract('month', DailyProductionRollup.date).label('month')
+    return db.session.execute(
+        select(year_col, month_col, func.sum(DailyProductionRollup.completed_count).label('total'))
+        .where(DailyProductionRollup.area == area)
+        .group_by(year_col, month_col)
+        .order_by(year_col.desc(), month_col.desc())
+    ).all()
+
+
+@schema_migration(13, "cushion_workflow_tables")
 def ensure_cushion_workflow_tables():
     TableStock.__table__.create(db.engine, checkfirst=True)
     CushionWorkflowCount.__table__.create(db.engine, checkfirst=True)
@@ -7974,6 +9189,186 @@ def ensure_cushion_batch_columns():
         db.session.commit()
 
 
+def cushion_timing_key(values):
+    """CushionTimingStat key for a log row's values, or None when the row carries no timing."""
+    seconds_taken = values["seconds_taken"]
+    if values["action_type"] != "add" or seconds_taken is None or seconds_taken <= 0:
+        return None
+    return tuple(
+        (values[column] or 0) if column == "batch_number" else values[column]
+        for column in CUSHION_TIMING_KEY_COLUMNS
+    )
+
+
+def _add_cushion_timing_sample(connection, key, seconds_taken, created_at, log_id):
+    stats = CushionTimingStat.__table__
+    key_values = dict(zip(CUSHION_TIMING_KEY_COLUMNS, key))
+    upsert = sqlite_insert(stats).values(
+        **key_values,
+        sample_count=1,
+        seconds_sum=seconds_taken,
+        seconds_sum_squares=seconds_taken * seconds_taken,
+        min_seconds=seconds_taken,
+        max_seconds=seconds_taken,
+        last_seconds=seconds_taken,
+        last_created_at=created_at,
+        last_log_id=log_id,
+    )
+    incoming = upsert.excluded
+    is_newer = tuple_(incoming.last_created_at, incoming.last_log_id) > tuple_(stats.c.last_created_at, stats.c.last_log_id)
+    connection.execute(upsert.on_conflict_do_update(
+        index_elements=[stats.c[column] for column in CUSHION_TIMING_KEY_COLUMNS],
+        set_={
+            "sample_count": stats.c.sample_count + 1,
+            "seconds_sum": stats.c.seconds_sum + incoming.seconds_sum,
+            "seconds_sum_squares": stats.c.seconds_sum_squares + incoming.seconds_sum_squares,
+            "min_seconds": func.min(stats.c.min_seconds, incoming.min_seconds),
+            "max_seconds": func.max(stats.c.max_seconds, incoming.max_seconds),
+            "last_seconds": case((is_newer, incoming.last_seconds), else_=stats.c.last_seconds),
+            "last_created_at": case((is_newer, incoming.last_created_at), else_=stats.c.last_created_at),
+            "last_log_id": case((is_newer, incoming.last_log_id), else_=stats.c.last_log_id),
+        },
+    ))
+    buckets = CushionTimingBucket.__table__
+    bucket_upsert = sqlite_insert(buckets).values(
+        **{column: key_values[column] for column in CUSHION_TIMING_SKETCH_KEY_COLUMNS},
+        bucket=sketch_bucket(seconds_taken),
+        sample_count=1,
+    )
+    connection.execute(bucket_upsert.on_conflict_do_update(
+        index_elements=[buckets.c[column] for column in (*CUSHION_TIMING_SKETCH_KEY_COLUMNS, "bucket")],
+        set_={"sample_count": buckets.c.sample_count + 1},
+    ))
+
+
+def rebuild_cushion_timing_stats(connection, **scope):
+    """Recompute timing stats and sketches from the log, for every key or those matching ``scope``.
+
+    ``scope`` names CUSHION_TIMING_KEY_COLUMNS; ``batch_number=0`` means logs
+    without a batch. Sketches are rebuilt for every stage/worker/batch the
+    scope touches. Returns the number of stats keys written.
+    """
+    stats_table = CushionTimingStat.__table__
+    buckets_table = CushionTimingBucket.__table__
+    sketch_scope = {name: value for name, value in scope.items() if name in CUSHION_TIMING_SKETCH_KEY_COLUMNS}
+    connection.execute(stats_table.delete().where(*(stats_table.c[name] == value for name, value in scope.items())))
+    connection.execute(buckets_table.delete().where(*(buckets_table.c[name] == value for name, value in sketch_scope.items())))
+
+    log_filters = [
+        CushionWorkflowLog.action_type == "add",
+        CushionWorkflowLog.seconds_taken.isnot(None),
+        CushionWorkflowLog.seconds_taken > 0,
+    ]
+    for name, value in sketch_scope.items():
+        column = getattr(CushionWorkflowLog, name)
+        log_filters.append(column.is_(None) if name == "batch_number" and not value else column == value)
+    rows = connection.execute(
+        select(
+            *(getattr(CushionWorkflowLog, column) for column in CUSHION_TIMING_KEY_COLUMNS),
+            CushionWorkflowLog.seconds_taken,
+            CushionWorkflowLog.created_at,
+            CushionWorkflowLog.id,
+        ).where(*log_filters)
+    )
+    stats_by_key = {}
+    buckets_by_key = defaultdict(lambda: defaultdict(int))
+    for row in rows:
+        key_values = dict(zip(CUSHION_TIMING_KEY_COLUMNS, row[:6]))
+        key_values["batch_number"] = key_values["batch_number"] or 0
+        seconds_taken, created_at, log_id = row[6:]
+        sketch_key = tuple(key_values[column] for column in CUSHION_TIMING_SKETCH_KEY_COLUMNS)
+        buckets_by_key[sketch_key][sketch_bucket(seconds_taken)] += 1
+        if any(key_values[name] != value for name, value in scope.items()):
+            continue
+        key = tuple(key_values.values())
+        if key not in stats_by_key:
+            stats_by_key[key] = empty_timing_stats()
+        add_timing_sample(stats_by_key[key], seconds_taken, created_at, log_id)
+
+    if stats_by_key:
+        connection.execute(stats_table.insert(), [
+            {**dict(zip(CUSHION_TIMING_KEY_COLUMNS, key)), **stats}
+            for key, stats in stats_by_key.items()
+        ])
+    if buckets_by_key:
+        connection.execute(buckets_table.insert(), [
+            {**dict(zip(CUSHION_TIMING_SKETCH_KEY_COLUMNS, key)), "bucket": bucket, "sample_count": count}
+            for key, bucket_counts in buckets_by_key.items()
+            for bucket, count in bucket_counts.items()
+        ])
+    return len(stats_by_key)
+
+
+def _cushion_timing_log_values(target, use_previous=False):
+    state = sa_inspect(target)
+    values = {}
+    for attr in (*CUSHION_TIMING_KEY_COLUMNS, "action_type", "seconds_taken", "created_at"):
+        history = state.attrs[attr].history
+        if use_previous and history.deleted:
+            values[attr] = history.deleted[0]
+        else:
+            values[attr] = getattr(target, attr)
+    return values
+
+
+@event.listens_for(CushionWorkflowLog, "after_insert")
+def _time_inserted_cushion_log(mapper, connection, target):
+    values = _cushion_timing_log_values(target)
+    key = cushion_timing_key(values)
+    if key is not None:
+        _add_cushion_timing_sample(connection, key, values["seconds_taken"], values["created_at"], target.id)
+
+
+@event.listens_for(CushionWorkflowLog, "after_update")
+def _time_updated_cushion_log(mapper, connection, target):
+    # Sums can be reversed but min, max and last cannot, so affected keys are recomputed.
+    state = sa_inspect(target)
+    if not any(
+        state.attrs[attr].history.deleted
+        for attr in (*CUSHION_TIMING_KEY_COLUMNS, "action_type", "seconds_taken", "created_at")
+    ):
+        return
+    keys = {
+        cushion_timing_key(_cushion_timing_log_values(target, use_previous=True)),
+        cushion_timing_key(_cushion_timing_log_values(target)),
+    }
+    for key in keys - {None}:
+        rebuild_cushion_timing_stats(connection, **dict(zip(CUSHION_TIMING_KEY_COLUMNS, key)))
+
+
+@event.listens_for(CushionWorkflowLog, "after_delete")
+def _time_deleted_cushion_log(mapper, connection, target):
+    key = cushion_timing_key(_cushion_timing_log_values(target))
+    if key is not None:
+        rebuild_cushion_timing_stats(connection, **dict(zip(CUSHION_TIMING_KEY_COLUMNS, key)))
+
+
+@schema_migration(21, "cushion_timing_stats")
+def ensure_cushion_timing_stat_tables():
+    CushionTimingStat.__table__.create(db.engine, checkfirst=True)
+    CushionTimingBucket.__table__.create(db.engine, checkfirst=True)
+    with db.engine.begin() as conn:
+        if not conn.execute(select(CushionTimingStat.stage_key).limit(1)).first():
+            rebuild_cushion_timing_stats(conn)
+
+
+@schema_migration(22, "cushion_history_indexes")
+def ensure_cushion_history_indexes():
+    """Date indexes behind cushion history date ranges and action log paging."""
+    for model in (CushionWorkflowLog, CushionCompletedSet):
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+@app.cli.command("rebuild-cushion-timing-stats")
+def rebuild_cushion_timing_stats_command():
+    """Recompute cushion timing stats and quantile sketches from the workflow log."""
+    ensure_cushion_timing_stat_tables()
+    with db.engine.begin() as conn:
+        keys = rebuild_cushion_timing_stats(conn)
+    print(f"Rebuilt cushion timing stats for {keys} variant/worker/batch keys.")
+
+
 def cushion_batch_display_name(batch):
     if not batch:
         return ""
@@ -8028,14 +9423,20 @@ def get_or_create_active_cushion_batch(worker_name):
     return start_new_cushion_batch(worker_name)
 
 
-def cushion_timing_batch_filter(query, batch_number=None):
+def resolve_cushion_timing_batch(batch_number=None):
+    """The batch number a timing filter selects, or None for every batch."""
     if batch_number in (None, "", "all"):
-        return query
+        return None
     try:
         resolved = int(batch_number)
     except (TypeError, ValueError):
-        return query
-    if resolved <= 0:
+        return None
+    return resolved if resolved > 0 else None
+
+
+def cushion_timing_batch_filter(query, batch_number=None):
+    resolved = resolve_cushion_timing_batch(batch_number)
+    if resolved is None:
         return query
     return query.filter(CushionWorkflowLog.batch_number == resolved)
 
@@ -8080,6 +9481,7 @@ def cushion_current_stage_key(batch_number=None):
     return latest_log.stage_key if latest_log else None
 
 
+@schema_migration(14, "cushion_consumables")
 def ensure_cushion_consumables():
     HardwarePart.__table__.create(db.engine, checkfirst=True)
     PrintedPartsCount.__table__.create(db.engine, checkfirst=True)
@@ -8097,12 +9499,7 @@ def ensure_cushion_consumables():
 def consumable_stock_state(part_name):
     hardware_part = HardwarePart.query.filter(func.lower(HardwarePart.name) == part_name.lower()).first()
     canonical_name = hardware_part.name if hardware_part else part_name
-    latest_entry = (
-        PrintedPartsCount.query
-        .filter(func.lower(PrintedPartsCount.part_name) == canonical_name.lower())
-        .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-        .first()
-    )
+    latest_entry = current_part_inventory_entry(canonical_name)
     count = latest_entry.count if latest_entry else (hardware_part.initial_count if hardware_part else 0)
     return count, canonical_name
 
@@ -8671,50 +10068,127 @@ def cushion_estimated_set_seconds(size_label=None):
     return total_seconds if has_data else None
 
 
-def add_cushion_set_to_stock(size_label, worker, estimated_seconds=None):
+def cushion_count_records(variants):
+    """Count rows for normalised ``(stage_key, size_label, shape_no, end_type)`` keys, read in one query."""
+    variants = list(dict.fromkeys(variants))
+    if not variants:
+        return {}
+    columns = (
+        CushionWorkflowCount.stage_key,
+        CushionWorkflowCount.size_label,
+        CushionWorkflowCount.shape_no,
+        CushionWorkflowCount.end_type,
+    )
+    records = CushionWorkflowCount.query.filter(tuple_(*columns).in_(variants)).all()
+    return {
+        (record.stage_key, record.size_label, record.shape_no, record.end_type): record
+        for record in records
+    }
+
+
+def _upsert_cushion_count_record(variant, now, delta=0, count=None):
+    """Add ``delta`` to a variant's count, or set it to ``count``, creating the row if needed."""
+    stage_key, size_label, shape_no, end_type = variant
+    upsert = sqlite_insert(CushionWorkflowCount).values(
+        stage_key=stage_key,
+        size_label=size_label,
+        shape_no=shape_no,
+        end_type=end_type,
+        count=delta if count is None else count,
+        updated_at=now,
+    )
+    new_count = CushionWorkflowCount.count + delta if count is None else upsert.excluded.count
+    statement = upsert.on_conflict_do_update(
+        index_elements=["stage_key", "size_label", "shape_no", "end_type"],
+        set_={"count": new_count, "updated_at": now},
+    ).returning(CushionWorkflowCount)
+    return db.session.scalars(statement, execution_options={"populate_existing": True}).one()
+
+
+def _take_cushion_inputs(required_counts, records, now):
+    """Subtract every input requirement in one UPDATE; returns ``{variant: count_after}``.
+
+    The UPDATE only matches rows that still hold enough, so a count that fell
+    after validation raises instead of going negative.
+    """
+    required_by_id = {records[variant].id: required for variant, required in required_counts.items()}
+    required = case(required_by_id, value=CushionWorkflowCount.id)
+    rows = db.session.execute(
+        update(CushionWorkflowCount)
+        .where(CushionWorkflowCount.id.in_(required_by_id), CushionWorkflowCount.count >= required)
+        .values(count=CushionWorkflowCount.count - required, updated_at=now)
+        .returning(CushionWorkflowCount.id, CushionWorkflowCount.count),
+        execution_options={"synchronize_session": "fetch"},
+    ).all()
+    counts_by_id = dict(rows)
+    counts_after = {}
+    for variant in required_counts:
+        record = records[variant]
+        if record.id not in counts_by_id:
+            raise ValueError(f"Not enough {cushion_variant_display(*variant)} to move on.")
+        counts_after[variant] = counts_by_id[record.id]
+    return counts_after
+
+
+def add_cushion_sets_to_stock(size_label, worker, quantity, estimated_seconds=None, now=None):
+    """Add ``quantity`` completed sets to stock with one stock update and one bulk insert.
+
+    The bulk insert skips CushionCompletedSet's mapper events, so the daily
+    production rollup is updated here.
+    """
+    now = now or london_now()
     stock_type = cushion_stock_key(size_label)
-    stock_entry = TableStock.query.filter_by(type=stock_type).first()
-    if not stock_entry:
-        stock_entry = TableStock(type=stock_type, count=0)
-        db.session.add(stock_entry)
-        db.session.flush()
-    old_count = stock_entry.count
-    stock_entry.count += 1
+    upsert = sqlite_insert(TableStock).values(type=stock_type, count=quantity)
+    stock_entry = db.session.scalars(
+        upsert.on_conflict_do_update(
+            index_elements=["type"],
+            set_={"count": TableStock.count + quantity},
+        ).returning(TableStock),
+        execution_options={"populate_existing": True},
+    ).one()
+    count_before = stock_entry.count - quantity
     record_table_stock_log(
         stock_type,
         "complete_cushion_set",
         worker,
-        1,
-        old_count,
+        quantity,
+        count_before,
         stock_entry.count,
-        f"Completed {size_label} cushion set"
+        f"Completed {quantity} {size_label} cushion set(s)"
     )
 
-    completed_set = CushionCompletedSet(
-        size_label=size_label,
-        worker=worker,
-        stock_type=stock_type,
-        stock_count_after=stock_entry.count,
-        estimated_seconds=estimated_seconds if estimated_seconds is not None else cushion_estimated_set_seconds(size_label),
-        completed_at=london_now()
-    )
-    db.session.add(completed_set)
-    return completed_set
+    if estimated_seconds is None:
+        estimated_seconds = cushion_estimated_set_seconds(size_label)
+    completed_sets = db.session.scalars(
+        insert(CushionCompletedSet).returning(CushionCompletedSet),
+        [
+            {
+                "size_label": size_label,
+                "worker": worker,
+                "stock_type": stock_type,
+                "stock_count_after": count_before + number,
+                "estimated_seconds": estimated_seconds,
+                "completed_at": now,
+            }
+            for number in range(1, quantity + 1)
+        ],
+    ).all()
+    rollup_key = production_rollup_key("cushions", {"completed_at": now, "size_label": size_label, "worker": worker})
+    _apply_production_rollup_delta(db.session.connection(), rollup_key, quantity)
+    return completed_sets
 
 
 def complete_available_cushion_sets(size_label, worker):
-    completed_sets = []
-    while True:
-        sanded_top_records = [
-            get_cushion_count_record("sand_tops", size_label, shape_no, "", create=True)
-            for shape_no in CUSHION_SHAPES
-        ]
-        if any(record.count <= 0 for record in sanded_top_records):
-            break
-
-        _, new_sets = record_cushion_stage_add("bundle", size_label, 0, "", worker)
-        completed_sets.extend(new_sets)
+    sanded_top_variants = [("sand_tops", size_label, shape_no, "") for shape_no in CUSHION_SHAPES]
+    records = cushion_count_records(sanded_top_variants)
+    ready_count = min(
+        records[variant].count if variant in records else 0
+        for variant in sanded_top_variants
+    )
+    if ready_count <= 0:
+        return []
 
+    _, completed_sets = _record_cushion_stage_add_bulk("bundle", size_label, 0, "", ready_count, worker)
     return completed_sets
 
 
@@ -8729,23 +10203,33 @@ def cushion_tee_nuts_required_for_glue_ends(size_label, quantity=1):
 def record_cushion_stage_add_many(stage_key, size_label, shape_no, end_type, quantity, worker):
     size_label, shape_no, end_type = normalize_cushion_variant(stage_key, size_label, shape_no, end_type)
     quantity = parse_positive_count(quantity, "Quantity")
+    return _record_cushion_stage_add_bulk(stage_key, size_label, shape_no, end_type, quantity, worker)
+
+
+def _record_cushion_stage_add_bulk(stage_key, size_label, shape_no, end_type, quantity, worker):
+    """Move ``quantity`` units of a normalised variant on from their inputs as one set of statements.
 
+    Requirements are checked against one read of the count rows, inputs are
+    taken in one UPDATE and the workflow logs and completed sets are bulk
+    inserted. Bulk inserts skip mapper events, so the timing stats and the
+    production rollup are maintained here. The caller commits.
+    """
+    target_variant = (stage_key, size_label, shape_no, end_type)
     requirements = cushion_input_requirements(stage_key, size_label, shape_no, end_type)
     required_counts = defaultdict(int)
     for requirement in requirements:
         required_counts[requirement] += quantity
 
+    records = cushion_count_records([*required_counts, target_variant])
     missing_requirements = []
-    for (input_stage_key, input_size, input_shape, input_end), required_count in required_counts.items():
-        input_record = get_cushion_count_record(input_stage_key, input_size, input_shape, input_end, create=True)
-        if input_record.count < required_count:
-            available = input_record.count
-            label = cushion_variant_display(input_stage_key, input_record.size_label, input_record.shape_no, input_record.end_type)
+    for variant, required_count in required_counts.items():
+        available = records[variant].count if variant in records else 0
+        if available < required_count:
             missing_requirements.append({
-                "input_stage_key": input_stage_key,
+                "input_stage_key": variant[0],
                 "required_count": required_count,
                 "available": available,
-                "variant_label": label,
+                "variant_label": cushion_variant_display(*variant),
             })
 
     if missing_requirements:
@@ -8765,20 +10249,6 @@ def record_cushion_stage_add_many(stage_key, size_label, shape_no, end_type, qua
     batch_number = active_batch.batch_number if active_batch else None
     batch_date = active_batch.batch_date if active_batch else None
 
-    for (input_stage_key, input_size, input_shape, input_end), required_count in required_counts.items():
-        apply_cushion_count_delta(
-            input_stage_key,
-            input_size,
-            input_shape,
-            input_end,
-            -required_count,
-            worker,
-            action_type="move_out",
-            note=f"Moved to {CUSHION_STAGE_BY_KEY[stage_key]['label']}",
-            batch_number=batch_number,
-            batch_date=batch_date
-        )
-
     now = london_now()
     seconds_taken = cushion_action_duration_seconds(
         stage_key,
@@ -8792,48 +10262,54 @@ def record_cushion_stage_add_many(stage_key, size_label, shape_no, end_type, qua
     if seconds_taken and quantity > 1:
         seconds_taken = max(1, int(round(seconds_taken / quantity)))
 
+    input_counts_after = _take_cushion_inputs(required_counts, records, now) if required_counts else {}
+
+    stage_label = CUSHION_STAGE_BY_KEY[stage_key]["label"]
+    completed_sets = []
     if stage_key == "bundle":
-        completed_sets = [
-            add_cushion_set_to_stock(size_label, worker, seconds_taken)
-            for _ in range(quantity)
-        ]
-        target_record = get_cushion_count_record(stage_key, size_label, 0, "", create=True)
-        target_record.count = completed_sets[-1].stock_count_after
-        target_record.updated_at = now
-        db.session.add(CushionWorkflowLog(
-            action_type="add",
-            stage_key=stage_key,
-            stage_label=CUSHION_STAGE_BY_KEY[stage_key]["label"],
-            size_label=size_label,
-            shape_no=0,
-            end_type="",
-            worker=worker,
-            delta=quantity,
-            count_after=target_record.count,
-            seconds_taken=seconds_taken,
-            batch_number=batch_number,
-            batch_date=batch_date,
-            note=f"Bundled {quantity} completed cushion set(s)"
-        ))
-        return target_record, completed_sets
+        completed_sets = add_cushion_sets_to_stock(size_label, worker, quantity, seconds_taken, now)
+        target_record = _upsert_cushion_count_record(target_variant, now, count=completed_sets[-1].stock_count_after)
+        add_note = f"Bundled {quantity} completed cushion set(s)"
+    else:
+        if tee_nuts_required:
+            adjust_consumable_stock(CUSHION_CONSUMABLE_TEE_NUTS["name"], -tee_nuts_required)
+        target_record = _upsert_cushion_count_record(target_variant, now, delta=quantity)
+        add_note = None
 
-    if tee_nuts_required:
-        adjust_consumable_stock(CUSHION_CONSUMABLE_TEE_NUTS["name"], -tee_nuts_required)
+    def log_row(variant, action_type, delta, count_after, seconds, note):
+        return {
+            "action_type": action_type,
+            "stage_key": variant[0],
+            "stage_label": CUSHION_STAGE_BY_KEY[variant[0]]["label"],
+            "size_label": variant[1],
+            "shape_no": variant[2],
+            "end_type": variant[3],
+            "worker": worker,
+            "delta": delta,
+            "count_after": count_after,
+            "seconds_taken": seconds,
+            "batch_number": batch_number,
+            "batch_date": batch_date,
+            "note": note,
+            "created_at": now,
+        }
 
-    target_record = apply_cushion_count_delta(
-        stage_key,
-        size_label,
-        shape_no,
-        end_type,
-        quantity,
-        worker,
-        action_type="add",
-        seconds_taken=seconds_taken,
-        batch_number=batch_number,
-        batch_date=batch_date
-    )
+    log_rows = [
+        log_row(variant, "move_out", -required_counts[variant], count_after, None, f"Moved to {stage_label}")
+        for variant, count_after in input_counts_after.items()
+    ]
+    add_row = log_row(target_variant, "add", quantity, target_record.count, seconds_taken, add_note)
+    log_rows.append(add_row)
+    log_table = CushionWorkflowLog.__table__
+    inserted_logs = db.session.execute(
+        log_table.insert().returning(log_table.c.id, log_table.c.action_type),
+        log_rows,
+    ).all()
+    timing_key = cushion_timing_key(add_row)
+    if timing_key is not None:
+        add_log_id = next(log_id for log_id, action_type in inserted_logs if action_type == "add")
+        _add_cushion_timing_sample(db.session.connection(), timing_key, seconds_taken, now, add_log_id)
 
-    completed_sets = []
     return target_record, completed_sets
 
 
@@ -8903,61 +10379,110 @@ def set_cushion_stage_count(stage_key, size_label, shape_no, end_type, new_count
     return record
 
 
-def cushion_variant_timing(stage_key, size_label="", shape_no=0, end_type="", worker_name=None, batch_number=None):
-    size_label, shape_no, end_type = normalize_cushion_variant(stage_key, size_label, shape_no, end_type)
-    average_query = (
-        db.session.query(func.avg(CushionWorkflowLog.seconds_taken))
-        .filter(
-            CushionWorkflowLog.action_type == "add",
-            CushionWorkflowLog.stage_key == stage_key,
-            CushionWorkflowLog.size_label == size_label,
-            CushionWorkflowLog.shape_no == shape_no,
-            CushionWorkflowLog.end_type == end_type,
-            CushionWorkflowLog.seconds_taken.isnot(None),
-            CushionWorkflowLog.seconds_taken > 0
-        )
-    )
-    last_query = (
-        CushionWorkflowLog.query
-        .filter_by(
-            action_type="add",
-            stage_key=stage_key,
-            size_label=size_label,
-            shape_no=shape_no,
-            end_type=end_type
-        )
-        .filter(CushionWorkflowLog.seconds_taken.isnot(None), CushionWorkflowLog.seconds_taken > 0)
-    )
+def cushion_timing_stat_filters(model, worker_name=None, batch_number=None, **variant):
+    filters = [getattr(model, name) == value for name, value in variant.items()]
     if worker_name:
-        average_query = average_query.filter(CushionWorkflowLog.worker == worker_name)
-        last_query = last_query.filter(CushionWorkflowLog.worker == worker_name)
+        filters.append(model.worker == worker_name)
+    resolved_batch = resolve_cushion_timing_batch(batch_number)
+    if resolved_batch is not None:
+        filters.append(model.batch_number == resolved_batch)
+    return filters
 
-    average_query = cushion_timing_batch_filter(average_query, batch_number)
-    last_query = cushion_timing_batch_filter(last_query, batch_number)
 
-    average_seconds = average_query.scalar()
-    last_log = (
-        last_query
-        .order_by(CushionWorkflowLog.created_at.desc(), CushionWorkflowLog.id.desc())
-        .first()
+def cushion_timing_stats(group_by=(), worker_name=None, batch_number=None, **variant):
+    """Running timing stats merged per ``group_by`` key, read from CushionTimingStat.
+
+    ``variant`` pins key columns (e.g. ``stage_key="bundle"``). Keys with no
+    timed adds are missing from the result.
+    """
+    stat_columns = (
+        "sample_count", "seconds_sum", "seconds_sum_squares", "min_seconds", "max_seconds",
+        "last_seconds", "last_created_at", "last_log_id",
     )
+    rows = db.session.execute(
+        select(*(getattr(CushionTimingStat, name) for name in (*group_by, *stat_columns)))
+        .where(*cushion_timing_stat_filters(CushionTimingStat, worker_name, batch_number, **variant))
+    ).all()
+    rows_by_group = defaultdict(list)
+    for row in rows:
+        rows_by_group[tuple(row[:len(group_by)])].append(dict(zip(stat_columns, row[len(group_by):])))
+    return {group: combine_timing_stats(group_rows) for group, group_rows in rows_by_group.items()}
+
+
+def cushion_timing_sketches(group_by=(), worker_name=None, batch_number=None, **variant):
+    """``{group: {bucket: count}}`` quantile sketches merged per ``group_by`` key."""
+    group_columns = [getattr(CushionTimingBucket, name) for name in group_by]
+    rows = db.session.execute(
+        select(*group_columns, CushionTimingBucket.bucket, func.sum(CushionTimingBucket.sample_count))
+        .where(*cushion_timing_stat_filters(CushionTimingBucket, worker_name, batch_number, **variant))
+        .group_by(*group_columns, CushionTimingBucket.bucket)
+    ).all()
+    sketches = defaultdict(dict)
+    for row in rows:
+        sketches[tuple(row[:len(group_by)])][row[-2]] = row[-1]
+    return sketches
+
+
+def cushion_variant_timing(stage_key, size_label="", shape_no=0, end_type="", worker_name=None, batch_number=None):
+    size_label, shape_no, end_type = normalize_cushion_variant(stage_key, size_label, shape_no, end_type)
+    stats = cushion_timing_stats(
+        worker_name=worker_name,
+        batch_number=batch_number,
+        stage_key=stage_key,
+        size_label=size_label,
+        shape_no=shape_no,
+        end_type=end_type,
+    ).get((), empty_timing_stats())
+    return cushion_timing_payload(timing_mean(stats), stats["last_seconds"])
+
+
+def cushion_timing_payload(average_seconds, last_seconds):
     return {
         "average_seconds": int(round(float(average_seconds))) if average_seconds else None,
         "average_display": cushion_format_duration(average_seconds) if average_seconds else "N/A",
-        "last_seconds": last_log.seconds_taken if last_log else None,
-        "last_display": cushion_format_duration(last_log.seconds_taken) if last_log else "N/A",
+        "last_seconds": last_seconds,
+        "last_display": cushion_format_duration(last_seconds) if last_seconds is not None else "N/A",
+    }
+
+
+def cushion_count_values():
+    """Every stored cushion count keyed by (stage_key, size_label, shape_no, end_type), in one query."""
+    rows = db.session.query(
+        CushionWorkflowCount.stage_key,
+        CushionWorkflowCount.size_label,
+        CushionWorkflowCount.shape_no,
+        CushionWorkflowCount.end_type,
+        CushionWorkflowCount.count,
+    ).all()
+    return {
+        (stage_key, size_label, shape_no, end_type): count
+        for stage_key, size_label, shape_no, end_type, count in rows
+    }
+
+
+def cushion_variant_timings(worker_name=None, batch_number=None):
+    """``cushion_variant_timing`` for every variant with timed adds, from the running stats.
+
+    Variants with no timed adds are missing; ``cushion_timing_payload(None, None)``
+    is their timing.
+    """
+    return {
+        variant: cushion_timing_payload(timing_mean(stats), stats["last_seconds"])
+        for variant, stats in cushion_timing_stats(
+            ("stage_key", "size_label", "shape_no", "end_type"), worker_name, batch_number,
+        ).items()
     }
 
 
-def cushion_ready_bundle_count(size_label):
+def cushion_ready_bundle_count(size_label, current_counts):
     counts = [
-        cushion_count_value("sand_tops", size_label, shape_no, "")
+        current_counts.get(("sand_tops", size_label, shape_no, ""), 0)
         for shape_no in CUSHION_SHAPES
     ]
     return min(counts) if counts else 0
 
 
-def cushion_ready_count_for_variant(stage_key, size_label="", shape_no=0, end_type=""):
+def cushion_ready_count_for_variant(current_counts, stage_key, size_label="", shape_no=0, end_type=""):
     requirements = cushion_input_requirements(stage_key, size_label, shape_no, end_type)
     if not requirements:
         return 0
@@ -8967,35 +10492,56 @@ def cushion_ready_count_for_variant(stage_key, size_label="", shape_no=0, end_ty
         required_counts[requirement] += 1
 
     ready_counts = []
-    for (input_stage_key, input_size, input_shape, input_end), required_count in required_counts.items():
-        available = cushion_current_count_for_variant(input_stage_key, input_size, input_shape, input_end)
-        ready_counts.append(available // required_count)
+    for variant, required_count in required_counts.items():
+        ready_counts.append(current_counts.get(variant, 0) // required_count)
 
     return min(ready_counts) if ready_counts else 0
 
 
-def cushion_ready_count_for_stage(stage_key):
+def cushion_ready_count_for_stage(stage_key, current_counts):
+    """Units of ``stage_key`` its inputs can supply, from ``cushion_current_counts()``."""
     stage = CUSHION_STAGE_BY_KEY[stage_key]
     if stage_key == "bundle":
-        return sum(cushion_ready_bundle_count(size_label) for size_label in CUSHION_SIZES)
+        return sum(cushion_ready_bundle_count(size_label, current_counts) for size_label in CUSHION_SIZES)
     if stage["variant"] == CUSHION_STAGE_PLAIN:
-        return cushion_ready_count_for_variant(stage_key)
+        return cushion_ready_count_for_variant(current_counts, stage_key)
     if stage["variant"] == CUSHION_STAGE_END_TYPE:
         return 0
     if stage["variant"] == CUSHION_STAGE_SIZE_ONLY:
-        return sum(cushion_ready_count_for_variant(stage_key, size_label=size_label) for size_label in CUSHION_SIZES)
+        return sum(
+            cushion_ready_count_for_variant(current_counts, stage_key, size_label=size_label)
+            for size_label in CUSHION_SIZES
+        )
 
     ready_count = 0
     for size_label in CUSHION_SIZES:
         for shape_no in CUSHION_SHAPES:
-            ready_count += cushion_ready_count_for_variant(stage_key, size_label=size_label, shape_no=shape_no)
+            ready_count += cushion_ready_count_for_variant(current_counts, stage_key, size_label=size_label, shape_no=shape_no)
     return ready_count
 
 
+def cushion_current_counts(stock_summary=None):
+    """``cushion_current_count_for_variant`` for every variant: stage counts, with bundles read from stock."""
+    current_counts = cushion_count_values()
+    for key in [key for key in current_counts if key[0] == "bundle"]:
+        del current_counts[key]
+    for size_label, count in (stock_summary or cushion_stock_summary()).items():
+        current_counts[("bundle", size_label, 0, "")] = count
+    return current_counts
+
+
 def build_cushion_stage_context(include_timing=False, worker_name=None, batch_number=None, highlight_stage_key=None):
     stage_context = []
     furthest_in_progress_index = None
     furthest_ready_index = None
+    stock_summary = cushion_stock_summary()
+    current_counts = cushion_current_counts(stock_summary)
+    timings = cushion_variant_timings(worker_name, batch_number) if include_timing else {}
+    no_timing = cushion_timing_payload(None, None)
+
+    def variant_timing(*variant):
+        return dict(timings.get(variant, no_timing)) if include_timing else None
+
     for stage in CUSHION_WORKFLOW_STAGES:
         stage_index = len(stage_context)
         stage_total = 0
@@ -9003,8 +10549,8 @@ def build_cushion_stage_context(include_timing=False, worker_name=None, batch_nu
         ready_bundle_count = 0
 
         if stage["variant"] == CUSHION_STAGE_PLAIN:
-            count = cushion_count_value(stage["key"])
-            timing = cushion_variant_timing(stage["key"], worker_name=worker_name, batch_number=batch_number) if include_timing else None
+            count = current_counts.get((stage["key"], "", 0, ""), 0)
+            timing = variant_timing(stage["key"], "", 0, "")
             stage_total += count
             groups.append({
                 "label": stage["short_label"],
@@ -9022,8 +10568,8 @@ def build_cushion_stage_context(include_timing=False, worker_name=None, batch_nu
         elif stage["variant"] == CUSHION_STAGE_END_TYPE:
             variants = []
             for end_type in CUSHION_END_TYPES:
-                count = cushion_count_value(stage["key"], end_type=end_type)
-                timing = cushion_variant_timing(stage["key"], end_type=end_type, worker_name=worker_name, batch_number=batch_number) if include_timing else None
+                count = current_counts.get((stage["key"], "", 0, end_type), 0)
+                timing = variant_timing(stage["key"], "", 0, end_type)
                 stage_total += count
                 variants.append({
                     "label": end_type,
@@ -9038,11 +10584,10 @@ def build_cushion_stage_context(include_timing=False, worker_name=None, batch_nu
             groups.append({"label": "Rubber ends", "variants": variants})
         elif stage["variant"] == CUSHION_STAGE_SIZE_ONLY:
             variants = []
-            stock_summary = cushion_stock_summary()
             for size_label in CUSHION_SIZES:
                 count = stock_summary.get(size_label, 0)
-                ready_bundle_count += cushion_ready_bundle_count(size_label)
-                timing = cushion_variant_timing(stage["key"], size_label=size_label, worker_name=worker_name, batch_number=batch_number) if include_timing else None
+                ready_bundle_count += cushion_ready_bundle_count(size_label, current_counts)
+                timing = variant_timing(stage["key"], size_label, 0, "")
                 stage_total += count
                 variants.append({
                     "label": f"{size_label} Set",
@@ -9059,8 +10604,8 @@ def build_cushion_stage_context(include_timing=False, worker_name=None, batch_nu
             for size_label in CUSHION_SIZES:
                 variants = []
                 for shape_no in CUSHION_SHAPES:
-                    count = cushion_count_value(stage["key"], size_label=size_label, shape_no=shape_no)
-                    timing = cushion_variant_timing(stage["key"], size_label=size_label, shape_no=shape_no, worker_name=worker_name, batch_number=batch_number) if include_timing else None
+                    count = current_counts.get((stage["key"], size_label, shape_no, ""), 0)
+                    timing = variant_timing(stage["key"], size_label, shape_no, "")
                     stage_total += count
                     variants.append({
                         "label": f"Shape {shape_no}",
@@ -9074,7 +10619,7 @@ def build_cushion_stage_context(include_timing=False, worker_name=None, batch_nu
                     })
                 groups.append({"label": size_label, "variants": variants})
 
-        ready_to_work_count = cushion_ready_count_for_stage(stage["key"])
+        ready_to_work_count = cushion_ready_count_for_stage(stage["key"], current_counts)
         if stage["key"] == "bundle":
             # Bundle is driven by upstream readiness rather than in-stage stock.
             has_wip = False
@@ -9148,80 +10693,56 @@ def flatten_cushion_stage_variants(stage_context):
 
 
 def cushion_stock_summary():
-    summary = {}
-    for size_label in CUSHION_SIZES:
-        stock_type = cushion_stock_key(size_label)
-        entry = TableStock.query.filter_by(type=stock_type).first()
-        summary[size_label] = entry.count if entry else 0
+    size_by_stock_type = {cushion_stock_key(size_label): size_label for size_label in CUSHION_SIZES}
+    summary = dict.fromkeys(CUSHION_SIZES, 0)
+    entries = db.session.query(TableStock.type, TableStock.count).filter(TableStock.type.in_(size_by_stock_type))
+    for stock_type, count in entries:
+        summary[size_by_stock_type[stock_type]] = count
     return summary
 
 
+CUSHION_TIMING_QUANTILES = (0.5, 0.9)
+
+
+def cushion_timing_distribution(stats, bucket_counts):
+    """Sample count, average, spread and quantile displays for merged running stats."""
+    average_seconds = timing_mean(stats)
+    median_seconds, p90_seconds = sketch_quantiles(
+        bucket_counts, CUSHION_TIMING_QUANTILES, stats["min_seconds"], stats["max_seconds"],
+    )
+    spread_seconds = timing_standard_deviation(stats)
+    return {
+        "sample_count": stats["sample_count"],
+        "average_seconds": int(round(float(average_seconds))) if average_seconds else None,
+        "average_display": cushion_format_duration(average_seconds) if average_seconds else "N/A",
+        "fastest_display": cushion_format_duration(stats["min_seconds"]) if stats["min_seconds"] else "N/A",
+        "slowest_display": cushion_format_duration(stats["max_seconds"]) if stats["max_seconds"] else "N/A",
+        "median_display": cushion_format_duration(median_seconds) if median_seconds else "N/A",
+        "p90_display": cushion_format_duration(p90_seconds) if p90_seconds else "N/A",
+        "spread_display": cushion_format_duration(spread_seconds) if spread_seconds is not None else "N/A",
+    }
+
+
 def cushion_timing_summary(batch_number=None):
-    summary = {}
-    for stage in CUSHION_WORKFLOW_STAGES:
-        base_query = db.session.query(
-                func.count(CushionWorkflowLog.id),
-                func.avg(CushionWorkflowLog.seconds_taken),
-                func.min(CushionWorkflowLog.seconds_taken),
-                func.max(CushionWorkflowLog.seconds_taken)
-            )
-        rows = (
-            cushion_timing_batch_filter(base_query, batch_number)
-            .filter(
-                CushionWorkflowLog.action_type == "add",
-                CushionWorkflowLog.stage_key == stage["key"],
-                CushionWorkflowLog.seconds_taken.isnot(None),
-                CushionWorkflowLog.seconds_taken > 0
-            )
-            .first()
+    stats_by_stage = cushion_timing_stats(("stage_key",), batch_number=batch_number)
+    sketches_by_stage = cushion_timing_sketches(("stage_key",), batch_number=batch_number)
+    return {
+        stage["key"]: cushion_timing_distribution(
+            stats_by_stage.get((stage["key"],), empty_timing_stats()),
+            sketches_by_stage.get((stage["key"],), {}),
         )
-        sample_count = rows[0] if rows else 0
-        average_seconds = rows[1] if rows else None
-        summary[stage["key"]] = {
-            "sample_count": sample_count or 0,
-            "average_seconds": int(round(float(average_seconds))) if average_seconds else None,
-            "average_display": cushion_format_duration(average_seconds) if average_seconds else "N/A",
-            "fastest_display": cushion_format_duration(rows[2]) if rows and rows[2] else "N/A",
-            "slowest_display": cushion_format_duration(rows[3]) if rows and rows[3] else "N/A",
-        }
-    return summary
+        for stage in CUSHION_WORKFLOW_STAGES
+    }
 
 
 def cushion_stage_timing(stage_key, worker_name=None, batch_number=None):
-    filters = [
-        CushionWorkflowLog.action_type == "add",
-        CushionWorkflowLog.stage_key == stage_key,
-        CushionWorkflowLog.seconds_taken.isnot(None),
-        CushionWorkflowLog.seconds_taken > 0,
-    ]
-    if worker_name:
-        filters.append(CushionWorkflowLog.worker == worker_name)
-
-    rows = (
-        cushion_timing_batch_filter(
-            db.session.query(
-            func.count(CushionWorkflowLog.id),
-            func.avg(CushionWorkflowLog.seconds_taken),
-            ),
-            batch_number
-        )
-        .filter(*filters)
-        .first()
-    )
-    last_log = (
-        cushion_timing_batch_filter(CushionWorkflowLog.query, batch_number)
-        .filter(*filters)
-        .order_by(CushionWorkflowLog.created_at.desc(), CushionWorkflowLog.id.desc())
-        .first()
+    stats = cushion_timing_stats(worker_name=worker_name, batch_number=batch_number, stage_key=stage_key).get(
+        (), empty_timing_stats()
     )
-    sample_count = rows[0] if rows else 0
-    average_seconds = rows[1] if rows else None
+    sketch = cushion_timing_sketches(worker_name=worker_name, batch_number=batch_number, stage_key=stage_key).get((), {})
     return {
-        "sample_count": sample_count or 0,
-        "average_seconds": int(round(float(average_seconds))) if average_seconds else None,
-        "average_display": cushion_format_duration(average_seconds) if average_seconds else "N/A",
-        "last_seconds": last_log.seconds_taken if last_log else None,
-        "last_display": cushion_format_duration(last_log.seconds_taken) if last_log else "N/A",
+        **cushion_timing_distribution(stats, sketch),
+        **cushion_timing_payload(timing_mean(stats), stats["last_seconds"]),
     }
 
 
@@ -9287,6 +10808,10 @@ def cushion_history_filter_state(args):
 
 
 def cushion_history_filter_options():
+    return cushion_history_summary_cache.get_or_compute(("filter_options",), build_cushion_history_filter_options)
+
+
+def build_cushion_history_filter_options():
     workers = set()
     try:
         workers.update(
@@ -9376,58 +10901,160 @@ def cushion_history_consumable_query(filters):
     return query
 
 
-def cushion_history_sum_delta(query):
-    return int(query.with_entities(func.coalesce(func.sum(CushionWorkflowLog.delta), 0)).scalar() or 0)
+# Each process caches its own summaries, so another worker's view of a new
+# action can lag by at most this long; local writes clear the cache on commit.
+CUSHION_HISTORY_SUMMARY_TTL_SECONDS = 30
+CUSHION_HISTORY_FILTER_KEYS = (
+    "start_dt", "end_dt", "worker", "stage_key", "size_label", "shape_no", "end_type", "action_type",
+)
+CUSHION_HISTORY_MODELS = (CushionWorkflowLog, CushionCompletedSet)
+CUSHION_HISTORY_TABLES = tuple(model.__table__ for model in CUSHION_HISTORY_MODELS)
+cushion_history_summary_cache = TTLCache(CUSHION_HISTORY_SUMMARY_TTL_SECONDS, max_entries=256)
 
 
-def cushion_history_summary(filters):
-    log_query = cushion_history_log_query(filters)
-    completed_query = cushion_history_completed_query(filters)
-    average_seconds = (
-        log_query
-        .filter(CushionWorkflowLog.seconds_taken.isnot(None), CushionWorkflowLog.seconds_taken > 0)
-        .with_entities(func.avg(CushionWorkflowLog.seconds_taken))
-        .scalar()
+def cushion_history_filter_key(filters):
+    """The filter values that select rows; echoed form values and labels are left out."""
+    return tuple(filters.get(name) for name in CUSHION_HISTORY_FILTER_KEYS)
+
+
+def cushion_history_average_display(seconds_sum, timed_count):
+    return cushion_format_duration(seconds_sum / timed_count) if timed_count and seconds_sum else "N/A"
+
+
+def cushion_history_stage_totals(filters):
+    """Action log totals per stage key for ``filters``, from one grouped pass."""
+    log = CushionWorkflowLog
+    timed = log.seconds_taken > 0
+    rows = (
+        cushion_history_log_query(filters)
+        .with_entities(
+            log.stage_key,
+            func.count(log.id),
+            func.sum(case((and_(log.action_type == "add", log.delta > 0), log.delta), else_=0)),
+            func.sum(case((and_(log.action_type == "move_out", log.delta < 0), log.delta), else_=0)),
+            func.count(case((log.action_type == "correction", 1))),
+            func.sum(case((timed, log.seconds_taken), else_=0)),
+            func.count(case((timed, 1))),
+        )
+        .group_by(log.stage_key)
+        .all()
     )
-    completed_by_size = {
-        size_label: completed_query.filter(CushionCompletedSet.size_label == size_label).count()
-        for size_label in CUSHION_SIZES
-    }
     return {
-        "total_actions": log_query.count(),
-        "added_units": cushion_history_sum_delta(
-            log_query.filter(CushionWorkflowLog.action_type == "add", CushionWorkflowLog.delta > 0)
-        ),
-        "moved_out_units": abs(cushion_history_sum_delta(
-            log_query.filter(CushionWorkflowLog.action_type == "move_out", CushionWorkflowLog.delta < 0)
-        )),
-        "corrections": log_query.filter(CushionWorkflowLog.action_type == "correction").count(),
-        "completed_sets": completed_query.count(),
-        "completed_by_size": completed_by_size,
-        "average_display": cushion_format_duration(average_seconds) if average_seconds else "N/A",
+        stage_key: {
+            "actions": int(actions or 0),
+            "added_units": int(added or 0),
+            "moved_out_units": abs(int(moved_out or 0)),
+            "corrections": int(corrections or 0),
+            "seconds_sum": int(seconds_sum or 0),
+            "timed_count": int(timed_count or 0),
+        }
+        for stage_key, actions, added, moved_out, corrections, seconds_sum, timed_count in rows
     }
 
 
-def cushion_completed_size_stats(today=None):
-    today = today or london_now().date()
-    month_start = datetime.combine(today.replace(day=1), time.min)
-    year_start = datetime.combine(date(today.year, 1, 1), time.min)
-    end_dt = datetime.combine(today + timedelta(days=1), time.min)
-
-    def counts_since(start_dt):
-        rows = (
-            db.session.query(CushionCompletedSet.size_label, func.count(CushionCompletedSet.id))
-            .filter(
-                CushionCompletedSet.completed_at >= start_dt,
-                CushionCompletedSet.completed_at < end_dt
-            )
+def build_cushion_history_summaries(filters):
+    stage_totals = cushion_history_stage_totals(filters)
+    completed_counts = {
+        size_label: int(count or 0)
+        for size_label, count in (
+            cushion_history_completed_query(filters)
+            .with_entities(CushionCompletedSet.size_label, func.count(CushionCompletedSet.id))
             .group_by(CushionCompletedSet.size_label)
             .all()
         )
-        return {size_label: int(count or 0) for size_label, count in rows}
+    }
+    empty_totals = dict.fromkeys(
+        ("actions", "added_units", "moved_out_units", "corrections", "seconds_sum", "timed_count"), 0
+    )
+    totals = {
+        name: sum(stage_row[name] for stage_row in stage_totals.values())
+        for name in empty_totals
+    }
+    summary = {
+        "total_actions": totals["actions"],
+        "added_units": totals["added_units"],
+        "moved_out_units": totals["moved_out_units"],
+        "corrections": totals["corrections"],
+        "completed_sets": sum(completed_counts.values()),
+        "completed_by_size": {size_label: completed_counts.get(size_label, 0) for size_label in CUSHION_SIZES},
+        "average_display": cushion_history_average_display(totals["seconds_sum"], totals["timed_count"]),
+    }
+
+    stage_rows = []
+    selected_stage = filters.get("stage_key")
+    for stage in CUSHION_WORKFLOW_STAGES:
+        if selected_stage and selected_stage != stage["key"]:
+            continue
+        stage_row = stage_totals.get(stage["key"], empty_totals)
+        stage_rows.append({
+            "label": stage["label"],
+            "actions": stage_row["actions"],
+            "added_units": stage_row["added_units"],
+            "moved_out_units": stage_row["moved_out_units"],
+            "corrections": stage_row["corrections"],
+            "average_display": cushion_history_average_display(stage_row["seconds_sum"], stage_row["timed_count"]),
+        })
+    return summary, stage_rows
+
+
+def cushion_history_summaries(filters):
+    """``(summary, stage rows)`` for the history page, cached per filter state.
+
+    The cached dicts are shared between requests and must not be modified.
+    """
+    return cushion_history_summary_cache.get_or_compute(
+        ("summaries", cushion_history_filter_key(filters)),
+        lambda: build_cushion_history_summaries(filters),
+    )
+
+
+@event.listens_for(db.session, "before_flush")
+def _note_cushion_history_flush(flush_session, flush_context, instances):
+    changed = (*flush_session.new, *flush_session.dirty, *flush_session.deleted)
+    if any(isinstance(instance, CUSHION_HISTORY_MODELS) for instance in changed):
+        flush_session.info["cushion_history_changed"] = True
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _note_cushion_history_statement(orm_execute_state):
+    # Bulk inserts and query deletes skip the flush, so catch them here.
+    if orm_execute_state.is_select:
+        return
+    if getattr(orm_execute_state.statement, "table", None) in CUSHION_HISTORY_TABLES:
+        orm_execute_state.session.info["cushion_history_changed"] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def _clear_cushion_history_cache(committed_session):
+    if committed_session.info.pop("cushion_history_changed", False):
+        cushion_history_summary_cache.clear()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_cushion_history_flag(rolled_back_session):
+    rolled_back_session.info.pop("cushion_history_changed", None)
+
+
+def cushion_completed_daily_counts(start_date, end_date):
+    """``{(day, size_label): completed sets}`` between two dates, from the daily production rollup."""
+    return production_rollup_totals(start_date, end_date, group_by=("date", "size_label"), areas=("cushions",))
+
+
+def cushion_completed_size_stats(today=None, daily_counts=None):
+    today = today or london_now().date()
+    month_start = today.replace(day=1)
+    year_start = date(today.year, 1, 1)
+    if daily_counts is None:
+        daily_counts = cushion_completed_daily_counts(year_start, today)
 
-    month_counts = counts_since(month_start)
-    year_counts = counts_since(year_start)
+    month_counts = defaultdict(int)
+    year_counts = defaultdict(int)
+    for (day, size_label), count in daily_counts.items():
+        if day < year_start or day > today:
+            continue
+        year_counts[size_label] += count
+        if day >= month_start:
+            month_counts[size_label] += count
     return [
         {
             "size": size_label,
@@ -9438,103 +11065,126 @@ def cushion_completed_size_stats(today=None):
     ]
 
 
-def cushion_completed_weekly_stats(today=None, week_count=6):
+def cushion_completed_weekly_start(today, week_count):
+    current_week_start = today - timedelta(days=today.weekday())
+    return current_week_start - timedelta(weeks=max(week_count, 1) - 1)
+
+
+def cushion_completed_weekly_stats(today=None, week_count=6, daily_counts=None):
     today = today or london_now().date()
     week_count = max(0, int(week_count or 0))
     if week_count == 0:
         return []
-    current_week_start = today - timedelta(days=today.weekday())
-    oldest_week_start = current_week_start - timedelta(weeks=week_count - 1)
-    start_dt = datetime.combine(oldest_week_start, time.min)
-    end_dt = datetime.combine(today + timedelta(days=1), time.min)
-    completed_sets = (
-        CushionCompletedSet.query
-        .filter(
-            CushionCompletedSet.completed_at >= start_dt,
-            CushionCompletedSet.completed_at < end_dt,
-        )
-        .order_by(CushionCompletedSet.completed_at.desc(), CushionCompletedSet.id.asc())
-        .all()
-    )
+    if daily_counts is None:
+        daily_counts = cushion_completed_daily_counts(cushion_completed_weekly_start(today, week_count), today)
     return build_recent_weekly_size_history(
-        completed_sets,
+        [item for item in daily_counts.items() if item[0][0] <= today],
         today,
-        date_getter=lambda completed_set: completed_set.completed_at,
-        size_getter=lambda completed_set: completed_set.size_label,
+        date_getter=lambda item: item[0][0],
+        size_getter=lambda item: item[0][1],
         week_count=week_count,
+        count_getter=lambda item: item[1],
     )
 
 
-def cushion_completed_previous_month_stats(today=None, month_count=6):
-    today = today or london_now().date()
-    current_month_start = today.replace(day=1)
+def cushion_completed_month_starts(today, month_count):
+    """The current month's first day followed by ``month_count`` earlier ones."""
+    month_start = today.replace(day=1)
+    month_starts = [month_start]
+    for _ in range(month_count):
+        month_start = (month_start - timedelta(days=1)).replace(day=1)
+        month_starts.append(month_start)
+    return month_starts
+
 
-    def previous_month_start(month_start):
-        return (month_start - timedelta(days=1)).replace(day=1)
+def cushion_completed_previous_month_stats(today=None, month_count=6, daily_counts=None):
+    today = today or london_now().date()
+    month_starts = cushion_completed_month_starts(today, month_count)
+    if daily_counts is None:
+        daily_counts = cushion_completed_daily_counts(month_starts[-1], today)
 
-    def next_month_start(month_start):
-        if month_start.month == 12:
-            return date(month_start.year + 1, 1, 1)
-        return date(month_start.year, month_start.month + 1, 1)
+    counts_by_month = defaultdict(lambda: defaultdict(int))
+    for (day, size_label), count in daily_counts.items():
+        if day <= today:
+            counts_by_month[(day.year, day.month)][size_label] += count
 
     rows = []
-    month_start = current_month_start
-    for _ in range(month_count + 1):
-        start_dt = datetime.combine(month_start, time.min)
-        end_dt = datetime.combine(next_month_start(month_start), time.min)
-        query_rows = (
-            db.session.query(CushionCompletedSet.size_label, func.count(CushionCompletedSet.id))
-            .filter(
-                CushionCompletedSet.completed_at >= start_dt,
-                CushionCompletedSet.completed_at < end_dt
-            )
-            .group_by(CushionCompletedSet.size_label)
-            .all()
-        )
-        counts = {size_label: int(count or 0) for size_label, count in query_rows}
+    for month_start in month_starts:
+        counts = counts_by_month.get((month_start.year, month_start.month), {})
         rows.append({
             "label": month_start.strftime("%B %Y"),
             "sizes": {size_label: counts.get(size_label, 0) for size_label in CUSHION_SIZES},
             "total": sum(counts.get(size_label, 0) for size_label in CUSHION_SIZES),
         })
-        month_start = previous_month_start(month_start)
-
     return rows
 
 
-def cushion_history_stage_summary(filters):
-    rows = []
-    selected_stage = filters.get("stage_key")
-    for stage in CUSHION_WORKFLOW_STAGES:
-        if selected_stage and selected_stage != stage["key"]:
-            continue
-        stage_filters = {**filters, "stage_key": stage["key"]}
-        query = cushion_history_log_query(stage_filters)
-        average_seconds = (
-            query
-            .filter(CushionWorkflowLog.seconds_taken.isnot(None), CushionWorkflowLog.seconds_taken > 0)
-            .with_entities(func.avg(CushionWorkflowLog.seconds_taken))
-            .scalar()
+def cushion_completed_stats(today=None, week_count=6, month_count=6):
+    """Size, weekly and monthly completed-set stats from one rollup read, cached per day."""
+    today = today or london_now().date()
+
+    def build():
+        start_date = min(
+            date(today.year, 1, 1),
+            cushion_completed_weekly_start(today, week_count),
+            cushion_completed_month_starts(today, month_count)[-1],
         )
-        rows.append({
-            "label": stage["label"],
-            "actions": query.count(),
-            "added_units": cushion_history_sum_delta(
-                query.filter(CushionWorkflowLog.action_type == "add", CushionWorkflowLog.delta > 0)
-            ),
-            "moved_out_units": abs(cushion_history_sum_delta(
-                query.filter(CushionWorkflowLog.action_type == "move_out", CushionWorkflowLog.delta < 0)
-            )),
-            "corrections": query.filter(CushionWorkflowLog.action_type == "correction").count(),
-            "average_display": cushion_format_duration(average_seconds) if average_seconds else "N/A",
-        })
-    return rows
+        daily_counts = cushion_completed_daily_counts(start_date, today)
+        return {
+            "completed_size_stats": cushion_completed_size_stats(today, daily_counts),
+            "weekly_size_stats": cushion_completed_weekly_stats(today, week_count, daily_counts),
+            "previous_month_size_stats": cushion_completed_previous_month_stats(today, month_count, daily_counts),
+        }
+
+    return cushion_history_summary_cache.get_or_compute(("completed_stats", today, week_count, month_count), build)
+
+
+def encode_cushion_history_cursor(entry):
+    payload = json.dumps([entry.created_at.isoformat(), entry.id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cushion_history_cursor(cursor):
+    try:
+        created_at_text, log_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at_text), int(log_id)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+
+def cushion_history_action_page(filters, per_page, cursor=None, older=True, offset=0):
+    """One page of the action log, newest first.
+
+    With a ``(created_at, id)`` cursor the page is the rows just older (or,
+    with ``older=False``, just newer) than it, read straight off the
+    created_at index; without one, ``offset`` rows are skipped.
+    """
+    log = CushionWorkflowLog
+    query = cushion_history_log_query(filters)
+    if cursor is None:
+        return query.order_by(log.created_at.desc(), log.id.desc()).offset(offset).limit(per_page).all()
+    position = tuple_(log.created_at, log.id)
+    if older:
+        return (
+            query.filter(position < tuple_(*cursor))
+            .order_by(log.created_at.desc(), log.id.desc())
+            .limit(per_page)
+            .all()
+        )
+    entries = (
+        query.filter(position > tuple_(*cursor))
+        .order_by(log.created_at.asc(), log.id.asc())
+        .limit(per_page)
+        .all()
+    )
+    entries.reverse()
+    return entries
 
 
 def cushion_history_clean_query_args(args):
     cleaned = {}
     for key, value in args.items():
-        if key == "page" or value in (None, ""):
+        if key in {"page", "cursor", "direction"} or value in (None, ""):
             continue
         cleaned[key] = value
     return cleaned
@@ -9564,40 +11214,39 @@ def predicted_finish():
         current_month = today.month
         last_full_day = today - timedelta(days=1)
 
-        def calculate_average(model):
-            first_entry_date = db.session.query(func.min(model.date)).filter(
-                func.extract('year', model.date) == current_year,
-                func.extract('month', model.date) == current_month
-            ).scalar()
-            
+        month_start = today.replace(day=1)
+        month_end = shift_month_start(month_start, 1) - timedelta(days=1)
+        daily_totals = production_rollup_totals(
+            month_start,
+            month_end,
+            group_by=("area", "date"),
+            areas=["pods", "bodies", "top_rails"],
+        )
+
+        def calculate_average(area):
+            area_days = {day: total for (row_area, day), total in daily_totals.items() if row_area == area and total}
+            first_entry_date = min(area_days) if area_days else None
+
             if not first_entry_date or first_entry_date >= last_full_day:
                 return None
 
             days_worked = sum(1 for i in range((last_full_day - first_entry_date).days + 1)
                               if (first_entry_date + timedelta(days=i)).weekday() in work_days)
 
-            records = db.session.query(func.count(model.id)).filter(
-                func.extract('year', model.date) == current_year,
-                func.extract('month', model.date) == current_month,
-                model.date >= first_entry_date,
-                model.date <= last_full_day
-            ).scalar()
+            records = sum(total for day, total in area_days.items() if day <= last_full_day)
 
             return records / days_worked if days_worked > 0 else None
 
-        avg_pods = calculate_average(CompletedPods)
-        avg_bodies = calculate_average(CompletedTable)
-        avg_top_rails = calculate_average(TopRail)
+        avg_pods = calculate_average("pods")
+        avg_bodies = calculate_average("bodies")
+        avg_top_rails = calculate_average("top_rails")
 
-        def completed_this_month(model):
-            return db.session.query(func.count(model.id)).filter(
-                func.extract('year', model.date) == current_year,
-                func.extract('month', model.date) == current_month
-            ).scalar()
+        def completed_this_month(area):
+            return sum(total for (row_area, _), total in daily_totals.items() if row_area == area)
 
-        completed_pods = completed_this_month(CompletedPods)
-        completed_bodies = completed_this_month(CompletedTable)
-        completed_top_rails = completed_this_month(TopRail)
+        completed_pods = completed_this_month("pods")
+        completed_bodies = completed_this_month("bodies")
+        completed_top_rails = completed_this_month("top_rails")
 
         remaining_pods = max(tables_for_month - completed_pods, 0)
         remaining_bodies = max(tables_for_month - completed_bodies, 0)
@@ -10286,14 +11935,7 @@ def bodies():
             f"Completed body {serial_number}"
         )
         db.session.commit()
-        try:
-            requests.post(
-                "https://ntfy.sh/PoolTableTrackerV2",
-                data=message,
-                headers={"Title": title},
-            )
-        except requests.RequestException as e:
-            print(f"Ntfy notification failed: {e}")
+        send_ntfy_notification(message, title)
         # --- End NTFY Notification ---
         if automatically_added_parts:
             flash(
@@ -10632,16 +12274,7 @@ def bodies():
         for body in completed_tables
     }
 
-    monthly_totals = (
-        db.session.query(
-            extract('year', CompletedTable.date).label('year'),
-            extract('month', CompletedTable.date).label('month'),
-            func.count(CompletedTable.id).label('total')
-        )
-        .group_by('year', 'month')
-        .order_by(desc(extract('year', CompletedTable.date)), desc(extract('month', CompletedTable.date)))
-        .all()
-    )
+    monthly_totals = production_rollup_monthly_totals("bodies")
     monthly_totals_formatted = []
     monthly_worker_stats = []
     for row in monthly_totals:
@@ -11645,10 +13278,7 @@ def top_rails():
                 )
             else:
                 # Handle other parts using PrintedPartsCount as before
-                latest_entry = (PrintedPartsCount.query
-                                .filter_by(part_name=part_name)
-                                .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-                                .first())
+                latest_entry = current_part_inventory_entry(part_name)
 
                 allow_negative_stock = allows_negative_inventory(part_name)
                 if not latest_entry and not allow_negative_stock:
@@ -11811,12 +13441,7 @@ def top_rails():
                 title = f"[LOW STOCK] Top Rail Completed: {size} {display_color}"
             else:
                 title = f"Top Rail Completed: {size} {display_color}"
-            try:
-                requests.post("https://ntfy.sh/PoolTableTrackerV2",
-                              data=message,
-                              headers={"Title": title})
-            except requests.RequestException as e:
-                print(f"Ntfy notification failed: {e}")
+            send_ntfy_notification(message, title)
             # --- End NTFY Notification ---
 
             if 'timer had an issue' not in str(flash):  # Only show success if no timer warning
@@ -11944,16 +13569,7 @@ def top_rails():
         size_getter=lambda rail: "6ft" if serial_is_6ft(rail.serial_number) else "7ft",
     )
 
-    monthly_totals = (
-        db.session.query(
-            extract('year', TopRail.date).label('year'),
-            extract('month', TopRail.date).label('month'),
-            func.count(TopRail.id).label('total')
-        )
-        .group_by('year', 'month')
-        .order_by(desc(extract('year', TopRail.date)), desc(extract('month', TopRail.date)))
-        .all()
-    )
+    monthly_totals = production_rollup_monthly_totals("top_rails")
     monthly_totals_formatted = []
     for row in monthly_totals:
         yr = int(row.year)
@@ -12170,19 +13786,11 @@ def _format_seconds_display(seconds_value):
     return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
 
-def _latest_part_count(part_name):
-    latest_entry = (
-        PrintedPartsCount.query
-        .filter_by(part_name=part_name)
-        .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-        .first()
-    )
-    if latest_entry:
-        return latest_entry.count
-    hardware_part = HardwarePart.query.filter_by(name=part_name).first()
-    if hardware_part:
-        return hardware_part.initial_count
-    return 0
+def _latest_part_count(part_name, snapshot=None):
+    if snapshot is not None:
+        return snapshot_part_count(snapshot, part_name)
+    _, count = current_printed_part_inventory(part_name)
+    return count
 
 
 def _table_stock_count(stock_key):
@@ -12376,19 +13984,10 @@ def bonus_goals():
 
 
 @app.route('/top_rail_dashboard')
-def top_rail_dashboard_view():
-    today = date.today()
-    start_of_week = today - timedelta(days=today.weekday())
-
-    stats = {
-        "daily": TopRail.query.filter(TopRail.date == today).count(),
-        "weekly": TopRail.query.filter(TopRail.date >= start_of_week, TopRail.date <= today).count(),
-        "monthly": TopRail.query.filter(
-            extract('year', TopRail.date) == today.year,
-            extract('month', TopRail.date) == today.month
-        ).count(),
-        "yearly": TopRail.query.filter(extract('year', TopRail.date) == today.year).count()
-    }
+def top_rail_dashboard_view():
+    today = date.today()
+
+    stats = production_rollup_period_counts("top_rails", calendar_period_buckets(today))
 
     next_serial = "1000"
     last_rail = TopRail.query.order_by(TopRail.id.desc()).first()
@@ -12427,8 +14026,9 @@ def top_rail_dashboard_view():
 
     parts_data = []
     min_rails_possible = None
+    inventory_snapshot = current_part_inventory_snapshot()
     for part_name, qty_per_rail in TOP_RAIL_PARTS_REQUIREMENTS:
-        stock = _latest_part_count(part_name)
+        stock = _latest_part_count(part_name, inventory_snapshot)
         rails_possible = max(stock, 0) // qty_per_rail if qty_per_rail else max(stock, 0)
         status = 'ok'
         if rails_possible < 5:
@@ -12611,25 +14211,16 @@ def top_rail_dashboard_view():
 @app.route('/pod_dashboard')
 def pod_dashboard_view():
     today = date.today()
-    start_of_week = today - timedelta(days=today.weekday())
     start_of_month = today.replace(day=1)
-    start_of_year = today.replace(month=1, day=1)
-
-    stats = {
-        "daily": CompletedPods.query.filter(CompletedPods.date == today).count(),
-        "weekly": CompletedPods.query.filter(CompletedPods.date >= start_of_week, CompletedPods.date <= today).count(),
-        "monthly": CompletedPods.query.filter(
-            extract('year', CompletedPods.date) == today.year,
-            extract('month', CompletedPods.date) == today.month
-        ).count(),
-        "yearly": CompletedPods.query.filter(extract('year', CompletedPods.date) == today.year).count()
-    }
+
+    stats = production_rollup_period_counts("pods", calendar_period_buckets(today))
 
     next_serial, default_size = _next_pod_serial_and_size()
     next_serial_display = f"{next_serial} - 6" if default_size == "6ft" else next_serial
 
+    inventory_snapshot = current_part_inventory_snapshot()
     part_stock = {
-        part["name"]: _latest_part_count(part["name"])
+        part["name"]: _latest_part_count(part["name"], inventory_snapshot)
         for part in POD_PARTS_REQUIREMENTS
     }
 
@@ -12816,37 +14407,21 @@ def pod_dashboard_view():
 @app.route('/body_dashboard')
 def body_dashboard_view():
     today = date.today()
-    start_of_week = today - timedelta(days=today.weekday())
     start_of_month = today.replace(day=1)
-    start_of_year = today.replace(month=1, day=1)
-
-    stats = {
-        "daily": CompletedTable.query.filter(CompletedTable.date == today).count(),
-        "weekly": CompletedTable.query.filter(CompletedTable.date >= start_of_week, CompletedTable.date <= today).count(),
-        "monthly": CompletedTable.query.filter(
-            extract('year', CompletedTable.date) == today.year,
-            extract('month', CompletedTable.date) == today.month
-        ).count(),
-        "yearly": CompletedTable.query.filter(extract('year', CompletedTable.date) == today.year).count()
-    }
+
+    stats = production_rollup_period_counts("bodies", calendar_period_buckets(today))
 
     next_serial, default_size = _next_body_serial_and_size()
     next_serial_display = f"{next_serial} - 6" if default_size == "6ft" else next_serial
 
+    inventory_snapshot = current_part_inventory_snapshot()
     part_stock = {
-        part["name"]: _latest_part_count(part["name"])
+        part["name"]: _latest_part_count(part["name"], inventory_snapshot)
         for part in BODY_PARTS_REQUIREMENTS
     }
 
     def pallet_wrap_display_count():
-        target_name = "Pallet Wrap"
-        wrap_part = HardwarePart.query.filter(func.lower(HardwarePart.name) == target_name.lower()).first()
-        part_name = wrap_part.name if wrap_part else target_name
-        latest_entry = (PrintedPartsCount.query
-                        .filter(func.lower(PrintedPartsCount.part_name) == part_name.lower())
-                        .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-                        .first())
-        roll_count = latest_entry.count if latest_entry else (wrap_part.initial_count if wrap_part else 0)
+        roll_count = snapshot_part_count(inventory_snapshot, "Pallet Wrap")
         remainder_entry = TableStock.query.filter_by(type="pallet_wrap_remainder").first()
         used_in_current_roll = remainder_entry.count if remainder_entry else 0
         bodies_per_wrap_roll = 7
@@ -13171,6 +14746,7 @@ def cnc_queue_manager():
         return redirect(url_for('login'))
 
     ensure_cnc_tables()
+    event_cursor = cnc_queue_event_cursor()
 
     jobs = (
         CncJob.query
@@ -13193,7 +14769,8 @@ def cnc_queue_manager():
         queued_counts=queued_counts,
         queues=queues,
         monthly_cut_history=monthly_cut_history,
-        machine_numbers=CNC_MACHINE_NUMBERS
+        machine_numbers=CNC_MACHINE_NUMBERS,
+        cnc_event_cursor=event_cursor
     )
 
 
@@ -13204,6 +14781,7 @@ def cnc_dashboard():
         return redirect(url_for('login'))
 
     ensure_cnc_tables()
+    event_cursor = cnc_queue_event_cursor()
     queues = _cnc_queue_snapshot()
     current_time = london_now()
     today = current_time.date()
@@ -13249,9 +14827,8 @@ def cnc_dashboard():
         for machine_number, completed_at in last_recorded_rows
     }
     machine_run_rows = (
-        db.session.query(CncQueueItem.machine_number, func.count(CncQueueItem.id))
-        .filter(*completed_today_filters)
-        .group_by(CncQueueItem.machine_number)
+        db.session.query(CncMachineDayStats.machine_number, CncMachineDayStats.runs)
+        .filter(CncMachineDayStats.date == today)
         .all()
     )
     machine_runs_today_by_machine = {machine_number: 0 for machine_number in CNC_MACHINE_NUMBERS}
@@ -13267,8 +14844,8 @@ def cnc_dashboard():
     if pacing_goal and pacing_goal.get("next_bonus"):
         next_bonus_year = pacing_goal.get("period_year")
         next_bonus_month = pacing_goal.get("period_month")
-        remaining_work_hours += weekdays_in_month(next_bonus_year, next_bonus_month) * 7.5
-    remaining_workdays = remaining_work_hours / 7.5
+        remaining_work_hours += weekdays_in_month(next_bonus_year, next_bonus_month) * CNC_SHIFT_HOURS
+    remaining_workdays = remaining_work_hours / CNC_SHIFT_HOURS
     if cnc_goal_target <= 0:
         required_sheets_per_day_display = "No Goal"
         goal_pacing_note = "Set a CNC goal"
@@ -13282,6 +14859,7 @@ def cnc_dashboard():
         required_sheets_per_day = cnc_goal_remaining / remaining_workdays
         required_sheets_per_day_display = f"{required_sheets_per_day:.1f}".rstrip("0").rstrip(".")
         goal_pacing_note = f"{cnc_goal_remaining} left / {remaining_workdays:.2f} working days"
+    analytics = cnc_analytics_report(today - timedelta(days=CNC_DASHBOARD_ANALYTICS_DAYS - 1), today, current_time)
     mdf_inventory = _get_or_create_mdf_inventory()
     if mdf_inventory in db.session.new:
         db.session.commit()
@@ -13303,7 +14881,11 @@ def cnc_dashboard():
         bonus_progress=bonus_progress,
         bonus_month_label=bonus_goal_month_label(today.year, today.month),
         mdf_inventory=mdf_inventory,
-        render_time=current_time.strftime("%d/%m/%Y %H:%M")
+        render_time=current_time.strftime("%d/%m/%Y %H:%M"),
+        cnc_event_cursor=event_cursor,
+        machine_analytics=analytics["machines"],
+        analytics_days=CNC_DASHBOARD_ANALYTICS_DAYS,
+        idle_gap_minutes=analytics["idle_gap_minutes"]
     )
 
 
@@ -13379,9 +14961,6 @@ def api_cnc_bulk_delete_jobs():
     for job in jobs:
         db.session.delete(job)
 
-    for machine_number in CNC_MACHINE_NUMBERS:
-        _cnc_reindex_machine(machine_number)
-
     db.session.commit()
     if not _payload_bool(data.get('suppress_low_queue_notification')):
         _cnc_notify_low_queue_transitions(previous_counts)
@@ -13409,16 +14988,10 @@ def api_cnc_queue_add():
     if not job:
         return jsonify({"success": False, "error": "Job not found."}), 404
 
-    next_position = (
-        db.session.query(func.count(CncQueueItem.id))
-        .filter_by(machine_number=machine_number, status=CNC_STATUS_QUEUED)
-        .scalar() or 0
-    ) + 1
-
     queue_item = CncQueueItem(
         job_id=job.id,
         machine_number=machine_number,
-        position=next_position,
+        position=_cnc_position_at_end(machine_number),
         status=CNC_STATUS_QUEUED
     )
     db.session.add(queue_item)
@@ -13450,23 +15023,8 @@ def api_cnc_queue_move():
 
     original_machine = item.machine_number
     previous_counts = _cnc_capture_queue_counts([original_machine, machine_number])
-    next_position = (
-        db.session.query(func.count(CncQueueItem.id))
-        .filter(
-            CncQueueItem.machine_number == machine_number,
-            CncQueueItem.status == CNC_STATUS_QUEUED,
-            CncQueueItem.id != item.id
-        )
-        .scalar() or 0
-    ) + 1
-
+    item.position = _cnc_position_at_end(machine_number, exclude_id=item.id)
     item.machine_number = machine_number
-    item.position = next_position
-
-    _cnc_reindex_machine(machine_number)
-    if original_machine != machine_number:
-        _cnc_reindex_machine(original_machine)
-
     db.session.commit()
     if not _payload_bool(data.get('suppress_low_queue_notification')):
         _cnc_notify_low_queue_transitions(previous_counts)
@@ -13494,48 +15052,76 @@ def api_cnc_queue_reorder():
     if not item or item.status != CNC_STATUS_QUEUED:
         return jsonify({"success": False, "error": "Queue item not found."}), 404
 
-    machine_items = (
-        CncQueueItem.query
-        .filter_by(machine_number=item.machine_number, status=CNC_STATUS_QUEUED)
-        .order_by(CncQueueItem.position.asc(), CncQueueItem.id.asc())
-        .all()
-    )
-    if len(machine_items) <= 1:
-        return jsonify({"success": True}), 200
+    if _cnc_move_item(item, direction):
+        db.session.commit()
+    return jsonify({"success": True}), 200
 
-    target_index = None
-    for idx, machine_item in enumerate(machine_items):
-        if machine_item.id == item.id:
-            target_index = idx
-            break
 
-    if target_index is None:
-        return jsonify({"success": False, "error": "Queue item not found in machine queue."}), 404
+@app.route('/api/cnc/queue/batch_reorder', methods=['POST'])
+def api_cnc_queue_batch_reorder():
+    """Apply a whole drag-and-drop layout in one transaction.
 
-    if direction == 'top':
-        if target_index == 0:
-            return jsonify({"success": True}), 200
-        machine_items.pop(target_index)
-        machine_items.insert(0, item)
-        for index, machine_item in enumerate(machine_items, start=1):
-            machine_item.position = index
-        db.session.commit()
-        return jsonify({"success": True}), 200
+    Payload: {"machines": {"1": [item_id, ...], ...}}. Listed items move to that
+    machine in the given order; unlisted items already on the machine keep
+    their relative order after them. Only rows whose position has to change
+    are written (see _cnc_apply_machine_order).
+    """
+    if 'worker' not in session:
+        return jsonify({"success": False, "error": "Not logged in"}), 401
 
-    if direction == 'up':
-        swap_index = target_index - 1
-    else:
-        swap_index = target_index + 1
+    ensure_cnc_tables()
+    data = request.get_json(silent=True) or {}
+    raw_layout = data.get('machines')
+    if not isinstance(raw_layout, dict) or not raw_layout:
+        return jsonify({"success": False, "error": "machines must map machine numbers to item ids."}), 400
 
-    if swap_index < 0 or swap_index >= len(machine_items):
-        return jsonify({"success": True}), 200
+    layout = {}
+    seen_ids = set()
+    for raw_machine, raw_ids in raw_layout.items():
+        try:
+            machine_number = int(raw_machine)
+            item_ids = [int(item_id) for item_id in raw_ids]
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "error": "Invalid reorder payload."}), 400
+        if machine_number not in CNC_MACHINE_NUMBERS:
+            return jsonify({"success": False, "error": "Machine must be between 1 and 4."}), 400
+        if seen_ids.intersection(item_ids) or len(set(item_ids)) != len(item_ids):
+            return jsonify({"success": False, "error": "Each queue item can only appear once."}), 400
+        seen_ids.update(item_ids)
+        layout[machine_number] = item_ids
+
+    items_by_id = {
+        item.id: item
+        for item in CncQueueItem.query.filter(
+            CncQueueItem.id.in_(seen_ids),
+            CncQueueItem.status == CNC_STATUS_QUEUED,
+        ).all()
+    } if seen_ids else {}
+    missing_ids = sorted(seen_ids - set(items_by_id))
+    if missing_ids:
+        return jsonify({"success": False, "error": f"Queue items not found: {missing_ids}"}), 404
+
+    affected_machines = set(layout) | {item.machine_number for item in items_by_id.values()}
+    previous_counts = _cnc_capture_queue_counts(sorted(affected_machines))
+    rewritten = 0
+    for machine_number, item_ids in layout.items():
+        unlisted_items = (
+            CncQueueItem.query
+            .filter(
+                CncQueueItem.machine_number == machine_number,
+                CncQueueItem.status == CNC_STATUS_QUEUED,
+                CncQueueItem.id.notin_(seen_ids),
+            )
+            .order_by(CncQueueItem.position.asc(), CncQueueItem.id.asc())
+            .all()
+        )
+        ordered_items = [items_by_id[item_id] for item_id in item_ids] + unlisted_items
+        rewritten += _cnc_apply_machine_order(machine_number, ordered_items)
 
-    swap_item = machine_items[swap_index]
-    item.position, swap_item.position = swap_item.position, item.position
-    _cnc_reindex_machine(item.machine_number)
     db.session.commit()
-
-    return jsonify({"success": True}), 200
+    if not _payload_bool(data.get('suppress_low_queue_notification')):
+        _cnc_notify_low_queue_transitions(previous_counts)
+    return jsonify({"success": True, "reordered_items": len(seen_ids), "rewritten_items": rewritten}), 200
 
 
 @app.route('/api/cnc/queue/bulk_copy', methods=['POST'])
@@ -13565,13 +15151,9 @@ def api_cnc_bulk_copy_queue_items():
 
     created_count = 0
     for machine_number in machine_numbers:
-        next_position = (
-            db.session.query(func.count(CncQueueItem.id))
-            .filter_by(machine_number=machine_number, status=CNC_STATUS_QUEUED)
-            .scalar() or 0
-        )
+        next_position = _cnc_position_at_end(machine_number) - CNC_POSITION_GAP
         for selected_item in selected_items:
-            next_position += 1
+            next_position += CNC_POSITION_GAP
             db.session.add(CncQueueItem(
                 job_id=selected_item.job_id,
                 machine_number=machine_number,
@@ -13615,35 +15197,27 @@ def api_cnc_bulk_duplicate_same_queue_items():
         return jsonify({"success": False, "error": "Selected queue items not found."}), 404
 
     created_count = 0
-    selected_ids_by_machine = defaultdict(set)
     for selected_item in selected_items:
-        selected_ids_by_machine[selected_item.machine_number].add(selected_item.id)
-
-    for machine_number, selected_ids in selected_ids_by_machine.items():
-        machine_items = (
-            CncQueueItem.query
-            .filter_by(machine_number=machine_number, status=CNC_STATUS_QUEUED)
-            .order_by(CncQueueItem.position.asc(), CncQueueItem.id.asc())
-            .all()
+        next_items = _cnc_queue_neighbours(
+            selected_item.machine_number,
+            (selected_item.position, selected_item.id),
+            "after",
         )
-        reordered_items = []
-        for machine_item in machine_items:
-            reordered_items.append(machine_item)
-            if machine_item.id not in selected_ids:
-                continue
-            for _ in range(copies):
-                duplicate_item = CncQueueItem(
-                    job_id=machine_item.job_id,
-                    machine_number=machine_number,
-                    position=0,
-                    status=CNC_STATUS_QUEUED
-                )
-                db.session.add(duplicate_item)
-                reordered_items.append(duplicate_item)
-                created_count += 1
-
-        for position, queue_item in enumerate(reordered_items, start=1):
-            queue_item.position = position
+        positions = _cnc_positions_between(
+            selected_item.machine_number,
+            selected_item,
+            next_items[0] if next_items else None,
+            count=copies,
+        )
+        for position in positions:
+            db.session.add(CncQueueItem(
+                job_id=selected_item.job_id,
+                machine_number=selected_item.machine_number,
+                position=position,
+                status=CNC_STATUS_QUEUED
+            ))
+            created_count += 1
+        db.session.flush()
 
     db.session.commit()
     return jsonify({"success": True, "created_items": created_count}), 200
@@ -13673,9 +15247,6 @@ def api_cnc_bulk_remove_queue_items():
     for item in selected_items:
         db.session.delete(item)
 
-    for machine_number in affected_machines:
-        _cnc_reindex_machine(machine_number)
-
     db.session.commit()
     if not _payload_bool(data.get('suppress_low_queue_notification')):
         _cnc_notify_low_queue_transitions(previous_counts)
@@ -13734,7 +15305,6 @@ def api_cnc_complete_queue_item():
     item.completed_at = datetime.utcnow()
     item.completed_by = session.get('worker', 'Unknown')
     item.completion_wood_change = _serialize_cnc_completion_wood_change(wood_result)
-    _cnc_reindex_machine(machine_number)
     db.session.commit()
     _forget_cnc_wood_log(item.id)
     _cnc_notify_low_queue_transitions(previous_counts)
@@ -13802,22 +15372,11 @@ def api_cnc_undo_complete_queue_item():
             db.session.rollback()
             return jsonify({"success": False, "error": str(error)}), 400
 
-    queued_items = (
-        CncQueueItem.query
-        .filter_by(machine_number=machine_number, status=CNC_STATUS_QUEUED)
-        .order_by(CncQueueItem.position.asc(), CncQueueItem.id.asc())
-        .all()
-    )
-    for queued_item in queued_items:
-        queued_item.position += 1
-
+    item.position = _cnc_position_at_top(machine_number, exclude_id=item.id)
     item.status = CNC_STATUS_QUEUED
-    item.position = 1
     item.completed_at = None
     item.completed_by = None
     item.completion_wood_change = None
-
-    _cnc_reindex_machine(machine_number)
     db.session.commit()
     _forget_cnc_wood_log(item.id)
 
@@ -13832,6 +15391,51 @@ def api_cnc_undo_complete_queue_item():
     }), 200
 
 
+@app.route('/api/cnc/queue/events')
+def api_cnc_queue_events():
+    """Server-Sent Events feed of queue changes for the CNC kiosks.
+
+    Resumes after the ``Last-Event-ID`` header (sent by EventSource on
+    reconnect) or ``?after=``. Streams end after CNC_EVENT_STREAM_SECONDS and
+    the browser reconnects from its cursor, so an open stream always occupies
+    a server thread; gunicorn.conf.py runs gthread workers for that reason.
+    A ``reset`` event means the cursor is too old and the page should reload.
+    """
+    if 'worker' not in session:
+        return jsonify({"success": False, "error": "Not logged in"}), 401
+
+    raw_cursor = request.headers.get('Last-Event-ID') or request.args.get('after', '')
+    try:
+        cursor = int(raw_cursor)
+    except (TypeError, ValueError):
+        cursor = None
+
+    def generate(cursor):
+        cnc_event_fanout.subscribe()
+        deadline = datetime.utcnow() + timedelta(seconds=CNC_EVENT_STREAM_SECONDS)
+        try:
+            yield "retry: 2000\n\n"
+            while datetime.utcnow() < deadline:
+                try:
+                    events = cnc_event_fanout.events_after(cursor, CNC_EVENT_KEEPALIVE_SECONDS)
+                except CursorExpired:
+                    yield format_sse({"after": cursor}, event_type="reset")
+                    return
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+                for queue_event in events:
+                    yield format_sse(queue_event["data"], queue_event["id"], queue_event["type"])
+                cursor = events[-1]["id"]
+        finally:
+            cnc_event_fanout.unsubscribe()
+
+    response = Response(generate(cursor), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 UK_BANK_HOLIDAY_CACHE_SECONDS = 6 * 60 * 60
 
 
@@ -14761,20 +16365,9 @@ def table_stock():
     )
 
 
-@app.route('/admin/table_stock_export.csv')
-def table_stock_export_csv():
-    color_codes = {
-        "Black": "B",
-        "Rustic Oak": "RO",
-        "Grey Oak": "GO",
-        "Rustic Black": "RB",
-        "Stone": "S",
-    }
-
-    rows = [("Type", "Size", "Color", "Code", "Count")]
-    # Export in planning-friendly format
-    rows = []
-    rows.append(("Top Rails", "Needed", "Have", "To Make"))
+def table_stock_export_rows():
+    """Planning-friendly table stock rows, with every stock count read in one query."""
+    stock_counts = dict(db.session.query(TableStock.type, TableStock.count))
     rail_order = [
         ("6ft", "Black"), ("7ft", "Black"),
         ("6ft", "Stone"), ("7ft", "Stone"),
@@ -14782,31 +16375,29 @@ def table_stock_export_csv():
         ("6ft", "Grey Oak"), ("7ft", "Grey Oak"),
         ("6ft", "Rustic Black"), ("7ft", "Rustic Black"),
     ]
-    for size, color in rail_order:
-        cfg = next((c for c in TOP_RAIL_TABLE_STOCK_CONFIGS if c["size"] == size and c["color"] == color), None)
-        rail_count = _table_stock_count(cfg["rail_key"]) if cfg else 0
-        rows.append((f"{size} - {color}", "", rail_count, ""))
-
-    rows.append(("", "", "", ""))
-    rows.append(("Bodies", "Needed", "Have", "To Make"))
-    for size, color in rail_order:
-        cfg = next((c for c in TOP_RAIL_TABLE_STOCK_CONFIGS if c["size"] == size and c["color"] == color), None)
-        body_count = _table_stock_count(cfg["body_key"]) if cfg else 0
-        rows.append((f"{size} - {color}", "", body_count, ""))
+    configs = [
+        next((c for c in TOP_RAIL_TABLE_STOCK_CONFIGS if c["size"] == size and c["color"] == color), None)
+        for size, color in rail_order
+    ]
+
+    yield ("Top Rails", "Needed", "Have", "To Make")
+    for (size, color), cfg in zip(rail_order, configs):
+        rail_count = stock_counts.get(cfg["rail_key"], 0) if cfg else 0
+        yield (f"{size} - {color}", "", rail_count, "")
+
+    yield ("", "", "", "")
+    yield ("Bodies", "Needed", "Have", "To Make")
+    for (size, color), cfg in zip(rail_order, configs):
+        body_count = stock_counts.get(cfg["body_key"], 0) if cfg else 0
+        yield (f"{size} - {color}", "", body_count, "")
     for size in ["6ft", "7ft"]:
         lite_key = f"body_{size.lower()}_lite"
-        lite_count = _table_stock_count(lite_key)
-        rows.append((f"{size} - Lite", "", lite_count, ""))
+        yield (f"{size} - Lite", "", stock_counts.get(lite_key, 0), "")
 
-    output = StringIO()
-    writer = csv.writer(output)
-    for row in rows:
-        writer.writerow(row)
 
-    resp = make_response(output.getvalue())
-    resp.headers["Content-Type"] = "text/csv"
-    resp.headers["Content-Disposition"] = "attachment; filename=table_stock_export.csv"
-    return resp
+@app.route('/admin/table_stock_export.csv')
+def table_stock_export_csv():
+    return csv_stream_response(csv_chunks(table_stock_export_rows()), "table_stock_export.csv")
 
 
 @app.route('/material_calculator', methods=['GET', 'POST'])
@@ -14906,10 +16497,7 @@ def counting_3d_printing_parts():
         """Return the latest recorded inventory count for a part (not the sum of all historical rows)."""
         if part_name == FELT_PART_NAME:
             return get_felt_count()
-        latest_entry = (PrintedPartsCount.query
-                        .filter_by(part_name=part_name)
-                        .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-                        .first())
+        latest_entry = current_part_inventory_entry(part_name)
         return latest_entry.count if latest_entry else 0
 
     selected_part = request.form.get('part') or request.args.get('selected') or (parts[0] if parts else None)
@@ -15055,6 +16643,8 @@ def counting_3d_printing_parts():
         )
 
         for entry in recent_entries:
+            # The delta needs the snapshot before this one; the projection only
+            # keeps the latest, so this stays on the log.
             previous = (
                 PrintedPartsCount.query
                 .filter(PrintedPartsCount.part_name == entry.part_name)
@@ -15334,9 +16924,7 @@ def counting_cushions():
         sizes=CUSHION_SIZES,
         shapes=CUSHION_SHAPES,
         stock_summary=stock_summary,
-        completed_size_stats=cushion_completed_size_stats(),
-        weekly_size_stats=cushion_completed_weekly_stats(),
-        previous_month_size_stats=cushion_completed_previous_month_stats(),
+        **cushion_completed_stats(today),
         bonus_progress=bonus_progress,
         bonus_month_label=bonus_goal_month_label(today.year, today.month),
         extra_time_progress=cushion_extra_time_progress("Katie", today.year, today.month),
@@ -15617,6 +17205,10 @@ def cushion_production_admin():
                     },
                     synchronize_session=False
                 )
+                # Bulk updates skip the log's mapper events, so move the timing stats here.
+                timing_connection = db.session.connection()
+                rebuild_cushion_timing_stats(timing_connection, batch_number=batch.batch_number)
+                rebuild_cushion_timing_stats(timing_connection, batch_number=0)
 
                 db.session.delete(batch)
                 db.session.flush()
@@ -15854,24 +17446,29 @@ def cushion_history():
     ensure_cushion_consumables()
 
     filters = cushion_history_filter_state(request.args)
-    log_query = cushion_history_log_query(filters)
-    total_actions = log_query.count()
+    summary, stage_summary = cushion_history_summaries(filters)
+    total_actions = summary["total_actions"]
     per_page = request.args.get('per_page', 50, type=int)
     per_page = min(max(per_page, 25), 200)
     total_pages = max(1, int(ceil(total_actions / per_page))) if total_actions else 1
     page = request.args.get('page', 1, type=int)
     page = min(max(page, 1), total_pages)
 
-    action_logs = (
-        log_query
-        .order_by(CushionWorkflowLog.created_at.desc(), CushionWorkflowLog.id.desc())
-        .offset((page - 1) * per_page)
-        .limit(per_page)
-        .all()
-    )
+    # Prev/next links carry the (created_at, id) of the row at the page edge,
+    # so deep pages seek the index instead of counting past every newer row.
+    # Links without a cursor (old bookmarks, stale cursors) fall back to offsets.
+    cursor = decode_cushion_history_cursor(request.args.get('cursor', '')) if page > 1 else None
+    action_logs = []
+    if cursor is not None:
+        action_logs = cushion_history_action_page(
+            filters, per_page, cursor, older=request.args.get('direction') != 'prev'
+        )
+    if not action_logs:
+        action_logs = cushion_history_action_page(filters, per_page, offset=(page - 1) * per_page)
     completed_sets = (
         cushion_history_completed_query(filters)
         .order_by(CushionCompletedSet.completed_at.desc(), CushionCompletedSet.id.desc())
+        .limit(200)
         .all()
     )
     consumable_entries = (
@@ -15884,17 +17481,27 @@ def cushion_history():
     query_args = cushion_history_clean_query_args(request.args.to_dict(flat=True))
     prev_url = None
     next_url = None
-    if page > 1:
-        prev_url = url_for('cushion_history', **{**query_args, "page": page - 1})
-    if page < total_pages:
-        next_url = url_for('cushion_history', **{**query_args, "page": page + 1})
+    if page == 2:
+        prev_url = url_for('cushion_history', **query_args)
+    elif page > 2 and action_logs:
+        prev_url = url_for(
+            'cushion_history',
+            **{**query_args, "page": page - 1, "cursor": encode_cushion_history_cursor(action_logs[0]),
+               "direction": "prev"},
+        )
+    if page < total_pages and action_logs:
+        next_url = url_for(
+            'cushion_history',
+            **{**query_args, "page": page + 1, "cursor": encode_cushion_history_cursor(action_logs[-1])},
+        )
+    first_item = ((page - 1) * per_page + 1) if action_logs else 0
 
     return render_template(
         'cushion_history.html',
         filters=filters,
         filter_options=cushion_history_filter_options(),
-        summary=cushion_history_summary(filters),
-        stage_summary=cushion_history_stage_summary(filters),
+        summary=summary,
+        stage_summary=stage_summary,
         action_logs=action_logs,
         completed_sets=completed_sets,
         consumable_entries=consumable_entries,
@@ -15903,8 +17510,8 @@ def cushion_history():
             "per_page": per_page,
             "total_pages": total_pages,
             "total_actions": total_actions,
-            "first_item": ((page - 1) * per_page + 1) if total_actions else 0,
-            "last_item": min(page * per_page, total_actions),
+            "first_item": first_item,
+            "last_item": first_item + len(action_logs) - 1 if action_logs else 0,
             "prev_url": prev_url,
             "next_url": next_url,
         },
@@ -15914,92 +17521,118 @@ def cushion_history():
     )
 
 
-@app.route('/cushion_history/export.csv')
-def cushion_history_export_csv():
-    if 'worker' not in session:
-        flash("Please log in first.", "error")
-        return redirect(url_for('login'))
-
-    ensure_cushion_workflow_tables()
-    ensure_cushion_consumables()
-
-    filters = cushion_history_filter_state(request.args)
-    output = StringIO()
-    writer = csv.writer(output)
-
-    writer.writerow(["Cushion History Export"])
-    writer.writerow(["Period", filters["period"]])
-    writer.writerow(["Start Date", filters["start_date_value"]])
-    writer.writerow(["End Date", filters["end_date_value"]])
-    writer.writerow(["Worker", filters["worker"]])
-    writer.writerow(["Stage", filters["stage_key"]])
-    writer.writerow(["Size", filters["size_label"]])
-    writer.writerow(["Shape", filters["shape_value"]])
-    writer.writerow(["End Type", filters["end_type"]])
-    writer.writerow(["Action", filters["action_type"]])
-    writer.writerow([])
-
-    writer.writerow(["Action Log"])
-    writer.writerow([
+def cushion_history_csv_rows(filters):
+    """Rows of the cushion history export, read from the database in batches as they are written."""
+    yield ["Cushion History Export"]
+    yield ["Period", filters["period"]]
+    yield ["Start Date", filters["start_date_value"]]
+    yield ["End Date", filters["end_date_value"]]
+    yield ["Worker", filters["worker"]]
+    yield ["Stage", filters["stage_key"]]
+    yield ["Size", filters["size_label"]]
+    yield ["Shape", filters["shape_value"]]
+    yield ["End Type", filters["end_type"]]
+    yield ["Action", filters["action_type"]]
+    yield []
+
+    yield ["Action Log"]
+    yield [
         "When", "Worker", "Stage", "Size", "Shape", "End Type",
         "Action", "Delta", "Count After", "Seconds Taken", "Note"
-    ])
-    for entry in (
+    ]
+    log_rows = csv_export_rows(
         cushion_history_log_query(filters)
+        .with_entities(
+            CushionWorkflowLog.created_at,
+            CushionWorkflowLog.worker,
+            CushionWorkflowLog.stage_label,
+            CushionWorkflowLog.size_label,
+            CushionWorkflowLog.shape_no,
+            CushionWorkflowLog.end_type,
+            CushionWorkflowLog.action_type,
+            CushionWorkflowLog.delta,
+            CushionWorkflowLog.count_after,
+            CushionWorkflowLog.seconds_taken,
+            CushionWorkflowLog.note,
+        )
         .order_by(CushionWorkflowLog.created_at.desc(), CushionWorkflowLog.id.desc())
-        .all()
-    ):
-        writer.writerow([
-            entry.created_at.strftime("%Y-%m-%d %H:%M:%S") if entry.created_at else "",
-            entry.worker,
-            entry.stage_label,
-            entry.size_label,
-            entry.shape_no or "",
-            entry.end_type,
-            entry.action_type,
-            entry.delta,
-            entry.count_after,
-            entry.seconds_taken if entry.seconds_taken is not None else "",
-            entry.note or "",
-        ])
+    )
+    for created_at, worker, stage_label, size_label, shape_no, end_type, action_type, delta, count_after, seconds_taken, note in log_rows:
+        yield [
+            created_at.strftime("%Y-%m-%d %H:%M:%S") if created_at else "",
+            worker,
+            stage_label,
+            size_label,
+            shape_no or "",
+            end_type,
+            action_type,
+            delta,
+            count_after,
+            seconds_taken if seconds_taken is not None else "",
+            note or "",
+        ]
 
-    writer.writerow([])
-    writer.writerow(["Completed Cushion Sets"])
-    writer.writerow(["Completed", "Size", "Worker", "Stock After", "Estimated Seconds"])
-    for completed in (
+    yield []
+    yield ["Completed Cushion Sets"]
+    yield ["Completed", "Size", "Worker", "Stock After", "Estimated Seconds"]
+    completed_rows = csv_export_rows(
         cushion_history_completed_query(filters)
+        .with_entities(
+            CushionCompletedSet.completed_at,
+            CushionCompletedSet.size_label,
+            CushionCompletedSet.worker,
+            CushionCompletedSet.stock_count_after,
+            CushionCompletedSet.estimated_seconds,
+        )
         .order_by(CushionCompletedSet.completed_at.desc(), CushionCompletedSet.id.desc())
-        .all()
-    ):
-        writer.writerow([
-            completed.completed_at.strftime("%Y-%m-%d %H:%M:%S") if completed.completed_at else "",
-            completed.size_label,
-            completed.worker,
-            completed.stock_count_after,
-            completed.estimated_seconds if completed.estimated_seconds is not None else "",
-        ])
+    )
+    for completed_at, size_label, worker, stock_count_after, estimated_seconds in completed_rows:
+        yield [
+            completed_at.strftime("%Y-%m-%d %H:%M:%S") if completed_at else "",
+            size_label,
+            worker,
+            stock_count_after,
+            estimated_seconds if estimated_seconds is not None else "",
+        ]
 
-    writer.writerow([])
-    writer.writerow(["Consumable Stock Entries"])
-    writer.writerow(["Date", "Time", "Part", "Count After"])
-    for entry in (
+    yield []
+    yield ["Consumable Stock Entries"]
+    yield ["Date", "Time", "Part", "Count After"]
+    consumable_rows = csv_export_rows(
         cushion_history_consumable_query(filters)
+        .with_entities(
+            PrintedPartsCount.date,
+            PrintedPartsCount.time,
+            PrintedPartsCount.part_name,
+            PrintedPartsCount.count,
+        )
         .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc(), PrintedPartsCount.id.desc())
-        .all()
-    ):
-        writer.writerow([
-            entry.date.strftime("%Y-%m-%d") if entry.date else "",
-            entry.time.strftime("%H:%M:%S") if entry.time else "",
-            entry.part_name,
-            entry.count,
-        ])
+    )
+    for entry_date, entry_time, part_name, count in consumable_rows:
+        yield [
+            entry_date.strftime("%Y-%m-%d") if entry_date else "",
+            entry_time.strftime("%H:%M:%S") if entry_time else "",
+            part_name,
+            count,
+        ]
+
+
+@app.route('/cushion_history/export.csv')
+def cushion_history_export_csv():
+    if 'worker' not in session:
+        flash("Please log in first.", "error")
+        return redirect(url_for('login'))
+
+    ensure_cushion_workflow_tables()
+    ensure_cushion_consumables()
 
+    filters = cushion_history_filter_state(request.args)
     filename_start = filters["start_date_value"] or "all"
     filename_end = filters["end_date_value"] or "all"
-    response = make_response(output.getvalue())
-    response.headers["Content-Type"] = "text/csv"
-    response.headers["Content-Disposition"] = f"attachment; filename=cushion_history_{filename_start}_to_{filename_end}.csv"
-    return response
+    return csv_stream_response(
+        csv_chunks(cushion_history_csv_rows(filters)),
+        f"cushion_history_{filename_start}_to_{filename_end}.csv",
+    )
 
 
 @app.route('/counting_cushions_legacy', methods=['GET', 'POST'])
@@ -16719,7 +18352,10 @@ class TopRailPieceCountLog(db.Model):
     count_before = db.Column(db.Integer, nullable=False, default=0)
     count_after = db.Column(db.Integer, nullable=False, default=0)
     note = db.Column(db.String(200), nullable=True)
-    created_at = db.Column(db.DateTime, nullable=False, default=london_now, index=True)
+    # Keeps its old value on edit for the count checkpoints (see TableStockLog).
+    created_at = db.column_property(
+        db.Column(db.DateTime, nullable=False, default=london_now, index=True), active_history=True
+    )
 
 
 class BodyPieceCount(db.Model):
@@ -16728,6 +18364,255 @@ class BodyPieceCount(db.Model):
     count = db.Column(db.Integer, default=0, nullable=False)
 
 
+class BodyPieceCountLog(db.Model):
+    __tablename__ = 'body_piece_count_log'
+
+    id = db.Column(db.Integer, primary_key=True)
+    part_key = db.Column(db.String(60), nullable=False, index=True)
+    action_type = db.Column(db.String(30), nullable=False, default="set")
+    worker = db.Column(db.String(50), nullable=False, default="Unknown")
+    delta = db.Column(db.Integer, nullable=False, default=0)
+    count_before = db.Column(db.Integer, nullable=False, default=0)
+    count_after = db.Column(db.Integer, nullable=False, default=0)
+    note = db.Column(db.String(200), nullable=True)
+    # Keeps its old value on edit for the count checkpoints (see TableStockLog).
+    created_at = db.column_property(
+        db.Column(db.DateTime, nullable=False, default=london_now, index=True), active_history=True
+    )
+
+
+class CountCheckpoint(db.Model):
+    """Full key -> count snapshot of a count log up to (taken_at, last_log_id)."""
+    __tablename__ = 'count_checkpoint'
+    __table_args__ = (
+        db.Index('ix_count_checkpoint_source_taken_at', 'source', 'taken_at', 'last_log_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(40), nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False)
+    last_log_id = db.Column(db.Integer, nullable=False)
+    counts_json = db.Column(db.Text, nullable=False, default="{}")
+
+
+# source -> (log model, key column). Each log row carries the key's count_after.
+COUNT_HISTORY_SOURCES = {
+    "top_rail_pieces": (TopRailPieceCountLog, "part_key"),
+    "body_pieces": (BodyPieceCountLog, "part_key"),
+    "table_stock": (TableStockLog, "stock_type"),
+}
+COUNT_CHECKPOINT_INTERVAL = 200
+
+
+def _count_history_columns(source):
+    model, key_attr = COUNT_HISTORY_SOURCES[source]
+    columns = model.__table__.c
+    return model.__table__, columns[key_attr], columns.count_after, columns.created_at, columns.id
+
+
+def _latest_count_checkpoint(connection, source, as_of_dt):
+    checkpoints = CountCheckpoint.__table__.c
+    return connection.execute(
+        select(checkpoints.taken_at, checkpoints.last_log_id, checkpoints.counts_json)
+        .where(checkpoints.source == source, checkpoints.taken_at <= as_of_dt)
+        .order_by(checkpoints.taken_at.desc(), checkpoints.last_log_id.desc())
+        .limit(1)
+    ).first()
+
+
+def _count_log_rows(connection, source, after=None, upto_dt=None, upto_id=None):
+    table, key_col, count_col, created_col, id_col = _count_history_columns(source)
+    query = select(key_col, count_col, created_col, id_col).order_by(created_col.asc(), id_col.asc())
+    if after is not None:
+        after_dt, after_id = after
+        query = query.where(or_(created_col > after_dt, and_(created_col == after_dt, id_col > after_id)))
+    if upto_dt is not None:
+        if upto_id is None:
+            query = query.where(created_col <= upto_dt)
+        else:
+            query = query.where(or_(created_col < upto_dt, and_(created_col == upto_dt, id_col <= upto_id)))
+    return connection.execute(query)
+
+
+def _count_history_connection(connection):
+    return connection if connection is not None else db.session.connection()
+
+
+def counts_series(source, as_of_datetimes, connection=None):
+    """Counts per key at each datetime: {as_of_dt: {key: count}}.
+
+    Each point starts from the nearest checkpoint at or before it and replays
+    only the log tail, so the cost is bounded by COUNT_CHECKPOINT_INTERVAL rows
+    per point rather than by the age of the log.
+    """
+    conn = _count_history_connection(connection)
+    counts = {}
+    position = None
+    series = {}
+    for as_of_dt in sorted(set(as_of_datetimes)):
+        checkpoint = _latest_count_checkpoint(conn, source, as_of_dt)
+        if checkpoint is not None:
+            checkpoint_position = (checkpoint.taken_at, checkpoint.last_log_id)
+            if position is None or checkpoint_position > position:
+                counts = json.loads(checkpoint.counts_json or "{}")
+                position = checkpoint_position
+        for key, count_after, created_at, log_id in _count_log_rows(conn, source, after=position, upto_dt=as_of_dt):
+            counts[key] = count_after
+            position = (created_at, log_id)
+        series[as_of_dt] = dict(counts)
+    return series
+
+
+def counts_as_of(source, as_of_dt, connection=None):
+    return counts_series(source, [as_of_dt], connection)[as_of_dt]
+
+
+def _write_count_checkpoint(connection, source, taken_at, last_log_id, counts):
+    connection.execute(
+        CountCheckpoint.__table__.insert().values(
+            source=source,
+            taken_at=taken_at,
+            last_log_id=last_log_id,
+            counts_json=json.dumps(counts, sort_keys=True),
+        )
+    )
+
+
+def rebuild_count_checkpoints(source, connection):
+    """Drop and rewrite every checkpoint for a source from its full log."""
+    connection.execute(CountCheckpoint.__table__.delete().where(CountCheckpoint.__table__.c.source == source))
+    counts = {}
+    written = 0
+    rows = _count_log_rows(connection, source).all()
+    for index, (key, count_after, created_at, log_id) in enumerate(rows, start=1):
+        counts[key] = count_after
+        if index % COUNT_CHECKPOINT_INTERVAL == 0:
+            _write_count_checkpoint(connection, source, created_at, log_id, counts)
+            written += 1
+    return written
+
+
+def _invalidate_count_checkpoints(connection, source, changed_at, inclusive=False):
+    taken_at = CountCheckpoint.__table__.c.taken_at
+    connection.execute(
+        CountCheckpoint.__table__.delete().where(
+            CountCheckpoint.__table__.c.source == source,
+            taken_at >= changed_at if inclusive else taken_at > changed_at,
+        )
+    )
+
+
+def _count_log_inserted(connection, source, created_at, log_id):
+    # A back-dated row lands inside snapshots taken after it.
+    _invalidate_count_checkpoints(connection, source, created_at)
+    if log_id % COUNT_CHECKPOINT_INTERVAL == 0:
+        _, _, _, created_col, id_col = _count_history_columns(source)
+        checkpoint = _latest_count_checkpoint(connection, source, created_at)
+        counts = json.loads(checkpoint.counts_json) if checkpoint else {}
+        after = (checkpoint.taken_at, checkpoint.last_log_id) if checkpoint else None
+        for key, count_after, _, _ in _count_log_rows(connection, source, after, created_at, log_id):
+            counts[key] = count_after
+        _write_count_checkpoint(connection, source, created_at, log_id, counts)
+
+
+def _register_count_history_events(source, model):
+    @event.listens_for(model, "after_insert")
+    def checkpoint_inserted_log(mapper, connection, target):
+        _count_log_inserted(connection, source, target.created_at, target.id)
+
+    @event.listens_for(model, "after_update")
+    def invalidate_updated_log(mapper, connection, target):
+        history = sa_inspect(target).attrs.created_at.history
+        changed_at = min([target.created_at, *history.deleted])
+        _invalidate_count_checkpoints(connection, source, changed_at, inclusive=True)
+
+    @event.listens_for(model, "after_delete")
+    def invalidate_deleted_log(mapper, connection, target):
+        _invalidate_count_checkpoints(connection, source, target.created_at, inclusive=True)
+
+
+for _history_source, (_history_model, _) in COUNT_HISTORY_SOURCES.items():
+    _register_count_history_events(_history_source, _history_model)
+
+
+def _record_body_piece_count_change(connection, part_key, count_before, count_after, action_type):
+    if count_before == count_after:
+        return
+    worker = session.get("worker") if has_request_context() else None
+    created_at = london_now()
+    result = connection.execute(
+        BodyPieceCountLog.__table__.insert().values(
+            part_key=part_key,
+            action_type=action_type,
+            worker=(worker or "Unknown").strip() or "Unknown",
+            delta=count_after - count_before,
+            count_before=count_before,
+            count_after=count_after,
+            created_at=created_at,
+        )
+    )
+    _count_log_inserted(connection, "body_pieces", created_at, result.inserted_primary_key[0])
+
+
+@event.listens_for(BodyPieceCount, "after_insert")
+def _log_inserted_body_piece_count(mapper, connection, target):
+    _record_body_piece_count_change(connection, target.part_key, 0, target.count or 0, "create")
+
+
+@event.listens_for(BodyPieceCount, "after_update")
+def _log_updated_body_piece_count(mapper, connection, target):
+    history = sa_inspect(target).attrs.count.history
+    if history.deleted:
+        _record_body_piece_count_change(connection, target.part_key, history.deleted[0] or 0, target.count or 0, "set")
+
+
+@event.listens_for(BodyPieceCount, "after_delete")
+def _log_deleted_body_piece_count(mapper, connection, target):
+    _record_body_piece_count_change(connection, target.part_key, target.count or 0, 0, "delete")
+
+
+def _seed_body_piece_count_log_baseline(connection):
+    if connection.execute(select(BodyPieceCountLog.id).limit(1)).first():
+        return
+    baseline_time = london_now()
+    rows = connection.execute(select(BodyPieceCount.part_key, BodyPieceCount.count)).all()
+    if rows:
+        connection.execute(BodyPieceCountLog.__table__.insert(), [
+            {
+                "part_key": part_key,
+                "action_type": "baseline",
+                "worker": "System",
+                "delta": count or 0,
+                "count_before": 0,
+                "count_after": count or 0,
+                "note": "Initial body piece count history baseline",
+                "created_at": baseline_time,
+            }
+            for part_key, count in rows
+        ])
+
+
+@schema_migration(16, "count_history_checkpoints")
+def ensure_count_history_tables():
+    for model in (TableStockLog, TopRailPieceCountLog, BodyPieceCount, BodyPieceCountLog, CountCheckpoint):
+        model.__table__.create(db.engine, checkfirst=True)
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+    with db.engine.begin() as conn:
+        _seed_body_piece_count_log_baseline(conn)
+        for source in COUNT_HISTORY_SOURCES:
+            rebuild_count_checkpoints(source, conn)
+
+
+@app.cli.command("rebuild-count-checkpoints")
+def rebuild_count_checkpoints_command():
+    """Rewrite the as-of checkpoints for every count log."""
+    with db.engine.begin() as conn:
+        for source in COUNT_HISTORY_SOURCES:
+            written = rebuild_count_checkpoints(source, conn)
+            print(f"{source}: {written} checkpoints")
+
+
 @app.route('/fastest_leaderboard')
 def fastest_leaderboard():
     if 'worker' not in session:
@@ -16894,16 +18779,12 @@ def order_chinese_parts():
     }
 
     # Fetch latest count for each part
-    part_stock = {}
+    inventory_snapshot = current_part_inventory_snapshot()
     inventory_parts = list(chinese_parts) + supplemental_parts + ["Latch"]
-    for part in inventory_parts:
-        latest_entry = (
-            db.session.query(PrintedPartsCount.count)
-            .filter_by(part_name=part)
-            .order_by(PrintedPartsCount.date.desc(), PrintedPartsCount.time.desc())
-            .first()
-        )
-        part_stock[part] = latest_entry[0] if latest_entry else 0
+    part_stock = {
+        part: snapshot_part_count(inventory_snapshot, part, include_baseline=False)
+        for part in inventory_parts
+    }
 
     gullies_parts = []
     gullies_per_table = GULLIES_PER_SET
@@ -17371,7 +19252,6 @@ class LaminatePieceCount(db.Model):
 
 @app.route('/top_rail_pieces', methods=['GET', 'POST'])
 def top_rail_pieces():
-    TopRailPieceCount.__table__.create(db.engine, checkfirst=True)
     ensure_top_rail_piece_count_log_table()
     seed_top_rail_piece_count_log_baseline()
 
@@ -17553,7 +19433,6 @@ def top_rail_pieces():
 
 @app.route('/body_pieces', methods=['GET', 'POST'])
 def body_pieces():
-    BodyPieceCount.__table__.create(db.engine, checkfirst=True)
     color_defs = [
         ("black", "Black"),
         ("rustic_oak", "Rustic Oak"),
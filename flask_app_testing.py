@@ -0,0 +1,68 @@
+"""Load ``flask_app`` against a throwaway SQLite file for the app tests.
+
+Flask-SQLAlchemy builds its engine when ``flask_app`` is imported, pointed
+at ``POOL_TRACKER_DATABASE_URI`` or the live ``pool_table_tracker.db``, and
+the ntfy dispatcher is built against ``NTFY_URL`` and ``NTFY_SPOOL_PATH`` or
+the live topic and spool. Test modules that import the app import this
+module first, so alerts go to a local stub server and a throwaway spool.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from notification_dispatcher import StubNtfyServer
+
+if "flask_app" not in sys.modules:
+    _database_dir = tempfile.mkdtemp(prefix="pool-tracker-tests-")
+    atexit.register(shutil.rmtree, _database_dir, ignore_errors=True)
+    os.environ["POOL_TRACKER_DATABASE_URI"] = "sqlite:///" + os.path.join(_database_dir, "tracker.db")
+    TEST_DATABASE_URI = os.environ["POOL_TRACKER_DATABASE_URI"]
+    # Alerts raised by the tests are recorded here instead of reaching ntfy.sh.
+    NTFY_STUB = StubNtfyServer().start()
+    atexit.register(NTFY_STUB.stop)
+    os.environ["NTFY_URL"] = NTFY_STUB.url
+    os.environ["NTFY_SPOOL_PATH"] = os.path.join(_database_dir, "ntfy_spool.db")
+else:
+    TEST_DATABASE_URI = None
+    NTFY_STUB = None
+
+import flask_app  # noqa: E402
+
+if flask_app.app.config["SQLALCHEMY_DATABASE_URI"] != TEST_DATABASE_URI:
+    raise RuntimeError(
+        "flask_app was imported before flask_app_testing; import flask_app_testing "
+        "first so the tests cannot write to the real database."
+    )
+flask_app.app.config["TESTING"] = True
+with flask_app.app.app_context():
+    flask_app.run_schema_migrations()
+
+
+class AppTestCase(unittest.TestCase):
+    """Each test runs in an app context on empty tables, with the in-process caches cleared."""
+
+    worker = "Test Worker"
+
+    def setUp(self):
+        context = flask_app.app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        self.addCleanup(flask_app.db.session.remove)
+        with flask_app.db.engine.begin() as connection:
+            for table in reversed(flask_app.db.metadata.sorted_tables):
+                if table.name != flask_app.SchemaMigration.__tablename__:
+                    connection.execute(table.delete())
+        flask_app.cushion_history_summary_cache.clear()
+        self.db = flask_app.db
+        self.client = flask_app.app.test_client()
+
+    def log_in(self, **extra):
+        with self.client.session_transaction() as session:
+            session["worker"] = self.worker
+            session.update(extra)
@@ -0,0 +1,24 @@
+"""Gunicorn settings, read from ``./gunicorn.conf.py`` when gunicorn starts in this directory.
+
+The CNC kiosks keep ``/api/cnc/queue/events`` open for up to
+CNC_EVENT_STREAM_SECONDS at a time and reconnect straight away. Under the
+default sync workers every open stream takes a whole worker process, so a
+few kiosks starve the rest of the site. gthread workers serve each request
+on its own thread. A stream waits on the in-process event fan-out without
+holding a database connection, so it costs one thread, not a worker.
+Command-line flags (``-w``, ``-b``, ``--threads``) still override these.
+"""
+
+import os
+
+wsgi_app = "wsgi:app"
+worker_class = "gthread"
+# Each thread serves one request or one kiosk stream; leave room for both.
+# Keep it near the SQLAlchemy pool size plus overflow (15), as page requests
+# beyond that wait for a connection.
+threads = int(os.environ.get("GUNICORN_THREADS", "16"))
+# With gthread the timeout only covers the worker's heartbeat, not how long
+# one request (or stream) may run.
+timeout = 60
+# Kiosks reconnect 2 s after a stream ends (``retry: 2000``); keep the socket that long.
+keepalive = 5
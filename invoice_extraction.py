@@ -0,0 +1,333 @@
+"""Parallel, cached extraction of uploaded invoice files off the request thread."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from invoice_ocr import empty_stage_stats, merge_stage_stats
+from packaging_planner import _new_id, extract_invoice_bytes
+
+
+# Bump when extraction output changes so cached results from older parsers are ignored.
+EXTRACTION_CACHE_VERSION = 2
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoice_extraction_cache (
+    content_hash TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    items_json TEXT NOT NULL,
+    warnings_json TEXT NOT NULL,
+    last_used_at REAL NOT NULL,
+    PRIMARY KEY (content_hash, extension, version)
+)
+"""
+
+# Plain-text formats this small parse faster inline than the round trip to a worker.
+INLINE_EXTENSIONS = {".csv", ".txt"}
+INLINE_MAX_BYTES = 256 * 1024
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _rename_result(items, warnings, cached_name, filename):
+    """Point a cached result at the name the file was uploaded under this time."""
+    renamed_items = []
+    for item in items:
+        item = dict(item)
+        item["id"] = _new_id("item")
+        if item.get("source_file") == cached_name:
+            item["source_file"] = filename
+        renamed_items.append(item)
+    prefix = f"{cached_name}:"
+    renamed_warnings = [
+        f"{filename}:{warning[len(prefix):]}" if warning.startswith(prefix) else warning
+        for warning in warnings
+    ]
+    return renamed_items, renamed_warnings
+
+
+class ExtractionCache:
+    """Extraction results keyed by file content, shared by every worker process via SQLite."""
+
+    def __init__(self, path, max_entries=500):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def _connect(self):
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(CACHE_SCHEMA)
+            self._connection.commit()
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def get(self, digest, filename):
+        extension = os.path.splitext(filename)[1].lower()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT filename, items_json, warnings_json FROM invoice_extraction_cache "
+                "WHERE content_hash = ? AND extension = ? AND version = ?",
+                (digest, extension, EXTRACTION_CACHE_VERSION),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE invoice_extraction_cache SET last_used_at = ? "
+                "WHERE content_hash = ? AND extension = ? AND version = ?",
+                (time.time(), digest, extension, EXTRACTION_CACHE_VERSION),
+            )
+            connection.commit()
+        cached_name, items_json, warnings_json = row
+        return _rename_result(json.loads(items_json), json.loads(warnings_json), cached_name, filename)
+
+    def put(self, digest, filename, items, warnings):
+        extension = os.path.splitext(filename)[1].lower()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO invoice_extraction_cache "
+                "(content_hash, extension, version, filename, items_json, warnings_json, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest, extension, EXTRACTION_CACHE_VERSION, filename,
+                 json.dumps(items), json.dumps(warnings), time.time()),
+            )
+            connection.execute(
+                "DELETE FROM invoice_extraction_cache WHERE rowid IN ("
+                "SELECT rowid FROM invoice_extraction_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            connection.commit()
+
+
+def _extract_in_worker(filename, data):
+    stats = {}
+    items, warnings = extract_invoice_bytes(filename, data, stats=stats)
+    return items, warnings, stats
+
+
+class ExtractionPipeline:
+    """Extract a batch of files on a process pool, largest first, with per-file timeouts.
+
+    At most ``max_workers`` files are in flight across every run sharing the
+    pipeline, so a file is only handed to the pool once a worker is free for
+    it and its timeout runs from when that worker picks it up. A file that
+    overruns is reported as a warning and the pool is replaced, since a stuck
+    worker cannot be interrupted; other files that were in flight are
+    resubmitted.
+    """
+
+    def __init__(self, max_workers=None, timeout_seconds=60.0, cache=None, extractor=None,
+                 initializer=None, initargs=()):
+        self.max_workers = max(1, max_workers or min(4, os.cpu_count() or 1))
+        self.timeout_seconds = timeout_seconds
+        self.cache = cache
+        self.extractor = extractor or _extract_in_worker
+        self.initializer = initializer
+        self.initargs = initargs
+        self._pool = None
+        self._pool_pid = None
+        # Bumped on every restart so concurrent runs notice their tasks died with the old pool.
+        self._generation = 0
+        self._pool_lock = threading.Lock()
+        # One slot per worker, shared by concurrent runs.
+        self._slots = threading.Semaphore(self.max_workers)
+        self._counters = {
+            "files": 0, "cache_hits": 0, "inline": 0, "pooled": 0, "timeouts": 0, "pool_restarts": 0, "errors": 0,
+        }
+        self._ocr_stats = empty_stage_stats()
+
+    def stats(self):
+        with self._pool_lock:
+            return {**self._counters, "ocr": dict(self._ocr_stats)}
+
+    def _record_result(self, result):
+        """Split an extractor result into ``(items, warnings, status)``, keeping any OCR stage stats.
+
+        A read that raised inside the extractor (a transient OCR error, say)
+        comes back as warnings with ``stats["errors"]`` set; it is ``failed``
+        so the empty result is not cached against the file's content.
+        """
+        status = "done"
+        if len(result) > 2:
+            stats = dict(result[2] or {})
+            if stats.pop("errors", 0):
+                status = "failed"
+                self._count("errors")
+            with self._pool_lock:
+                merge_stage_stats(self._ocr_stats, stats)
+        return result[0], result[1], status
+
+    def _count(self, key, amount=1):
+        with self._pool_lock:
+            self._counters[key] += amount
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # Spawned workers never inherit the web process's threads or locks.
+                context = multiprocessing.get_context("spawn")
+                self._pool = context.Pool(self.max_workers, self.initializer, self.initargs)
+                self._pool_pid = os.getpid()
+            return self._pool, self._generation
+
+    def _restart_pool(self, generation):
+        with self._pool_lock:
+            if generation != self._generation:
+                return
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.terminate()
+            self._pool = None
+            self._generation += 1
+            self._counters["pool_restarts"] += 1
+
+    def _current_generation(self):
+        with self._pool_lock:
+            return self._generation
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.terminate()
+                self._pool.join()
+            self._pool = None
+            self._generation += 1
+
+    def run(self, files, on_file_done=None):
+        """Extract ``[(filename, data), ...]``; returns ``[(items, warnings), ...]`` in input order.
+
+        ``on_file_done(index, filename, status)`` is called as each file
+        finishes, with status ``cached``, ``done``, ``timeout`` or ``failed``;
+        ``failed`` includes reads the extractor caught and reported as warnings.
+        Only ``done`` results are written to the cache.
+        """
+        results = [None] * len(files)
+        digests = [content_hash(data) for _, data in files]
+        self._count("files", len(files))
+
+        def finish(index, items, warnings, status):
+            filename = files[index][0]
+            results[index] = (items, warnings)
+            if self.cache is not None and status == "done":
+                self.cache.put(digests[index], filename, items, warnings)
+            if on_file_done:
+                on_file_done(index, filename, status)
+
+        pending = []
+        for index, (filename, data) in enumerate(files):
+            cached = self.cache.get(digests[index], filename) if self.cache is not None else None
+            if cached is not None:
+                self._count("cache_hits")
+                finish(index, cached[0], cached[1], "cached")
+            else:
+                pending.append(index)
+
+        inline = [
+            index for index in pending
+            if os.path.splitext(files[index][0])[1].lower() in INLINE_EXTENSIONS
+            and len(files[index][1]) <= INLINE_MAX_BYTES
+        ]
+        # Longest-first keeps one big scan from starting last and setting the finish time.
+        pooled = sorted(
+            (index for index in pending if index not in inline),
+            key=lambda index: len(files[index][1]),
+            reverse=True,
+        )
+        if pooled:
+            self._count("pooled", len(pooled))
+            self._run_pooled(files, pooled, finish)
+        for index in inline:
+            self._count("inline")
+            finish(index, *self._record_result(self.extractor(*files[index])))
+        return results
+
+    def _run_pooled(self, files, order, finish):
+        completed = queue.Queue()
+        waiting = list(order)
+        in_flight = {}
+        generation_of = {}
+
+        def by_size(index):
+            return len(files[index][1])
+
+        def submit(index):
+            pool, generation = self._get_pool()
+
+            def on_result(result):
+                completed.put((index, generation, result, None))
+
+            def on_error(error):
+                completed.put((index, generation, None, error))
+
+            generation_of[index] = generation
+            pool.apply_async(self.extractor, files[index], callback=on_result, error_callback=on_error)
+            in_flight[index] = time.monotonic() + self.timeout_seconds
+
+        def release(indexes):
+            for index in list(indexes):
+                del in_flight[index]
+                self._slots.release()
+
+        try:
+            while waiting or in_flight:
+                # A slot is a free worker, so the file starts as soon as it is submitted.
+                # With nothing in flight, wait for a slot held by a concurrent run.
+                while waiting and self._slots.acquire(timeout=0 if in_flight else 1.0):
+                    submit(waiting.pop(0))
+                if not in_flight:
+                    continue
+                if any(generation_of[index] != self._current_generation() for index in in_flight):
+                    # Another run replaced the pool and took these tasks with it; start them again.
+                    waiting = sorted(in_flight, key=by_size, reverse=True) + waiting
+                    release(in_flight)
+                    continue
+                # Wake at least every second to notice a pool restarted by a concurrent run.
+                wait_seconds = min(min(in_flight.values()) - time.monotonic(), 1.0)
+                try:
+                    index, generation, result, error = completed.get(timeout=max(wait_seconds, 0))
+                except queue.Empty:
+                    now = time.monotonic()
+                    expired = [index for index, deadline in in_flight.items() if deadline <= now]
+                    if not expired:
+                        continue
+                    # A stuck worker cannot be interrupted, so the whole pool is replaced
+                    # (before its slots are handed back) and anything else that was still
+                    # running starts again.
+                    self._restart_pool(generation_of[expired[0]])
+                    release(expired)
+                    for index in expired:
+                        self._count("timeouts")
+                        filename = files[index][0]
+                        finish(index, [], [
+                            f"{filename}: extraction took longer than {self.timeout_seconds:g} seconds. "
+                            "Add the items manually.",
+                        ], "timeout")
+                    waiting = sorted(in_flight, key=by_size, reverse=True) + waiting
+                    release(in_flight)
+                    continue
+                if index not in in_flight or generation != generation_of[index]:
+                    continue
+                release([index])
+                if error is not None:
+                    filename = files[index][0]
+                    finish(index, [], [f"{filename}: extraction failed ({type(error).__name__})."], "failed")
+                else:
+                    finish(index, *self._record_result(result))
+        finally:
+            # Hand back the slots of anything still in flight if finish() raised.
+            release(in_flight)
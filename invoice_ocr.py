@@ -0,0 +1,260 @@
+"""OCR for scanned invoices: PDF page rasterising, image clean-up, parallel pages and a text cache."""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Bump when preprocessing changes so text read from differently prepared images is ignored.
+OCR_CACHE_VERSION = 1
+# Longest side handed to tesseract; an A4 page at 300 dpi is 3508 px, and
+# phone photos above that only make recognition slower.
+OCR_MAX_SIDE = 3500
+PDF_RASTER_DPI = 200
+OCR_LANGUAGE = "eng"
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr_text_cache (
+    cache_key TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    last_used_at REAL NOT NULL
+)
+"""
+
+STAGES = ("rasterize", "preprocess", "ocr")
+
+_settings = {"cache": None, "max_workers": None}
+
+
+class OcrCache:
+    """Recognised page text keyed by image content, kept in SQLite with least-recently-used eviction."""
+
+    def __init__(self, path, max_entries=2000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def _connect(self):
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(CACHE_SCHEMA)
+            self._connection.commit()
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def get(self, key):
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT text FROM ocr_text_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE ocr_text_cache SET last_used_at = ? WHERE cache_key = ?", (time.time(), key)
+            )
+            connection.commit()
+            return row[0]
+
+    def put(self, key, text):
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO ocr_text_cache (cache_key, text, last_used_at) VALUES (?, ?, ?)",
+                (key, text, time.time()),
+            )
+            connection.execute(
+                "DELETE FROM ocr_text_cache WHERE rowid IN ("
+                "SELECT rowid FROM ocr_text_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            connection.commit()
+
+
+def configure_ocr(cache_path=None, max_workers=None):
+    """Set the process-wide OCR cache and page parallelism (also used as a pool initializer)."""
+    _settings["cache"] = OcrCache(cache_path) if cache_path else None
+    _settings["max_workers"] = max_workers
+
+
+def empty_stage_stats():
+    stats = {f"{stage}_seconds": 0.0 for stage in STAGES}
+    stats.update({"pages": 0, "cache_hits": 0})
+    return stats
+
+
+def merge_stage_stats(total, stats):
+    for key, value in (stats or {}).items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+
+def otsu_threshold(histogram):
+    """Grey level that best separates ink from paper in a 256-bin histogram."""
+    total = sum(histogram)
+    if not total:
+        return 127
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background_count = 0
+    background_sum = 0
+    best_threshold = 127
+    best_variance = -1.0
+    for level, count in enumerate(histogram):
+        background_count += count
+        if not background_count:
+            continue
+        foreground_count = total - background_count
+        if not foreground_count:
+            break
+        background_sum += level * count
+        background_mean = background_sum / background_count
+        foreground_mean = (weighted_total - background_sum) / foreground_count
+        variance = background_count * foreground_count * (background_mean - foreground_mean) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = level
+    return best_threshold
+
+
+def preprocess_image(image, max_side=OCR_MAX_SIDE):
+    """Upright, greyscale, downscaled and binarised copy of ``image`` for tesseract."""
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(image)
+    grey = image.convert("L")
+    longest = max(grey.size)
+    if longest > max_side:
+        scale = max_side / longest
+        grey = grey.resize(
+            (max(1, round(grey.width * scale)), max(1, round(grey.height * scale))),
+            Image.Resampling.LANCZOS,
+        )
+    grey = ImageOps.autocontrast(grey, cutoff=1)
+    threshold = otsu_threshold(grey.histogram())
+    return grey.point([0 if level <= threshold else 255 for level in range(256)])
+
+
+def pdf_page_images(data):
+    """Yield ``(content_digest, image)`` for each page of a PDF.
+
+    Pages are rendered with pypdfium2 when it is installed. Otherwise the
+    largest image embedded in each page is used, which for scanner output is
+    the page itself.
+    """
+    try:
+        import pypdfium2
+    except ImportError:
+        pypdfium2 = None
+
+    if pypdfium2 is not None:
+        document = pypdfium2.PdfDocument(data)
+        try:
+            for page in document:
+                image = page.render(scale=PDF_RASTER_DPI / 72).to_pil()
+                yield hashlib.sha256(image.tobytes()).hexdigest(), image
+        finally:
+            document.close()
+        return
+
+    from pypdf import PdfReader
+
+    for page in PdfReader(io.BytesIO(data)).pages:
+        embedded = [
+            embedded_image for embedded_image in page.images
+            if embedded_image.image is not None
+        ]
+        if not embedded:
+            continue
+        largest = max(embedded, key=lambda embedded_image: embedded_image.image.width * embedded_image.image.height)
+        yield hashlib.sha256(largest.data).hexdigest(), largest.image
+
+
+def _default_engine(image):
+    import pytesseract
+
+    return pytesseract.image_to_string(image, lang=OCR_LANGUAGE)
+
+
+def ocr_pages(pages, stats=None, engine=None, max_workers=None, cache=None):
+    """OCR ``(digest, image)`` pages in parallel and return their text in page order.
+
+    ``pages`` is consumed lazily with a bounded number of pages in flight, so
+    a long scan is never fully rasterised in memory. Stage timings, page and
+    cache-hit counts are added to ``stats``.
+    """
+    engine = engine or _default_engine
+    cache = cache if cache is not None else _settings["cache"]
+    max_workers = max(1, max_workers or _settings["max_workers"] or min(4, os.cpu_count() or 1))
+    if max_workers > 1:
+        # Tesseract's own OpenMP threads fight with page-level parallelism.
+        os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    stats = stats if stats is not None else {}
+    merge_stage_stats(stats, empty_stage_stats())
+    stats_lock = threading.Lock()
+
+    def record(**values):
+        with stats_lock:
+            merge_stage_stats(stats, values)
+
+    def read_page(digest, image):
+        key = f"{OCR_CACHE_VERSION}:{OCR_MAX_SIDE}:{OCR_LANGUAGE}:{digest}"
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                record(pages=1, cache_hits=1)
+                return cached
+        started = time.perf_counter()
+        prepared = preprocess_image(image)
+        prepared_at = time.perf_counter()
+        text = engine(prepared) or ""
+        record(pages=1, preprocess_seconds=prepared_at - started, ocr_seconds=time.perf_counter() - prepared_at)
+        if cache is not None:
+            cache.put(key, text)
+        return text
+
+    texts = []
+    in_flight = deque()
+    page_iter = iter(pages)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="invoice-ocr") as executor:
+        while True:
+            started = time.perf_counter()
+            page = next(page_iter, None)
+            record(rasterize_seconds=time.perf_counter() - started)
+            if page is not None:
+                in_flight.append(executor.submit(read_page, *page))
+            if in_flight and (page is None or len(in_flight) >= max_workers * 2):
+                texts.append(in_flight.popleft().result())
+            elif page is None:
+                break
+    return "\n".join(texts)
+
+
+def image_frames(data):
+    """Yield ``(content_digest, image)`` per frame; multi-page TIFF scans carry one page per frame."""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    frame_count = getattr(image, "n_frames", 1)
+    file_digest = hashlib.sha256(data).hexdigest()
+    for frame_index in range(frame_count):
+        image.seek(frame_index)
+        digest = file_digest if frame_count == 1 else f"{file_digest}#{frame_index}"
+        yield digest, image.copy()
+
+
+def ocr_image_bytes(data, stats=None, engine=None):
+    return ocr_pages(image_frames(data), stats=stats, engine=engine)
+
+
+def ocr_pdf_bytes(data, stats=None, engine=None):
+    return ocr_pages(pdf_page_images(data), stats=stats, engine=engine)
@@ -0,0 +1,442 @@
+"""Queued, retrying delivery of ntfy alerts off the request thread."""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+
+SPOOL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ntfy_spool (
+    id TEXT PRIMARY KEY,
+    dedup_key TEXT,
+    title TEXT,
+    priority TEXT,
+    message TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+)
+"""
+
+
+class NotificationDeliveryError(Exception):
+    pass
+
+
+def post_to_ntfy(url, message, title=None, priority=None, timeout=5):
+    headers = {}
+    if title:
+        headers["Title"] = title
+    if priority:
+        headers["Priority"] = priority
+    try:
+        response = requests.post(
+            url,
+            data=message.encode("utf-8"),
+            headers=headers,
+            timeout=timeout,
+        )
+        response.raise_for_status()
+    except requests.RequestException as error:
+        raise NotificationDeliveryError(str(error)) from error
+
+
+class NotificationDispatcher:
+    """Deliver notifications from a bounded in-process queue on a worker thread.
+
+    Messages sharing a ``dedup_key`` coalesce while they are still pending, so
+    only the newest text is sent. Failed sends retry with exponential backoff
+    up to ``max_attempts``. When ``spool_path`` is set, pending messages are
+    written to SQLite and picked up again after a restart; rows are leased to
+    one process at a time so several gunicorn workers never double-send.
+    """
+
+    def __init__(
+        self,
+        url,
+        spool_path=None,
+        max_queue=200,
+        max_attempts=6,
+        backoff_seconds=2.0,
+        max_backoff_seconds=300.0,
+        timeout=5,
+        lease_seconds=60.0,
+        sender=None,
+    ):
+        self.url = url
+        self.spool_path = spool_path
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.timeout = timeout
+        self.lease_seconds = lease_seconds
+        self.sender = sender or post_to_ntfy
+        self.owner = uuid.uuid4().hex
+
+        self._pending = {}
+        self._dedup_index = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._thread_pid = None
+        self._stopping = False
+        self._spool = None
+        self._last_lease_refresh = 0.0
+        self._counters = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "sent": 0,
+            "retried": 0,
+            "failed": 0,
+            "dropped": 0,
+            "recovered": 0,
+        }
+
+    # -- public API -----------------------------------------------------
+
+    def enqueue(self, message, title=None, priority=None, dedup_key=None):
+        """Queue a notification; returns False when the queue is full."""
+        self.ensure_started()
+        now = time.time()
+        with self._condition:
+            existing_id = self._dedup_index.get(dedup_key) if dedup_key else None
+            if existing_id in self._pending:
+                entry = self._pending[existing_id]
+                entry.update(message=message, title=title, priority=priority)
+                self._spool_write(entry)
+                self._counters["coalesced"] += 1
+                self._condition.notify()
+                return True
+
+            if len(self._pending) >= self.max_queue:
+                self._counters["dropped"] += 1
+                return False
+
+            entry = {
+                "id": uuid.uuid4().hex,
+                "dedup_key": dedup_key,
+                "title": title,
+                "priority": priority,
+                "message": message,
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now,
+            }
+            self._pending[entry["id"]] = entry
+            if dedup_key:
+                self._dedup_index[dedup_key] = entry["id"]
+            self._spool_write(entry)
+            self._counters["enqueued"] += 1
+            self._condition.notify()
+        return True
+
+    def stats(self):
+        with self._condition:
+            counters = dict(self._counters)
+            counters["pending"] = len(self._pending)
+            counters["running"] = bool(self._thread and self._thread.is_alive())
+        return counters
+
+    def ensure_started(self):
+        # Threads do not survive a fork, so a preloaded app restarts the
+        # worker in each gunicorn process on first use.
+        if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+            return
+        with self._condition:
+            if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            if self._thread_pid not in (None, os.getpid()):
+                self._pending.clear()
+                self._dedup_index.clear()
+                self._spool = None
+                self.owner = uuid.uuid4().hex
+            self._stopping = False
+            self._open_spool()
+            self._recover_spool()
+            self._thread = threading.Thread(
+                target=self._run,
+                name="ntfy-dispatcher",
+                daemon=True,
+            )
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def flush(self, timeout=10.0):
+        """Wait until the queue drains; returns False if it is still pending."""
+        deadline = time.time() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(min(remaining, 0.05))
+        return True
+
+    # -- worker ---------------------------------------------------------
+
+    def _run(self):
+        while True:
+            with self._condition:
+                entry = None
+                while entry is None:
+                    if self._stopping:
+                        return
+                    now = time.time()
+                    self._refresh_leases(now)
+                    due = [
+                        candidate for candidate in self._pending.values()
+                        if candidate["next_attempt_at"] <= now
+                    ]
+                    if due:
+                        entry = min(due, key=lambda candidate: candidate["next_attempt_at"])
+                        snapshot = dict(entry)
+                        break
+                    wake_at = min(
+                        (candidate["next_attempt_at"] for candidate in self._pending.values()),
+                        default=now + self.lease_seconds / 3,
+                    )
+                    self._condition.wait(max(0.01, min(wake_at - now, self.lease_seconds / 3)))
+
+            try:
+                self.sender(
+                    self.url,
+                    snapshot["message"],
+                    title=snapshot["title"],
+                    priority=snapshot["priority"],
+                    timeout=self.timeout,
+                )
+                error = None
+            except Exception as exc:
+                error = exc
+
+            with self._condition:
+                current = self._pending.get(snapshot["id"])
+                if error is None:
+                    self._counters["sent"] += 1
+                    # A coalesced update that arrived mid-send still needs sending.
+                    if current is not None and current["message"] == snapshot["message"] \
+                            and current["title"] == snapshot["title"]:
+                        self._forget(current)
+                    continue
+
+                if current is None:
+                    continue
+                current["attempts"] += 1
+                if current["attempts"] >= self.max_attempts:
+                    self._counters["failed"] += 1
+                    print(f"Ntfy notification failed after {current['attempts']} attempts: {error}")
+                    self._forget(current)
+                    continue
+                delay = min(
+                    self.backoff_seconds * (2 ** (current["attempts"] - 1)),
+                    self.max_backoff_seconds,
+                )
+                current["next_attempt_at"] = time.time() + delay
+                self._counters["retried"] += 1
+                self._spool_write(current)
+                self._condition.notify_all()
+
+    def _forget(self, entry):
+        self._pending.pop(entry["id"], None)
+        if entry.get("dedup_key") and self._dedup_index.get(entry["dedup_key"]) == entry["id"]:
+            self._dedup_index.pop(entry["dedup_key"], None)
+        if self._spool is not None:
+            try:
+                self._spool.execute("DELETE FROM ntfy_spool WHERE id = ?", (entry["id"],))
+                self._spool.commit()
+            except sqlite3.Error as error:
+                print(f"Ntfy spool delete failed: {error}")
+        self._condition.notify_all()
+
+    # -- spool ----------------------------------------------------------
+
+    def _open_spool(self):
+        if not self.spool_path or self._spool is not None:
+            return
+        try:
+            self._spool = sqlite3.connect(self.spool_path, timeout=5, check_same_thread=False)
+            self._spool.execute(SPOOL_SCHEMA)
+            self._spool.commit()
+        except sqlite3.Error as error:
+            print(f"Ntfy spool unavailable, alerts will not survive restarts: {error}")
+            self._spool = None
+
+    def _spool_write(self, entry):
+        if self._spool is None:
+            return
+        try:
+            self._spool.execute(
+                "INSERT OR REPLACE INTO ntfy_spool "
+                "(id, dedup_key, title, priority, message, attempts, next_attempt_at, "
+                "owner, lease_until, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    entry["id"],
+                    entry["dedup_key"],
+                    entry["title"],
+                    entry["priority"],
+                    entry["message"],
+                    entry["attempts"],
+                    entry["next_attempt_at"],
+                    self.owner,
+                    time.time() + self.lease_seconds,
+                    entry["created_at"],
+                ),
+            )
+            self._spool.commit()
+        except sqlite3.Error as error:
+            print(f"Ntfy spool write failed: {error}")
+
+    def _recover_spool(self):
+        """Claim spooled rows whose lease has expired (e.g. left by a dead process)."""
+        if self._spool is None:
+            return
+        now = time.time()
+        try:
+            self._spool.execute(
+                "UPDATE ntfy_spool SET owner = ?, lease_until = ? WHERE lease_until < ?",
+                (self.owner, now + self.lease_seconds, now),
+            )
+            self._spool.commit()
+            rows = self._spool.execute(
+                "SELECT id, dedup_key, title, priority, message, attempts, next_attempt_at, created_at "
+                "FROM ntfy_spool WHERE owner = ? ORDER BY created_at",
+                (self.owner,),
+            ).fetchall()
+        except sqlite3.Error as error:
+            print(f"Ntfy spool recovery failed: {error}")
+            return
+
+        duplicate_ids = []
+        for row in rows:
+            entry_id, dedup_key, title, priority, message, attempts, next_attempt_at, created_at = row
+            if entry_id in self._pending:
+                continue
+            existing_id = self._dedup_index.get(dedup_key) if dedup_key else None
+            if existing_id in self._pending:
+                # Coalesce as enqueue() would: one entry per key, carrying the newer text.
+                existing = self._pending[existing_id]
+                if created_at > existing["created_at"]:
+                    existing.update(message=message, title=title, priority=priority)
+                    self._spool_write(existing)
+                duplicate_ids.append(entry_id)
+                self._counters["coalesced"] += 1
+                continue
+            self._pending[entry_id] = {
+                "id": entry_id,
+                "dedup_key": dedup_key,
+                "title": title,
+                "priority": priority,
+                "message": message,
+                "attempts": attempts,
+                # The previous owner is gone, so retry now instead of
+                # waiting out its backoff.
+                "next_attempt_at": min(next_attempt_at, now),
+                "created_at": created_at,
+            }
+            if dedup_key:
+                self._dedup_index[dedup_key] = entry_id
+            self._counters["recovered"] += 1
+
+        if duplicate_ids:
+            try:
+                self._spool.executemany("DELETE FROM ntfy_spool WHERE id = ?", [(entry_id,) for entry_id in duplicate_ids])
+                self._spool.commit()
+            except sqlite3.Error as error:
+                print(f"Ntfy spool delete failed: {error}")
+
+    def _refresh_leases(self, now):
+        if self._spool is None or now - self._last_lease_refresh < self.lease_seconds / 3:
+            return
+        self._last_lease_refresh = now
+        try:
+            self._spool.execute(
+                "UPDATE ntfy_spool SET lease_until = ? WHERE owner = ?",
+                (now + self.lease_seconds, self.owner),
+            )
+            self._spool.commit()
+        except sqlite3.Error as error:
+            print(f"Ntfy spool lease refresh failed: {error}")
+        self._recover_spool()
+
+
+class StubNtfyServer:
+    """Local stand-in for ntfy.sh that records posts; used by tests and dev runs."""
+
+    def __init__(self, host="127.0.0.1", port=0, fail_first=0, delay_seconds=0.0):
+        self.messages = []
+        self.fail_remaining = fail_first
+        self.delay_seconds = delay_seconds
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode("utf-8")
+                if stub.delay_seconds:
+                    time.sleep(stub.delay_seconds)
+                with stub._lock:
+                    if stub.fail_remaining > 0:
+                        stub.fail_remaining -= 1
+                        status = 503
+                    else:
+                        stub.messages.append({
+                            "path": self.path,
+                            "title": self.headers.get("Title"),
+                            "priority": self.headers.get("Priority"),
+                            "message": body,
+                        })
+                        status = 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                return
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/PoolTableTrackerV2"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    stub_server = StubNtfyServer(port=int(os.environ.get("NTFY_STUB_PORT", "8089"))).start()
+    print(f"Stub ntfy endpoint listening on {stub_server.url}")
+    try:
+        while True:
+            time.sleep(1)
+            for recorded in stub_server.messages[:]:
+                print(f"[{recorded['title']}] {recorded['message']}")
+                stub_server.messages.remove(recorded)
+    except KeyboardInterrupt:
+        stub_server.stop()
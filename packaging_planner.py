@@ -2,14 +2,21 @@
 
 from __future__ import annotations
 
+import codecs
 import copy
 import csv
+import functools
 import io
+import itertools
 import math
 import os
 import re
+import threading
+import time
 import uuid
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+
+from invoice_ocr import ocr_image_bytes, ocr_pdf_bytes
 
 
 ITEM_TYPES = (
@@ -39,6 +46,11 @@ SUPPORTED_EXTENSIONS = {
     ".csv", ".xlsx", ".xlsm", ".docx", ".txt",
 }
 
+SIZE_PATTERNS = (
+    ("6ft", re.compile(r"\b6\s*(?:ft|foot|feet|')\b", re.I)),
+    ("7ft", re.compile(r"\b7\s*(?:ft|foot|feet|')\b", re.I)),
+)
+
 MODEL_PATTERNS = (
     ("Premium Edition", re.compile(r"\bpremium(?:\s+edition)?\b", re.I)),
     ("Champion", re.compile(r"\bchampion\b", re.I)),
@@ -73,62 +85,136 @@ FIELD_ALIASES = {
 }
 
 
+# Header cell text -> field, so each cell is one dictionary lookup.
+FIELD_BY_ALIAS = {
+    alias: field_name
+    for field_name, aliases in FIELD_ALIASES.items()
+    for alias in aliases
+}
+
+# Size, model and colour keywords in one alternation, so a line is scanned
+# once. Each group maps back to its field and its position in the pattern
+# list, and the earliest-listed match wins as it did when the lists were
+# searched one pattern at a time. Every keyword pattern starts at a word
+# boundary; checking it once outside the alternation lets the scan skip
+# mid-word positions without trying each keyword there.
+KEYWORD_GROUPS = [
+    (field_name, rank, label, pattern.pattern.removeprefix(r"\b"))
+    for field_name, patterns in (("size", SIZE_PATTERNS), ("model", MODEL_PATTERNS), ("colour", COLOUR_PATTERNS))
+    for rank, (label, pattern) in enumerate(patterns)
+]
+KEYWORD_PATTERN = re.compile(
+    r"\b(?:" + "|".join(f"({pattern})" for _, _, _, pattern in KEYWORD_GROUPS) + ")", re.I
+)
+# Distinct description/keyword strings and invoice lines whose parses are
+# remembered. Large invoices repeat the same products on many lines.
+INFERENCE_CACHE_SIZE = 4096
+# Normalised items remembered between saves. Sized above the largest plans, as
+# a save walks every item in order and an LRU smaller than the plan never hits.
+ITEM_CACHE_SIZE = 16384
+
+HEADER_SEPARATORS = re.compile(r"[^a-z0-9]+")
+INTEGER = re.compile(r"-?\d+")
+COMPACT_PO = re.compile(r"\b(PO[A-Z0-9][A-Z0-9./_-]{2,})\b", re.I)
+LABELLED_PO_PATTERNS = (
+    re.compile(
+        r"\b(?:purchase\s+order|customer\s+po|po(?:\s+number|\s+no\.?)?)\s*[:#-]?\s*([A-Z0-9][A-Z0-9./_-]{2,})",
+        re.I,
+    ),
+    re.compile(r"\border\s+(?:number|no\.?)\s*[:#-]?\s*([A-Z0-9][A-Z0-9./_-]{2,})", re.I),
+)
+DOCUMENT_PO_LINE = re.compile(r"^(?:purchase\s+order|customer\s+po|po\s+(?:number|no\.?))\s*[:#-]", re.I)
+LEADING_QUANTITY = re.compile(r"^\s*(\d+)\s*(?:x|X|\*)\s+")
+QTY_LABEL = re.compile(r"\bqty\.?\s*[:x-]?\s*(\d+)\b", re.I)
+UNITS_QUANTITY = re.compile(r"^\s*(\d+)\s+units?\s*(?:x|X|\*)\s+", re.I)
+PUNCTUATION_ONLY = re.compile(r"^[^\w]*$")
+TRAILING_PRICE = re.compile(r"\s+(?:\u00a3|\u0141|\$|\u20ac)\s*[\d,]+(?:\.\d{2})?\s*$")
+
+PRODUCT_TERMS = re.compile(
+    r"\b(?:6\s*ft|7\s*ft|champion|league|premium|pool\s+table|table\s+body|"
+    r"top\s*rail|cushion|leg\s*box|replacement)\b",
+    re.I,
+)
+IGNORED_LINE_TERMS = re.compile(
+    r"^(?:invoice|description|product|quantity|qty|subtotal|total|vat|delivery|"
+    r"purchase order|page \d+)\b",
+    re.I,
+)
+
+# Spreadsheet and CSV rows are read one at a time; these bound how much of a
+# large export is ever held. A plan cannot be saved with more than 2,000 rows.
+HEADER_SCAN_ROWS = 20
+TEXT_FALLBACK_MAX_ROWS = 5000
+MAX_ITEMS_PER_FILE = 2000
+CSV_CHUNK_BYTES = 64 * 1024
+CSV_SNIFF_CHARS = 4096
+
+PACKING_MODES = ("standard", "optimised")
+# Time the optimised layout search may take before the standard layout is used.
+OPTIMISER_TIME_BUDGET_SECONDS = 0.5
+
+
 def _new_id(prefix):
-    return f"{prefix}-{uuid.uuid4().hex[:12]}"
+    # 48 random bits, the same as the first 12 hex digits of a uuid4, without building a UUID.
+    return f"{prefix}-{os.urandom(6).hex()}"
 
 
 def _clean_text(value):
-    if value is None:
+    if value is None or value == "":
         return ""
-    return re.sub(r"\s+", " ", str(value)).strip()
+    # str.split() splits on the same characters as \s, without the regex overhead.
+    return " ".join(str(value).split())
 
 
 def _safe_quantity(value, default=1):
     if value is None or value == "":
         return default
-    match = re.search(r"-?\d+", str(value).replace(",", ""))
+    match = INTEGER.search(str(value).replace(",", ""))
     if not match:
         return default
     return max(1, min(9999, int(match.group(0))))
 
 
 def _normalise_header(value):
-    return re.sub(r"[^a-z0-9]+", " ", _clean_text(value).lower()).strip()
+    return HEADER_SEPARATORS.sub(" ", _clean_text(value).lower()).strip()
 
 
 def _field_for_header(header):
-    normalised = _normalise_header(header)
-    for field_name, aliases in FIELD_ALIASES.items():
-        if normalised in aliases:
-            return field_name
-    return None
+    return FIELD_BY_ALIAS.get(_normalise_header(header))
+
+
+@functools.lru_cache(maxsize=INFERENCE_CACHE_SIZE)
+def _keyword_labels(text):
+    """``{"size": ..., "model": ..., "colour": ...}`` found in ``text``; missing fields are ``""``."""
+    best = {}
+    for match in KEYWORD_PATTERN.finditer(text):
+        field_name, rank, label, _ = KEYWORD_GROUPS[match.lastindex - 1]
+        if field_name not in best or rank < best[field_name][0]:
+            best[field_name] = (rank, label)
+    return {
+        field_name: best[field_name][1] if field_name in best else ""
+        for field_name in ("size", "model", "colour")
+    }
 
 
 def infer_size(text):
-    text = _clean_text(text)
-    if re.search(r"\b6\s*(?:ft|foot|feet|')\b", text, re.I):
-        return "6ft"
-    if re.search(r"\b7\s*(?:ft|foot|feet|')\b", text, re.I):
-        return "7ft"
-    return ""
+    return _keyword_labels(_clean_text(text))["size"]
 
 
 def infer_model(text):
-    for label, pattern in MODEL_PATTERNS:
-        if pattern.search(text or ""):
-            return label
-    return ""
+    return _keyword_labels(_clean_text(text))["model"]
 
 
 def infer_colour(text):
-    for label, pattern in COLOUR_PATTERNS:
-        if pattern.search(text or ""):
-            return label
-    return ""
+    return _keyword_labels(_clean_text(text))["colour"]
 
 
 def infer_item_type(text):
-    lowered = _clean_text(text).lower()
+    return _infer_item_type(_clean_text(text).lower())
+
+
+@functools.lru_cache(maxsize=INFERENCE_CACHE_SIZE)
+def _infer_item_type(lowered):
     if ("top rail" in lowered or "toprail" in lowered) and (
         "replacement" in lowered or "only" in lowered
     ):
@@ -146,7 +232,7 @@ def infer_item_type(text):
     if (
         "complete table" in lowered
         or "pool table" in lowered
-        or any(pattern.search(lowered) for _, pattern in MODEL_PATTERNS)
+        or _keyword_labels(lowered)["model"]
     ):
         return "complete_table"
     return "other"
@@ -197,9 +283,10 @@ def build_item(values, source_file="", raw_text="", confidence=None):
             _clean_text(values.get("item_type")),
         ])
     )
-    size = infer_size(values.get("size") or combined)
-    model = _clean_text(values.get("model")) or infer_model(combined)
-    colour = _clean_text(values.get("colour")) or infer_colour(combined)
+    labels = _keyword_labels(combined)
+    size = infer_size(values["size"]) if values.get("size") else labels["size"]
+    model = _clean_text(values.get("model")) or labels["model"]
+    colour = _clean_text(values.get("colour")) or labels["colour"]
     item_type = normalise_item_type(values.get("item_type"), description)
     quantity = _safe_quantity(values.get("quantity"), 1)
     po_number = _clean_text(values.get("po_number"))
@@ -231,16 +318,12 @@ def build_item(values, source_file="", raw_text="", confidence=None):
 
 
 def _extract_po(text):
-    compact_match = re.search(r"\b(PO[A-Z0-9][A-Z0-9./_-]{2,})\b", text or "", re.I)
+    compact_match = COMPACT_PO.search(text or "")
     if compact_match:
         return compact_match.group(1).upper()
 
-    patterns = (
-        r"\b(?:purchase\s+order|customer\s+po|po(?:\s+number|\s+no\.?)?)\s*[:#-]?\s*([A-Z0-9][A-Z0-9./_-]{2,})",
-        r"\border\s+(?:number|no\.?)\s*[:#-]?\s*([A-Z0-9][A-Z0-9./_-]{2,})",
-    )
-    for pattern in patterns:
-        match = re.search(pattern, text or "", re.I)
+    for pattern in LABELLED_PO_PATTERNS:
+        match = pattern.search(text or "")
         if match:
             return match.group(1)
     return ""
@@ -249,92 +332,94 @@ def _extract_po(text):
 def _extract_document_po(text):
     for raw_line in (text or "").splitlines():
         line = _clean_text(raw_line)
-        if re.match(
-            r"^(?:purchase\s+order|customer\s+po|po\s+(?:number|no\.?))\s*[:#-]",
-            line,
-            re.I,
-        ):
+        if DOCUMENT_PO_LINE.match(line):
             return _extract_po(line)
     return ""
 
 
 def _line_quantity(line):
-    match = re.match(r"^\s*(\d+)\s*(?:x|X|\*)\s+", line)
+    match = LEADING_QUANTITY.match(line)
     if match:
         return int(match.group(1))
-    match = re.search(r"\bqty\.?\s*[:x-]?\s*(\d+)\b", line, re.I)
+    match = QTY_LABEL.search(line)
     return int(match.group(1)) if match else 1
 
 
 def _following_quantity(lines, product_index):
     for next_line in lines[product_index + 1:product_index + 4]:
-        match = re.match(
-            r"^\s*(\d+)\s+units?\s*(?:x|X|\*)\s+",
-            next_line,
-            re.I,
-        )
+        match = UNITS_QUANTITY.match(next_line)
         if match:
             return max(1, int(match.group(1)))
-        if next_line and not re.match(r"^[^\w]*$", next_line):
+        if next_line and not PUNCTUATION_ONLY.match(next_line):
             break
     return None
 
 
 def _clean_product_description(line):
-    return re.sub(
-        r"\s+(?:\u00a3|\u0141|\$|\u20ac)\s*[\d,]+(?:\.\d{2})?\s*$",
-        "",
-        line,
-    ).strip()
+    return TRAILING_PRICE.sub("", line).strip()
 
 
 def items_from_text(text, source_file):
     text = (text or "").replace("\x00", " ")
+    source_file = _clean_text(source_file)
     global_po = _extract_document_po(text)
     candidates = []
     seen = set()
-    product_terms = re.compile(
-        r"\b(?:6\s*ft|7\s*ft|champion|league|premium|pool\s+table|table\s+body|"
-        r"top\s*rail|cushion|leg\s*box|replacement)\b",
-        re.I,
-    )
-    ignored_terms = re.compile(
-        r"^(?:invoice|description|product|quantity|qty|subtotal|total|vat|delivery|"
-        r"purchase order|page \d+)\b",
-        re.I,
-    )
     lines = [_clean_text(raw_line) for raw_line in text.splitlines()]
     for line_index, line in enumerate(lines):
-        if len(line) < 4 or ignored_terms.search(line):
+        if len(line) < 4 or IGNORED_LINE_TERMS.search(line):
             continue
-        if not product_terms.search(line):
+        if not PRODUCT_TERMS.search(line):
             continue
         fingerprint = line.lower()
         if fingerprint in seen:
             continue
         seen.add(fingerprint)
-        following_quantity = _following_quantity(lines, line_index)
-        description = _clean_product_description(line)
-        candidates.append(build_item({
-            "description": description,
-            "quantity": (
-                following_quantity
-                if following_quantity is not None
-                else _line_quantity(line)
-            ),
-            "po_number": _extract_po(line) or global_po,
-        }, source_file=source_file, raw_text=line))
+        item = _text_line_item(line, _following_quantity(lines, line_index), global_po)
+        candidates.append(dict(item, id=_new_id("item"), source_file=source_file))
     return candidates
 
 
-def items_from_rows(rows, source_file):
-    rows = [list(row) for row in rows if any(_clean_text(cell) for cell in row)]
-    if not rows:
+@functools.lru_cache(maxsize=INFERENCE_CACHE_SIZE)
+def _text_line_item(line, following_quantity, global_po):
+    """The item parsed from one invoice text line; callers copy it and give it an id."""
+    return build_item({
+        "description": _clean_product_description(line),
+        "quantity": (
+            following_quantity
+            if following_quantity is not None
+            else _line_quantity(line)
+        ),
+        "po_number": _extract_po(line) or global_po,
+    }, raw_text=line)
+
+
+def clear_inference_cache():
+    for cached in (_keyword_labels, _infer_item_type, _text_line_item, _cached_item_fields, _clean_label):
+        cached.cache_clear()
+
+
+def _row_text(row):
+    return " | ".join(_clean_text(cell) for cell in row)
+
+
+def items_from_rows(rows, source_file, warnings=None, limit=MAX_ITEMS_PER_FILE):
+    """Build items from spreadsheet rows, consuming ``rows`` lazily.
+
+    The header is looked for in the first ``HEADER_SCAN_ROWS`` non-empty rows
+    and data rows are turned into items one at a time, so a large export is
+    never held in memory. Reading stops early when the sheet has no product
+    description column, when a headerless sheet shows no products up front,
+    or once ``limit`` items have been built.
+    """
+    rows = (list(row) for row in rows if any(_clean_text(cell) for cell in row))
+    window = list(itertools.islice(rows, HEADER_SCAN_ROWS))
+    if not window:
         return []
 
     header_index = None
     field_map = {}
-    for index, row in enumerate(rows[:20]):
+    for index, row in enumerate(window):
         candidate_map = {
             column_index: _field_for_header(cell)
             for column_index, cell in enumerate(row)
@@ -346,14 +431,28 @@ def items_from_rows(rows, source_file):
             break
 
     if header_index is None:
-        return items_from_text(
-            "\n".join(" | ".join(_clean_text(cell) for cell in row) for row in rows),
-            source_file,
-        )
+        if not any(PRODUCT_TERMS.search(_row_text(row)) for row in window):
+            return []
+        text_rows = list(itertools.islice(
+            itertools.chain(window, rows), TEXT_FALLBACK_MAX_ROWS + 1
+        ))
+        if len(text_rows) > TEXT_FALLBACK_MAX_ROWS:
+            text_rows.pop()
+            if warnings is not None:
+                warnings.append(
+                    f"{source_file}: only the first {TEXT_FALLBACK_MAX_ROWS:,} rows were read "
+                    "because no column headings were found."
+                )
+        items = items_from_text("\n".join(_row_text(row) for row in text_rows), source_file)
+        return items if limit is None else items[:limit]
+
+    # Without a description column every row would be skipped below.
+    if "description" not in field_map.values():
+        return []
 
     items = []
     global_po = ""
-    for row in rows[header_index + 1:]:
+    for row in itertools.chain(window[header_index + 1:], rows):
         values = {}
         for column_index, field_name in field_map.items():
             if column_index < len(row):
@@ -365,12 +464,77 @@ def items_from_rows(rows, source_file):
         description = values.get("description", "")
         if not description or _normalise_header(description) in FIELD_ALIASES["description"]:
             continue
-        items.append(build_item(values, source_file=source_file, raw_text=" | ".join(
-            _clean_text(cell) for cell in row
-        ), confidence=0.9))
+        if limit is not None and len(items) >= limit:
+            if warnings is not None:
+                warnings.append(
+                    f"{source_file}: only the first {limit:,} item rows were read. "
+                    "Split the file to plan the rest."
+                )
+            break
+        items.append(build_item(values, source_file=source_file, raw_text=_row_text(row), confidence=0.9))
     return items
 
 
+def _iter_decoded_text(stream, chunk_size=CSV_CHUNK_BYTES):
+    """Decode a binary stream chunk by chunk, falling back to cp1252 then latin-1.
+
+    Only the bytes from the first undecodable one onwards switch encoding;
+    text already decoded is kept.
+    """
+    encodings = iter(("utf-8", "cp1252", "latin-1"))
+    encoding = next(encodings)
+    decoder = codecs.getincrementaldecoder(encoding)()
+    chunk = stream.read(chunk_size)
+    if chunk.startswith(codecs.BOM_UTF8):
+        chunk = chunk[len(codecs.BOM_UTF8):]
+    while True:
+        final = not chunk
+        while True:
+            try:
+                text = decoder.decode(chunk, final)
+                break
+            except UnicodeDecodeError as error:
+                pending = decoder.getstate()[0] + chunk
+                yield pending[:error.start].decode(encoding)
+                chunk = pending[error.start:]
+                encoding = next(encodings)
+                decoder = codecs.getincrementaldecoder(encoding)()
+        if text:
+            yield text
+        if final:
+            return
+        chunk = stream.read(chunk_size)
+
+
+def _iter_lines(chunks):
+    remainder = ""
+    for chunk in chunks:
+        lines = (remainder + chunk).split("\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if remainder:
+        yield remainder
+
+
+def iter_csv_rows(stream):
+    """Yield CSV rows from a binary stream without decoding the whole file."""
+    chunks = _iter_decoded_text(stream)
+    leading = []
+    leading_size = 0
+    for chunk in chunks:
+        leading.append(chunk)
+        leading_size += len(chunk)
+        if leading_size >= CSV_SNIFF_CHARS:
+            break
+    leading_text = "".join(leading)
+    try:
+        dialect = csv.Sniffer().sniff(leading_text[:CSV_SNIFF_CHARS], delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    return csv.reader(_iter_lines(itertools.chain([leading_text], chunks)), dialect)
+
+
 def _decode_text(data):
     for encoding in ("utf-8-sig", "utf-8", "cp1252", "latin-1"):
         try:
@@ -380,21 +544,55 @@ def _decode_text(data):
     return data.decode("utf-8", errors="replace")
 
 
-def extract_invoice_bytes(filename, data):
+def _record_extraction_error(stats):
+    """Count a read that raised, so the result is not cached as the file's content."""
+    if stats is not None:
+        stats["errors"] = stats.get("errors", 0) + 1
+
+
+def _ocr_scanned_pdf(filename, stream, warnings, stats):
+    try:
+        import pytesseract  # noqa: F401
+        from PIL import Image  # noqa: F401
+    except ImportError:
+        text = ""
+    else:
+        try:
+            stream.seek(0)
+            text = ocr_pdf_bytes(stream.read(), stats=stats)
+        except Exception:
+            _record_extraction_error(stats)
+            text = ""
+    if text.strip():
+        warnings.append(
+            f"{filename}: no selectable PDF text was found, so the pages were read with OCR. "
+            "Check the detected items carefully."
+        )
+    else:
+        warnings.append(
+            f"{filename}: no selectable PDF text was found. "
+            "It may be a scanned invoice; review it manually."
+        )
+    return text
+
+
+def extract_invoice_bytes(filename, data, stats=None):
+    return extract_invoice_stream(filename, io.BytesIO(data), stats=stats)
+
+
+def extract_invoice_stream(filename, stream, stats=None):
+    """Extract items from a binary file object; CSV and Excel files are read row by row.
+
+    OCR stage timings for scanned PDFs and images are added to ``stats``, and
+    ``stats["errors"]`` counts reads that raised and were reported as warnings.
+    """
     extension = os.path.splitext(filename or "")[1].lower()
     warnings = []
     items = []
 
     try:
         if extension == ".csv":
-            text = _decode_text(data)
-            sample = text[:4096]
-            try:
-                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
-            except csv.Error:
-                dialect = csv.excel
-            rows = list(csv.reader(io.StringIO(text), dialect))
-            items = items_from_rows(rows, filename)
+            items = items_from_rows(iter_csv_rows(stream), filename, warnings)
         elif extension in (".xlsx", ".xlsm"):
             try:
                 import openpyxl
@@ -403,11 +601,17 @@ def extract_invoice_bytes(filename, data):
                     f"{filename}: Excel support is not installed. Add the item manually."
                 )
             else:
-                workbook = openpyxl.load_workbook(
-                    io.BytesIO(data), read_only=True, data_only=True
-                )
-                for sheet in workbook.worksheets:
-                    items.extend(items_from_rows(sheet.iter_rows(values_only=True), filename))
+                workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+                try:
+                    for sheet in workbook.worksheets:
+                        remaining = MAX_ITEMS_PER_FILE - len(items)
+                        if remaining <= 0:
+                            break
+                        items.extend(items_from_rows(
+                            sheet.iter_rows(values_only=True), filename, warnings, limit=remaining
+                        ))
+                finally:
+                    workbook.close()
         elif extension == ".pdf":
             try:
                 from pypdf import PdfReader
@@ -416,14 +620,11 @@ def extract_invoice_bytes(filename, data):
                     f"{filename}: PDF support is not installed. Add the item manually."
                 )
             else:
-                reader = PdfReader(io.BytesIO(data))
+                reader = PdfReader(stream)
                 text = "\n".join(page.extract_text() or "" for page in reader.pages)
-                items = items_from_text(text, filename)
                 if not text.strip():
-                    warnings.append(
-                        f"{filename}: no selectable PDF text was found. "
-                        "It may be a scanned invoice; review it manually."
-                    )
+                    text = _ocr_scanned_pdf(filename, stream, warnings, stats)
+                items = items_from_text(text, filename)
         elif extension == ".docx":
             try:
                 from docx import Document
@@ -432,7 +633,7 @@ def extract_invoice_bytes(filename, data):
                     f"{filename}: Word support is not installed. Add the item manually."
                 )
             else:
-                document = Document(io.BytesIO(data))
+                document = Document(stream)
                 text_parts = [paragraph.text for paragraph in document.paragraphs]
                 for table in document.tables:
                     rows = [[cell.text for cell in row.cells] for row in table.rows]
@@ -440,26 +641,28 @@ def extract_invoice_bytes(filename, data):
                 items.extend(items_from_text("\n".join(text_parts), filename))
         elif extension in (".png", ".jpg", ".jpeg", ".webp", ".tif", ".tiff"):
             try:
-                import pytesseract
-                from PIL import Image
+                import pytesseract  # noqa: F401
+                from PIL import Image  # noqa: F401
             except ImportError:
                 warnings.append(
                     f"{filename}: image OCR is not installed. Add the item manually."
                 )
             else:
                 try:
-                    text = pytesseract.image_to_string(Image.open(io.BytesIO(data)))
+                    text = ocr_image_bytes(stream.read(), stats=stats)
                     items = items_from_text(text, filename)
                 except Exception:
+                    _record_extraction_error(stats)
                     warnings.append(
                         f"{filename}: image OCR was unavailable or could not read the file. "
                         "Review it manually."
                     )
         elif extension == ".txt":
-            items = items_from_text(_decode_text(data), filename)
+            items = items_from_text(_decode_text(stream.read()), filename)
         else:
             warnings.append(f"{filename}: unsupported file type.")
     except Exception as error:
+        _record_extraction_error(stats)
         warnings.append(f"{filename}: extraction failed ({type(error).__name__}).")
 
     if not items:
@@ -470,29 +673,32 @@ def extract_invoice_bytes(filename, data):
     return items, warnings
 
 
-def extract_invoice_files(files):
-    all_items = []
-    warnings = []
-    source_files = []
-    for uploaded_file in files:
-        filename = os.path.basename(uploaded_file.filename or "invoice")
-        source_files.append(filename)
-        data = uploaded_file.read()
-        items, file_warnings = extract_invoice_bytes(filename, data)
-        all_items.extend(items)
-        warnings.extend(file_warnings)
-    return all_items, warnings, source_files
+def _normalise_item_fields(item):
+    clean = build_item(item, source_file=item.get("source_file", ""))
+    del clean["id"]
+    clean["confidence"] = max(0.0, min(1.0, float(item.get("confidence", clean["confidence"]))))
+    clean["raw_text"] = _clean_text(item.get("raw_text"))[:2000]
+    return clean
+
+
+@functools.lru_cache(maxsize=ITEM_CACHE_SIZE)
+def _cached_item_fields(fields):
+    """Normalised fields for an item given as ``(key, value)`` pairs; callers copy them."""
+    return _normalise_item_fields(dict(fields))
 
 
 def normalise_items(items):
     clean_items = []
     for item in items or []:
         item = dict(item or {})
-        clean = build_item(item, source_file=item.get("source_file", ""))
-        clean["id"] = _clean_text(item.get("id")) or clean["id"]
-        clean["confidence"] = max(0.0, min(1.0, float(item.get("confidence", clean["confidence"]))))
-        clean["raw_text"] = _clean_text(item.get("raw_text"))[:2000]
-        clean_items.append(clean)
+        # Every save re-normalises the whole plan, and most items are unchanged since the last one.
+        try:
+            fields = _cached_item_fields(tuple(
+                (key, value) for key, value in item.items() if key != "id"
+            ))
+        except TypeError:
+            fields = _normalise_item_fields(item)
+        clean_items.append({"id": _clean_text(item.get("id")) or _new_id("item"), **fields})
     return clean_items
 
 
@@ -506,6 +712,9 @@ def normalise_config(config):
         "cushion_pallet_count": max(1, min(50, _safe_quantity(config.get("cushion_pallet_count"), 1))),
         "legs_per_6ft_table": max(0, min(100, int(config.get("legs_per_6ft_table", 4) or 0))),
         "legs_per_box": max(1, min(100, _safe_quantity(config.get("legs_per_box"), 8))),
+        "packing_mode": (
+            config.get("packing_mode") if config.get("packing_mode") in PACKING_MODES else "standard"
+        ),
     }
 
 
@@ -725,136 +934,521 @@ def _compatible_body_pallet(
     return candidates[0] if candidates else None
 
 
-def generate_packaging(items, config=None):
-    items = normalise_items(items)
-    config = normalise_config(config)
-    requirements = build_requirements(items, config)
-    pallets = []
-    next_number = 1
+LINE_SIGNATURE_FIELDS = (
+    "item_id", "component_type", "size", "model", "colour", "quantity", "po_number",
+    "description", "notes", "source_file", "origin_type",
+)
+# Planned segments (body pallets, top rails per size, cushions) keyed by
+# everything they depend on. A re-plan after an item edit reuses every
+# segment the edit did not touch; line and pallet ids are the only
+# difference from planning from scratch.
+SEGMENT_CACHE_SIZE = 256
+_segment_cache = OrderedDict()
+_segment_cache_lock = threading.Lock()
+
+
+def _lines_signature(lines):
+    return tuple(tuple(map(line.get, LINE_SIGNATURE_FIELDS)) for line in lines)
+
+
+def _cached_segment(key, build, cacheable=None):
+    """Return the cached segment for ``key`` or build it, storing it unless ``cacheable`` rejects it."""
+    with _segment_cache_lock:
+        segment = _segment_cache.get(key)
+        if segment is not None:
+            _segment_cache.move_to_end(key)
+            return segment
+    segment = build()
+    if cacheable is not None and not cacheable(segment):
+        return segment
+    with _segment_cache_lock:
+        _segment_cache[key] = segment
+        while len(_segment_cache) > SEGMENT_CACHE_SIZE:
+            _segment_cache.popitem(last=False)
+    return segment
+
+
+def clear_planning_cache():
+    with _segment_cache_lock:
+        _segment_cache.clear()
+
+
+def _copy_pallet(pallet):
+    return {
+        **pallet,
+        "lines": [dict(line) for line in pallet["lines"]],
+        "carried_top_rails": [dict(line) for line in pallet["carried_top_rails"]],
+    }
+
 
-    body_lines = [dict(line) for line in requirements["bodies"]]
+def _plan_body_segment(lines, config):
+    body_lines = [dict(line) for line in lines]
     body_lines.sort(key=lambda line: (
         0 if line.get("size") == "7ft" else 1,
         line.get("colour") or "Unknown",
     ))
-    while _line_total(body_lines):
+    pallets = []
+    remaining = _line_total(body_lines)
+    while remaining:
         lines = _take_from_lines(body_lines, config["body_capacity"])
-        pallet = _new_pallet("body", next_number, lines)
+        remaining -= _line_total(lines)
+        pallet = _new_pallet("body", len(pallets) + 1, lines)
         _refresh_pallet_labels(pallet, config)
         pallets.append(pallet)
-        next_number += 1
-    body_pallets = list(pallets)
+    return pallets
 
-    for size in ("7ft", "6ft", "Unknown"):
-        rail_lines = [
-            dict(line) for line in requirements["top_rails"]
-            if (line.get("size") or "Unknown") == size
-        ]
-        rail_lines.sort(key=lambda line: line.get("colour") or "Unknown")
 
-        while _line_total(rail_lines) >= config["top_rail_capacity"]:
-            full_pallet_lines = _take_from_lines(
-                rail_lines,
-                config["top_rail_capacity"],
-            )
-            pallet = _new_pallet(
-                "top_rail",
-                next_number,
-                full_pallet_lines,
-                size=size,
-            )
-            _refresh_pallet_labels(pallet, config)
-            pallets.append(pallet)
-            next_number += 1
+def _plan_rail_segment(lines, size, body_pallets, config):
+    """Top-rail pallets for one size, or the body pallets that carry the remainder.
 
-        remainder = _line_total(rail_lines)
-        if not remainder:
-            continue
+    Returns ``(rail_pallets, carried)`` where ``carried`` lists
+    ``(body_pallet_index, lines)`` to add to the body pallets as they stand.
+    """
+    rail_lines = [dict(line) for line in lines]
+    rail_lines.sort(key=lambda line: line.get("colour") or "Unknown")
+    rail_pallets = []
 
-        remainder_groups = defaultdict(list)
-        for line in rail_lines:
-            remainder_groups[line.get("colour") or "Unknown"].append(dict(line))
-        rail_batches = [
-            remainder_groups[colour]
-            for colour in sorted(remainder_groups)
-        ]
+    remainder = _line_total(rail_lines)
+    while remainder >= config["top_rail_capacity"]:
+        full_pallet_lines = _take_from_lines(rail_lines, config["top_rail_capacity"])
+        remainder -= config["top_rail_capacity"]
+        pallet = _new_pallet("top_rail", None, full_pallet_lines, size=size)
+        _refresh_pallet_labels(pallet, config)
+        rail_pallets.append(pallet)
 
-        planning_body_pallets = [
-            {
-                **pallet,
-                "carried_top_rails": [
-                    dict(line) for line in pallet.get("carried_top_rails", [])
-                ],
-            }
-            for pallet in body_pallets
-        ]
-        planned_body_assignments = []
-        all_batches_fit_bodies = (
-            size != "Unknown"
-            and remainder < config["loose_rail_limit"]
+    if not remainder:
+        return rail_pallets, []
+
+    remainder_groups = defaultdict(list)
+    for line in rail_lines:
+        remainder_groups[line.get("colour") or "Unknown"].append(dict(line))
+    rail_batches = [
+        remainder_groups[colour]
+        for colour in sorted(remainder_groups)
+    ]
+
+    planning_body_pallets = [
+        {
+            **pallet,
+            "carried_top_rails": [
+                dict(line) for line in pallet.get("carried_top_rails", [])
+            ],
+        }
+        for pallet in body_pallets
+    ]
+    body_index_by_id = {pallet["id"]: index for index, pallet in enumerate(body_pallets)}
+    planned_body_assignments = []
+    all_batches_fit_bodies = (
+        size != "Unknown"
+        and remainder < config["loose_rail_limit"]
+    )
+    for batch in rail_batches if all_batches_fit_bodies else []:
+        batch_colour = next(
+            (line.get("colour") for line in batch if line.get("colour")),
+            "",
         )
-        for batch in rail_batches if all_batches_fit_bodies else []:
-            batch_colour = next(
-                (line.get("colour") for line in batch if line.get("colour")),
-                "",
+        remaining_batch = [dict(line) for line in batch]
+        while _line_total(remaining_batch):
+            suitable_body = _compatible_body_pallet(
+                planning_body_pallets,
+                size,
+                batch_colour,
+                config,
             )
-            remaining_batch = [dict(line) for line in batch]
-            while _line_total(remaining_batch):
-                suitable_body = _compatible_body_pallet(
-                    planning_body_pallets,
-                    size,
-                    batch_colour,
-                    config,
-                )
-                if not suitable_body:
-                    all_batches_fit_bodies = False
-                    break
-                rail_capacity = config["top_rails_per_body_pallet"]
-                available_space = rail_capacity - _line_total(
-                    suitable_body.get("carried_top_rails", [])
-                )
-                moved_lines = _take_from_lines(
-                    remaining_batch,
-                    min(available_space, _line_total(remaining_batch)),
-                )
-                suitable_body["carried_top_rails"].extend(moved_lines)
-                planned_body_assignments.append((suitable_body["id"], moved_lines))
-            if not all_batches_fit_bodies:
+            if not suitable_body:
+                all_batches_fit_bodies = False
                 break
+            rail_capacity = config["top_rails_per_body_pallet"]
+            available_space = rail_capacity - _line_total(
+                suitable_body.get("carried_top_rails", [])
+            )
+            moved_lines = _take_from_lines(
+                remaining_batch,
+                min(available_space, _line_total(remaining_batch)),
+            )
+            suitable_body["carried_top_rails"].extend(moved_lines)
+            planned_body_assignments.append((body_index_by_id[suitable_body["id"]], moved_lines))
+        if not all_batches_fit_bodies:
+            break
 
-        if all_batches_fit_bodies:
-            body_pallet_by_id = {pallet["id"]: pallet for pallet in body_pallets}
-            for pallet_id, batch in planned_body_assignments:
-                body_pallet_by_id[pallet_id]["carried_top_rails"].extend(batch)
-            continue
+    if all_batches_fit_bodies:
+        return rail_pallets, planned_body_assignments
 
-        pallet = _new_pallet("top_rail", next_number, rail_lines, size=size)
+    pallet = _new_pallet("top_rail", None, rail_lines, size=size)
+    _refresh_pallet_labels(pallet, config)
+    rail_pallets.append(pallet)
+    return rail_pallets, []
+
+
+def _plan_cushion_segment(cushion_requirements, leg_requirements, config):
+    cushion_lines = _aggregate_cushion_lines(cushion_requirements)
+    leg_lines = [dict(line) for line in leg_requirements]
+    if not (_line_total(cushion_lines) or _line_total(leg_lines)):
+        return []
+    cushion_pallets = [
+        _new_pallet("cushion", None)
+        for _ in range(config["cushion_pallet_count"])
+    ]
+    line_index = 0
+    for source_lines in (cushion_lines, leg_lines):
+        for line in source_lines:
+            cushion_pallets[line_index % len(cushion_pallets)]["lines"].append(line)
+            line_index += 1
+    for pallet in cushion_pallets:
         _refresh_pallet_labels(pallet, config)
-        pallets.append(pallet)
-        next_number += 1
-
-    cushion_lines = _aggregate_cushion_lines(requirements["cushions"])
-    leg_lines = [dict(line) for line in requirements["leg_boxes"]]
-    if _line_total(cushion_lines) or _line_total(leg_lines):
-        cushion_pallet_count = config["cushion_pallet_count"]
-        cushion_pallets = [
-            _new_pallet("cushion", next_number + index)
-            for index in range(cushion_pallet_count)
-        ]
-        next_number += cushion_pallet_count
-        line_index = 0
-        for source_lines in (cushion_lines, leg_lines):
-            while source_lines:
-                line = source_lines.pop(0)
-                target = cushion_pallets[line_index % len(cushion_pallets)]
-                target["lines"].append(line)
-                line_index += 1
-        for pallet in cushion_pallets:
+    return cushion_pallets
+
+
+class _OptimiserTimeout(Exception):
+    pass
+
+
+def _check_deadline(deadline):
+    if time.monotonic() > deadline:
+        raise _OptimiserTimeout
+
+
+def _group_key(line):
+    return (line.get("size") or "Unknown", line.get("colour") or "Unknown")
+
+
+def _group_order(key):
+    return ({"7ft": 0, "6ft": 1}.get(key[0], 2), key[1])
+
+
+def _pure_first_bins(quantities, capacity):
+    """Split ``{group: quantity}`` into the fewest bins with as many single-group bins as possible.
+
+    Whole bins of one group come first. Of the leftovers, the largest are
+    each given a bin of their own while the rest still fit in the remaining
+    bins; those remaining bins share the other leftovers.
+    """
+    bins = []
+    remainders = {}
+    for key in sorted(quantities, key=_group_order):
+        full, remainder = divmod(quantities[key], capacity)
+        bins.extend({key: capacity} for _ in range(full))
+        if remainder:
+            remainders[key] = remainder
+
+    remainder_total = sum(remainders.values())
+    bin_count = math.ceil(remainder_total / capacity)
+    by_size = sorted(remainders, key=lambda key: (-remainders[key], _group_order(key)))
+    isolated = 0
+    for count in range(min(len(by_size), bin_count), -1, -1):
+        shared_total = remainder_total - sum(remainders[key] for key in by_size[:count])
+        if shared_total <= (bin_count - count) * capacity:
+            isolated = count
+            break
+    bins.extend({key: remainders[key]} for key in by_size[:isolated])
+
+    shared_bins = [{} for _ in range(bin_count - isolated)]
+    bin_index = 0
+    for key in sorted(by_size[isolated:], key=_group_order):
+        left = remainders[key]
+        while left:
+            space = capacity - sum(shared_bins[bin_index].values())
+            if not space:
+                bin_index += 1
+                continue
+            amount = min(space, left)
+            shared_bins[bin_index][key] = shared_bins[bin_index].get(key, 0) + amount
+            left -= amount
+    bins.extend(shared_bins)
+    return bins
+
+
+def _bins_with_size(bins, sizes):
+    return sum(1 for contents in bins if any(key[0] in sizes for key in contents))
+
+
+def _rail_carry_plan(rail_totals, slots_7ft, slots_sized, config):
+    """Rails per size to load onto body pallets and the rail pallets left, fewest pallets first.
+
+    7ft rails need a 7ft body beneath them; 6ft rails take any sized body
+    pallet the 7ft rails left free. Rails of unknown size always get a pallet.
+    """
+    capacity = config["top_rail_capacity"]
+    carried = {}
+    rail_pallets = 0
+    free_slots = {"7ft": slots_7ft, "6ft": slots_sized, "Unknown": 0}
+    for size in ("7ft", "6ft", "Unknown"):
+        total = rail_totals.get(size, 0)
+        most_carried = min(total, config["loose_rail_limit"] - 1, free_slots[size])
+        pallet_count = math.ceil((total - most_carried) / capacity)
+        carried[size] = max(0, total - pallet_count * capacity)
+        free_slots["6ft"] -= carried[size] if size == "7ft" else 0
+        rail_pallets += pallet_count
+    return carried, rail_pallets
+
+
+def _move_unit(bins, source, target, key):
+    bins[source][key] -= 1
+    if not bins[source][key]:
+        del bins[source][key]
+    bins[target][key] = bins[target].get(key, 0) + 1
+
+
+def _add_rail_anchors(bins, target_7ft, target_sized, capacity, deadline):
+    """Move single bodies so ``target_7ft`` bins hold a 7ft body and ``target_sized`` a sized one.
+
+    A full receiving bin hands one of its own bodies back, preferring a group
+    the donor already holds so no new pallet becomes mixed. Returns ``None``
+    when there are not enough bodies to spread.
+    """
+    bins = [dict(contents) for contents in bins]
+    for sizes, target in ((("7ft",), target_7ft), (("7ft", "6ft"), target_sized)):
+        while _bins_with_size(bins, sizes) < target:
+            _check_deadline(deadline)
+            receivers = [index for index, contents in enumerate(bins) if not any(key[0] in sizes for key in contents)]
+            donors = []
+            for index, contents in enumerate(bins):
+                for key, quantity in contents.items():
+                    if key[0] not in sizes:
+                        continue
+                    same_size = sum(count for other, count in contents.items() if other[0] == key[0])
+                    sized = sum(count for other, count in contents.items() if other[0] in sizes)
+                    # The donor must keep the size it is counted for.
+                    if same_size >= 2 and sized >= 2:
+                        donors.append((-same_size, len(contents) == 1, index, key))
+            if not receivers or not donors:
+                return None
+            _, _, donor, key = min(donors)
+            receiver = min(receivers, key=lambda index: (
+                sum(bins[index].values()) - capacity, len(bins[index]) == 1, index,
+            ))
+            _move_unit(bins, donor, receiver, key)
+            if sum(bins[receiver].values()) > capacity:
+                returned = min(
+                    (other for other in bins[receiver] if other != key),
+                    key=lambda other: (other not in bins[donor], -bins[receiver][other], _group_order(other)),
+                )
+                _move_unit(bins, receiver, donor, returned)
+    return bins
+
+
+def _layout_score(pallets):
+    """``(pallets, mixed pallets, line pieces)``; lower is better."""
+    mixed = 0
+    pieces = 0
+    for pallet in pallets:
+        groups = {_group_key(line) for line in pallet["lines"]}
+        if pallet["pallet_type"] == "top_rail":
+            groups = {colour for _, colour in groups}
+        mixed += len(groups) > 1
+        pieces += len(pallet["lines"]) + len(pallet["carried_top_rails"])
+    return len(pallets), mixed, pieces
+
+
+def _build_optimised_layout(requirements, bins, carried, config):
+    group_lines = defaultdict(list)
+    for line in requirements["bodies"]:
+        group_lines[_group_key(line)].append(dict(line))
+    body_pallets = []
+    for contents in sorted(bins, key=lambda contents: sorted(map(_group_order, contents))):
+        lines = []
+        for key in sorted(contents, key=_group_order):
+            lines.extend(_take_from_lines(group_lines[key], contents[key]))
+        pallet = _new_pallet("body", None, lines)
+        _refresh_pallet_labels(pallet, config)
+        body_pallets.append(pallet)
+
+    body_sizes = [{line.get("size") for line in pallet["lines"]} for pallet in body_pallets]
+    body_colours = [{line.get("colour") or "Unknown" for line in pallet["lines"]} for pallet in body_pallets]
+    free_pallets = set(range(len(body_pallets)))
+
+    rail_pallets = []
+    for size in ("7ft", "6ft", "Unknown"):
+        colour_lines = defaultdict(list)
+        for line in requirements["top_rails"]:
+            if (line.get("size") or "Unknown") == size:
+                colour_lines[line.get("colour") or "Unknown"].append(dict(line))
+        quantities = {colour: _line_total(lines) for colour, lines in colour_lines.items()}
+        # Load the odd rails that would otherwise mix a rail pallet, smallest first.
+        capacity = config["top_rail_capacity"]
+        left = carried.get(size, 0)
+        carry_order = sorted(
+            quantities, key=lambda colour: (quantities[colour] % capacity == 0, quantities[colour] % capacity, colour)
+        )
+        compatible = {"7ft"} if size == "7ft" else {"6ft", "7ft"}
+        for colour in carry_order:
+            if not left:
+                break
+            targets = sorted(
+                (index for index in free_pallets if body_sizes[index] & compatible),
+                key=lambda index: (size not in body_sizes[index], colour not in body_colours[index], index),
+            )
+            for index in targets[:min(left, quantities[colour])]:
+                body_pallets[index]["carried_top_rails"].extend(_take_from_lines(colour_lines[colour], 1))
+                free_pallets.discard(index)
+                quantities[colour] -= 1
+                left -= 1
+        rail_bins = _pure_first_bins(
+            {(size, colour): quantity for colour, quantity in quantities.items() if quantity}, capacity
+        )
+        for contents in sorted(rail_bins, key=lambda contents: sorted(map(_group_order, contents))):
+            lines = []
+            for key in sorted(contents, key=_group_order):
+                lines.extend(_take_from_lines(colour_lines[key[1]], contents[key]))
+            pallet = _new_pallet("top_rail", None, lines, size=size)
             _refresh_pallet_labels(pallet, config)
-            pallets.append(pallet)
+            rail_pallets.append(pallet)
+    return body_pallets, rail_pallets
+
+
+def optimise_layout(requirements, config, standard_pallets, time_budget=None):
+    """Search for a body and top-rail layout with fewer pallets, then fewer mixed pallets.
+
+    Body pallets are packed with whole single-colour pallets first. The
+    search then tries spreading single 7ft or 6ft bodies over more pallets
+    so leftover top rails can ride on them instead of a rail pallet of their
+    own, pruning any spread that cannot beat the best layout found so far.
+
+    Returns ``{"status", "pallets", "seconds"}``. ``pallets`` is
+    ``(body_pallets, rail_pallets)`` when the layout beats
+    ``standard_pallets``, otherwise ``None`` with status ``standard``, or
+    ``timeout`` if the budget ran out first.
+    """
+    started = time.monotonic()
+    deadline = started + (OPTIMISER_TIME_BUDGET_SECONDS if time_budget is None else time_budget)
+
+    def finish(status, pallets=None):
+        return {"status": status, "pallets": pallets, "seconds": time.monotonic() - started}
+
+    quantities = defaultdict(int)
+    for line in requirements["bodies"]:
+        quantities[_group_key(line)] += line["quantity"]
+    rail_totals = defaultdict(int)
+    for line in requirements["top_rails"]:
+        rail_totals[line.get("size") or "Unknown"] += line["quantity"]
+    body_units = {
+        sizes: sum(quantity for key, quantity in quantities.items() if key[0] in sizes)
+        for sizes in (("7ft",), ("7ft", "6ft"))
+    }
+
+    try:
+        base_bins = _pure_first_bins(quantities, config["body_capacity"])
+        base_7ft = _bins_with_size(base_bins, ("7ft",))
+        base_sized = _bins_with_size(base_bins, ("7ft", "6ft"))
+        reach = config["loose_rail_limit"]
+        candidates = []
+        for target_7ft in range(base_7ft, min(len(base_bins), body_units[("7ft",)], base_7ft + reach) + 1):
+            for target_sized in range(
+                max(base_sized, target_7ft),
+                min(len(base_bins), body_units[("7ft", "6ft")], base_sized + reach) + 1,
+            ):
+                _check_deadline(deadline)
+                carried, rail_pallets = _rail_carry_plan(rail_totals, target_7ft, target_sized, config)
+                spread = target_7ft - base_7ft + target_sized - base_sized
+                candidates.append((rail_pallets, spread, target_7ft, target_sized, carried))
+        candidates.sort(key=lambda candidate: candidate[:4])
+
+        best_score = _layout_score(standard_pallets)
+        best_layout = None
+        base_mixed = sum(len(contents) > 1 for contents in base_bins)
+        settled_rail_pallets = None
+        for rail_pallets, spread, target_7ft, target_sized, carried in candidates:
+            if rail_pallets == settled_rail_pallets:
+                continue
+            # Spreading bodies never unmixes a pallet and candidates come in rail-pallet
+            # order, so once this bound loses every later candidate loses too.
+            if (len(base_bins) + rail_pallets, base_mixed) > best_score[:2]:
+                break
+            bins = _add_rail_anchors(base_bins, target_7ft, target_sized, config["body_capacity"], deadline)
+            if bins is None:
+                continue
+            # The smallest spread that reaches this rail pallet count mixes the fewest pallets.
+            settled_rail_pallets = rail_pallets
+            layout = _build_optimised_layout(requirements, bins, carried, config)
+            score = _layout_score(layout[0] + layout[1])
+            if score < best_score:
+                best_score, best_layout = score, layout
+    except _OptimiserTimeout:
+        return finish("timeout")
+    if best_layout is None:
+        return finish("standard")
+    return finish("optimised", best_layout)
+
+
+def _plan_pallets(requirements, config):
+    """Pallets for normalised requirements, reusing cached segments whose inputs are unchanged."""
+    return _plan_segments(requirements, config)[0]
+
+
+def _plan_segments(requirements, config):
+    """``_plan_pallets`` plus whether every segment of the plan came from, or went into, the cache."""
+    complete = True
+    body_key = (
+        "body",
+        config["body_capacity"],
+        _lines_signature(requirements["bodies"]),
+    )
+    body_segment = _cached_segment(
+        body_key, lambda: _plan_body_segment(requirements["bodies"], config)
+    )
+    body_pallets = [_copy_pallet(pallet) for pallet in body_segment]
+    rail_pallets = []
+
+    rail_config = (
+        config["top_rail_capacity"],
+        config["loose_rail_limit"],
+        config["top_rails_per_body_pallet"],
+    )
+    # Each size can load rails onto the body pallets, so later sizes depend on earlier ones.
+    previous_key = body_key
+    for size in ("7ft", "6ft", "Unknown"):
+        size_lines = [
+            line for line in requirements["top_rails"]
+            if (line.get("size") or "Unknown") == size
+        ]
+        rail_key = ("top_rail", size, rail_config, previous_key, _lines_signature(size_lines))
+        size_pallets, carried = _cached_segment(
+            rail_key,
+            lambda: _plan_rail_segment(size_lines, size, body_pallets, config),
+        )
+        for body_index, lines in carried:
+            body_pallets[body_index]["carried_top_rails"].extend(dict(line) for line in lines)
+        rail_pallets.extend(_copy_pallet(pallet) for pallet in size_pallets)
+        previous_key = rail_key
+
+    if config["packing_mode"] == "optimised":
+        optimised = _cached_segment(
+            ("optimised", rail_config, previous_key),
+            lambda: optimise_layout(requirements, config, body_pallets + rail_pallets),
+            # A timed-out search says nothing about the layout, so let the next plan try again.
+            cacheable=lambda result: result["status"] in ("optimised", "standard"),
+        )
+        complete = optimised["status"] in ("optimised", "standard")
+        if optimised["pallets"] is not None:
+            body_pallets = [_copy_pallet(pallet) for pallet in optimised["pallets"][0]]
+            rail_pallets = [_copy_pallet(pallet) for pallet in optimised["pallets"][1]]
+    pallets = body_pallets + rail_pallets
+
+    cushion_key = (
+        "cushion",
+        config["cushion_pallet_count"],
+        _lines_signature(requirements["cushions"]),
+        _lines_signature(requirements["leg_boxes"]),
+    )
+    cushion_segment = _cached_segment(
+        cushion_key,
+        lambda: _plan_cushion_segment(requirements["cushions"], requirements["leg_boxes"], config),
+    )
+    pallets.extend(_copy_pallet(pallet) for pallet in cushion_segment)
+
+    for number, pallet in enumerate(pallets, start=1):
+        pallet["pallet_number"] = number
+    return pallets, complete
+
+
+def generate_packaging(items, config=None):
+    items = normalise_items(items)
+    config = normalise_config(config)
+    requirements = build_requirements(items, config)
+    pallets = _plan_pallets(requirements, config)
 
     summary = build_summary(items, pallets, requirements, config)
-    warnings = validate_packaging(items, pallets, config, requirements=requirements)
+    warnings = _validate_packaging(items, pallets, config, requirements)
     return {
         "items": items,
         "pallets": pallets,
@@ -870,13 +1464,19 @@ def _pallet_identity(pallet):
         number = int(number)
     except (TypeError, ValueError):
         number = _clean_text(number)
-    return number, _clean_text(pallet.get("pallet_type")) or "custom"
+    return number, _clean_label(pallet.get("pallet_type")) or "custom"
+
+
+@functools.lru_cache(maxsize=ITEM_CACHE_SIZE)
+def _clean_label(value):
+    """_clean_text for the values that identify pallets and layout lines, which repeat on every save."""
+    return _clean_text(value)
 
 
 def _layout_line_identity(line):
-    component_type = _clean_text(line.get("component_type")) or "other"
-    item_id = _clean_text(line.get("item_id"))
-    origin_type = _clean_text(line.get("origin_type"))
+    component_type = _clean_label(line.get("component_type")) or "other"
+    item_id = _clean_label(line.get("item_id"))
+    origin_type = _clean_label(line.get("origin_type"))
     if item_id:
         return "item", item_id, component_type
     if origin_type == "manual":
@@ -888,7 +1488,7 @@ def _layout_line_identity(line):
     return (
         "group",
         component_type,
-        _clean_text(line.get("size")),
+        _clean_label(line.get("size")),
         origin_type,
     )
 
@@ -900,17 +1500,49 @@ def _layout_state(pallets):
     for pallet in pallets:
         pallet_identity = _pallet_identity(pallet)
         for collection_name in ("lines", "carried_top_rails"):
+            location = pallet_identity, collection_name
             for line in pallet.get(collection_name, []):
                 line_identity = _layout_line_identity(line)
-                location = pallet_identity, collection_name
-                quantity = max(0, int(line.get("quantity", 0) or 0))
-                quantities[(location, line_identity)] += quantity
-                samples.setdefault(line_identity, line)
-                if location not in preferences[line_identity]:
-                    preferences[line_identity].append(location)
+                quantities[(location, line_identity)] += max(0, int(line.get("quantity", 0) or 0))
+                if line_identity not in samples:
+                    samples[line_identity] = line
+                locations = preferences[line_identity]
+                if location not in locations:
+                    locations.append(location)
     return quantities, samples, preferences
 
 
+def _planned_layout(items, config, plan=None):
+    """``_layout_state`` of the plan for normalised ``items``, cached like the segments it is built from.
+
+    ``plan`` returns the pallets and whether every segment was cacheable,
+    for callers that have already planned the items. The samples are copies,
+    so later edits to those pallets do not reach the cache.
+    """
+    # Normalised items all have their fields in the same order, so the values identify them.
+    key = ("layout", tuple(config.items()), tuple(tuple(item.values()) for item in items))
+    if plan is None:
+        plan = lambda: _plan_segments(build_requirements(items, config), config)
+    planned = {}
+
+    def build():
+        pallets, planned["complete"] = plan()
+        quantities, samples, preferences = _layout_state(pallets)
+        return quantities, {identity: dict(line) for identity, line in samples.items()}, preferences
+
+    return _cached_segment(key, build, cacheable=lambda _: planned["complete"])
+
+
+def _layout_identity_total(pallets, line_identity):
+    return sum(
+        max(0, int(line.get("quantity", 0) or 0))
+        for pallet in pallets
+        for collection_name in ("lines", "carried_top_rails")
+        for line in pallet.get(collection_name, [])
+        if _layout_line_identity(line) == line_identity
+    )
+
+
 def _new_layout_pallet(source):
     return {
         "id": _clean_text(source.get("id")) or _new_id("pallet"),
@@ -1030,32 +1662,48 @@ def regenerate_packaging(
             ):
                 raise ValueError("The pallet data is invalid or too large.")
 
-    result = generate_packaging(items, config)
     has_manual_layout = preserve_manual_layout or any(
         bool(pallet.get("manual_override")) for pallet in existing_pallets
     )
     if replace_manual_layout or not has_manual_layout:
+        result = generate_packaging(items, config)
         result["manual_layout_preserved"] = False
         return result
 
-    baseline = generate_packaging(
-        items if baseline_items is None else baseline_items,
-        config if baseline_config is None else baseline_config,
+    clean_items = normalise_items(items)
+    clean_config = normalise_config(config)
+    requirements = build_requirements(clean_items, clean_config)
+    pallets, complete = _plan_segments(requirements, clean_config)
+    result = {
+        "items": clean_items,
+        "pallets": pallets,
+        "config": clean_config,
+    }
+    fresh_quantities, fresh_samples, fresh_preferences = _planned_layout(
+        clean_items, clean_config, plan=lambda: (pallets, complete)
     )
-    baseline_quantities, _, _ = _layout_state(baseline["pallets"])
+    # The saved layout was planned from the baseline items. Only its layout
+    # is needed, and layouts are cached, so saving again after an item edit
+    # does not plan the baseline a second time.
+    baseline_config = normalise_config(config if baseline_config is None else baseline_config)
+    if baseline_items is None and baseline_config == clean_config:
+        baseline_quantities = fresh_quantities
+    else:
+        baseline_items = clean_items if baseline_items is None else normalise_items(baseline_items)
+        baseline_quantities = _planned_layout(baseline_items, baseline_config)[0]
     current_quantities, current_samples, _ = _layout_state(existing_pallets)
-    fresh_quantities, fresh_samples, fresh_preferences = _layout_state(
-        result["pallets"]
-    )
     # UUIDs change on every run. Compare quantities by stable item/component and
     # pallet location to capture only the operator's changes to the auto layout.
-    deltas = {
-        key: current_quantities.get(key, 0) - baseline_quantities.get(key, 0)
-        for key in set(current_quantities) | set(baseline_quantities)
-        if current_quantities.get(key, 0) != baseline_quantities.get(key, 0)
-    }
-
-    rebuilt_pallets = copy.deepcopy(result["pallets"])
+    deltas = {}
+    for key, quantity in current_quantities.items():
+        if quantity != baseline_quantities.get(key, 0):
+            deltas[key] = quantity - baseline_quantities.get(key, 0)
+    for key, quantity in baseline_quantities.items():
+        if quantity and key not in current_quantities:
+            deltas[key] = -quantity
+
+    # _plan_pallets hands back fresh copies, so the plan can be edited in place.
+    rebuilt_pallets = result["pallets"]
     current_pallets = {
         _pallet_identity(pallet): pallet for pallet in existing_pallets
     }
@@ -1077,13 +1725,12 @@ def regenerate_packaging(
     deltas_by_line = defaultdict(dict)
     for (location, line_identity), delta in deltas.items():
         deltas_by_line[line_identity][location] = delta
+    fresh_totals = defaultdict(int)
+    for (_, line_identity), quantity in fresh_quantities.items():
+        fresh_totals[line_identity] += quantity
 
     for line_identity, location_deltas in deltas_by_line.items():
-        fresh_total = sum(
-            quantity
-            for (_, candidate_identity), quantity in fresh_quantities.items()
-            if candidate_identity == line_identity
-        )
+        fresh_total = fresh_totals[line_identity]
         desired_total = max(0, fresh_total + sum(location_deltas.values()))
         positive_locations = {
             location for location, delta in location_deltas.items() if delta > 0
@@ -1119,12 +1766,7 @@ def regenerate_packaging(
                     delta,
                 )
 
-        actual_total = sum(
-            quantity
-            for (_, candidate_identity), quantity
-            in _layout_state(rebuilt_pallets)[0].items()
-            if candidate_identity == line_identity
-        )
+        actual_total = _layout_identity_total(rebuilt_pallets, line_identity)
         if actual_total > desired_total:
             _remove_layout_quantity(
                 rebuilt_pallets,
@@ -1200,12 +1842,14 @@ def regenerate_packaging(
     result["summary"] = build_summary(
         result["items"],
         rebuilt_pallets,
+        requirements,
         config=result["config"],
     )
-    result["warnings"] = validate_packaging(
+    result["warnings"] = _validate_packaging(
         result["items"],
         rebuilt_pallets,
-        config=result["config"],
+        result["config"],
+        requirements,
     )
     result["manual_layout_preserved"] = True
     return result
@@ -1281,7 +1925,13 @@ def _warning(code, message, severity="warning"):
 def validate_packaging(items, pallets, config=None, requirements=None):
     items = normalise_items(items)
     config = normalise_config(config)
-    requirements = requirements or build_requirements(items, config)
+    return _validate_packaging(
+        items, pallets, config, requirements or build_requirements(items, config)
+    )
+
+
+def _validate_packaging(items, pallets, config, requirements):
+    """validate_packaging for items and config that are already normalised."""
     warnings = []
 
     required = {
@@ -0,0 +1,94 @@
+"""SQLite connection profiles (pragmas and pool settings) for the tracker database."""
+
+from __future__ import annotations
+
+import sqlite3
+
+from sqlalchemy.engine import make_url
+
+
+SQLITE_PRAGMA_PROFILES = {
+    # Matches how the app ran before profiles existed: rollback journal and
+    # full fsync on every commit, so readers queue behind writers.
+    "legacy": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+    },
+    # WAL lets kiosks keep reading while a count submission commits; NORMAL is
+    # durable in WAL mode apart from the last commit on power loss.
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+}
+
+DEFAULT_SQLITE_PROFILE = "performance"
+
+DEFAULT_POOL_SETTINGS = {
+    "pool_pre_ping": True,
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_recycle": 3600,
+    "pool_timeout": 30,
+}
+# In-memory databases get SQLAlchemy's per-thread pool, which rejects these.
+QUEUE_POOL_SETTINGS = ("pool_size", "max_overflow", "pool_timeout")
+
+# journal_mode is stored in the database file, so set it before the others.
+PRAGMA_ORDER = ("journal_mode", "busy_timeout", "synchronous", "cache_size", "mmap_size", "temp_store")
+
+
+def resolve_pragmas(profile=None, overrides=None):
+    name = profile or DEFAULT_SQLITE_PROFILE
+    if name not in SQLITE_PRAGMA_PROFILES:
+        raise ValueError(
+            f"Unknown SQLite profile {name!r}; choose one of {', '.join(sorted(SQLITE_PRAGMA_PROFILES))}."
+        )
+    pragmas = dict(SQLITE_PRAGMA_PROFILES[name])
+    pragmas.update(overrides or {})
+    return pragmas
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    ordered = [key for key in PRAGMA_ORDER if key in pragmas]
+    ordered.extend(key for key in pragmas if key not in PRAGMA_ORDER)
+    cursor = dbapi_connection.cursor()
+    try:
+        for key in ordered:
+            value = pragmas[key]
+            if value is None:
+                continue
+            if not key.replace("_", "").isalnum() or not str(value).replace("-", "").isalnum():
+                raise ValueError(f"Invalid SQLite pragma {key}={value!r}.")
+            cursor.execute(f"PRAGMA {key}={value}")
+    finally:
+        cursor.close()
+
+
+def is_memory_database(database_uri):
+    url = make_url(database_uri)
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+
+def engine_options(pool_settings=None, database_uri=None):
+    """Pool options for ``create_engine``; queue-pool sizing only applies to file databases."""
+    options = dict(DEFAULT_POOL_SETTINGS)
+    options.update(pool_settings or {})
+    if database_uri is not None and is_memory_database(database_uri):
+        for key in QUEUE_POOL_SETTINGS:
+            options.pop(key, None)
+    return options
+
+
+def current_pragmas(dbapi_connection, keys=PRAGMA_ORDER):
+    cursor = dbapi_connection.cursor()
+    try:
+        return {key: cursor.execute(f"PRAGMA {key}").fetchone()[0] for key in keys}
+    finally:
+        cursor.close()
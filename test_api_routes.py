@@ -0,0 +1,79 @@
+import unittest
+from datetime import date, time
+
+from flask_app_testing import AppTestCase
+
+from api_routes import API_TOKENS
+from flask_app import PrintedPartsCount
+
+
+LOG_URL = "/api/inventory/printed_parts_count/all"
+
+
+class InventoryLogPagingTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.headers = {"X-API-Token": API_TOKENS[0]}
+        # Eleven rows logged within one second, between rows from other seconds.
+        rows = [PrintedPartsCount(part_name="Felt", count=1, date=date(2026, 3, 2), time=time(9, 30, 14))]
+        rows += [
+            PrintedPartsCount(part_name="Felt", count=number, date=date(2026, 3, 2), time=time(9, 30, 15, micro))
+            for number, micro in enumerate((0, 5, 5, 120, 999_999, 40_000, 40_000, 7, 300_000, 300_001, 5), start=1)
+        ]
+        rows.append(PrintedPartsCount(part_name="Straps", count=2, date=date(2026, 3, 2), time=time(9, 30, 16)))
+        self.db.session.add_all(rows)
+        self.db.session.commit()
+
+    def get(self, **query):
+        return self.client.get(LOG_URL, query_string=query, headers=self.headers)
+
+    def test_pages_cover_rows_that_share_a_second(self):
+        expected = [row["id"] for row in self.get().get_json()]
+        self.assertEqual(len(expected), 13)
+
+        for limit in (1, 3, 4, 13):
+            with self.subTest(limit=limit):
+                paged, query = [], {"limit": limit}
+                while True:
+                    response = self.get(**query)
+                    self.assertEqual(response.status_code, 200)
+                    paged += [row["id"] for row in response.get_json()]
+                    cursor = response.headers.get("X-Next-Cursor")
+                    if cursor is None:
+                        break
+                    query = {"limit": limit, "cursor": cursor}
+                self.assertEqual(paged, expected)
+
+    def test_editing_only_a_time_changes_the_etag(self):
+        etag = self.get().headers["ETag"]
+        self.assertEqual(self.get(limit=3).status_code, 200)
+        row = self.db.session.execute(
+            PrintedPartsCount.__table__.select().where(PrintedPartsCount.part_name == "Straps")
+        ).one()
+        self.db.session.get(PrintedPartsCount, row.id).time = time(9, 31, 16)
+        self.db.session.commit()
+
+        response = self.client.get(LOG_URL, headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_renaming_a_part_to_a_same_length_name_changes_the_etag(self):
+        etag = self.get().headers["ETag"]
+        row = self.db.session.execute(
+            PrintedPartsCount.__table__.select().where(PrintedPartsCount.part_name == "Straps")
+        ).one()
+        self.db.session.get(PrintedPartsCount, row.id).part_name = "Strops"
+        self.db.session.commit()
+
+        response = self.client.get(LOG_URL, headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Strops", [entry["part_name"] for entry in response.get_json()])
+
+    def test_unchanged_log_is_not_modified(self):
+        etag = self.get().headers["ETag"]
+        response = self.client.get(LOG_URL, headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from datetime import date, datetime, timedelta
+
+from cnc_analytics import SHIFT_HOURS, add_work_hours, combine_stats, machine_metrics, shift_hours, summarise_machine_day
+
+
+class SummariseMachineDayTests(unittest.TestCase):
+    def test_splits_gaps_into_cycles_and_idle_time(self):
+        start = datetime(2026, 10, 12, 9, 0)
+        completions = [
+            (start + timedelta(minutes=minutes), start - timedelta(hours=2), job_id)
+            for minutes, job_id in [(20, 1), (0, 1), (35, 2), (120, 2)]
+        ]
+        stats, per_job = summarise_machine_day(completions, idle_gap_seconds=30 * 60)
+
+        self.assertEqual(stats["runs"], 4)
+        self.assertEqual(stats["cycle_count"], 2)
+        self.assertEqual(stats["cycle_seconds"], 35 * 60)
+        self.assertEqual((stats["idle_gap_count"], stats["idle_seconds"]), (1, 85 * 60))
+        self.assertEqual(per_job[1]["runs"], 2)
+        self.assertEqual(per_job[2]["wait_seconds"], (155 + 240) * 60)
+
+    def test_empty_day(self):
+        stats, per_job = summarise_machine_day([])
+        self.assertEqual(stats["runs"], 0)
+        self.assertEqual(per_job, {})
+
+
+class WorkHoursTests(unittest.TestCase):
+    def test_skips_lunch_evenings_and_weekends(self):
+        friday_afternoon = datetime(2026, 10, 16, 16, 0)
+        self.assertEqual(add_work_hours(friday_afternoon, 2), datetime(2026, 10, 19, 10, 0))
+        morning = datetime(2026, 10, 13, 12, 0)
+        self.assertEqual(add_work_hours(morning, 1), datetime(2026, 10, 13, 13, 30))
+        before_shift = datetime(2026, 10, 13, 6, 0)
+        self.assertEqual(add_work_hours(before_shift, 0), datetime(2026, 10, 13, 9, 0))
+
+    def test_shift_hours_clip_to_window_and_skip_lunch(self):
+        day = date(2026, 10, 13)
+        self.assertEqual(SHIFT_HOURS, 7.5)
+        self.assertEqual(shift_hours(day), SHIFT_HOURS)
+        self.assertEqual(shift_hours(day, end=datetime(2026, 10, 13, 12, 45)), 3.5)
+        self.assertEqual(shift_hours(day, start=datetime(2026, 10, 13, 12, 45)), 4.0)
+        self.assertEqual(shift_hours(day, end=datetime(2026, 10, 13, 6, 0)), 0.0)
+        self.assertEqual(shift_hours(day, start=datetime(2026, 10, 13, 18, 0)), 0.0)
+
+
+class MachineMetricsTests(unittest.TestCase):
+    def test_projects_queue_drain_from_average_cycle(self):
+        stats = combine_stats([
+            {"runs": 5, "cycle_count": 4, "cycle_seconds": 4 * 900, "idle_gap_count": 1,
+             "idle_seconds": 3600, "wait_seconds": 5 * 7200},
+            {"runs": 1, "cycle_count": 0, "cycle_seconds": 0, "idle_gap_count": 0,
+             "idle_seconds": 0, "wait_seconds": 0},
+        ])
+        now = datetime(2026, 10, 13, 9, 0)
+        metrics = machine_metrics(stats, queued_runs=8, current_time=now)
+
+        self.assertEqual(metrics["avg_cycle_minutes"], 15.0)
+        self.assertEqual(metrics["avg_queue_wait_hours"], round(10 * 3600 / 6 / 3600, 1))
+        self.assertEqual(metrics["drain_work_hours"], 2.0)
+        self.assertEqual(metrics["drain_finish"], datetime(2026, 10, 13, 11, 0))
+
+    def test_no_history_leaves_projection_empty(self):
+        metrics = machine_metrics(combine_stats([]), queued_runs=3, current_time=datetime(2026, 10, 13, 9, 0))
+        self.assertIsNone(metrics["avg_cycle_minutes"])
+        self.assertIsNone(metrics["drain_finish"])
+        self.assertEqual(machine_metrics(combine_stats([]), 0, date(2026, 10, 13))["drain_work_hours"], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
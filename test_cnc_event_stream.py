@@ -0,0 +1,126 @@
+import threading
+import unittest
+
+from cnc_event_stream import CursorExpired, EventFanout, format_sse
+
+
+class FakeEventLog:
+    def __init__(self):
+        self.rows = []
+        self.fetches = 0
+        self.lock = threading.Lock()
+
+    def append(self, event_type, **data):
+        with self.lock:
+            event_id = (self.rows[-1]["id"] if self.rows else 0) + 1
+            self.rows.append({"id": event_id, "type": event_type, "data": data})
+            return event_id
+
+    def prune(self, keep):
+        with self.lock:
+            self.rows = self.rows[-keep:]
+
+    def fetch_after(self, after_id, limit):
+        with self.lock:
+            self.fetches += 1
+            return [row for row in self.rows if row["id"] > after_id][:limit]
+
+    def fetch_bounds(self):
+        with self.lock:
+            if not self.rows:
+                return (None, None)
+            return (self.rows[0]["id"], self.rows[-1]["id"])
+
+
+class EventFanoutTests(unittest.TestCase):
+    def setUp(self):
+        self.log = FakeEventLog()
+        self.fanouts = []
+
+    def tearDown(self):
+        for fanout in self.fanouts:
+            fanout.stop()
+
+    def fanout(self, **kwargs):
+        kwargs.setdefault("poll_interval", 0.02)
+        fanout = EventFanout(self.log.fetch_after, self.log.fetch_bounds, **kwargs)
+        self.fanouts.append(fanout)
+        return fanout
+
+    def test_waiting_streams_share_one_poll(self):
+        fanout = self.fanout(poll_interval=30)
+        fanout.subscribe()
+        results = []
+
+        def stream():
+            results.append(fanout.events_after(0, timeout=5))
+
+        threads = [threading.Thread(target=stream) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        fetches_before = self.log.fetches
+        self.log.append("added", item_id=1)
+        fanout.wake()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual([[event["id"] for event in events] for events in results], [[1]] * 8)
+        self.assertEqual(self.log.fetches - fetches_before, 1)
+
+    def test_resumes_from_cursor_without_replaying_seen_events(self):
+        fanout = self.fanout()
+        fanout.subscribe()
+        for item_id in range(1, 4):
+            self.log.append("added", item_id=item_id)
+        fanout.wake()
+        first = fanout.events_after(0, timeout=2)
+        self.assertEqual([event["id"] for event in first], [1, 2, 3])
+
+        self.log.append("moved", item_id=2)
+        fanout.wake()
+        resumed = fanout.events_after(3, timeout=2)
+        self.assertEqual([(event["id"], event["type"]) for event in resumed], [(4, "moved")])
+
+    def test_cursor_older_than_buffer_reads_the_log(self):
+        fanout = self.fanout(buffer_size=3)
+        fanout.subscribe()
+        for item_id in range(1, 6):
+            self.log.append("added", item_id=item_id)
+        fanout.wake()
+        seen = [0]
+        while seen[-1] < 5:
+            seen.extend(event["id"] for event in fanout.events_after(seen[-1], timeout=2))
+        self.assertEqual(seen, [0, 1, 2, 3, 4, 5])
+        self.assertEqual(fanout.stats()["buffered"], 3)
+
+        caught_up = fanout.events_after(1, timeout=2)
+        self.assertEqual([event["id"] for event in caught_up], [2, 3, 4])
+        self.assertEqual(fanout.stats()["catch_up_reads"], 1)
+
+    def test_pruned_cursor_expires(self):
+        for item_id in range(1, 11):
+            self.log.append("added", item_id=item_id)
+        self.log.prune(keep=3)
+        fanout = self.fanout(buffer_size=3)
+        with self.assertRaises(CursorExpired):
+            fanout.events_after(2, timeout=0.1)
+        self.assertEqual(fanout.events_after(10, timeout=0.05), [])
+
+    def test_cursor_from_newer_page_refreshes_idle_fanout(self):
+        fanout = self.fanout()
+        fanout.ensure_started()
+        page_cursor = self.log.append("added", item_id=1)
+        self.assertEqual(fanout.events_after(page_cursor, timeout=0.05), [])
+        with self.assertRaises(CursorExpired):
+            fanout.events_after(page_cursor + 5, timeout=0.05)
+
+    def test_format_sse(self):
+        self.assertEqual(
+            format_sse({"item_id": 4}, event_id=12, event_type="completed"),
+            'id: 12\nevent: completed\ndata: {"item_id":4}\n\n',
+        )
+        self.assertEqual(format_sse("a\nb"), "data: a\ndata: b\n\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
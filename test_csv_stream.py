@@ -0,0 +1,82 @@
+import csv
+import gzip
+import io
+import os
+import tempfile
+import unittest
+
+from csv_stream import csv_chunks, file_chunks, gzip_chunks
+
+
+ROWS = [
+    ["When", "Worker", "Note"],
+    ["2026-10-01 09:00:00", "Sam", 'Said "done", moved on'],
+    ["2026-10-01 09:05:00", "Jo", "Line one\nline two"],
+    ["", "", ""],
+    [],
+    [3, None, 1.5],
+]
+
+
+def plain_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+class CsvChunkTests(unittest.TestCase):
+    def test_chunks_join_to_the_same_text_as_one_writer(self):
+        rows = ROWS * 500
+        for chunk_size in (1, 50, 4096, 10 ** 9):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual("".join(csv_chunks(iter(rows), chunk_size)), plain_csv(rows))
+
+    def test_chunks_stay_near_the_chunk_size(self):
+        rows = [["x" * 30, index] for index in range(5000)]
+        chunks = list(csv_chunks(rows, chunk_size=1000))
+        self.assertGreater(len(chunks), 100)
+        longest_row = max(len(plain_csv([row])) for row in rows)
+        self.assertTrue(all(len(chunk) < 1000 + longest_row for chunk in chunks))
+
+    def test_rows_are_pulled_lazily(self):
+        pulled = []
+
+        def rows():
+            for index in range(10_000):
+                pulled.append(index)
+                yield [index]
+
+        first = next(csv_chunks(rows(), chunk_size=100))
+        self.assertTrue(first.startswith("0\r\n"))
+        self.assertLess(len(pulled), 100)
+
+    def test_no_rows_yield_nothing(self):
+        self.assertEqual(list(csv_chunks([])), [])
+
+
+class GzipChunkTests(unittest.TestCase):
+    def test_text_and_bytes_round_trip(self):
+        text = plain_csv(ROWS * 2000)
+        pieces = [text[start:start + 777] for start in range(0, len(text), 777)]
+        self.assertEqual(gzip.decompress(b"".join(gzip_chunks(pieces))).decode("utf-8"), text)
+        encoded = [piece.encode("utf-8") for piece in pieces]
+        self.assertEqual(gzip.decompress(b"".join(gzip_chunks(encoded))), text.encode("utf-8"))
+
+    def test_empty_stream_is_a_valid_empty_member(self):
+        self.assertEqual(gzip.decompress(b"".join(gzip_chunks([]))), b"")
+
+
+class FileChunkTests(unittest.TestCase):
+    def test_reads_the_whole_file_in_pieces(self):
+        data = os.urandom(10_000)
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "snapshot.csv")
+            with open(path, "wb") as handle:
+                handle.write(data)
+            chunks = list(file_chunks(path, chunk_size=4096))
+        self.assertEqual([len(chunk) for chunk in chunks], [4096, 4096, 1808])
+        self.assertEqual(b"".join(chunks), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
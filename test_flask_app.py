@@ -0,0 +1,1193 @@
+import os
+import random
+import unittest
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+from urllib.parse import urlsplit
+
+from sqlalchemy import event, text
+
+from flask_app_testing import NTFY_STUB, AppTestCase
+
+import flask_app
+from flask_app import (
+    CNC_MACHINE_NUMBERS,
+    CNC_POSITION_GAP,
+    CNC_STATUS_COMPLETED,
+    CNC_STATUS_QUEUED,
+    CUSHION_CONSUMABLE_TEE_NUTS,
+    CUSHION_SIZES,
+    CncCompletionRollup,
+    CncJob,
+    CncMachineDayStats,
+    CncQueueItem,
+    CompletedPods,
+    CompletedTable,
+    CountCheckpoint,
+    CurrentPartInventory,
+    CushionCompletedSet,
+    CushionTimingStat,
+    CushionWorkflowCount,
+    CushionWorkflowLog,
+    DailyProductionRollup,
+    HardwarePart,
+    PrintedPartsCount,
+    SCHEMA_MIGRATIONS,
+    SchemaMigration,
+    TableStock,
+    TableStockLog,
+    TopRail,
+    _cnc_rebalance_machine,
+    _current_part_inventory_source_select,
+    count_completed_to_clock_windows,
+    counts_as_of,
+    build_cushion_stage_context,
+    calendar_period_buckets,
+    cnc_completed_quantity_total,
+    cnc_effective_completed_quantity,
+    cnc_monthly_cut_file_history,
+    consumable_current_count,
+    counts_series,
+    current_part_inventory_entry,
+    current_printed_part_inventory,
+    cushion_current_count_for_variant,
+    cushion_input_requirements,
+    cushion_ready_count_for_stage,
+    cushion_stock_key,
+    cushion_timing_batch_filter,
+    cushion_timing_payload,
+    flatten_cushion_stage_variants,
+    month_buckets,
+    period_counts,
+    production_rollup_period_counts,
+    rebuild_cnc_completion_rollup,
+    rebuild_cushion_timing_stats,
+    rebuild_daily_production_rollup,
+    record_cushion_stage_add,
+    record_cushion_stage_add_many,
+    run_schema_migrations,
+    serial_is_6ft_expression,
+    set_consumable_stock,
+    start_new_cushion_batch,
+)
+
+
+class CurrentPartInventoryTests(AppTestCase):
+    def projection(self):
+        return sorted(
+            tuple(row) for row in self.db.session.execute(
+                CurrentPartInventory.__table__.select()
+            )
+        )
+
+    def rebuilt(self):
+        return sorted(tuple(row) for row in self.db.session.execute(_current_part_inventory_source_select()))
+
+    def snapshot(self, part_name, count, day, at):
+        entry = PrintedPartsCount(part_name=part_name, count=count, date=date(2026, 3, day), time=at)
+        self.db.session.add(entry)
+        self.db.session.commit()
+        return entry
+
+    def assertProjection(self, part_name, expected):
+        self.assertEqual(self.projection(), self.rebuilt())
+        entry = current_part_inventory_entry(part_name)
+        self.assertEqual(
+            (entry.part_name, entry.count, entry.date, entry.time) if entry else None,
+            expected,
+        )
+
+    def test_inserts_keep_the_newest_snapshot(self):
+        self.snapshot("Paddle", 10, 2, time(9, 0))
+        self.assertProjection("paddle", ("Paddle", 10, date(2026, 3, 2), time(9, 0)))
+
+        self.snapshot("Paddle", 7, 3, time(8, 0))
+        self.snapshot("Bushing", 4, 3, time(8, 0))
+        self.assertProjection("Paddle", ("Paddle", 7, date(2026, 3, 3), time(8, 0)))
+
+        # A back-dated snapshot is history, not the current count.
+        self.snapshot("Paddle", 99, 1, time(12, 0))
+        self.assertProjection("Paddle", ("Paddle", 7, date(2026, 3, 3), time(8, 0)))
+
+        # Snapshots logged in the same instant resolve to the last one written.
+        self.snapshot("Paddle", 6, 3, time(8, 0))
+        self.assertProjection("Paddle", ("Paddle", 6, date(2026, 3, 3), time(8, 0)))
+
+    def test_edits_refresh_the_part(self):
+        older = self.snapshot("Paddle", 10, 2, time(9, 0))
+        latest = self.snapshot("Paddle", 7, 3, time(8, 0))
+        self.snapshot("Bushing", 4, 3, time(8, 0))
+
+        latest.count = 8
+        self.db.session.commit()
+        self.assertProjection("Paddle", ("Paddle", 8, date(2026, 3, 3), time(8, 0)))
+
+        # Moving the latest row back in time hands the part to the other row.
+        latest.date = date(2026, 3, 1)
+        self.db.session.commit()
+        self.assertProjection("Paddle", ("Paddle", 10, date(2026, 3, 2), time(9, 0)))
+
+        older.time = time(7, 0)
+        self.db.session.commit()
+        self.assertProjection("Paddle", ("Paddle", 10, date(2026, 3, 2), time(7, 0)))
+
+        # Renaming a row refreshes both the part it left and the one it joined.
+        older.part_name = "Bushing"
+        self.db.session.commit()
+        self.assertProjection("Paddle", ("Paddle", 8, date(2026, 3, 1), time(8, 0)))
+        self.assertProjection("Bushing", ("Bushing", 4, date(2026, 3, 3), time(8, 0)))
+
+        latest.part_name = "Bushing"
+        latest.date = date(2026, 3, 4)
+        self.db.session.commit()
+        self.assertProjection("Paddle", None)
+        self.assertProjection("Bushing", ("Bushing", 8, date(2026, 3, 4), time(8, 0)))
+
+    def test_deletes_fall_back_to_the_previous_snapshot(self):
+        self.snapshot("Paddle", 10, 2, time(9, 0))
+        latest = self.snapshot("Paddle", 7, 3, time(8, 0))
+        self.snapshot("Bushing", 4, 3, time(8, 0))
+
+        self.db.session.delete(latest)
+        self.db.session.commit()
+        self.assertProjection("Paddle", ("Paddle", 10, date(2026, 3, 2), time(9, 0)))
+
+        for entry in PrintedPartsCount.query.filter_by(part_name="Paddle").all():
+            self.db.session.delete(entry)
+        self.db.session.commit()
+        self.assertProjection("Paddle", None)
+        self.assertProjection("Bushing", ("Bushing", 4, date(2026, 3, 3), time(8, 0)))
+
+    def test_pending_snapshots_are_read_back_in_the_same_request(self):
+        self.db.session.add(HardwarePart(name="M10x13mm Tee Nut", initial_count=50))
+        self.db.session.commit()
+        self.assertEqual(current_printed_part_inventory("m10x13mm tee nut"), ("M10x13mm Tee Nut", 50))
+
+        # Routes that log several changes to one part before committing read
+        # each change back through the projection.
+        self.db.session.add(PrintedPartsCount(
+            part_name="M10x13mm Tee Nut", count=34, date=date(2026, 3, 2), time=time(9, 0)
+        ))
+        self.assertEqual(current_printed_part_inventory("M10x13mm Tee Nut"), ("M10x13mm Tee Nut", 34))
+        self.db.session.add(PrintedPartsCount(
+            part_name="M10x13mm Tee Nut", count=18, date=date(2026, 3, 2), time=time(9, 0)
+        ))
+        self.assertEqual(current_printed_part_inventory("M10x13mm Tee Nut"), ("M10x13mm Tee Nut", 18))
+        self.db.session.rollback()
+        self.assertEqual(current_printed_part_inventory("M10x13mm Tee Nut"), ("M10x13mm Tee Nut", 50))
+        self.assertEqual(self.projection(), self.rebuilt())
+
+
+class DailyProductionRollupTests(AppTestCase):
+    def rollup(self):
+        return sorted(
+            tuple(row) for row in self.db.session.execute(DailyProductionRollup.__table__.select())
+        )
+
+    def rebuilt(self):
+        with self.db.engine.connect() as connection:
+            with connection.begin() as transaction:
+                rebuild_daily_production_rollup(connection)
+                rows = connection.execute(DailyProductionRollup.__table__.select()).all()
+                transaction.rollback()
+        return sorted(tuple(row) for row in rows)
+
+    def body(self, serial_number, day=2, worker="Sam"):
+        entry = CompletedTable(
+            worker=worker, start_time="09:00", finish_time="10:00",
+            serial_number=serial_number, date=date(2026, 3, day),
+        )
+        self.db.session.add(entry)
+        self.db.session.commit()
+        return entry
+
+    def test_insert_update_and_delete_apply_deltas(self):
+        first = self.body("B100")
+        second = self.body("B101-6")
+        self.body("B102-L")
+        self.assertEqual(self.rollup(), [
+            (date(2026, 3, 2), "bodies", "6ft", "champion", "Sam", 1),
+            (date(2026, 3, 2), "bodies", "7ft", "champion", "Sam", 1),
+            (date(2026, 3, 2), "bodies", "7ft", "lite", "Sam", 1),
+        ])
+
+        # Changing a key column moves the build; other columns leave the rollup alone.
+        first.serial_number = "B100-6"
+        second.issue = "Scratched"
+        self.db.session.commit()
+        self.assertEqual(self.rollup(), [
+            (date(2026, 3, 2), "bodies", "6ft", "champion", "Sam", 2),
+            (date(2026, 3, 2), "bodies", "7ft", "lite", "Sam", 1),
+        ])
+
+        second.worker = "Alex"
+        second.date = date(2026, 3, 3)
+        self.db.session.commit()
+        self.assertEqual(self.rollup(), [
+            (date(2026, 3, 2), "bodies", "6ft", "champion", "Sam", 1),
+            (date(2026, 3, 2), "bodies", "7ft", "lite", "Sam", 1),
+            (date(2026, 3, 3), "bodies", "6ft", "champion", "Alex", 1),
+        ])
+
+        self.db.session.delete(first)
+        self.db.session.commit()
+        self.assertEqual(self.rollup(), [
+            (date(2026, 3, 2), "bodies", "7ft", "lite", "Sam", 1),
+            (date(2026, 3, 3), "bodies", "6ft", "champion", "Alex", 1),
+        ])
+        self.assertEqual(self.rollup(), self.rebuilt())
+
+    def test_incremental_rollup_matches_a_rebuild(self):
+        workers = ("Sam", "Alex", None)
+        sizes = ("", "-6", "-L", "-6-L")
+
+        def serial():
+            return f"S{rng.randrange(10 ** 6)}{rng.choice(sizes)}"
+
+        def day():
+            return date(2026, 3, rng.randint(1, 4))
+
+        def new_row(area):
+            if area == "cushions":
+                return CushionCompletedSet(
+                    size_label=rng.choice(("6ft", "7ft")), worker=rng.choice(workers[:2]),
+                    stock_type="cushion_set", stock_count_after=0,
+                    completed_at=datetime.combine(day(), time(rng.randrange(24), 30)),
+                )
+            fields = {"worker": rng.choice(workers[:2]), "serial_number": serial(), "date": day()}
+            if area == "pods":
+                return CompletedPods(start_time=time(9), finish_time=time(10), **fields)
+            if area == "top_rails":
+                return TopRail(start_time="09:00", finish_time="10:00", issue="", **fields)
+            return CompletedTable(start_time="09:00", finish_time="10:00", **fields)
+
+        def edit(row):
+            if isinstance(row, CushionCompletedSet):
+                choices = {
+                    "size_label": lambda: rng.choice(("6ft", "7ft")),
+                    "worker": lambda: rng.choice(workers[:2]),
+                    "completed_at": lambda: datetime.combine(day(), time(rng.randrange(24))),
+                    "stock_count_after": lambda: rng.randrange(50),
+                }
+            else:
+                choices = {
+                    "serial_number": serial, "date": day,
+                    "worker": lambda: rng.choice(workers[:2]), "lunch": lambda: rng.choice(("Yes", "No")),
+                }
+            for name in rng.sample(sorted(choices), rng.randint(1, 2)):
+                setattr(row, name, choices[name]())
+
+        for seed in range(12):
+            rng = random.Random(seed)
+            with self.subTest(seed=seed):
+                rows = []
+                for _ in range(40):
+                    action = rng.random()
+                    if action < 0.5 or not rows:
+                        row = new_row(rng.choice(("bodies", "pods", "top_rails", "cushions")))
+                        self.db.session.add(row)
+                        rows.append(row)
+                    elif action < 0.85:
+                        edit(rng.choice(rows))
+                    else:
+                        self.db.session.flush()
+                        self.db.session.delete(rows.pop(rng.randrange(len(rows))))
+                    # Commit often, so edits also land on rows whose attributes have expired.
+                    if rng.random() < 0.5:
+                        self.db.session.commit()
+                self.db.session.commit()
+                self.assertEqual(self.rollup(), self.rebuilt())
+                for row in rows:
+                    self.db.session.delete(row)
+                self.db.session.commit()
+                self.assertEqual(self.rollup(), [])
+
+
+class CountCheckpointTests(AppTestCase):
+    start = datetime(2026, 3, 2, 8, 0)
+
+    def log(self, stock_type, count_after, minutes):
+        entry = TableStockLog(
+            stock_type=stock_type, action_type="set", count_after=count_after,
+            created_at=self.start + timedelta(minutes=minutes),
+        )
+        self.db.session.add(entry)
+        return entry
+
+    def scanned(self, as_of_datetimes):
+        """Counts at each datetime from one pass over the whole log."""
+        rows = self.db.session.execute(
+            TableStockLog.__table__.select().order_by(TableStockLog.created_at, TableStockLog.id)
+        ).all()
+        counts, series, position = {}, {}, 0
+        for as_of_dt in sorted(as_of_datetimes):
+            while position < len(rows) and rows[position].created_at <= as_of_dt:
+                counts[rows[position].stock_type] = rows[position].count_after
+                position += 1
+            series[as_of_dt] = dict(counts)
+        return series
+
+    def checkpoints(self):
+        return CountCheckpoint.query.filter_by(source="table_stock").count()
+
+    def assertMatchesScan(self, as_of_datetimes):
+        series = counts_series("table_stock", as_of_datetimes)
+        self.assertEqual(series, self.scanned(as_of_datetimes))
+        for as_of_dt in as_of_datetimes[:3]:
+            self.assertEqual(counts_as_of("table_stock", as_of_dt), series[as_of_dt], as_of_dt)
+
+    def test_inserts_across_the_interval_write_checkpoints(self):
+        interval = flask_app.COUNT_CHECKPOINT_INTERVAL
+        for number in range(2 * interval + 30):
+            self.log(("body_7ft", "body_6ft", "top_rail")[number % 3], number, number)
+        self.db.session.commit()
+        self.assertEqual(self.checkpoints(), 2)
+
+        self.assertMatchesScan([
+            self.start + timedelta(minutes=minutes)
+            for minutes in (-1, 0, interval - 2, interval - 1, interval, 2 * interval - 1, 2 * interval + 29)
+        ])
+
+        # A back-dated row drops the checkpoints it lands before.
+        self.log("body_7ft", -5, interval - 10)
+        self.db.session.commit()
+        self.assertEqual(self.checkpoints(), 0)
+        self.assertMatchesScan([self.start + timedelta(minutes=minutes) for minutes in (interval - 10, interval, 500)])
+
+    def test_moving_a_row_later_drops_the_checkpoints_it_leaves(self):
+        with mock.patch.object(flask_app, "COUNT_CHECKPOINT_INTERVAL", 5):
+            entries = [self.log(f"stock_{number}", number, number) for number in range(10)]
+            self.db.session.commit()
+            self.assertEqual(self.checkpoints(), 2)
+
+            # A new request edits the first row without loading it.
+            self.db.session.expire_all()
+            entries[0].created_at = self.start + timedelta(minutes=100)
+            self.db.session.commit()
+            self.assertEqual(self.checkpoints(), 0)
+            self.assertMatchesScan([self.start + timedelta(minutes=minutes) for minutes in (4, 9, 100)])
+
+            self.db.session.delete(entries[0])
+            self.db.session.commit()
+            self.assertMatchesScan([self.start + timedelta(minutes=minutes) for minutes in (4, 9, 100)])
+
+    def test_checkpoints_follow_edits_and_deletes(self):
+        # Enough keys that a stale checkpoint still holds a value no later row overwrote.
+        stock_types = [f"stock_{number}" for number in range(15)]
+        checkpoints_seen = 0
+        with mock.patch.object(flask_app, "COUNT_CHECKPOINT_INTERVAL", 5):
+            for seed in range(6):
+                rng = random.Random(seed)
+                with self.subTest(seed=seed):
+                    TableStockLog.query.delete()
+                    CountCheckpoint.query.delete()
+                    self.db.session.commit()
+                    self.db.session.expunge_all()
+                    entries, minutes = [], {}
+                    clock = 0
+                    for step in range(150):
+                        action = rng.random()
+                        if action < 0.7 or not entries:
+                            clock += rng.randint(0, 3)
+                            logged_at = clock - rng.randint(1, 60) if rng.random() < 0.05 else clock
+                            entries.append(self.log(rng.choice(stock_types), rng.randrange(100), logged_at))
+                            minutes[entries[-1]] = logged_at
+                        elif action < 0.8:
+                            # Nudge the time without reading it, as an edit form posts it.
+                            entry = rng.choice(entries)
+                            minutes[entry] += rng.randint(-10, 30)
+                            entry.created_at = self.start + timedelta(minutes=minutes[entry])
+                        elif action < 0.9:
+                            rng.choice(entries).count_after = rng.randrange(100)
+                        else:
+                            self.db.session.flush()
+                            self.db.session.delete(entries.pop(rng.randrange(len(entries))))
+                        if step % 10 == 9:
+                            self.db.session.commit()
+                            checkpoints_seen = max(checkpoints_seen, self.checkpoints())
+                            as_of = {entry.created_at for entry in entries}
+                            as_of.update(checkpoint.taken_at for checkpoint in CountCheckpoint.query)
+                            self.assertMatchesScan(sorted(as_of))
+                            # As in a new request: edits land on rows that have not been loaded.
+                            self.db.session.expire_all()
+        self.assertGreater(checkpoints_seen, 0)
+
+
+class CncQueuePositionTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.log_in()
+        self.job = CncJob(name="Rails", quantity=1)
+        self.db.session.add(self.job)
+        self.db.session.commit()
+
+    def queue(self, machine_number, positions, status=CNC_STATUS_QUEUED):
+        items = [
+            CncQueueItem(job_id=self.job.id, machine_number=machine_number, position=position, status=status)
+            for position in positions
+        ]
+        self.db.session.add_all(items)
+        self.db.session.commit()
+        return [item.id for item in items]
+
+    def order(self, machine_number):
+        return [
+            item.id for item in CncQueueItem.query
+            .filter_by(machine_number=machine_number, status=CNC_STATUS_QUEUED)
+            .order_by(CncQueueItem.position, CncQueueItem.id)
+        ]
+
+    def positions(self, machine_number):
+        return [
+            item.position for item in CncQueueItem.query
+            .filter_by(machine_number=machine_number, status=CNC_STATUS_QUEUED)
+            .order_by(CncQueueItem.position, CncQueueItem.id)
+        ]
+
+    def post(self, url, payload):
+        """Post to a queue endpoint and return how many queue rows it rewrote."""
+        rewritten = []
+
+        def count_updates(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("UPDATE cnc_queue_item"):
+                rewritten.append(len(parameters) if executemany else 1)
+
+        event.listen(self.db.engine, "before_cursor_execute", count_updates)
+        try:
+            response = self.client.post(url, json=payload)
+        finally:
+            event.remove(self.db.engine, "before_cursor_execute", count_updates)
+        self.assertEqual(response.status_code, 200, response.get_json())
+        self.db.session.expire_all()
+        return sum(rewritten)
+
+    def move(self, item_id, direction):
+        return self.post("/api/cnc/queue/reorder", {"item_id": item_id, "direction": direction})
+
+    def test_rebalance_respaces_the_queued_items_in_order(self):
+        queued = self.queue(1, [5, 5, 3, -2000, 9])
+        completed = self.queue(1, [4], status=CNC_STATUS_COMPLETED)
+        other_machine = self.queue(2, [7])
+        expected = self.order(1)
+
+        self.assertEqual(_cnc_rebalance_machine(1), len(queued))
+        self.db.session.commit()
+        self.assertEqual(self.order(1), expected)
+        self.assertEqual(self.positions(1), [CNC_POSITION_GAP * index for index in range(1, 6)])
+        self.assertEqual(self.db.session.get(CncQueueItem, completed[0]).position, 4)
+        self.assertEqual(self.db.session.get(CncQueueItem, other_machine[0]).position, 7)
+
+    def test_moves_write_one_row_until_a_gap_runs_out(self):
+        first, second, third = self.queue(1, [CNC_POSITION_GAP * index for index in range(1, 4)])
+        expected = [first, second, third]
+        rewrites = []
+        # Keep moving the last item up into the gap after the first, halving it each time.
+        for _ in range(12):
+            last = expected[-1]
+            rewrites.append(self.move(last, "up"))
+            expected = [first, last, expected[1]]
+            self.assertEqual(self.order(1), expected)
+
+        respaced = rewrites.index(3)
+        self.assertEqual(respaced, CNC_POSITION_GAP.bit_length() - 1)
+        self.assertEqual(set(rewrites[:respaced] + rewrites[respaced + 1:]), {1})
+        self.assertEqual(self.positions(1)[0], CNC_POSITION_GAP)
+
+        # Moves past either end change nothing.
+        self.assertEqual(self.move(first, "top"), 0)
+        self.assertEqual(self.move(expected[-1], "down"), 0)
+        self.assertEqual(self.move(expected[-1], "top"), 1)
+        self.assertEqual(self.order(1), [expected[-1], first, expected[1]])
+
+    def test_random_moves_match_a_list_model(self):
+        for seed in range(5):
+            rng = random.Random(seed)
+            with self.subTest(seed=seed):
+                CncQueueItem.query.delete()
+                self.db.session.commit()
+                queues = {
+                    machine: self.queue(machine, [CNC_POSITION_GAP * index for index in range(1, rng.randint(2, 12))])
+                    for machine in (1, 2)
+                }
+                for _ in range(60):
+                    machine = rng.choice([number for number, items in queues.items() if items])
+                    items = queues[machine]
+                    index = rng.randrange(len(items))
+                    item_id = items[index]
+                    action = rng.choice(("up", "down", "top", "move"))
+                    if action == "move":
+                        target = 3 - machine
+                        self.post("/api/cnc/queue/move", {"item_id": item_id, "machine_number": target})
+                        queues[target].append(items.pop(index))
+                    else:
+                        self.assertLessEqual(self.move(item_id, action), 1 if action == "top" else len(items))
+                        if action == "top":
+                            items.insert(0, items.pop(index))
+                        elif action == "up" and index:
+                            items[index - 1], items[index] = items[index], items[index - 1]
+                        elif action == "down" and index < len(items) - 1:
+                            items[index + 1], items[index] = items[index], items[index + 1]
+                    self.assertEqual({number: self.order(number) for number in queues}, queues)
+
+    def test_batch_reorder_rewrites_only_rows_that_change_place(self):
+        ids = self.queue(1, [CNC_POSITION_GAP * index for index in range(1, 7)])
+        moved = self.queue(2, [CNC_POSITION_GAP])[0]
+
+        # Dragging the last item to second place writes one row.
+        layout = [ids[0], ids[5], *ids[1:5]]
+        self.assertEqual(self.post("/api/cnc/queue/batch_reorder", {"machines": {"1": layout}}), 1)
+        self.assertEqual(self.order(1), layout)
+
+        # So does dragging an item in from another machine.
+        layout = [moved, *layout]
+        self.assertEqual(self.post("/api/cnc/queue/batch_reorder", {"machines": {"1": layout}}), 1)
+        self.assertEqual(self.order(1), layout)
+        self.assertEqual(self.order(2), [])
+
+        # Unlisted items keep their order after the listed ones.
+        self.assertEqual(self.post("/api/cnc/queue/batch_reorder", {"machines": {"1": [ids[3], ids[2]]}}), 2)
+        self.assertEqual(self.order(1), [ids[3], ids[2], moved, ids[0], ids[5], ids[1], ids[4]])
+
+        # With no room between the kept neighbours the machine is respaced.
+        tight = self.queue(3, [1, 2, 3])
+        layout = [tight[0], tight[2], tight[1]]
+        self.assertEqual(self.post("/api/cnc/queue/batch_reorder", {"machines": {"3": layout}}), 3)
+        self.assertEqual(self.order(3), layout)
+        self.assertEqual(self.positions(3), [CNC_POSITION_GAP * index for index in range(1, 4)])
+
+        for seed in range(5):
+            rng = random.Random(seed)
+            with self.subTest(seed=seed):
+                layout = self.order(1) + self.order(2)
+                rng.shuffle(layout)
+                split = rng.randrange(len(layout) + 1)
+                self.post("/api/cnc/queue/batch_reorder", {
+                    "machines": {"1": layout[:split], "2": layout[split:]},
+                })
+                self.assertEqual(self.order(1), layout[:split])
+                self.assertEqual(self.order(2), layout[split:])
+
+
+class CncCompletionRollupTests(AppTestCase):
+    # Straddles the March clock change, so UTC completions land on the right London day.
+    start = datetime(2026, 3, 27, 6, 0)
+    days = [date(2026, 3, 27) + timedelta(days=offset) for offset in range(6)]
+
+    def rollup(self):
+        return [
+            sorted(tuple(row) for row in self.db.session.execute(table.select()))
+            for table in (CncCompletionRollup.__table__, CncMachineDayStats.__table__)
+        ]
+
+    def rebuilt(self):
+        with self.db.engine.connect() as connection:
+            with connection.begin() as transaction:
+                rebuild_cnc_completion_rollup(connection)
+                rows = [
+                    sorted(tuple(row) for row in connection.execute(table.select()))
+                    for table in (CncCompletionRollup.__table__, CncMachineDayStats.__table__)
+                ]
+                transaction.rollback()
+        return rows
+
+    def scanned(self):
+        """(London day, job name, job quantity) for every completed item, read straight off the queue."""
+        rows = (
+            self.db.session.query(CncQueueItem.completed_at, CncJob.name, CncJob.quantity)
+            .join(CncJob, CncQueueItem.job_id == CncJob.id)
+            .filter(CncQueueItem.status == CNC_STATUS_COMPLETED, CncQueueItem.completed_at.isnot(None))
+            .all()
+        )
+        return [(flask_app.utc_to_london(completed_at).date(), name, quantity) for completed_at, name, quantity in rows]
+
+    def assertTotalsMatchScan(self):
+        completions = self.scanned()
+
+        def scanned_total(matches):
+            return sum(
+                cnc_effective_completed_quantity(name, quantity)
+                for day, name, quantity in completions if matches(day)
+            )
+
+        for day in self.days:
+            self.assertEqual(
+                cnc_completed_quantity_total(day.year, day.month, day.day),
+                scanned_total(lambda completed_day: completed_day == day),
+                day,
+            )
+        for month in (3, 4):
+            self.assertEqual(
+                cnc_completed_quantity_total(2026, month),
+                scanned_total(lambda completed_day: completed_day.month == month),
+            )
+        self.assertEqual(cnc_completed_quantity_total(2026), scanned_total(lambda completed_day: True))
+
+        expected = {}
+        for day, name, quantity in completions:
+            files = expected.setdefault(day.strftime("%Y-%m"), {})
+            file_quantity, file_runs = files.get(name, (0, 0))
+            files[name] = (file_quantity + cnc_effective_completed_quantity(name, quantity), file_runs + 1)
+        history = cnc_monthly_cut_file_history()
+        self.assertEqual(
+            {month["key"]: {entry["name"]: (entry["quantity"], entry["runs"]) for entry in month["files"]}
+             for month in history},
+            expected,
+        )
+        for month in history:
+            self.assertEqual(month["total_quantity"], sum(entry["quantity"] for entry in month["files"]))
+            self.assertEqual(month["total_runs"], sum(entry["runs"] for entry in month["files"]))
+
+    def test_listeners_match_a_rebuild_and_the_raw_scan(self):
+        def moment():
+            return self.start + timedelta(minutes=rng.randrange(6 * 24 * 60))
+
+        def new_job():
+            job = CncJob(name=f"{rng.choice(('Egger', 'Plain'))} sheet {rng.randrange(10 ** 6)}",
+                         quantity=rng.randint(1, 3))
+            self.db.session.add(job)
+            jobs.append(job)
+            return job
+
+        def complete(item):
+            item.status = CNC_STATUS_COMPLETED
+            item.completed_at = moment()
+
+        def undo(item):
+            item.status = CNC_STATUS_QUEUED
+            item.completed_at = None
+
+        def move(item):
+            item.machine_number = rng.choice(CNC_MACHINE_NUMBERS)
+
+        def retime(item):
+            item.completed_at = moment() if item.status == CNC_STATUS_COMPLETED else None
+
+        def requeue_time(item):
+            item.created_at = moment() - timedelta(hours=rng.randint(1, 72))
+
+        for seed in range(10):
+            rng = random.Random(seed)
+            with self.subTest(seed=seed):
+                jobs, items = [], []
+                for _ in range(3):
+                    new_job()
+                for _ in range(60):
+                    action = rng.random()
+                    if action < 0.3 or not items:
+                        # Attaching to the job loads its queue_items, which must not flush the half-built item.
+                        with self.db.session.no_autoflush:
+                            item = CncQueueItem(
+                                job=rng.choice(jobs), machine_number=rng.choice(CNC_MACHINE_NUMBERS),
+                                position=CNC_POSITION_GAP, created_at=moment() - timedelta(hours=rng.randint(1, 72)),
+                            )
+                            if rng.random() < 0.5:
+                                complete(item)
+                            self.db.session.add(item)
+                        items.append(item)
+                    elif action < 0.9:
+                        rng.choice((complete, undo, move, retime, requeue_time))(rng.choice(items))
+                    elif action < 0.97:
+                        self.db.session.flush()
+                        self.db.session.delete(items.pop(rng.randrange(len(items))))
+                        # As the delete route does; the item stays in its job's loaded collection until then.
+                        self.db.session.commit()
+                    elif len(jobs) > 1:
+                        # Removing a job cascades to its queue items.
+                        self.db.session.flush()
+                        job = jobs.pop(rng.randrange(len(jobs)))
+                        items = [item for item in items if item.job is not job]
+                        self.db.session.delete(job)
+                    # Commit often, so edits also land on items whose attributes have expired.
+                    if rng.random() < 0.5:
+                        self.db.session.commit()
+                self.db.session.commit()
+                self.assertEqual(self.rollup(), self.rebuilt())
+                self.assertTotalsMatchScan()
+                for job in jobs:
+                    self.db.session.delete(job)
+                self.db.session.commit()
+                self.assertEqual(self.rollup(), [[], []])
+
+
+class CushionBulkAddTests(AppTestCase):
+    CASES = (
+        ("spindle_mould", "", 0, ""),
+        ("glue_ends", "7ft", 1, ""),
+        ("bundle", "7ft", 0, ""),
+    )
+    STARTED = datetime(2026, 3, 2, 9, 0)
+    STEP = timedelta(seconds=75)
+
+    def seed(self, case, stock):
+        """``stock`` of every input the case reads, and an earlier timed add so the adds are timed."""
+        for model in (
+            CushionWorkflowCount, CushionWorkflowLog, CushionCompletedSet, flask_app.CushionBatch, CushionTimingStat,
+            DailyProductionRollup, TableStock, TableStockLog, PrintedPartsCount,
+        ):
+            self.db.session.query(model).delete()
+        self.db.session.expunge_all()
+        self.db.session.execute(CushionWorkflowCount.__table__.insert(), [
+            {
+                "stage_key": stage_key, "size_label": size_label, "shape_no": shape_no, "end_type": end_type,
+                "count": stock, "updated_at": self.STARTED,
+            }
+            for stage_key, size_label, shape_no, end_type in dict.fromkeys(cushion_input_requirements(*case))
+        ])
+        self.db.session.add(TableStock(type=cushion_stock_key("7ft"), count=3))
+        with mock.patch.object(flask_app, "london_now", return_value=self.STARTED):
+            set_consumable_stock(CUSHION_CONSUMABLE_TEE_NUTS["name"], 4 * stock)
+            batch = start_new_cushion_batch(self.worker)
+        stage_key, size_label, shape_no, end_type = case
+        self.db.session.add(CushionWorkflowLog(
+            action_type="add", stage_key=stage_key, stage_label=stage_key, size_label=size_label,
+            shape_no=shape_no, end_type=end_type, worker=self.worker, delta=1, count_after=1,
+            batch_number=batch.batch_number, batch_date=batch.batch_date, created_at=self.STARTED,
+        ))
+        self.db.session.commit()
+
+    def add(self, case, quantity, at):
+        with mock.patch.object(flask_app, "london_now", return_value=at):
+            if quantity == 1:
+                record_cushion_stage_add(*case, self.worker)
+            else:
+                record_cushion_stage_add_many(*case, quantity, self.worker)
+        self.db.session.commit()
+
+    def timing_stats(self, rebuild=False):
+        """Timing stats as stored, or as rebuilt from the log; the rebuild is rolled back."""
+        table = CushionTimingStat.__table__
+        columns = [column for column in table.c if column.name != "last_log_id"]
+        with self.db.engine.connect() as connection:
+            with connection.begin() as transaction:
+                if rebuild:
+                    rebuild_cushion_timing_stats(connection)
+                rows = connection.execute(table.select().with_only_columns(*columns)).all()
+                transaction.rollback()
+        return sorted(tuple(row) for row in rows)
+
+    def state(self):
+        logs = CushionWorkflowLog.query.order_by(CushionWorkflowLog.id).all()
+        stats = CushionTimingStat.query.all()
+        deltas = Counter()
+        for row in logs:
+            deltas[(row.action_type, row.stage_key, row.size_label, row.shape_no, row.end_type)] += row.delta
+        return {
+            "counts": {
+                (row.stage_key, row.size_label, row.shape_no, row.end_type): row.count
+                for row in CushionWorkflowCount.query
+            },
+            "deltas": deltas,
+            "counts_after": {
+                (row.action_type, row.stage_key, row.size_label, row.shape_no, row.end_type): row.count_after
+                for row in logs
+            },
+            # One "+N" press is one timed sample of the seconds per unit.
+            "timing": sorted(
+                (row.stage_key, row.worker, row.batch_number, row.seconds_sum // row.sample_count,
+                 row.min_seconds, row.max_seconds, row.last_seconds)
+                for row in stats
+            ),
+            "completed": sorted(
+                (row.size_label, row.worker, row.stock_count_after, row.estimated_seconds)
+                for row in CushionCompletedSet.query
+            ),
+            "rollup": sorted(tuple(row) for row in self.db.session.execute(DailyProductionRollup.__table__.select())),
+            "stock": {row.type: row.count for row in TableStock.query},
+            "tee_nuts": consumable_current_count(CUSHION_CONSUMABLE_TEE_NUTS["name"]),
+        }
+
+    def test_adding_n_at_once_matches_n_single_adds(self):
+        quantity = 5
+        for case in self.CASES:
+            with self.subTest(stage=case[0]):
+                self.seed(case, 2 * quantity)
+                for number in range(1, quantity + 1):
+                    self.add(case, 1, self.STARTED + number * self.STEP)
+                singles = self.state()
+
+                self.seed(case, 2 * quantity)
+                self.add(case, quantity, self.STARTED + quantity * self.STEP)
+                bulk = self.state()
+
+                self.assertEqual(bulk, singles)
+                self.assertEqual(bulk["timing"][0][3:], (75, 75, 75, 75))
+                if case[0] == "bundle":
+                    self.assertEqual(bulk["stock"], {cushion_stock_key("7ft"): 3 + quantity})
+                    self.assertEqual(bulk["rollup"][0][-1], quantity)
+                if case[0] == "glue_ends":
+                    self.assertEqual(bulk["tee_nuts"], 4 * 2 * quantity - 4 * quantity)
+
+                self.assertEqual(self.timing_stats(), self.timing_stats(rebuild=True))
+
+    def test_edits_to_expired_logs_refresh_timing_stats(self):
+        case = self.CASES[1]
+        self.seed(case, 6)
+        for number in range(1, 4):
+            self.add(case, 1, self.STARTED + number * self.STEP)
+        first, second, third = CushionWorkflowLog.query.filter(CushionWorkflowLog.seconds_taken > 0).all()
+
+        # Each commit expires the rows, so the listener only sees old values through active_history.
+        for edit in (
+            lambda: setattr(first, "seconds_taken", 300),
+            lambda: setattr(second, "worker", "Alex"),
+            lambda: setattr(third, "stage_key", "spindle_mould"),
+            lambda: setattr(first, "created_at", self.STARTED + 10 * self.STEP),
+        ):
+            edit()
+            self.db.session.commit()
+            self.assertEqual(self.timing_stats(), self.timing_stats(rebuild=True))
+
+    def test_a_count_taken_after_validation_raises_and_rolls_back(self):
+        self.log_in()
+        case = ("glue_ends", "7ft", 2, "")
+        self.seed(case, 6)
+        short_input = ("punch_rubber_ends", "", 0, "Small end")
+        read_counts = flask_app.cushion_count_records
+
+        def read_then_take(variants):
+            records = read_counts(variants)
+            # Another worker moves the small ends on once this request has validated them.
+            with self.db.engine.begin() as connection:
+                connection.execute(
+                    CushionWorkflowCount.__table__.update()
+                    .where(CushionWorkflowCount.stage_key == short_input[0], CushionWorkflowCount.end_type == short_input[3])
+                    .values(count=2)
+                )
+            return records
+
+        before = self.state()
+        before["counts"][short_input] = 2
+        with mock.patch.object(flask_app, "cushion_count_records", side_effect=read_then_take):
+            response = self.client.post("/counting_cushions", data={
+                "action": "add", "stage_key": case[0], "size_label": case[1], "shape_no": case[2],
+                "end_type": case[3], "quantity": "5",
+            })
+        self.assertEqual(response.status_code, 303)
+        self.db.session.expire_all()
+        self.assertEqual(self.state(), before)
+        self.assertEqual(CushionWorkflowLog.query.filter_by(action_type="move_out").count(), 0)
+        self.assertEqual(self.db.session.query(flask_app.CushionBatch).count(), 1)
+        with self.client.session_transaction() as session:
+            self.assertIn(("error", "Not enough Punch out rubber ends - Small end to move on."), session["_flashes"])
+
+
+class SchemaMigrationTests(AppTestCase):
+    def spied_steps(self):
+        """Patch every registered step with a spy that still runs it; returns the spies by version."""
+        spies = {version: mock.Mock(wraps=step) for version, (_, step) in SCHEMA_MIGRATIONS.items()}
+        patcher = mock.patch.dict(
+            SCHEMA_MIGRATIONS,
+            {version: (SCHEMA_MIGRATIONS[version][0], spy) for version, spy in spies.items()},
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return spies
+
+    def schema(self):
+        return sorted(tuple(row) for row in self.db.session.execute(
+            text("SELECT type, name, tbl_name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'")
+        ))
+
+    def recorded(self):
+        return {migration.version: migration.name for migration in SchemaMigration.query}
+
+    def test_recorded_steps_do_not_run_again(self):
+        registered = {version: name for version, (name, _) in SCHEMA_MIGRATIONS.items()}
+        self.assertEqual(self.recorded(), registered)
+        spies = self.spied_steps()
+
+        self.assertEqual(run_schema_migrations(), [])
+        self.assertFalse(any(spy.called for spy in spies.values()))
+
+        version = sorted(registered)[len(registered) // 2]
+        self.db.session.query(SchemaMigration).filter_by(version=version).delete()
+        self.db.session.commit()
+        self.assertEqual(run_schema_migrations(), [registered[version]])
+        self.assertEqual([number for number, spy in spies.items() if spy.called], [version])
+        self.assertEqual(self.recorded(), registered)
+
+    def test_forced_steps_are_idempotent(self):
+        schema = self.schema()
+        recorded = self.recorded()
+        self.db.session.add(TableStock(type="body_7ft", count=4))
+        self.db.session.commit()
+
+        names = run_schema_migrations(force=True)
+
+        self.assertEqual(names, [SCHEMA_MIGRATIONS[version][0] for version in sorted(SCHEMA_MIGRATIONS)])
+        self.assertEqual(self.schema(), schema)
+        self.assertEqual(self.recorded(), recorded)
+        self.assertEqual([(row.type, row.count) for row in TableStock.query], [("body_7ft", 4)])
+
+
+class CompletionWindowCountTests(AppTestCase):
+    # British Summer Time starts at 01:00 on 29 March 2026 and ends at 02:00 on 25 October 2026.
+    CHANGE_DAYS = (date(2026, 3, 29), date(2026, 10, 25))
+    CLOCKS = ("00:59", "01:00", "1:05", "01:30", "01:59", "02:00", "02:30", "23:59")
+
+    def completions(self, rng):
+        """Completions on the days either side of each clock change, with finish times in each stored format."""
+        rows = []
+        for change_day in self.CHANGE_DAYS:
+            for offset in range(-8, 9):
+                day = change_day + timedelta(days=offset)
+                for clock in rng.sample(self.CLOCKS, 3):
+                    parsed = datetime.strptime(clock, "%H:%M").time()
+                    serial = f"S{len(rows)}"
+                    rows += [
+                        CompletedTable(worker="Sam", start_time="00:00", finish_time=clock, serial_number=serial, date=day),
+                        TopRail(
+                            worker="Sam", start_time="00:00", finish_time=f"{parsed:%H:%M}:{rng.randrange(60):02d}",
+                            serial_number=serial, date=day, issue="None",
+                        ),
+                        CompletedPods(
+                            worker="Sam", start_time=time(0, 0), finish_time=parsed.replace(second=rng.randrange(60)),
+                            serial_number=serial, date=day,
+                        ),
+                    ]
+        self.db.session.add_all(rows)
+        self.db.session.commit()
+
+    def scanned(self, model, start_date, as_of_date, as_of_time):
+        total = 0
+        for row in model.query.filter(model.date >= start_date, model.date <= as_of_date):
+            finish = row.finish_time
+            if isinstance(finish, str):
+                hour, minute, *second = (int(part) for part in finish.split(":"))
+                finish = time(hour, minute, *second)
+            if row.date < as_of_date or finish <= as_of_time:
+                total += 1
+        return total
+
+    def test_windows_across_clock_changes_match_a_row_scan(self):
+        self.completions(random.Random(0))
+        windows = {}
+        for change_day in self.CHANGE_DAYS:
+            for offset in (-1, 0, 1):
+                as_of_date = change_day + timedelta(days=offset)
+                for as_of_time in (time(0, 59), time(1, 0), time(1, 30), time(1, 59, 59), time(2, 0), time.max):
+                    windows[(as_of_date, as_of_time, "month")] = (as_of_date.replace(day=1), as_of_date, as_of_time)
+                    windows[(as_of_date, as_of_time, "week")] = (as_of_date - timedelta(days=6), as_of_date, as_of_time)
+
+        for model in (CompletedTable, TopRail, CompletedPods):
+            counts = count_completed_to_clock_windows(model, windows)
+            for key, window in windows.items():
+                with self.subTest(model=model.__name__, window=key):
+                    self.assertEqual(counts[key], self.scanned(model, *window))
+
+
+class CushionStageBoardTests(AppTestCase):
+    WORKERS = ("Alex", "Sam", "Jo")
+
+    def seed(self, rng):
+        variants = [
+            (stage["key"], variant["size_label"], variant["shape_no"], variant["end_type"])
+            for stage in build_cushion_stage_context()
+            for variant in flatten_cushion_stage_variants(stage)
+        ]
+        self.db.session.execute(CushionWorkflowCount.__table__.insert(), [
+            {
+                "stage_key": stage_key, "size_label": size_label, "shape_no": shape_no, "end_type": end_type,
+                "count": rng.randint(0, 12), "updated_at": datetime(2026, 3, 2, 9, 0),
+            }
+            for stage_key, size_label, shape_no, end_type in variants
+            if rng.random() < 0.8
+        ])
+        self.db.session.add_all(
+            TableStock(type=cushion_stock_key(size_label), count=rng.randint(0, 5)) for size_label in CUSHION_SIZES
+        )
+        started = datetime(2026, 3, 2, 9, 0)
+        self.db.session.execute(CushionWorkflowLog.__table__.insert(), [
+            {
+                "action_type": "add" if rng.random() < 0.9 else "correction",
+                "stage_key": stage_key, "stage_label": stage_key, "size_label": size_label,
+                "shape_no": shape_no, "end_type": end_type, "worker": rng.choice(self.WORKERS),
+                "delta": 1, "count_after": 1, "seconds_taken": rng.choice([None, 0, rng.randint(20, 900)]),
+                "batch_number": rng.choice([None, 1, 2]),
+                # Rows share created_at in pairs, so the latest is picked by id.
+                "created_at": started + timedelta(minutes=number // 2),
+            }
+            for number, (stage_key, size_label, shape_no, end_type) in enumerate(rng.choices(variants, k=600))
+        ])
+        # The bulk insert skips the log's mapper events.
+        rebuild_cushion_timing_stats(self.db.session.connection())
+        self.db.session.commit()
+
+    def logged_timing(self, variant, worker_name, batch_number):
+        """Average and last seconds for one variant, read from the workflow log."""
+        stage_key, size_label, shape_no, end_type = variant
+        filters = [
+            CushionWorkflowLog.action_type == "add",
+            CushionWorkflowLog.stage_key == stage_key,
+            CushionWorkflowLog.size_label == size_label,
+            CushionWorkflowLog.shape_no == shape_no,
+            CushionWorkflowLog.end_type == end_type,
+            CushionWorkflowLog.seconds_taken > 0,
+        ]
+        if worker_name:
+            filters.append(CushionWorkflowLog.worker == worker_name)
+        logs = cushion_timing_batch_filter(CushionWorkflowLog.query, batch_number).filter(*filters).all()
+        if not logs:
+            return cushion_timing_payload(None, None)
+        last = max(logs, key=lambda log: (log.created_at, log.id))
+        return cushion_timing_payload(sum(log.seconds_taken for log in logs) / len(logs), last.seconds_taken)
+
+    def test_board_matches_per_variant_lookups(self):
+        for seed in range(3):
+            self.seed(random.Random(seed))
+            for worker_name, batch_number in ((None, None), ("Sam", None), ("Sam", 2), (None, 1)):
+                with self.subTest(seed=seed, worker=worker_name, batch=batch_number):
+                    board = build_cushion_stage_context(True, worker_name, batch_number)
+                    per_variant_counts = {}
+                    for stage in board:
+                        variants = flatten_cushion_stage_variants(stage)
+                        for variant in variants:
+                            key = (stage["key"], variant["size_label"], variant["shape_no"], variant["end_type"])
+                            per_variant_counts[key] = cushion_current_count_for_variant(*key)
+                            self.assertEqual(variant["count"], per_variant_counts[key], key)
+                            self.assertEqual(variant["timing"], self.logged_timing(key, worker_name, batch_number), key)
+                        self.assertEqual(stage["total"], sum(variant["count"] for variant in variants))
+                    for stage in board:
+                        self.assertEqual(
+                            stage["ready_to_work_count"],
+                            cushion_ready_count_for_stage(stage["key"], per_variant_counts),
+                            stage["key"],
+                        )
+            for model in (CushionWorkflowCount, CushionWorkflowLog, CushionTimingStat, flask_app.CushionTimingBucket, TableStock):
+                self.db.session.query(model).delete()
+            self.db.session.commit()
+
+
+class NotificationHarnessTests(AppTestCase):
+    def test_alerts_stay_on_this_machine_under_testing(self):
+        self.assertTrue(flask_app.app.config["TESTING"])
+        dispatcher = flask_app.notification_dispatcher
+        self.assertIn(urlsplit(dispatcher.url).hostname, ("127.0.0.1", "localhost", "::1"), dispatcher.url)
+        self.assertNotEqual(os.path.dirname(os.path.abspath(dispatcher.spool_path)), flask_app.basedir)
+
+        self.assertTrue(flask_app.send_ntfy_notification("harness check", "Test"))
+        self.assertTrue(dispatcher.flush())
+        self.assertIn("harness check", [entry["message"] for entry in NTFY_STUB.messages])
+
+
+class PeriodCountTests(AppTestCase):
+    # Month and year ends, a leap day and both 2026 clock changes.
+    BOUNDARIES = (date(2025, 12, 31), date(2026, 2, 28), date(2026, 3, 29), date(2026, 10, 25), date(2028, 2, 29))
+    SERIALS = ("{} - 6", "{}-6", "{}- 6", "{}-6 ", "{} - 7", "{}-7", "{}- 7", "{}", "6-{}", "{}-60")
+
+    def seed(self, rng):
+        bodies, cushions = [], []
+        for boundary in self.BOUNDARIES:
+            for offset in range(-2, 3):
+                day = boundary + timedelta(days=offset)
+                for _ in range(rng.randint(0, 3)):
+                    serial = rng.choice(self.SERIALS).format(f"B{len(bodies)}")
+                    bodies.append(CompletedTable(
+                        worker=rng.choice(("Sam", "Jo")), start_time="09:00", finish_time="10:00",
+                        serial_number=serial, date=day,
+                    ))
+                # Sets finished either side of midnight, as stored in London time.
+                for at in (time(0, 0), time(0, 30), time(23, 59, 59, 999999)):
+                    if rng.random() < 0.6:
+                        cushions.append(CushionCompletedSet(
+                            size_label=rng.choice(("6ft", "7ft")), worker="Sam", stock_type="cushion_set",
+                            stock_count_after=1, completed_at=datetime.combine(day, at),
+                        ))
+        self.db.session.add_all(bodies + cushions)
+        self.db.session.commit()
+        return bodies, cushions
+
+    def buckets(self):
+        buckets = [(("open", None), None, None)]
+        for today in (boundary + timedelta(days=offset) for boundary in self.BOUNDARIES for offset in (0, 1)):
+            buckets += [((today, key), start, end) for key, start, end in calendar_period_buckets(today)]
+        month_starts = sorted({
+            day.replace(day=1) for boundary in self.BOUNDARIES for day in (boundary, boundary + timedelta(days=1))
+        })
+        buckets += [(("month", key), start, end) for key, start, end in month_buckets(month_starts)]
+        buckets.append((("since", date(2026, 3, 29)), date(2026, 3, 29), None))
+        return buckets
+
+    def counted(self, model, date_column, start, end, *filters):
+        """The per-period filter-and-count the dashboards used to run."""
+        def bound(value):
+            return datetime.combine(value, time.min) if model is CushionCompletedSet else value
+
+        query = model.query.filter(*filters)
+        if start is not None:
+            query = query.filter(date_column >= bound(start))
+        if end is not None:
+            query = query.filter(date_column < bound(end))
+        return query.count()
+
+    def test_buckets_match_per_period_counts(self):
+        for seed in range(2):
+            with self.subTest(seed=seed):
+                bodies, _ = self.seed(random.Random(seed))
+                buckets = self.buckets()
+                expected_bodies = {
+                    key: self.counted(CompletedTable, CompletedTable.date, start, end) for key, start, end in buckets
+                }
+
+                self.assertEqual(period_counts(CompletedTable, CompletedTable.date, buckets), expected_bodies)
+                self.assertEqual(production_rollup_period_counts("bodies", buckets), expected_bodies)
+                self.assertEqual(
+                    period_counts(CushionCompletedSet, CushionCompletedSet.completed_at, buckets),
+                    {
+                        key: self.counted(CushionCompletedSet, CushionCompletedSet.completed_at, start, end)
+                        for key, start, end in buckets
+                    },
+                )
+                by_worker = period_counts(
+                    CompletedTable, CompletedTable.date, buckets, group_by=CompletedTable.worker
+                )
+                for worker in ("Sam", "Jo"):
+                    self.assertEqual(by_worker.get(worker, dict.fromkeys(expected_bodies, 0)), {
+                        key: self.counted(
+                            CompletedTable, CompletedTable.date, start, end, CompletedTable.worker == worker
+                        )
+                        for key, start, end in buckets
+                    })
+                self.assertEqual(
+                    period_counts(
+                        DailyProductionRollup, DailyProductionRollup.date, buckets,
+                        filters=(DailyProductionRollup.area == "bodies",),
+                        measure=DailyProductionRollup.completed_count,
+                        group_by=DailyProductionRollup.worker,
+                    ),
+                    by_worker,
+                )
+
+                # The API's Python check that serial_is_6ft_expression replaces.
+                def is_6ft_serial(serial):
+                    return " - 6" in serial or "-6" in serial or serial.replace(" ", "").endswith("-6")
+
+                grouped = period_counts(
+                    CompletedTable, CompletedTable.date, buckets,
+                    group_by=serial_is_6ft_expression(CompletedTable.serial_number),
+                )
+                for key, start, end in buckets:
+                    in_bucket = [
+                        body for body in bodies
+                        if (start is None or body.date >= start) and (end is None or body.date < end)
+                    ]
+                    self.assertEqual(
+                        {is_6ft: counts[key] for is_6ft, counts in grouped.items() if counts[key]},
+                        {
+                            is_6ft: count for is_6ft, count in (
+                                (True, sum(is_6ft_serial(body.serial_number) for body in in_bucket)),
+                                (False, sum(not is_6ft_serial(body.serial_number) for body in in_bucket)),
+                            ) if count
+                        },
+                        key,
+                    )
+
+                for model in (CompletedTable, CushionCompletedSet, DailyProductionRollup):
+                    self.db.session.query(model).delete()
+                self.db.session.commit()
+                self.db.session.expunge_all()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from invoice_extraction import ExtractionCache, ExtractionPipeline, content_hash
+from packaging_planner import extract_invoice_bytes
+
+
+TEXT_INVOICE = b"2 x 7ft Champion Pool Table Black\n1 x 6ft Lite Pool Table Grey Oak\n"
+CSV_INVOICE = b"Description,Qty\n7ft Champion Pool Table Black,3\n"
+
+
+def extract_pretending_pdf(filename, data):
+    """Stands in for a slow PDF/OCR parse; runs in the pool workers."""
+    if b"hang" in data:
+        time.sleep(60)
+    return extract_invoice_bytes(filename.replace(".pdf", ".txt"), data)
+
+
+def extract_slowly(filename, data):
+    """Stands in for a parse that takes two seconds; runs in the pool workers."""
+    if b"slow" in data:
+        time.sleep(2)
+    return extract_invoice_bytes(filename.replace(".pdf", ".txt"), data)
+
+
+def extract_with_ocr_error(filename, data):
+    """Reports a caught OCR failure the way extract_invoice_bytes does for an unreadable scan."""
+    if b"ocr-error" in data:
+        return [], [f"{filename}: no selectable PDF text was found. Review it manually."], {"errors": 1}
+    return extract_pretending_pdf(filename, data)
+
+
+def stable_fields(items):
+    return [{key: value for key, value in item.items() if key != "id"} for item in items]
+
+
+class ExtractionPipelineTests(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache = ExtractionCache(os.path.join(self.tempdir.name, "cache.db"))
+        self.pipelines = []
+
+    def tearDown(self):
+        for pipeline in self.pipelines:
+            pipeline.close()
+        self.tempdir.cleanup()
+
+    def pipeline(self, **kwargs):
+        pipeline = ExtractionPipeline(**kwargs)
+        self.pipelines.append(pipeline)
+        return pipeline
+
+    def test_matches_serial_extraction_in_upload_order(self):
+        files = [("a.txt", TEXT_INVOICE), ("b.csv", CSV_INVOICE), ("empty.txt", b"nothing here")]
+        finished = []
+        results = self.pipeline(cache=self.cache).run(
+            files, on_file_done=lambda index, filename, status: finished.append((filename, status))
+        )
+
+        for (filename, data), (items, warnings) in zip(files, results):
+            expected_items, expected_warnings = extract_invoice_bytes(filename, data)
+            self.assertEqual(stable_fields(items), stable_fields(expected_items))
+            self.assertEqual(warnings, expected_warnings)
+        self.assertEqual(sorted(finished), [("a.txt", "done"), ("b.csv", "done"), ("empty.txt", "done")])
+
+    def test_cache_hit_renames_result_for_new_upload(self):
+        pipeline = self.pipeline(cache=self.cache)
+        first = pipeline.run([("monday.txt", TEXT_INVOICE), ("none.txt", b"nothing")])
+        statuses = []
+        second = pipeline.run(
+            [("tuesday.txt", TEXT_INVOICE), ("again.txt", b"nothing")],
+            on_file_done=lambda index, filename, status: statuses.append(status),
+        )
+
+        self.assertEqual(statuses, ["cached", "cached"])
+        self.assertEqual(pipeline.stats()["cache_hits"], 2)
+        items = second[0][0]
+        self.assertEqual({item["source_file"] for item in items}, {"tuesday.txt"})
+        self.assertFalse({item["id"] for item in items} & {item["id"] for item in first[0][0]})
+        self.assertTrue(second[1][1][0].startswith("again.txt: "))
+
+    def test_hung_file_times_out_without_losing_the_others(self):
+        pipeline = self.pipeline(
+            max_workers=2, timeout_seconds=4, cache=self.cache, extractor=extract_pretending_pdf
+        )
+        files = [
+            ("stuck.pdf", b"hang" + b" " * 4096),
+            ("one.pdf", TEXT_INVOICE),
+            ("two.pdf", CSV_INVOICE.replace(b",", b" x ")),
+            ("three.pdf", TEXT_INVOICE + b"\n"),
+        ]
+        started = time.monotonic()
+        results = pipeline.run(files)
+
+        self.assertLess(time.monotonic() - started, 30)
+        self.assertEqual(results[0][0], [])
+        self.assertIn("took longer than 4 seconds", results[0][1][0])
+        self.assertEqual(len(results[1][0]), 2)
+        self.assertEqual(len(results[3][0]), 2)
+        stats = pipeline.stats()
+        self.assertEqual((stats["timeouts"], stats["pool_restarts"]), (1, 1))
+        self.assertIsNone(self.cache.get(content_hash(files[0][1]), "stuck.pdf"))
+
+    def test_concurrent_runs_only_time_files_a_worker_has_picked_up(self):
+        pipeline = self.pipeline(max_workers=2, timeout_seconds=3, extractor=extract_slowly)
+        # Start the workers first, so spawning them does not count against the first run.
+        pipeline.run([("warm.pdf", TEXT_INVOICE)])
+        uploads = [
+            [
+                (f"{upload}-{number}.pdf", b"slow %s %d\n" % (upload.encode(), number) + TEXT_INVOICE)
+                for number in range(2)
+            ]
+            for upload in ("first", "second")
+        ]
+        results = {}
+
+        def upload(files):
+            results[files[0][0]] = pipeline.run(files)
+
+        threads = [threading.Thread(target=upload, args=(files,)) for files in uploads]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+
+        self.assertEqual(len(results), 2)
+        for files in uploads:
+            for (filename, _), (items, warnings) in zip(files, results[files[0][0]]):
+                with self.subTest(filename=filename):
+                    self.assertEqual(len(items), 2, warnings)
+        stats = pipeline.stats()
+        self.assertEqual((stats["timeouts"], stats["pool_restarts"]), (0, 0))
+
+    def test_caught_ocr_errors_are_failed_and_not_cached(self):
+        pipeline = self.pipeline(max_workers=1, cache=self.cache, extractor=extract_with_ocr_error)
+        files = [("scan.pdf", b"ocr-error" + b" " * 4096), ("one.pdf", TEXT_INVOICE)]
+        for attempt in range(2):
+            statuses = {}
+            results = pipeline.run(
+                files, on_file_done=lambda index, filename, status: statuses.update({filename: status})
+            )
+            with self.subTest(attempt=attempt):
+                self.assertEqual(statuses["scan.pdf"], "failed")
+                self.assertEqual(results[0][0], [])
+                self.assertIsNone(self.cache.get(content_hash(files[0][1]), "scan.pdf"))
+        self.assertEqual(statuses["one.pdf"], "cached")
+        self.assertEqual(pipeline.stats()["errors"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
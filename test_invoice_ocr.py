@@ -0,0 +1,120 @@
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from PIL import Image, ImageDraw
+
+import invoice_ocr
+from invoice_ocr import OcrCache, ocr_pages, otsu_threshold, pdf_page_images, preprocess_image
+from packaging_planner import extract_invoice_bytes
+
+
+def scanned_page(label, size=(1200, 1600)):
+    page = Image.new("RGB", size, (235, 232, 220))
+    ImageDraw.Draw(page).text((100, 100), label, fill=(40, 40, 40))
+    return page
+
+
+class FakeEngine:
+    """Returns the text each page was drawn with, recorded by image size."""
+
+    def __init__(self, texts_by_width, delay=0.0):
+        self.texts_by_width = texts_by_width
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, image):
+        with self.lock:
+            self.calls += 1
+        self.assert_binarised(image)
+        time.sleep(self.delay)
+        return self.texts_by_width[image.width]
+
+    @staticmethod
+    def assert_binarised(image):
+        assert image.mode == "L"
+        histogram = image.histogram()
+        assert sum(histogram) == histogram[0] + histogram[255]
+
+
+class PreprocessTests(unittest.TestCase):
+    def test_otsu_splits_bimodal_histogram(self):
+        histogram = [0] * 256
+        histogram[30] = 500
+        histogram[220] = 5000
+        self.assertTrue(30 <= otsu_threshold(histogram) < 220)
+
+    def test_downscales_and_binarises(self):
+        prepared = preprocess_image(scanned_page("7ft Champion", size=(5000, 3000)), max_side=2500)
+        self.assertEqual(prepared.size, (2500, 1500))
+        FakeEngine.assert_binarised(prepared)
+        self.assertGreater(prepared.histogram()[0], 0)
+
+
+class OcrPagesTests(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache = OcrCache(os.path.join(self.tempdir.name, "ocr.db"))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_parallel_pages_keep_order_and_hit_cache(self):
+        pages = [(f"page-{number}", scanned_page(str(number), size=(600 + number, 800))) for number in range(6)]
+        engine = FakeEngine({600 + number: f"line {number}" for number in range(6)}, delay=0.05)
+
+        stats = {}
+        text = ocr_pages(iter(pages), stats=stats, engine=engine, max_workers=3, cache=self.cache)
+        self.assertEqual(text, "\n".join(f"line {number}" for number in range(6)))
+        self.assertEqual((stats["pages"], stats["cache_hits"], engine.calls), (6, 0, 6))
+        self.assertGreater(stats["ocr_seconds"], 0)
+
+        again = {}
+        self.assertEqual(ocr_pages(pages, stats=again, engine=engine, max_workers=3, cache=self.cache), text)
+        self.assertEqual((again["cache_hits"], engine.calls), (6, 6))
+
+    def test_scanned_pdf_is_rasterised_and_read(self):
+        pages = [scanned_page("2 x 7ft Champion Pool Table Black", size=(1240, 1754)),
+                 scanned_page("1 x 6ft Lite Pool Table Grey Oak", size=(1241, 1754))]
+        buffer = io.BytesIO()
+        pages[0].save(buffer, format="PDF", save_all=True, append_images=pages[1:])
+        data = buffer.getvalue()
+        self.assertEqual([image.width for _, image in pdf_page_images(data)], [1240, 1241])
+
+        engine = FakeEngine({
+            1240: "2 x 7ft Champion Pool Table Black",
+            1241: "1 x 6ft Lite Pool Table Grey Oak",
+        })
+        stats = {}
+        with mock.patch.object(invoice_ocr, "_default_engine", engine), \
+                mock.patch.dict(invoice_ocr._settings, {"cache": self.cache}):
+            items, warnings = extract_invoice_bytes("scan.pdf", data, stats=stats)
+
+        self.assertEqual([(item["size"], item["quantity"]) for item in items], [("7ft", 2), ("6ft", 1)])
+        self.assertIn("read with OCR", warnings[0])
+        self.assertEqual(stats["pages"], 2)
+
+    def test_failed_scan_ocr_is_counted_as_an_error(self):
+        buffer = io.BytesIO()
+        scanned_page("2 x 7ft Champion Pool Table Black").save(buffer, format="PDF")
+
+        def broken_engine(image):
+            raise RuntimeError("tesseract exited")
+
+        stats = {}
+        with mock.patch.object(invoice_ocr, "_default_engine", broken_engine), \
+                mock.patch.dict(invoice_ocr._settings, {"cache": self.cache}):
+            items, warnings = extract_invoice_bytes("scan.pdf", buffer.getvalue(), stats=stats)
+
+        self.assertEqual(items, [])
+        self.assertIn("review it manually", warnings[0])
+        self.assertEqual(stats["errors"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from notification_dispatcher import SPOOL_SCHEMA, NotificationDispatcher, StubNtfyServer
+
+
+class NotificationDispatcherTests(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubNtfyServer().start()
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.spool_path = os.path.join(self.tempdir.name, "spool.db")
+        self.dispatchers = []
+
+    def tearDown(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.stop()
+        self.stub.stop()
+        self.tempdir.cleanup()
+
+    def dispatcher(self, **kwargs):
+        kwargs.setdefault("backoff_seconds", 0.01)
+        kwargs.setdefault("spool_path", self.spool_path)
+        dispatcher = NotificationDispatcher(self.stub.url, **kwargs)
+        self.dispatchers.append(dispatcher)
+        return dispatcher
+
+    def test_delivers_title_priority_and_body(self):
+        dispatcher = self.dispatcher()
+        self.assertTrue(dispatcher.enqueue("Stock for Felt is low (2 remaining).",
+                                           title="Low Stock Warning", priority="high"))
+        self.assertTrue(dispatcher.flush())
+        self.assertEqual(self.stub.messages, [{
+            "path": "/PoolTableTrackerV2",
+            "title": "Low Stock Warning",
+            "priority": "high",
+            "message": "Stock for Felt is low (2 remaining).",
+        }])
+        self.assertEqual(dispatcher.stats()["sent"], 1)
+
+    def test_retries_with_backoff_until_delivered(self):
+        self.stub.fail_remaining = 2
+        dispatcher = self.dispatcher()
+        dispatcher.enqueue("CNC 1 queue is low (2 queued jobs).", title="CNC Queue Warning")
+        self.assertTrue(dispatcher.flush())
+        stats = dispatcher.stats()
+        self.assertEqual((stats["sent"], stats["retried"], stats["failed"]), (1, 2, 0))
+        self.assertEqual(len(self.stub.messages), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        self.stub.fail_remaining = 10
+        dispatcher = self.dispatcher(max_attempts=3)
+        dispatcher.enqueue("never arrives", title="Test")
+        self.assertTrue(dispatcher.flush())
+        stats = dispatcher.stats()
+        self.assertEqual((stats["sent"], stats["failed"], stats["pending"]), (0, 1, 0))
+
+    def test_pending_alerts_with_same_key_coalesce(self):
+        gate = threading.Event()
+        sent = []
+
+        def blocking_sender(url, message, title=None, priority=None, timeout=None):
+            gate.wait(5)
+            sent.append(message)
+
+        dispatcher = self.dispatcher(sender=blocking_sender)
+        dispatcher.enqueue("first", title="Hold", dedup_key="hold")
+        for count in (5, 4, 3):
+            dispatcher.enqueue(f"Felt {count}", title="Low Stock Warning", dedup_key="low_stock:felt")
+        gate.set()
+        self.assertTrue(dispatcher.flush())
+        self.assertEqual(sent, ["first", "Felt 3"])
+        self.assertEqual(dispatcher.stats()["coalesced"], 2)
+
+    def test_full_queue_drops_and_counts(self):
+        gate = threading.Event()
+        dispatcher = self.dispatcher(
+            max_queue=2,
+            sender=lambda *args, **kwargs: gate.wait(5),
+        )
+        results = [dispatcher.enqueue(f"message {index}", title="Test") for index in range(3)]
+        gate.set()
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(dispatcher.stats()["dropped"], 1)
+
+    def test_spooled_alerts_survive_restart(self):
+        def failing_sender(*args, **kwargs):
+            raise RuntimeError("offline")
+
+        first = self.dispatcher(sender=failing_sender, backoff_seconds=60, lease_seconds=0.01)
+        first.enqueue("Order more Chinese parts", title="Order More Chinese Parts")
+        first.stop()
+        time.sleep(0.05)
+
+        second = self.dispatcher()
+        second.ensure_started()
+        self.assertTrue(second.flush())
+        self.assertEqual(second.stats()["recovered"], 1)
+        self.assertEqual([entry["message"] for entry in self.stub.messages],
+                         ["Order more Chinese parts"])
+
+    def test_live_lease_is_not_claimed_by_another_process(self):
+        gate = threading.Event()
+        first = self.dispatcher(sender=lambda *args, **kwargs: gate.wait(5))
+        first.enqueue("one owner only", title="Test")
+
+        second = self.dispatcher()
+        second.ensure_started()
+        self.assertEqual(second.stats()["recovered"], 0)
+        gate.set()
+
+    def test_recovered_rows_sharing_a_key_send_the_newest_once(self):
+        spool = sqlite3.connect(self.spool_path)
+        spool.execute(SPOOL_SCHEMA)
+        now = time.time()
+        # Two dead workers each spooled the same alert before either was sent.
+        spool.executemany(
+            "INSERT INTO ntfy_spool (id, dedup_key, title, message, attempts, next_attempt_at, "
+            "owner, lease_until, created_at) VALUES (?, 'cnc-1', 'CNC Queue Warning', ?, 2, ?, 'gone', 0, ?)",
+            [("newer", "CNC 1 queue is low (1 queued jobs).", now, now - 5),
+             ("older", "CNC 1 queue is low (2 queued jobs).", now, now - 10)],
+        )
+        spool.commit()
+
+        dispatcher = self.dispatcher()
+        dispatcher.ensure_started()
+        self.assertTrue(dispatcher.flush())
+        self.assertEqual([entry["message"] for entry in self.stub.messages],
+                         ["CNC 1 queue is low (1 queued jobs)."])
+        self.assertEqual(spool.execute("SELECT COUNT(*) FROM ntfy_spool").fetchone(), (0,))
+        spool.close()
+
+        dispatcher.stop()
+        restarted = self.dispatcher()
+        restarted.ensure_started()
+        self.assertTrue(restarted.flush())
+        self.assertEqual(restarted.stats()["recovered"], 0)
+        self.assertEqual(len(self.stub.messages), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
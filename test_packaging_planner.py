@@ -1,7 +1,28 @@
 import copy
+import io
+import random
 import unittest
+from collections import defaultdict
+from unittest import mock
 
-from packaging_planner import build_item, model_uses_lite_body, regenerate_packaging
+import packaging_planner
+from packaging_planner import (
+    HEADER_SCAN_ROWS,
+    build_item,
+    clear_planning_cache,
+    extract_invoice_bytes,
+    generate_packaging,
+    items_from_rows,
+    infer_colour,
+    infer_item_type,
+    infer_model,
+    infer_size,
+    items_from_text,
+    iter_csv_rows,
+    model_uses_lite_body,
+    normalise_config,
+    regenerate_packaging,
+)
 
 
 class RegeneratePackagingTests(unittest.TestCase):
@@ -208,5 +229,795 @@ class RegeneratePackagingTests(unittest.TestCase):
         )
 
 
+def without_ids(value):
+    if isinstance(value, dict):
+        return {key: without_ids(entry) for key, entry in value.items() if key != "id"}
+    if isinstance(value, list):
+        return [without_ids(entry) for entry in value]
+    return value
+
+
+# The planner as it was before planned segments were cached and re-plans
+# stopped planning from scratch, kept as the reference the cached planner
+# must agree with in standard packing mode.
+
+
+def reference_normalise_items(items):
+    clean_items = []
+    for item in items or []:
+        item = dict(item or {})
+        clean = packaging_planner.build_item(item, source_file=item.get("source_file", ""))
+        clean["id"] = packaging_planner._clean_text(item.get("id")) or clean["id"]
+        clean["confidence"] = max(0.0, min(1.0, float(item.get("confidence", clean["confidence"]))))
+        clean["raw_text"] = packaging_planner._clean_text(item.get("raw_text"))[:2000]
+        clean_items.append(clean)
+    return clean_items
+
+
+def reference_pallet_identity(pallet):
+    number = pallet.get("pallet_number", "")
+    try:
+        number = int(number)
+    except (TypeError, ValueError):
+        number = packaging_planner._clean_text(number)
+    return number, packaging_planner._clean_text(pallet.get("pallet_type")) or "custom"
+
+
+def reference_layout_line_identity(line):
+    component_type = packaging_planner._clean_text(line.get("component_type")) or "other"
+    item_id = packaging_planner._clean_text(line.get("item_id"))
+    origin_type = packaging_planner._clean_text(line.get("origin_type"))
+    if item_id:
+        return "item", item_id, component_type
+    if origin_type == "manual":
+        return (
+            "manual",
+            packaging_planner._clean_text(line.get("id"))
+            or packaging_planner._clean_text(line.get("description")),
+            component_type,
+        )
+    return (
+        "group",
+        component_type,
+        packaging_planner._clean_text(line.get("size")),
+        origin_type,
+    )
+
+
+def reference_layout_state(pallets):
+    quantities = defaultdict(int)
+    samples = {}
+    preferences = defaultdict(list)
+    for pallet in pallets:
+        pallet_identity = reference_pallet_identity(pallet)
+        for collection_name in ("lines", "carried_top_rails"):
+            for line in pallet.get(collection_name, []):
+                line_identity = reference_layout_line_identity(line)
+                location = pallet_identity, collection_name
+                quantity = max(0, int(line.get("quantity", 0) or 0))
+                quantities[(location, line_identity)] += quantity
+                samples.setdefault(line_identity, line)
+                if location not in preferences[line_identity]:
+                    preferences[line_identity].append(location)
+    return quantities, samples, preferences
+
+
+def reference_generate_packaging(items, config=None):
+    items = reference_normalise_items(items)
+    config = packaging_planner.normalise_config(config)
+    requirements = packaging_planner.build_requirements(items, config)
+    pallets = []
+    next_number = 1
+
+    body_lines = [dict(line) for line in requirements["bodies"]]
+    body_lines.sort(key=lambda line: (
+        0 if line.get("size") == "7ft" else 1,
+        line.get("colour") or "Unknown",
+    ))
+    while packaging_planner._line_total(body_lines):
+        lines = packaging_planner._take_from_lines(body_lines, config["body_capacity"])
+        pallet = packaging_planner._new_pallet("body", next_number, lines)
+        packaging_planner._refresh_pallet_labels(pallet, config)
+        pallets.append(pallet)
+        next_number += 1
+    body_pallets = list(pallets)
+
+    for size in ("7ft", "6ft", "Unknown"):
+        rail_lines = [
+            dict(line) for line in requirements["top_rails"]
+            if (line.get("size") or "Unknown") == size
+        ]
+        rail_lines.sort(key=lambda line: line.get("colour") or "Unknown")
+
+        while packaging_planner._line_total(rail_lines) >= config["top_rail_capacity"]:
+            full_pallet_lines = packaging_planner._take_from_lines(
+                rail_lines,
+                config["top_rail_capacity"],
+            )
+            pallet = packaging_planner._new_pallet(
+                "top_rail",
+                next_number,
+                full_pallet_lines,
+                size=size,
+            )
+            packaging_planner._refresh_pallet_labels(pallet, config)
+            pallets.append(pallet)
+            next_number += 1
+
+        remainder = packaging_planner._line_total(rail_lines)
+        if not remainder:
+            continue
+
+        remainder_groups = defaultdict(list)
+        for line in rail_lines:
+            remainder_groups[line.get("colour") or "Unknown"].append(dict(line))
+        rail_batches = [
+            remainder_groups[colour]
+            for colour in sorted(remainder_groups)
+        ]
+
+        planning_body_pallets = [
+            {
+                **pallet,
+                "carried_top_rails": [
+                    dict(line) for line in pallet.get("carried_top_rails", [])
+                ],
+            }
+            for pallet in body_pallets
+        ]
+        planned_body_assignments = []
+        all_batches_fit_bodies = (
+            size != "Unknown"
+            and remainder < config["loose_rail_limit"]
+        )
+        for batch in rail_batches if all_batches_fit_bodies else []:
+            batch_colour = next(
+                (line.get("colour") for line in batch if line.get("colour")),
+                "",
+            )
+            remaining_batch = [dict(line) for line in batch]
+            while packaging_planner._line_total(remaining_batch):
+                suitable_body = packaging_planner._compatible_body_pallet(
+                    planning_body_pallets,
+                    size,
+                    batch_colour,
+                    config,
+                )
+                if not suitable_body:
+                    all_batches_fit_bodies = False
+                    break
+                rail_capacity = config["top_rails_per_body_pallet"]
+                available_space = rail_capacity - packaging_planner._line_total(
+                    suitable_body.get("carried_top_rails", [])
+                )
+                moved_lines = packaging_planner._take_from_lines(
+                    remaining_batch,
+                    min(available_space, packaging_planner._line_total(remaining_batch)),
+                )
+                suitable_body["carried_top_rails"].extend(moved_lines)
+                planned_body_assignments.append((suitable_body["id"], moved_lines))
+            if not all_batches_fit_bodies:
+                break
+
+        if all_batches_fit_bodies:
+            body_pallet_by_id = {pallet["id"]: pallet for pallet in body_pallets}
+            for pallet_id, batch in planned_body_assignments:
+                body_pallet_by_id[pallet_id]["carried_top_rails"].extend(batch)
+            continue
+
+        pallet = packaging_planner._new_pallet("top_rail", next_number, rail_lines, size=size)
+        packaging_planner._refresh_pallet_labels(pallet, config)
+        pallets.append(pallet)
+        next_number += 1
+
+    cushion_lines = packaging_planner._aggregate_cushion_lines(requirements["cushions"])
+    leg_lines = [dict(line) for line in requirements["leg_boxes"]]
+    if packaging_planner._line_total(cushion_lines) or packaging_planner._line_total(leg_lines):
+        cushion_pallet_count = config["cushion_pallet_count"]
+        cushion_pallets = [
+            packaging_planner._new_pallet("cushion", next_number + index)
+            for index in range(cushion_pallet_count)
+        ]
+        next_number += cushion_pallet_count
+        line_index = 0
+        for source_lines in (cushion_lines, leg_lines):
+            while source_lines:
+                line = source_lines.pop(0)
+                target = cushion_pallets[line_index % len(cushion_pallets)]
+                target["lines"].append(line)
+                line_index += 1
+        for pallet in cushion_pallets:
+            packaging_planner._refresh_pallet_labels(pallet, config)
+            pallets.append(pallet)
+
+    summary = packaging_planner.build_summary(items, pallets, requirements, config)
+    warnings = packaging_planner.validate_packaging(items, pallets, config, requirements=requirements)
+    return {
+        "items": items,
+        "pallets": pallets,
+        "config": config,
+        "summary": summary,
+        "warnings": warnings,
+    }
+
+
+def reference_regenerate_packaging(
+    items,
+    config=None,
+    existing_pallets=None,
+    baseline_items=None,
+    baseline_config=None,
+    preserve_manual_layout=False,
+    replace_manual_layout=False,
+):
+    """Regenerate current requirements and replay saved manual layout changes."""
+    if existing_pallets is None:
+        existing_pallets = []
+    if not isinstance(existing_pallets, list):
+        raise ValueError("The pallet data is invalid or too large.")
+
+    for pallet in existing_pallets:
+        if not isinstance(pallet, dict):
+            raise ValueError("The pallet data is invalid or too large.")
+        for collection_name in ("lines", "carried_top_rails"):
+            lines = pallet.get(collection_name, [])
+            if not isinstance(lines, list) or any(
+                not isinstance(line, dict) for line in lines
+            ):
+                raise ValueError("The pallet data is invalid or too large.")
+
+    result = reference_generate_packaging(items, config)
+    has_manual_layout = preserve_manual_layout or any(
+        bool(pallet.get("manual_override")) for pallet in existing_pallets
+    )
+    if replace_manual_layout or not has_manual_layout:
+        result["manual_layout_preserved"] = False
+        return result
+
+    baseline = reference_generate_packaging(
+        items if baseline_items is None else baseline_items,
+        config if baseline_config is None else baseline_config,
+    )
+    baseline_quantities, _, _ = reference_layout_state(baseline["pallets"])
+    current_quantities, current_samples, _ = reference_layout_state(existing_pallets)
+    fresh_quantities, fresh_samples, fresh_preferences = reference_layout_state(
+        result["pallets"]
+    )
+    # UUIDs change on every run. Compare quantities by stable item/component and
+    # pallet location to capture only the operator's changes to the auto layout.
+    deltas = {
+        key: current_quantities.get(key, 0) - baseline_quantities.get(key, 0)
+        for key in set(current_quantities) | set(baseline_quantities)
+        if current_quantities.get(key, 0) != baseline_quantities.get(key, 0)
+    }
+
+    rebuilt_pallets = copy.deepcopy(result["pallets"])
+    current_pallets = {
+        reference_pallet_identity(pallet): pallet for pallet in existing_pallets
+    }
+    pallet_by_identity = {
+        reference_pallet_identity(pallet): pallet for pallet in rebuilt_pallets
+    }
+    for pallet_identity, current_pallet in current_pallets.items():
+        rebuilt = pallet_by_identity.get(pallet_identity)
+        if rebuilt is not None:
+            rebuilt["id"] = packaging_planner._clean_text(current_pallet.get("id")) or rebuilt["id"]
+            rebuilt["notes"] = packaging_planner._clean_text(current_pallet.get("notes"))
+            rebuilt["is_mixed"] = bool(current_pallet.get("is_mixed"))
+            rebuilt["manual_override"] = bool(current_pallet.get("manual_override"))
+        elif current_pallet.get("manual_override"):
+            rebuilt = packaging_planner._new_layout_pallet(current_pallet)
+            rebuilt_pallets.append(rebuilt)
+            pallet_by_identity[pallet_identity] = rebuilt
+
+    deltas_by_line = defaultdict(dict)
+    for (location, line_identity), delta in deltas.items():
+        deltas_by_line[line_identity][location] = delta
+
+    for line_identity, location_deltas in deltas_by_line.items():
+        fresh_total = sum(
+            quantity
+            for (_, candidate_identity), quantity in fresh_quantities.items()
+            if candidate_identity == line_identity
+        )
+        desired_total = max(0, fresh_total + sum(location_deltas.values()))
+        positive_locations = {
+            location for location, delta in location_deltas.items() if delta > 0
+        }
+
+        for location, delta in location_deltas.items():
+            if delta >= 0:
+                continue
+            removed = packaging_planner._remove_layout_quantity(
+                rebuilt_pallets,
+                line_identity,
+                -delta,
+                preferred_location=location,
+            )
+            if removed < -delta:
+                packaging_planner._remove_layout_quantity(
+                    rebuilt_pallets,
+                    line_identity,
+                    -delta - removed,
+                    avoided_locations=positive_locations,
+                )
+
+        sample = fresh_samples.get(line_identity) or current_samples.get(line_identity)
+        for location, delta in location_deltas.items():
+            if delta > 0:
+                packaging_planner._add_layout_quantity(
+                    pallet_by_identity,
+                    rebuilt_pallets,
+                    current_pallets,
+                    location,
+                    line_identity,
+                    sample,
+                    delta,
+                )
+
+        actual_total = sum(
+            quantity
+            for (_, candidate_identity), quantity
+            in reference_layout_state(rebuilt_pallets)[0].items()
+            if candidate_identity == line_identity
+        )
+        if actual_total > desired_total:
+            packaging_planner._remove_layout_quantity(
+                rebuilt_pallets,
+                line_identity,
+                actual_total - desired_total,
+                avoided_locations=positive_locations,
+            )
+        elif actual_total < desired_total:
+            preferred_locations = fresh_preferences.get(line_identity, [])
+            if not preferred_locations:
+                preferred_locations = list(positive_locations)
+            if preferred_locations:
+                packaging_planner._add_layout_quantity(
+                    pallet_by_identity,
+                    rebuilt_pallets,
+                    current_pallets,
+                    preferred_locations[0],
+                    line_identity,
+                    sample,
+                    desired_total - actual_total,
+                )
+
+    empty_manual_pallets = {
+        pallet_identity
+        for pallet_identity, pallet in current_pallets.items()
+        if pallet.get("manual_override")
+        and not pallet.get("lines")
+        and not pallet.get("carried_top_rails")
+    }
+    rebuilt_pallets = [
+        pallet for pallet in rebuilt_pallets
+        if pallet.get("lines")
+        or pallet.get("carried_top_rails")
+        or reference_pallet_identity(pallet) in empty_manual_pallets
+    ]
+
+    manual_identities = {
+        pallet_identity
+        for pallet_identity, pallet in current_pallets.items()
+        if pallet.get("manual_override")
+    }
+    integer_numbers = [
+        pallet.get("pallet_number")
+        for pallet in rebuilt_pallets
+        if isinstance(pallet.get("pallet_number"), int)
+    ]
+    next_number = max(integer_numbers, default=0) + 1
+    used_numbers = set()
+    for pallet in sorted(
+        rebuilt_pallets,
+        key=lambda entry: reference_pallet_identity(entry) not in manual_identities,
+    ):
+        number = pallet.get("pallet_number")
+        if number in used_numbers:
+            while next_number in used_numbers:
+                next_number += 1
+            pallet["pallet_number"] = next_number
+            number = next_number
+            next_number += 1
+        used_numbers.add(number)
+
+    if rebuilt_pallets and not any(
+        pallet.get("manual_override") for pallet in rebuilt_pallets
+    ):
+        # Keep plan-level manual intent discoverable after a save and reload,
+        # even when the originally edited pallet disappeared during regeneration.
+        rebuilt_pallets[0]["manual_override"] = True
+
+    for pallet in rebuilt_pallets:
+        packaging_planner._refresh_pallet_labels(pallet, result["config"])
+
+    result["pallets"] = rebuilt_pallets
+    result["summary"] = packaging_planner.build_summary(
+        result["items"],
+        rebuilt_pallets,
+        config=result["config"],
+    )
+    result["warnings"] = packaging_planner.validate_packaging(
+        result["items"],
+        rebuilt_pallets,
+        config=result["config"],
+    )
+    result["manual_layout_preserved"] = True
+    return result
+
+
+class IncrementalPlanningTests(unittest.TestCase):
+    """Re-plans that reuse cached segments must match planning from an empty cache.
+
+    Each case is a random order, a random manual move and a few random item
+    edits, seeded so a failure can be replayed.
+    """
+
+    ITEM_TYPES = ["complete_table"] * 4 + [
+        "body_only", "top_rail_only", "cushion_only", "legs_only", "replacement_item", "other",
+    ]
+
+    def random_item(self, rng, number):
+        return {
+            "id": f"item-{number}",
+            "description": rng.choice([
+                "7ft Champion pool table", "6ft League table", "Replacement top rail 7ft", "cushion set",
+            ]),
+            "size": rng.choice(["6ft", "7ft", ""]),
+            "model": rng.choice(["Champion", "Lite", ""]),
+            "colour": rng.choice(["Black", "Grey Oak", "Rustic Oak", ""]),
+            "quantity": rng.randint(1, 12),
+            "item_type": rng.choice(self.ITEM_TYPES),
+            "po_number": f"PO{rng.randint(1, 6)}",
+            "confidence": 1,
+        }
+
+    @staticmethod
+    def random_config(rng):
+        return {
+            "body_capacity": rng.randint(1, 8),
+            "top_rail_capacity": rng.randint(2, 20),
+            "loose_rail_limit": rng.randint(2, 15),
+            "cushion_pallet_count": rng.randint(1, 3),
+            "packing_mode": rng.choice(["standard", "optimised"]),
+        }
+
+    def edited_items(self, rng, items):
+        items = copy.deepcopy(items)
+        for _ in range(rng.randint(1, 3)):
+            choice = rng.random()
+            if items and choice < 0.4:
+                field = rng.choice(["quantity", "colour", "size", "item_type"])
+                rng.choice(items)[field] = self.random_item(rng, 0)[field]
+            elif items and choice < 0.6:
+                items.pop(rng.randrange(len(items)))
+            else:
+                items.append(self.random_item(rng, rng.randint(100, 999)))
+        return items
+
+    @staticmethod
+    def move_one_unit(rng, pallets):
+        pallets = copy.deepcopy(pallets)
+        source = rng.choice(pallets)
+        if not source["lines"]:
+            return pallets
+        line = rng.choice(source["lines"])
+        line["quantity"] -= 1
+        if not line["quantity"]:
+            source["lines"].remove(line)
+        target = rng.choice(pallets)
+        target["lines"].append(dict(line, id="line-moved", quantity=1))
+        source["manual_override"] = target["manual_override"] = True
+        return pallets
+
+    def test_cached_replan_matches_cold_replan(self):
+        for seed in range(120):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                items = [self.random_item(rng, number) for number in range(rng.randint(1, 20))]
+                config = self.random_config(rng)
+                clear_planning_cache()
+                initial = generate_packaging(items, config)
+                pallets = initial["pallets"]
+                if pallets and rng.random() < 0.7:
+                    pallets = self.move_one_unit(rng, pallets)
+                edited = self.edited_items(rng, items)
+                new_config = config if rng.random() < 0.8 else self.random_config(rng)
+                arguments = {
+                    "existing_pallets": pallets,
+                    "baseline_items": items,
+                    "baseline_config": config,
+                    "preserve_manual_layout": rng.random() < 0.5,
+                }
+
+                warm = regenerate_packaging(edited, new_config, **copy.deepcopy(arguments))
+                # Callers edit returned pallets in place; that must not leak into the cache.
+                for pallet in warm["pallets"]:
+                    for line in pallet["lines"]:
+                        line["quantity"] += 100
+                warm_again = regenerate_packaging(edited, new_config, **copy.deepcopy(arguments))
+                warm_plan = generate_packaging(edited, new_config)
+                clear_planning_cache()
+                cold = regenerate_packaging(edited, new_config, **copy.deepcopy(arguments))
+                cold_plan = generate_packaging(edited, new_config)
+
+                self.assertEqual(without_ids(warm_again), without_ids(cold))
+                self.assertEqual(without_ids(warm_plan), without_ids(cold_plan))
+
+    def test_matches_the_uncached_planner(self):
+        for seed in range(80):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                items = [self.random_item(rng, number) for number in range(rng.randint(1, 20))]
+                config = dict(self.random_config(rng), packing_mode="standard")
+                plan = generate_packaging(items, config)
+                self.assertEqual(without_ids(plan), without_ids(reference_generate_packaging(items, config)))
+
+                pallets = self.move_one_unit(rng, plan["pallets"]) if plan["pallets"] else []
+                edited = self.edited_items(rng, items)
+                new_config = config if rng.random() < 0.8 else dict(self.random_config(rng), packing_mode="standard")
+                arguments = {
+                    "existing_pallets": pallets,
+                    "baseline_items": items,
+                    "baseline_config": config,
+                    "preserve_manual_layout": rng.random() < 0.5,
+                }
+                # The second save finds both layouts in the cache.
+                for _ in range(2):
+                    self.assertEqual(
+                        without_ids(regenerate_packaging(edited, new_config, **copy.deepcopy(arguments))),
+                        without_ids(reference_regenerate_packaging(edited, new_config, **copy.deepcopy(arguments))),
+                    )
+
+    def test_plan_packs_every_required_unit(self):
+        for seed in range(60):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                items = [self.random_item(rng, number) for number in range(rng.randint(1, 30))]
+                result = generate_packaging(items, self.random_config(rng))
+                packed = {"body": 0, "top_rail": 0, "cushion": 0}
+                for pallet in result["pallets"]:
+                    for line in pallet["lines"] + pallet["carried_top_rails"]:
+                        if line["component_type"] in packed:
+                            packed[line["component_type"]] += line["quantity"]
+                summary = result["summary"]
+                self.assertEqual(
+                    (packed["body"], packed["top_rail"], packed["cushion"]),
+                    (summary["total_bodies"], summary["total_top_rails"], summary["total_cushion_sets"]),
+                )
+
+
+class OptimisedPackingTests(unittest.TestCase):
+    @staticmethod
+    def items(*rows):
+        return [
+            {
+                "id": f"item-{number}",
+                "description": f"{size} Champion pool table {item_type.replace('_', ' ')}",
+                "size": size,
+                "colour": colour,
+                "quantity": quantity,
+                "item_type": item_type,
+                "po_number": "PO100",
+                "confidence": 1,
+            }
+            for number, (item_type, size, colour, quantity) in enumerate(rows)
+        ]
+
+    @staticmethod
+    def contents(result, pallet_type):
+        return [
+            [(line["size"], line["colour"], line["quantity"]) for line in pallet["lines"]]
+            for pallet in result["pallets"]
+            if pallet["pallet_type"] == pallet_type
+        ]
+
+    def setUp(self):
+        clear_planning_cache()
+
+    def test_spreads_7ft_bodies_so_leftover_rails_ride_on_them(self):
+        items = self.items(
+            ("body_only", "7ft", "Black", 2),
+            ("body_only", "6ft", "Black", 8),
+            ("top_rail_only", "7ft", "Black", 2),
+        )
+        standard = generate_packaging(items, {"body_capacity": 5})
+        optimised = generate_packaging(items, {"body_capacity": 5, "packing_mode": "optimised"})
+
+        self.assertEqual(len(standard["pallets"]), 3)
+        self.assertEqual(self.contents(optimised, "body"), [
+            [("7ft", "Black", 1), ("6ft", "Black", 4)],
+            [("7ft", "Black", 1), ("6ft", "Black", 4)],
+        ])
+        self.assertEqual(
+            [len(pallet["carried_top_rails"]) for pallet in optimised["pallets"]], [1, 1]
+        )
+        self.assertEqual(optimised["warnings"], [])
+
+    def test_keeps_whole_colours_on_their_own_pallets(self):
+        items = self.items(
+            ("body_only", "7ft", "Black", 3),
+            ("body_only", "7ft", "Grey Oak", 5),
+            ("body_only", "7ft", "Stone", 2),
+        )
+        standard = generate_packaging(items, {"body_capacity": 5})
+        optimised = generate_packaging(items, {"body_capacity": 5, "packing_mode": "optimised"})
+
+        self.assertEqual(self.contents(standard, "body"), [
+            [("7ft", "Black", 3), ("7ft", "Grey Oak", 2)],
+            [("7ft", "Grey Oak", 3), ("7ft", "Stone", 2)],
+        ])
+        self.assertEqual(self.contents(optimised, "body"), [
+            [("7ft", "Black", 3), ("7ft", "Stone", 2)],
+            [("7ft", "Grey Oak", 5)],
+        ])
+
+    def test_falls_back_to_standard_layout_when_out_of_time(self):
+        items = self.items(
+            ("body_only", "7ft", "Black", 3),
+            ("body_only", "7ft", "Grey Oak", 5),
+            ("body_only", "7ft", "Stone", 2),
+        )
+        standard = generate_packaging(items, {"body_capacity": 5})
+        clear_planning_cache()
+        with mock.patch.object(packaging_planner, "OPTIMISER_TIME_BUDGET_SECONDS", -1):
+            optimised = generate_packaging(items, {"body_capacity": 5, "packing_mode": "optimised"})
+
+        self.assertEqual(without_ids(optimised["pallets"]), without_ids(standard["pallets"]))
+        self.assertEqual(optimised["config"]["packing_mode"], "optimised")
+
+        # The timed-out result is not cached, so a later plan with time to search improves on it.
+        retried = generate_packaging(items, {"body_capacity": 5, "packing_mode": "optimised"})
+        self.assertEqual(self.contents(retried, "body"), [
+            [("7ft", "Black", 3), ("7ft", "Stone", 2)],
+            [("7ft", "Grey Oak", 5)],
+        ])
+
+    def test_unknown_packing_mode_uses_standard(self):
+        self.assertEqual(normalise_config({"packing_mode": "fastest"})["packing_mode"], "standard")
+        self.assertEqual(normalise_config({})["packing_mode"], "standard")
+
+
+class StreamingIngestionTests(unittest.TestCase):
+    @staticmethod
+    def counted(rows, consumed):
+        for row in rows:
+            consumed.append(row)
+            yield row
+
+    def test_rows_are_read_only_up_to_the_item_limit(self):
+        rows = [["Description", "Qty"]] + [
+            [f"7ft Champion Pool Table Black {number}", "1"] for number in range(10_000)
+        ]
+        consumed = []
+        warnings = []
+        items = items_from_rows(self.counted(rows, consumed), "big.csv", warnings, limit=50)
+
+        self.assertEqual(len(items), 50)
+        self.assertLess(len(consumed), 60)
+        self.assertIn("only the first 50 item rows", warnings[0])
+
+    def test_sheet_without_products_stops_after_header_window(self):
+        consumed = []
+        no_description = [["Size", "Colour", "Qty"]] + [["7ft", "Black", "1"]] * 1000
+        self.assertEqual(items_from_rows(self.counted(no_description, consumed), "a.xlsx"), [])
+        self.assertEqual(len(consumed), HEADER_SCAN_ROWS)
+
+        consumed.clear()
+        terms = [["Terms and conditions apply"]] * 1000
+        self.assertEqual(items_from_rows(self.counted(terms, consumed), "a.xlsx"), [])
+        self.assertEqual(len(consumed), HEADER_SCAN_ROWS)
+
+    def test_csv_decoding_falls_back_mid_stream(self):
+        data = (
+            "\ufeffDescription;Qty\n".encode("utf-8")
+            + b"".join(f"6ft Lite table {number};1\n".encode() for number in range(5000))
+            + "7ft Champion Pool Table Black \u00a3120;3\n".encode("cp1252")
+        )
+        rows = list(iter_csv_rows(io.BytesIO(data)))
+
+        self.assertEqual(rows[0], ["Description", "Qty"])
+        self.assertEqual(rows[-1], ["7ft Champion Pool Table Black \u00a3120", "3"])
+        items, warnings = extract_invoice_bytes("supplier.csv", data)
+        self.assertEqual((len(items), items[-1]["quantity"], warnings), (2000, 1, [
+            "supplier.csv: only the first 2,000 item rows were read. Split the file to plan the rest.",
+        ]))
+
+
+class InvoiceTextInferenceTests(unittest.TestCase):
+    WORDS = [
+        "6ft", "7 ft", "6'", "7 feet", "premium", "premium edition", "champion", "league", "lite",
+        "rustic black", "rustic oak", "grey oak", "gray  oak", "black", "stone", "white",
+        "pool table", "top rail", "replacement", "only", "cushion", "legs", "body",
+        "blackstone", "championship", "x", "PO12345", "oak", "rustic", "3",
+    ]
+
+    @staticmethod
+    def first_match(patterns, text):
+        for label, pattern in patterns:
+            if pattern.search(text):
+                return label
+        return ""
+
+    def test_combined_matcher_agrees_with_pattern_lists(self):
+        rng = random.Random(20)
+        for _ in range(500):
+            text = " ".join(rng.choice(self.WORDS) for _ in range(rng.randint(0, 8)))
+            with self.subTest(text=text):
+                self.assertEqual(
+                    (infer_size(text), infer_model(text), infer_colour(text)),
+                    (
+                        self.first_match(packaging_planner.SIZE_PATTERNS, text),
+                        self.first_match(packaging_planner.MODEL_PATTERNS, text),
+                        self.first_match(packaging_planner.COLOUR_PATTERNS, text),
+                    ),
+                )
+
+    def test_earlier_listed_keyword_wins(self):
+        self.assertEqual(infer_colour("Black rustic black oak"), "Rustic Black")
+        self.assertEqual(infer_size("7ft cloth for 6 ft table"), "6ft")
+        self.assertEqual(infer_model("Lite league champion"), "Champion")
+        self.assertEqual(infer_item_type("Champion"), "complete_table")
+        self.assertEqual(infer_item_type("Championship"), "other")
+
+    def test_overlapping_keywords(self):
+        cases = [
+            # (text, size, model, colour)
+            ("Rustic Black 7ft Champion", "7ft", "Champion", "Rustic Black"),
+            ("Black rustic black", "", "", "Rustic Black"),
+            ("rustic oak black", "", "", "Rustic Oak"),
+            ("Blackstone pool table", "", "", ""),
+            ("GRAY   oak 6 foot", "6ft", "", "Grey Oak"),
+            ("white stone black", "", "", "Black"),
+            ("Premium Edition league", "", "Premium Edition", ""),
+            ("premium 7ft", "7ft", "Premium Edition", ""),
+            ("Premium editions", "", "Premium Edition", ""),
+            ("championship 6ft", "6ft", "", ""),
+            ("6ft then 7ft", "6ft", "", ""),
+            ("7ft table with 6ft cloth", "6ft", "", ""),
+            ("7 feet lite", "7ft", "Lite", ""),
+        ]
+        for text, size, model, colour in cases:
+            with self.subTest(text=text):
+                self.assertEqual((infer_size(text), infer_model(text), infer_colour(text)), (size, model, colour))
+                self.assertEqual(
+                    (size, model, colour),
+                    (
+                        self.first_match(packaging_planner.SIZE_PATTERNS, text),
+                        self.first_match(packaging_planner.MODEL_PATTERNS, text),
+                        self.first_match(packaging_planner.COLOUR_PATTERNS, text),
+                    ),
+                )
+
+    def test_cached_text_line_items_are_not_shared(self):
+        packaging_planner.clear_inference_cache()
+        text = "2 x 7ft Premium Edition Pool Table Rustic Black PO12345\n"
+        first, = items_from_text(text, "a.txt")
+        expected = {key: value for key, value in first.items() if key not in ("id", "source_file")}
+        for key in expected:
+            first[key] = "edited"
+
+        hits = packaging_planner._text_line_item.cache_info().hits
+        second, = items_from_text(text, "b.txt")
+        self.assertGreater(packaging_planner._text_line_item.cache_info().hits, hits)
+        self.assertEqual({key: second[key] for key in expected}, expected)
+        self.assertEqual(expected["colour"], "Rustic Black")
+        self.assertEqual(expected["model"], "Premium Edition")
+
+    def test_repeated_text_lines_get_their_own_items(self):
+        text = "2 x 7ft Champion Pool Table Black PO12345\n"
+        first = items_from_text(text, "a.txt")[0]
+        second, = items_from_text(text, "b.txt")
+        first["quantity"] = 9
+
+        self.assertNotEqual(first["id"], second["id"])
+        self.assertEqual(
+            (second["source_file"], second["quantity"], second["colour"], second["po_number"]),
+            ("b.txt", 2, "Black", "PO12345"),
+        )
+        self.assertEqual(items_from_text(text, "c.txt")[0]["quantity"], 2)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,133 @@
+import re
+import unittest
+from datetime import date, datetime, time
+
+from sqlalchemy import event
+
+from flask_app_testing import AppTestCase
+
+from flask_app import (
+    CNC_POSITION_GAP,
+    CNC_STATUS_COMPLETED,
+    CNC_STATUS_QUEUED,
+    CncJob,
+    CncQueueItem,
+    CompletedPods,
+    CompletedTable,
+    CushionCompletedSet,
+    CushionWorkflowLog,
+    PrintedPartsCount,
+    TopRail,
+    TopRailPieceCountLog,
+    WoodCount,
+    _cnc_queue_neighbours,
+    _cnc_rebalance_machine,
+    _get_or_create_monthly_wood_entry,
+    count_completed_to_clock_windows,
+    counts_series,
+    cushion_history_action_page,
+    cushion_history_completed_query,
+    rebuild_cushion_timing_stats,
+)
+
+
+class HotQueryPlanTests(AppTestCase):
+    """EXPLAIN QUERY PLAN on the statements the app's own helpers send, as captured off the engine."""
+
+    def captured(self, table, call):
+        """Statements (with their parameters) that read ``table`` while ``call`` runs."""
+        reads = re.compile(rf"\bFROM {table}(?: AS (\w+))?\b")
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            match = reads.search(statement)
+            if match and not executemany:
+                statements.append((statement, parameters, match.group(1) or table))
+
+        event.listen(self.db.engine, "before_cursor_execute", record)
+        try:
+            call()
+        finally:
+            event.remove(self.db.engine, "before_cursor_execute", record)
+        return statements
+
+    def assertUsesIndex(self, model, call):
+        table = model.__tablename__
+        statements = self.captured(table, call)
+        self.assertTrue(statements, f"No statement read {table}")
+        with self.db.engine.connect() as conn:
+            for statement, parameters, name in statements:
+                plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+                scans = [step for step in plan if re.match(rf"SCAN {name}\b", step)]
+                self.assertFalse(scans, f"Full scan of {table} in plan {plan} for:\n{statement}")
+
+    def test_printed_part_projection_refresh(self):
+        snapshot = PrintedPartsCount(part_name="Felt", count=4, date=date(2026, 1, 5), time=time(9))
+        self.db.session.add(snapshot)
+        self.db.session.commit()
+
+        def edit_and_delete():
+            snapshot.count = 5
+            self.db.session.commit()
+            self.db.session.delete(snapshot)
+            self.db.session.commit()
+
+        self.assertUsesIndex(PrintedPartsCount, edit_and_delete)
+
+    def test_monthly_wood_entry_for_section(self):
+        self.assertUsesIndex(WoodCount, lambda: _get_or_create_monthly_wood_entry("Body", date(2026, 1, 5), time(9)))
+
+    def test_completion_window_counts(self):
+        windows = {"month": (date(2026, 1, 1), date(2026, 1, 31), time(17))}
+        for model in (TopRail, CompletedTable, CompletedPods):
+            with self.subTest(model=model.__name__):
+                self.assertUsesIndex(model, lambda: count_completed_to_clock_windows(model, windows))
+
+    def test_cushion_timing_refresh(self):
+        scope = {
+            "stage_key": "spindle_mould", "size_label": "7ft", "shape_no": 1,
+            "end_type": "", "worker": "Sam", "batch_number": 0,
+        }
+        self.assertUsesIndex(
+            CushionWorkflowLog, lambda: rebuild_cushion_timing_stats(self.db.session.connection(), **scope)
+        )
+
+    def test_cnc_machine_queue(self):
+        self.assertUsesIndex(CncQueueItem, lambda: _cnc_rebalance_machine(1))
+        self.assertUsesIndex(
+            CncQueueItem, lambda: _cnc_queue_neighbours(1, (CNC_POSITION_GAP, 1), "before", exclude_id=1)
+        )
+
+    def test_cnc_machine_day_refresh(self):
+        job = CncJob(name="Plain 7ft", quantity=1)
+        item = CncQueueItem(job=job, machine_number=1, position=CNC_POSITION_GAP, status=CNC_STATUS_QUEUED)
+        self.db.session.add_all([job, item])
+        self.db.session.commit()
+
+        def complete():
+            item.status = CNC_STATUS_COMPLETED
+            item.completed_at = datetime(2026, 1, 5, 10)
+            self.db.session.commit()
+
+        self.assertUsesIndex(CncQueueItem, complete)
+
+    def test_top_rail_piece_log_window(self):
+        self.assertUsesIndex(TopRailPieceCountLog, lambda: counts_series("top_rail_pieces", [datetime(2026, 1, 5)]))
+
+    def test_cushion_history_keyset_page(self):
+        filters = {"start_dt": datetime(2026, 1, 1)}
+        for older in (True, False):
+            with self.subTest(older=older):
+                self.assertUsesIndex(
+                    CushionWorkflowLog,
+                    lambda: cushion_history_action_page(filters, 50, cursor=(datetime(2026, 3, 1, 9, 30), 5000),
+                                                        older=older),
+                )
+
+    def test_cushion_completed_sets_in_range(self):
+        filters = {"start_dt": datetime(2026, 1, 1), "end_dt": datetime(2026, 2, 1)}
+        self.assertUsesIndex(CushionCompletedSet, lambda: cushion_history_completed_query(filters).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, text
+
+from sqlite_profile import apply_sqlite_pragmas, current_pragmas, engine_options, resolve_pragmas
+
+
+class SqliteProfileTests(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.connection = sqlite3.connect(os.path.join(self.tempdir.name, "profile.db"))
+
+    def tearDown(self):
+        self.connection.close()
+        self.tempdir.cleanup()
+
+    def test_performance_profile_enables_wal(self):
+        apply_sqlite_pragmas(self.connection, resolve_pragmas("performance"))
+        pragmas = current_pragmas(self.connection)
+        self.assertEqual(pragmas["journal_mode"], "wal")
+        self.assertEqual(pragmas["synchronous"], 1)
+        self.assertEqual(pragmas["busy_timeout"], 5000)
+
+    def test_legacy_profile_returns_to_rollback_journal(self):
+        apply_sqlite_pragmas(self.connection, resolve_pragmas("performance"))
+        apply_sqlite_pragmas(self.connection, resolve_pragmas("legacy"))
+        self.assertEqual(current_pragmas(self.connection)["journal_mode"], "delete")
+
+    def test_overrides_and_unknown_profiles(self):
+        self.assertEqual(resolve_pragmas("performance", {"busy_timeout": 100})["busy_timeout"], 100)
+        with self.assertRaises(ValueError):
+            resolve_pragmas("turbo")
+        with self.assertRaises(ValueError):
+            apply_sqlite_pragmas(self.connection, {"cache_size": "1; DROP TABLE x"})
+
+    def test_engine_options_merge_pool_settings(self):
+        options = engine_options({"pool_size": 2})
+        self.assertEqual(options["pool_size"], 2)
+        self.assertTrue(options["pool_pre_ping"])
+
+    def test_pool_sizing_is_only_applied_to_file_databases(self):
+        file_uri = "sqlite:///" + os.path.join(self.tempdir.name, "pooled.db")
+        self.assertEqual(engine_options(database_uri=file_uri)["max_overflow"], 10)
+        for uri in ("sqlite://", "sqlite:///:memory:", "sqlite:///file:shared?mode=memory&uri=true"):
+            with self.subTest(uri=uri):
+                options = engine_options(database_uri=uri)
+                self.assertNotIn("max_overflow", options)
+                engine = create_engine(uri, **options)
+                try:
+                    with engine.connect() as conn:
+                        self.assertEqual(conn.execute(text("SELECT 1")).scalar(), 1)
+                finally:
+                    engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
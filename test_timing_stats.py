@@ -0,0 +1,85 @@
+import random
+import statistics
+import unittest
+from datetime import datetime, timedelta
+
+from timing_stats import (
+    SKETCH_RELATIVE_ACCURACY,
+    add_timing_sample,
+    combine_timing_stats,
+    empty_timing_stats,
+    sketch_bucket,
+    sketch_quantiles,
+    timing_mean,
+    timing_standard_deviation,
+)
+
+
+def samples(rng, count):
+    start = datetime(2026, 10, 1, 9, 0)
+    return [
+        (rng.randint(1, 8 * 60 * 60), start + timedelta(seconds=rng.randint(0, 3600)), log_id)
+        for log_id in range(1, count + 1)
+    ]
+
+
+class RunningStatsTests(unittest.TestCase):
+    def test_running_stats_match_direct_figures(self):
+        rng = random.Random(22)
+        rows = samples(rng, 500)
+        stats = empty_timing_stats()
+        for seconds, created_at, log_id in rows:
+            add_timing_sample(stats, seconds, created_at, log_id)
+        values = [seconds for seconds, _, _ in rows]
+        newest = max(rows, key=lambda row: (row[1], row[2]))
+
+        self.assertEqual((stats["min_seconds"], stats["max_seconds"]), (min(values), max(values)))
+        self.assertEqual(stats["last_seconds"], newest[0])
+        self.assertAlmostEqual(timing_mean(stats), statistics.fmean(values))
+        self.assertAlmostEqual(timing_standard_deviation(stats), statistics.pstdev(values), places=6)
+
+    def test_combining_partitions_matches_one_pass(self):
+        rng = random.Random(7)
+        for _ in range(50):
+            rows = samples(rng, rng.randint(1, 60))
+            whole = empty_timing_stats()
+            parts = [empty_timing_stats() for _ in range(rng.randint(1, 5))]
+            for row in rows:
+                add_timing_sample(whole, *row)
+                add_timing_sample(rng.choice(parts), *row)
+            self.assertEqual(combine_timing_stats(parts), whole)
+
+    def test_empty_stats(self):
+        stats = combine_timing_stats([empty_timing_stats()])
+        self.assertEqual(stats["sample_count"], 0)
+        self.assertIsNone(timing_mean(stats))
+        self.assertIsNone(timing_standard_deviation(stats))
+
+
+class SketchTests(unittest.TestCase):
+    def test_quantiles_stay_within_relative_accuracy(self):
+        rng = random.Random(3)
+        for _ in range(30):
+            values = sorted(
+                max(1, int(rng.lognormvariate(5, 1.2))) for _ in range(rng.randint(1, 2000))
+            )
+            counts = {}
+            for value in values:
+                counts[sketch_bucket(value)] = counts.get(sketch_bucket(value), 0) + 1
+            fractions = (0.0, 0.25, 0.5, 0.9, 0.99, 1.0)
+            estimates = sketch_quantiles(counts, fractions, values[0], values[-1])
+            for fraction, estimate in zip(fractions, estimates):
+                exact = values[int(fraction * (len(values) - 1))]
+                with self.subTest(size=len(values), fraction=fraction):
+                    self.assertLessEqual(abs(estimate - exact), exact * SKETCH_RELATIVE_ACCURACY + 1e-9)
+
+    def test_extremes_are_exact_when_bounds_are_given(self):
+        counts = {sketch_bucket(value): 1 for value in (17, 900)}
+        self.assertEqual(sketch_quantiles(counts, (0.0, 1.0), 17, 900), [17, 900])
+
+    def test_empty_sketch(self):
+        self.assertEqual(sketch_quantiles({}, (0.5, 0.9)), [None, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(30, max_entries=3, clock=self.clock)
+
+    def test_entries_expire_after_the_ttl(self):
+        self.cache.set("month", {"total": 4})
+        self.clock.now += 29.9
+        self.assertEqual(self.cache.get("month"), {"total": 4})
+        self.clock.now += 0.1
+        self.assertIsNone(self.cache.get("month"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_oldest_entry_is_dropped_past_max_entries(self):
+        for key in ("a", "b", "c", "d"):
+            self.cache.set(key, key.upper())
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual([self.cache.get(key) for key in ("b", "c", "d")], ["B", "C", "D"])
+
+    def test_get_or_compute_only_computes_on_a_miss(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(self.cache.get_or_compute(("week", "Sam"), compute), 1)
+        self.assertEqual(self.cache.get_or_compute(("week", "Sam"), compute), 1)
+        self.clock.now += 30
+        self.assertEqual(self.cache.get_or_compute(("week", "Sam"), compute), 2)
+
+    def test_cached_falsy_values_are_hits(self):
+        self.cache.set("empty", [])
+        self.assertEqual(self.cache.get_or_compute("empty", lambda: ["recomputed"]), [])
+
+    def test_clear_during_compute_discards_the_result(self):
+        def compute():
+            self.cache.clear()
+            return "stale"
+
+        self.assertEqual(self.cache.get_or_compute("month", compute), "stale")
+        self.assertIsNone(self.cache.get("month"))
+        self.assertEqual(self.cache.get_or_compute("month", lambda: "fresh"), "fresh")
+        self.assertEqual(self.cache.get("month"), "fresh")
+
+
+if __name__ == "__main__":
+    unittest.main()
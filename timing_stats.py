@@ -0,0 +1,113 @@
+"""Running duration statistics and a log-bucket quantile sketch for timed workshop actions."""
+
+from __future__ import annotations
+
+import math
+
+
+# Quantiles read from the sketch are within this fraction of a true sample.
+SKETCH_RELATIVE_ACCURACY = 0.02
+SKETCH_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(SKETCH_GAMMA)
+
+
+def empty_timing_stats():
+    return {
+        "sample_count": 0,
+        "seconds_sum": 0,
+        "seconds_sum_squares": 0,
+        "min_seconds": None,
+        "max_seconds": None,
+        "last_seconds": None,
+        "last_created_at": None,
+        "last_log_id": None,
+    }
+
+
+def _is_newer(created_at, log_id, stats):
+    if stats["last_created_at"] is None:
+        return True
+    return (created_at, log_id) > (stats["last_created_at"], stats["last_log_id"])
+
+
+def add_timing_sample(stats, seconds, created_at, log_id):
+    """Fold one duration into ``stats``; the newest ``(created_at, log_id)`` is the last value."""
+    stats["sample_count"] += 1
+    stats["seconds_sum"] += seconds
+    stats["seconds_sum_squares"] += seconds * seconds
+    stats["min_seconds"] = seconds if stats["min_seconds"] is None else min(stats["min_seconds"], seconds)
+    stats["max_seconds"] = seconds if stats["max_seconds"] is None else max(stats["max_seconds"], seconds)
+    if _is_newer(created_at, log_id, stats):
+        stats["last_seconds"] = seconds
+        stats["last_created_at"] = created_at
+        stats["last_log_id"] = log_id
+    return stats
+
+
+def combine_timing_stats(rows):
+    """Merge running stats (e.g. one per worker and batch) into one."""
+    totals = empty_timing_stats()
+    for row in rows:
+        if not row["sample_count"]:
+            continue
+        totals["sample_count"] += row["sample_count"]
+        totals["seconds_sum"] += row["seconds_sum"]
+        totals["seconds_sum_squares"] += row["seconds_sum_squares"]
+        for key, pick in (("min_seconds", min), ("max_seconds", max)):
+            totals[key] = row[key] if totals[key] is None else pick(totals[key], row[key])
+        if _is_newer(row["last_created_at"], row["last_log_id"], totals):
+            totals["last_seconds"] = row["last_seconds"]
+            totals["last_created_at"] = row["last_created_at"]
+            totals["last_log_id"] = row["last_log_id"]
+    return totals
+
+
+def timing_mean(stats):
+    return stats["seconds_sum"] / stats["sample_count"] if stats["sample_count"] else None
+
+
+def timing_standard_deviation(stats):
+    """Population standard deviation from the running sums, or None with no samples."""
+    count = stats["sample_count"]
+    if not count:
+        return None
+    # Integer sums keep this exact until the final square root.
+    variance_numerator = count * stats["seconds_sum_squares"] - stats["seconds_sum"] ** 2
+    return math.sqrt(max(variance_numerator, 0)) / count
+
+
+def sketch_bucket(seconds):
+    """Sketch bucket for a positive duration; bucket ``i`` covers ``(gamma**(i-1), gamma**i]``."""
+    return math.ceil(math.log(seconds) / _LOG_GAMMA)
+
+
+def sketch_bucket_value(bucket):
+    """The value that represents every sample in ``bucket`` to within the sketch accuracy."""
+    return 2 * SKETCH_GAMMA ** bucket / (SKETCH_GAMMA + 1)
+
+
+def sketch_quantiles(bucket_counts, fractions, min_seconds=None, max_seconds=None):
+    """Approximate quantiles from ``{bucket: count}``, one per fraction in ``fractions``.
+
+    Results are None when the sketch is empty. Passing the exact
+    ``min_seconds``/``max_seconds`` keeps the extreme quantiles exact.
+    """
+    total = sum(bucket_counts.values())
+    if not total:
+        return [None] * len(fractions)
+    ordered = sorted(bucket_counts.items())
+    results = []
+    for fraction in fractions:
+        rank = min(max(fraction, 0.0), 1.0) * (total - 1)
+        seen = 0
+        for bucket, count in ordered:
+            seen += count
+            if seen > rank:
+                value = sketch_bucket_value(bucket)
+                break
+        if min_seconds is not None:
+            value = max(value, min_seconds)
+        if max_seconds is not None:
+            value = min(value, max_seconds)
+        results.append(value)
+    return results
@@ -0,0 +1,72 @@
+"""Small in-process cache whose entries expire after a fixed number of seconds."""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Values keyed by any hashable, dropped ``ttl_seconds`` after they were stored.
+
+    At most ``max_entries`` are kept; the least recently stored goes first.
+    Each process has its own copy, so the TTL bounds how stale another
+    worker's entry can be.
+    """
+
+    def __init__(self, ttl_seconds, max_entries=128, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            stored_at, value = entry
+            if self._clock() - stored_at >= self.ttl_seconds:
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = (self._clock(), value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for ``key``, computing and storing it on a miss.
+
+        ``compute`` runs outside the lock. A result is not stored if ``clear``
+        was called while it was being computed, since it may predate the change.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        with self._lock:
+            generation = self._generation
+        value = compute()
+        with self._lock:
+            if generation == self._generation:
+                self._store(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
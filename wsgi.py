@@ -1,4 +1,8 @@
-from flask_app import app
+from flask_app import app, run_schema_migrations
+
+# Bring the schema up to date once per process instead of on every request.
+with app.app_context():
+    run_schema_migrations()
 
 if __name__ == "__main__":
     app.run()